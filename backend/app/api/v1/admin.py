@@ -14,15 +14,37 @@ from sqlalchemy import select, func
 from app.database import get_db
 from app.models.user import User
 from app.models.technician import Technician
+from app.models.technician_stats import TechnicianStats, WINDOW_DAYS
 from app.models.request import Request, RequestStatus
 from app.models.payment import Payment
 from app.models.audit_log import AuditLog
 from app.api.v1.auth import get_current_active_user
+from app.services.dispatch import sync_technician_index
+from app.services.dispatch_telemetry import acceptance_ratio, day_number
+from app.services.technician_index import technician_index
+from app.services.location_buffer import location_buffer
+from app.services.request_events import request_events
+from app.services.request_pipeline import request_pipeline
+from app.services.idempotency import idempotency_store
+from app.services.diagnosis_cache import diagnosis_cache
+from app.services.ai_diagnostic import invalidate_diagnoses
+from app.services.inference_batcher import inference_batcher
+from app.services.image_preprocessing import image_preprocessor
+from app.services.rescoring import rescore_requests
+from app.services.media_processing import media_processor
+from app.services.media_retention import media_retention
+from app.services.signatures import signature_migration
 
 
 router = APIRouter()
 
 
+def mean_or_none(values) -> Optional[float]:
+    """Mean of the non-None values, like SQL avg."""
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+
 async def get_admin_user(current_user: User = Depends(get_current_active_user)) -> User:
     """Ensure user is admin."""
     if current_user.role != "admin":
@@ -56,11 +78,36 @@ async def admin_dashboard(
         select(func.count(Request.id)).where(func.date(Request.created_at) == today)
     )
     
+    # Dispatch telemetry (precomputed per technician)
+    dispatch_result = await db.execute(
+        select(
+            func.avg(TechnicianStats.ewma_response_seconds),
+            func.avg(TechnicianStats.ewma_arrival_seconds),
+        )
+    )
+    response_s, arrival_s = dispatch_result.one()
+    
+    # Acceptance as of today, from the rings of technicians with events in the window
+    day = day_number(datetime.now(timezone.utc))
+    rings_result = await db.execute(
+        select(TechnicianStats.window_day, TechnicianStats.daily_offers, TechnicianStats.daily_accepts)
+        .where(TechnicianStats.window_day > day - WINDOW_DAYS)
+    )
+    rings = rings_result.all()
+    acceptance_7d = mean_or_none(acceptance_ratio(r, 7, day) for r in rings)
+    acceptance_30d = mean_or_none(acceptance_ratio(r, WINDOW_DAYS, day) for r in rings)
+    
     return {
         "total_users": total_users,
         "total_technicians": total_technicians,
         "requests_by_status": requests_by_status,
         "requests_today": today_requests.scalar(),
+        "dispatch": {
+            "avg_response_seconds": response_s,
+            "avg_arrival_seconds": arrival_s,
+            "acceptance_7d": acceptance_7d,
+            "acceptance_30d": acceptance_30d,
+        },
     }
 
 
@@ -126,9 +173,158 @@ async def verify_technician(
         raise HTTPException(status_code=404, detail="Tecnico non trovato")
     tech.is_verified = True
     await db.commit()
+    sync_technician_index(tech)
     return {"message": "Tecnico verificato"}
 
 
+@router.get("/dispatch/index")
+async def dispatch_index_stats(
+    admin: User = Depends(get_admin_user),
+):
+    """Size and staleness of this worker's in-process technician index."""
+    return technician_index.stats()
+
+
+@router.get("/dispatch/locations")
+async def location_buffer_stats(
+    admin: User = Depends(get_admin_user),
+):
+    """Pings received and rows written by this worker's location buffer."""
+    return location_buffer.stats()
+
+
+@router.get("/realtime")
+async def realtime_stats(
+    admin: User = Depends(get_admin_user),
+):
+    """Live-update subscribers and deltas on this worker."""
+    return request_events.stats()
+
+
+@router.get("/pipeline")
+async def pipeline_stats(
+    admin: User = Depends(get_admin_user),
+):
+    """Request pipeline queue and outcomes on this worker."""
+    return request_pipeline.stats()
+
+
+@router.get("/idempotency")
+async def idempotency_stats(
+    admin: User = Depends(get_admin_user),
+):
+    """Idempotency-Key executions, replays and waits on this worker."""
+    return idempotency_store.stats()
+
+
+@router.get("/diagnosis-cache")
+async def diagnosis_cache_stats(
+    admin: User = Depends(get_admin_user),
+):
+    """Diagnosis cache hits, misses and model time saved on this worker."""
+    return diagnosis_cache.stats()
+
+
+@router.post("/diagnosis-cache/invalidate")
+async def invalidate_diagnosis_cache(
+    admin: User = Depends(get_admin_user),
+):
+    """Drop this worker's cached diagnoses after the rule tables changed."""
+    invalidate_diagnoses()
+    return {"message": "Cache diagnosi svuotata", "rules_version": diagnosis_cache.rules_version}
+
+
+@router.get("/diagnosis/rescore")
+async def rescore_diagnoses(
+    limit: Optional[int] = Query(None, ge=1, description="Rescore only the first N requests"),
+    chunk_size: int = Query(5000, ge=100, le=50000),
+    admin: User = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Compare stored severities and initial estimates with what the current rules give."""
+    report = await rescore_requests(db, chunk_size, limit)
+    return report.to_dict()
+
+
+@router.get("/inference")
+async def inference_stats(
+    admin: User = Depends(get_admin_user),
+):
+    """Batches sent to the AI model and requests answered, failed or timed out on this worker."""
+    return inference_batcher.stats()
+
+
+@router.get("/ai-images")
+async def ai_image_stats(
+    admin: User = Depends(get_admin_user),
+):
+    """Photos shrunk for the AI model on this worker: bytes saved and processing time."""
+    return image_preprocessor.stats()
+
+
+@router.get("/media")
+async def media_stats(
+    admin: User = Depends(get_admin_user),
+):
+    """Uploads processed, rejected or failed in this worker's thumbnail pool."""
+    return media_processor.stats()
+
+
+@router.get("/media-retention")
+async def media_retention_stats(
+    admin: User = Depends(get_admin_user),
+):
+    """Media and uploads expired, and objects deleted, by this worker's retention sweeps."""
+    return media_retention.stats()
+
+
+@router.post("/media-retention/sweep")
+async def run_media_retention_sweep(
+    max_chunks: Optional[int] = Query(None, ge=1, le=1000),
+    admin: User = Depends(get_admin_user),
+):
+    """Run a retention sweep now instead of waiting for the next one."""
+    return await media_retention.sweep(max_chunks=max_chunks)
+
+
+@router.get("/signatures")
+async def signature_migration_stats(
+    admin: User = Depends(get_admin_user),
+):
+    """Inline signatures moved to the media store by this worker's background migration."""
+    return signature_migration.stats()
+
+
+@router.get("/dispatch/technicians")
+async def dispatch_technician_stats(
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=200),
+    admin: User = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Per-technician response time and acceptance rates, slowest responders first."""
+    query = (
+        select(Technician.internal_code, TechnicianStats)
+        .join(TechnicianStats, TechnicianStats.technician_id == Technician.id)
+        .order_by(TechnicianStats.ewma_response_seconds.desc().nulls_last())
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+    )
+    result = await db.execute(query)
+    day = day_number(datetime.now(timezone.utc))
+    return [{
+        "technician_id": s.technician_id,
+        "internal_code": code,
+        "offers_received": s.offers_received,
+        "offers_accepted": s.offers_accepted,
+        "offers_declined": s.offers_declined,
+        "avg_response_seconds": s.ewma_response_seconds,
+        "avg_arrival_seconds": s.ewma_arrival_seconds,
+        "acceptance_7d": acceptance_ratio(s, 7, day),
+        "acceptance_30d": acceptance_ratio(s, WINDOW_DAYS, day),
+    } for code, s in result.all()]
+
+
 @router.get("/audit-logs")
 async def list_audit_logs(
     page: int = Query(1, ge=1),
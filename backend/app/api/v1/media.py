@@ -0,0 +1,200 @@
+"""
+Media API Router
+
+Direct-to-storage uploads: the client asks for a presigned URL, PUTs the
+bytes to the object store, then confirms. Thumbnails and downscaled
+variants are generated in the background (see media_processing).
+"""
+import asyncio
+import posixpath
+import uuid
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request as HTTPRequest, Response
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from app.config import settings
+from app.database import get_db
+from app.models.user import User
+from app.models.upload import Upload, UploadState
+from app.api.v1.auth import get_current_active_user
+from app.schemas.media import UploadCreate, UploadTicket, UploadResponse
+from app.services.media_storage import FilesystemStorage, get_storage, verify_signature
+from app.services.media_processing import (
+    CONTENT_TYPES,
+    SIGNATURE_BYTES,
+    max_size_bytes,
+    media_processor,
+    upload_problem,
+)
+
+
+router = APIRouter()
+
+# Served by GET /local/{key}: uploads and the model-sized copies, never signatures
+LOCAL_PUBLIC_PREFIXES = ("uploads/", "ai/")
+
+
+async def get_own_upload(db: AsyncSession, upload_id: UUID, user: User) -> Upload:
+    result = await db.execute(
+        select(Upload).where(Upload.id == upload_id, Upload.user_id == user.id)
+    )
+    upload = result.scalar_one_or_none()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Caricamento non trovato")
+    return upload
+
+
+@router.post("/uploads", response_model=UploadTicket, status_code=status.HTTP_201_CREATED)
+async def create_upload(
+    upload_data: UploadCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Get a presigned URL to upload a photo or video.
+    
+    The bytes go straight to the object store; call /uploads/{id}/confirm
+    once the PUT succeeded.
+    """
+    content_type = upload_data.content_type.split(";")[0].strip().lower()
+    extension = CONTENT_TYPES[upload_data.type].get(content_type)
+    if extension is None:
+        raise HTTPException(status_code=400, detail=f"Tipo di file non supportato: {content_type}")
+    if upload_data.size_bytes > max_size_bytes(upload_data.type):
+        raise HTTPException(status_code=400, detail="File troppo grande")
+    
+    storage = get_storage()
+    upload_id = uuid.uuid4()
+    object_key = f"uploads/{current_user.id}/{upload_id}{extension}"
+    expires_in = settings.MEDIA_UPLOAD_URL_EXPIRE_SECONDS
+    upload_url, headers = await asyncio.to_thread(storage.presign_put, object_key, content_type, expires_in)
+    
+    upload = Upload(
+        id=upload_id,
+        user_id=current_user.id,
+        type=upload_data.type,
+        content_type=content_type,
+        object_key=object_key,
+        url=storage.public_url(object_key),
+        declared_size_bytes=upload_data.size_bytes,
+        state=UploadState.PENDING,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=settings.MEDIA_RETENTION_DAYS),
+    )
+    db.add(upload)
+    await db.commit()
+    
+    return UploadTicket(
+        id=upload.id,
+        upload_url=upload_url,
+        headers=headers,
+        url=upload.url,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=expires_in),
+    )
+
+
+@router.post("/uploads/{upload_id}/confirm", response_model=UploadResponse)
+async def confirm_upload(
+    upload_id: UUID,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Confirm an upload after the PUT.
+    
+    Size, content type and leading bytes of the stored object are checked;
+    an object that fails is deleted. Repeating the call is harmless.
+    """
+    upload = await get_own_upload(db, upload_id, current_user)
+    if upload.state == UploadState.REJECTED:
+        raise HTTPException(status_code=422, detail=upload.error)
+    if upload.state != UploadState.PENDING:
+        return upload
+    
+    storage = get_storage()
+    info = await asyncio.to_thread(storage.head, upload.object_key)
+    if info is None:
+        raise HTTPException(status_code=400, detail="File non ancora caricato")
+    head = await asyncio.to_thread(storage.read, upload.object_key, SIGNATURE_BYTES)
+    
+    problem = upload_problem(upload, info.size, info.content_type, head)
+    if problem:
+        await asyncio.to_thread(storage.delete, upload.object_key)
+        upload.state = UploadState.REJECTED
+        upload.error = problem
+        await db.commit()
+        raise HTTPException(status_code=422, detail=problem)
+    
+    upload.state = UploadState.CONFIRMED
+    upload.file_size_bytes = info.size
+    await db.commit()
+    media_processor.submit(upload.id, upload.object_key, upload.type, upload.url)
+    return upload
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadResponse)
+async def get_upload(
+    upload_id: UUID,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Get upload state (poll until processed to get the thumbnail)."""
+    return await get_own_upload(db, upload_id, current_user)
+
+
+def local_storage() -> FilesystemStorage:
+    """The filesystem backend; its routes do not exist with any other."""
+    storage = get_storage()
+    if not isinstance(storage, FilesystemStorage):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return storage
+
+
+@router.put("/local/{key:path}", status_code=status.HTTP_200_OK)
+async def put_local_object(
+    key: str,
+    http_request: HTTPRequest,
+    expires: int = Query(...),
+    signature: str = Query(...),
+):
+    """Receive a presigned PUT (filesystem backend only, for development)."""
+    storage = local_storage()
+    content_type = http_request.headers.get("content-type", "")
+    if not verify_signature(key, content_type, expires, signature):
+        raise HTTPException(status_code=403, detail="Firma non valida o scaduta")
+    
+    limit = settings.MAX_VIDEO_SIZE_MB * 1024 * 1024
+    chunks = []
+    size = 0
+    async for chunk in http_request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(status_code=413, detail="File troppo grande")
+        chunks.append(chunk)
+    try:
+        await asyncio.to_thread(storage.write, key, b"".join(chunks), content_type)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Chiave non valida")
+    return Response(status_code=status.HTTP_200_OK)
+
+
+@router.get("/local/{key:path}")
+async def get_local_object(key: str):
+    """
+    Serve a stored object (filesystem backend with DEBUG only, for development).
+    
+    Unauthenticated like a public bucket URL, so limited to LOCAL_PUBLIC_PREFIXES.
+    """
+    storage = local_storage()
+    if not settings.DEBUG or not posixpath.normpath(key).startswith(LOCAL_PUBLIC_PREFIXES):
+        raise HTTPException(status_code=404, detail="File non trovato")
+    try:
+        info = storage.head(key)
+    except ValueError:
+        info = None
+    if info is None:
+        raise HTTPException(status_code=404, detail="File non trovato")
+    return FileResponse(storage.path(key), media_type=info.content_type)
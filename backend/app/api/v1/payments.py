@@ -4,20 +4,25 @@ Payments API Router
 Handles payment creation, escrow, capture, and payouts.
 """
 from datetime import datetime, timezone
+from typing import Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Header, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.orm import selectinload
 
 from app.config import settings
 from app.database import get_db
 from app.models.user import User
 from app.models.request import Request, RequestStatus
+from app.models.quote import Quote
 from app.models.payment import Payment, PaymentStatus
 from app.models.audit_log import AuditLog, AuditAction, EntityType
 from app.api.v1.auth import get_current_active_user
+from app.services.request_transitions import apply_transition, transition_or_raise
+from app.services.request_events import publish_request_update
+from app.services.idempotency import idempotency_store
 from app.schemas.payment import (
     PaymentCreate,
     PaymentIntentResponse,
@@ -57,38 +62,76 @@ async def approve_quote(
     db: AsyncSession = Depends(get_db),
 ):
     """Client approves or rejects a quote."""
+    if approval.approved:
+        values = {"client_approved": True, "client_approved_at": datetime.now(timezone.utc)}
+    else:
+        values = {"client_rejected": True, "rejection_reason": approval.rejection_reason}
+    
     result = await db.execute(
-        select(Request).where(Request.id == request_id).options(selectinload(Request.quote))
+        update(Quote)
+        .where(
+            Quote.request_id == request_id,
+            Quote.request_id.in_(select(Request.id).where(Request.client_id == current_user.id)),
+        )
+        .values(**values)
+        .returning(Quote)
     )
-    request = result.scalar_one_or_none()
-    if not request or not request.quote:
+    quote = result.scalar_one_or_none()
+    if not quote:
+        owner = await db.execute(select(Request.client_id).where(Request.id == request_id))
+        client_id = owner.scalar_one_or_none()
+        if client_id is not None and client_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Accesso negato")
         raise HTTPException(status_code=404, detail="Non trovato")
-    if request.client_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Accesso negato")
     
-    quote = request.quote
     if approval.approved:
-        quote.client_approved = True
-        quote.client_approved_at = datetime.now(timezone.utc)
-        if request.status == RequestStatus.QUOTE_REVISION:
-            request.status = RequestStatus.IN_PROGRESS
+        # Resumes work only if a revision was pending
+        moved = await apply_transition(db, request_id, "approve_quote", current_user.id)
     else:
-        quote.client_rejected = True
-        quote.rejection_reason = approval.rejection_reason
-        request.status = RequestStatus.CANCELLED
+        moved = await transition_or_raise(db, request_id, "reject_quote", current_user.id)
     
     await db.commit()
-    await db.refresh(quote)
+    
+    delta = {"quote": {
+        "min_price": quote.min_price,
+        "max_price": quote.max_price,
+        "final_price": quote.final_price,
+        "client_approved": quote.client_approved,
+        "client_rejected": quote.client_rejected,
+    }}
+    if moved is not None:
+        delta["status"] = RequestStatus.IN_PROGRESS if approval.approved else RequestStatus.CANCELLED
+    await publish_request_update(request_id, **delta)
+    
     return QuoteResponse.model_validate(quote)
 
 
 @router.post("/create", response_model=PaymentIntentResponse)
 async def create_payment(
     payment_data: PaymentCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db),
 ):
-    """Create payment intent (holds funds in escrow)."""
+    """Create payment intent (holds funds in escrow); replayed for a repeated Idempotency-Key."""
+    return await idempotency_store.run(
+        idempotency_key,
+        "payments.create",
+        current_user.id,
+        payment_data,
+        response,
+        status.HTTP_200_OK,
+        lambda: start_payment(payment_data, current_user, db),
+    )
+
+
+async def start_payment(
+    payment_data: PaymentCreate,
+    current_user: User,
+    db: AsyncSession,
+) -> PaymentIntentResponse:
+    """Create the Payment row and the (mock) Stripe payment intent."""
     result = await db.execute(
         select(Request).where(Request.id == payment_data.request_id)
         .options(selectinload(Request.quote))
@@ -3,24 +3,30 @@ Requests API Router
 
 Handles repair request CRUD, AI analysis, and status management.
 """
-import secrets
-import string
+import asyncio
+import json
+import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Response, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, insert, func
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.config import settings
-from app.database import get_db
+from app.database import get_db, async_session
 from app.models.user import User
+from app.models.technician import Technician
 from app.models.request import Request, Media, RequestStatus, MediaType
 from app.models.quote import Quote
+from app.models.upload import Upload, UploadState
 from app.models.audit_log import AuditLog, AuditAction, EntityType
-from app.api.v1.auth import get_current_active_user
+from app.api.v1.auth import get_current_active_user, access_token_subject
 from app.schemas.request import (
     RequestCreate,
     RequestResponse,
@@ -30,37 +36,105 @@ from app.schemas.request import (
     SignatureSubmit,
 )
 from app.services.ai_diagnostic import analyze_request
-from app.services.dispatch import dispatch_technicians
+from app.services.dispatch_waves import wave_scheduler
+from app.services.technician_scoring import record_completion, record_cancellation
+from app.services.request_transitions import check_transition, transition_or_raise
+from app.services.request_events import request_events, publish_request_update, sse_messages
+from app.services.reference_codes import reference_codes
+from app.services.idempotency import idempotency_store
+from app.services.request_pipeline import request_pipeline, analysis_values, initial_quote, dispatch_stage
+from app.services.signatures import InvalidSignature, store_signature
 
 
 router = APIRouter()
 
 
-def generate_reference_code() -> str:
-    """Generate unique reference code for request."""
-    date_part = datetime.now().strftime("%Y%m%d")
-    random_part = ''.join(secrets.choice(string.ascii_uppercase) for _ in range(4))
-    return f"REQ-{date_part}-{random_part}"
+async def load_request(db: AsyncSession, request_id: UUID) -> Request:
+    """Load a request with the relations RequestResponse needs."""
+    result = await db.execute(
+        select(Request)
+        .where(Request.id == request_id)
+        .options(
+            selectinload(Request.media),
+            selectinload(Request.quote),
+            selectinload(Request.technician),
+        )
+    )
+    return result.scalar_one()
 
 
-@router.post("/", response_model=RequestResponse, status_code=status.HTTP_201_CREATED)
+@router.post("/", response_model=RequestResponse, status_code=status.HTTP_202_ACCEPTED)
 async def create_request(
     request_data: RequestCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db),
 ):
     """
     Create a new repair request.
     
-    This will:
-    1. Create the request with media
-    2. Trigger AI analysis
-    3. Generate initial quote estimate
-    4. Start technician dispatch
+    Retries carrying the same Idempotency-Key header get the first
+    response back instead of a second request.
+    """
+    return await idempotency_store.run(
+        idempotency_key,
+        "requests.create",
+        current_user.id,
+        request_data,
+        response,
+        status.HTTP_202_ACCEPTED,
+        lambda: submit_request(request_data, response, current_user, db),
+    )
+
+
+def uploaded(url: str, column, user_id: UUID):
+    """Column of the user's non-rejected upload stored at url, as a scalar subquery."""
+    return (
+        select(column)
+        .where(Upload.url == url, Upload.user_id == user_id, Upload.state != UploadState.REJECTED)
+        .scalar_subquery()
+    )
+
+
+async def submit_request(
+    request_data: RequestCreate,
+    response: Response,
+    current_user: User,
+    db: AsyncSession,
+) -> RequestResponse:
+    """
+    Store a new repair request.
+    
+    The request and its media are stored as PENDING and returned right
+    away (202); the pipeline then runs in the background:
+    1. AI analysis and initial quote estimate
+    2. Technician dispatch
+    Progress is pushed on /{id}/events and /{id}/ws, or visible via GET.
+    
+    With REQUEST_PIPELINE_MODE="inline" the analysis runs first and the
+    request, media, audit and quote are written in one transaction, already
+    DISPATCHING (201).
     """
+    inline = settings.REQUEST_PIPELINE_MODE == "inline"
+    request_id = uuid.uuid4()  # Set here so every row can reference it before the flush
+    now = datetime.now(timezone.utc)
+    
+    ai_result = None
+    if inline:
+        # Before any write, so no connection is held during the AI call
+        ai_result = await analyze_request(
+            request_id=request_id,
+            category=request_data.category,
+            description=request_data.description,
+            guided_answers=request_data.guided_answers.model_dump(),
+            media_urls=[m.url for m in request_data.media],
+        )
+    
     # Create request
     request = Request(
-        reference_code=generate_reference_code(),
+        id=request_id,
+        reference_code=reference_codes.generate(),
         client_id=current_user.id,
         category=request_data.category,
         title=request_data.title,
@@ -72,24 +146,15 @@ async def create_request(
         is_urgent=request_data.is_urgent,
         preferred_time=request_data.preferred_time,
         status=RequestStatus.PENDING,
+        quote=None,
+        technician=None,
     )
-    
+    if ai_result is not None:
+        for key, value in analysis_values(ai_result).items():
+            setattr(request, key, value)
+        request.status = RequestStatus.DISPATCHING
+        request.quote = initial_quote(request.id, ai_result)
     db.add(request)
-    await db.flush()
-    
-    # Add media
-    for media_data in request_data.media:
-        media = Media(
-            request_id=request.id,
-            type=MediaType(media_data.type),
-            url=media_data.url,
-            thumbnail_url=media_data.thumbnail_url,
-            duration_seconds=media_data.duration_seconds,
-            expires_at=datetime.now(timezone.utc) + timedelta(days=settings.MEDIA_RETENTION_DAYS),
-        )
-        db.add(media)
-    
-    await db.flush()
     
     # Audit log
     audit = AuditLog(
@@ -100,59 +165,41 @@ async def create_request(
         new_value={"category": request.category.value, "title": request.title},
     )
     db.add(audit)
+    await db.flush()
     
-    # Run AI analysis
-    ai_result = await analyze_request(
-        request_id=request.id,
-        category=request.category,
-        description=request.description,
-        guided_answers=request.guided_answers,
-        media_urls=[m.url for m in request_data.media],
-    )
-    
-    # Update request with AI results
-    request.severity = ai_result.severity
-    request.ai_confidence = ai_result.confidence
-    request.ai_diagnosis = {
-        "probable_issue": ai_result.probable_issue,
-        "safety_instructions": ai_result.safety_instructions,
-        "estimated_duration_hours": ai_result.estimated_duration_hours,
-    }
-    request.safety_instructions_shown = True
-    request.status = RequestStatus.ANALYZED
-    
-    # Create initial quote
-    quote = Quote(
-        request_id=request.id,
-        initial_min_price=ai_result.price_range.min_price,
-        initial_max_price=ai_result.price_range.max_price,
-        min_price=ai_result.price_range.min_price,
-        max_price=ai_result.price_range.max_price,
-    )
-    db.add(quote)
-    
-    await db.commit()
+    # Add media with one multi-row INSERT ... RETURNING; thumbnail and size
+    # come from the processed upload when the URL is one of ours
+    media = []
+    if request_data.media:
+        result = await db.execute(
+            insert(Media).values([
+                {
+                    "request_id": request.id,
+                    "type": MediaType(media_data.type),
+                    "url": media_data.url,
+                    "thumbnail_url": func.coalesce(
+                        uploaded(media_data.url, Upload.thumbnail_url, current_user.id),
+                        media_data.thumbnail_url,
+                    ),
+                    "file_size_bytes": uploaded(media_data.url, Upload.file_size_bytes, current_user.id),
+                    "duration_seconds": media_data.duration_seconds,
+                    "expires_at": now + timedelta(days=settings.MEDIA_RETENTION_DAYS),
+                }
+                for media_data in request_data.media
+            ]).returning(Media)
+        )
+        media = list(result.scalars().all())
+    set_committed_value(request, "media", media)
     
-    # Dispatch technicians (async task in production)
-    # For now, update status
-    request.status = RequestStatus.DISPATCHING
     await db.commit()
     
-    # Start dispatch in background
-    await dispatch_technicians(db, request.id)
-    
-    # Reload with relationships
-    result = await db.execute(
-        select(Request)
-        .where(Request.id == request.id)
-        .options(
-            selectinload(Request.media),
-            selectinload(Request.quote),
-            selectinload(Request.technician),
-        )
-    )
-    request = result.scalar_one()
+    if inline:
+        await dispatch_stage(db, request.id)
+        response.status_code = status.HTTP_201_CREATED
+    else:
+        request_pipeline.submit(request.id)
     
+    # Built from the objects just written, no reload
     return RequestResponse.model_validate(request)
 
 
@@ -227,6 +274,130 @@ async def get_request(
     return RequestResponse.model_validate(request)
 
 
+async def live_snapshot(db: AsyncSession, request_id: UUID, user_id: UUID) -> Optional[dict]:
+    """
+    Compact state of a request for the live channel, in one query.
+    
+    None unless the user is active and is the client or the assigned technician.
+    """
+    result = await db.execute(
+        select(
+            Request.status,
+            Request.estimated_arrival,
+            Request.client_id,
+            Technician.user_id,
+            Technician.internal_code,
+            Quote.min_price,
+            Quote.max_price,
+            Quote.final_price,
+            select(User.is_active).where(User.id == user_id).scalar_subquery().label("user_active"),
+        )
+        .outerjoin(Technician, Technician.id == Request.technician_id)
+        .outerjoin(Quote, Quote.request_id == Request.id)
+        .where(Request.id == request_id)
+    )
+    row = result.one_or_none()
+    if row is None or not row.user_active or user_id not in (row.client_id, row.user_id):
+        return None
+    
+    return {
+        "type": "request.snapshot",
+        "request_id": request_id,
+        "status": row.status,
+        "estimated_arrival": row.estimated_arrival,
+        "technician": {"internal_code": row.internal_code} if row.internal_code else None,
+        "quote": {
+            "min_price": row.min_price,
+            "max_price": row.max_price,
+            "final_price": row.final_price,
+        } if row.min_price is not None else None,
+    }
+
+
+async def authorize_live(request_id: UUID, token: Optional[str]) -> dict:
+    """Check the token and return the initial snapshot (401/404 otherwise)."""
+    user_id = access_token_subject(token) if token else None
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Credenziali non valide")
+    
+    # Short-lived session: no connection is held while the stream is open
+    async with async_session() as db:
+        snapshot = await live_snapshot(db, request_id, user_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Richiesta non trovata")
+    return snapshot
+
+
+@router.get("/{request_id}/events")
+async def request_events_stream(
+    request_id: UUID,
+    token: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Live status/ETA/quote updates as server-sent events.
+    
+    EventSource cannot set headers, so the access token may be passed as ?token=.
+    """
+    if token is None and authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    
+    # Subscribe first so nothing published during the snapshot query is missed
+    subscription = request_events.subscribe(request_id)
+    try:
+        snapshot = await authorize_live(request_id, token)
+    except HTTPException:
+        request_events.unsubscribe(subscription)
+        raise
+    
+    return StreamingResponse(
+        sse_messages(subscription, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/{request_id}/ws")
+async def request_events_socket(
+    websocket: WebSocket,
+    request_id: UUID,
+    token: Optional[str] = None,
+):
+    """Live status/ETA/quote updates over WebSocket (snapshot first, then deltas)."""
+    subscription = request_events.subscribe(request_id)
+    try:
+        try:
+            snapshot = await authorize_live(request_id, token)
+        except HTTPException:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        
+        await websocket.accept()
+        await websocket.send_text(json.dumps(jsonable_encoder(snapshot)))
+        
+        # Wait for deltas and for the client going away at the same time
+        receive = asyncio.ensure_future(websocket.receive())
+        try:
+            while True:
+                pending = asyncio.ensure_future(subscription.get(timeout=settings.REALTIME_HEARTBEAT_SECONDS))
+                await asyncio.wait({receive, pending}, return_when=asyncio.FIRST_COMPLETED)
+                if pending.done():
+                    message = pending.result()
+                    await websocket.send_text(message if message is not None else '{"type": "ping"}')
+                else:
+                    pending.cancel()
+                if receive.done():
+                    if receive.result()["type"] == "websocket.disconnect":
+                        break
+                    receive = asyncio.ensure_future(websocket.receive())  # Client messages are ignored
+        finally:
+            receive.cancel()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        request_events.unsubscribe(subscription)
+
+
 @router.post("/{request_id}/cancel")
 async def cancel_request(
     request_id: UUID,
@@ -234,41 +405,23 @@ async def cancel_request(
     db: AsyncSession = Depends(get_db),
 ):
     """Cancel a request (client only)."""
-    result = await db.execute(
-        select(Request).where(Request.id == request_id)
+    moved = await transition_or_raise(
+        db,
+        request_id,
+        "cancel",
+        current_user.id,
+        returning=(Request.technician_id,),
     )
-    request = result.scalar_one_or_none()
-    
-    if not request:
-        raise HTTPException(status_code=404, detail="Richiesta non trovata")
-    
-    if request.client_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Accesso negato")
-    
-    # Check if cancellation is allowed
-    if request.status in [RequestStatus.COMPLETED, RequestStatus.PAID]:
-        raise HTTPException(
-            status_code=400,
-            detail="Non puoi cancellare una richiesta completata",
-        )
     
     # Apply penalty if technician already accepted/en route
-    if request.status in [RequestStatus.ACCEPTED, RequestStatus.EN_ROUTE, RequestStatus.IN_PROGRESS]:
+    if moved.previous_status in [RequestStatus.ACCEPTED, RequestStatus.EN_ROUTE, RequestStatus.IN_PROGRESS]:
         # TODO: Apply 20% penalty (5% platform + 15% technician)
-        pass
-    
-    request.status = RequestStatus.CANCELLED
-    
-    # Audit log
-    audit = AuditLog(
-        action=AuditAction.REQUEST_CANCELLED,
-        entity_type=EntityType.REQUEST,
-        entity_id=request.id,
-        actor_id=current_user.id,
-    )
-    db.add(audit)
+        if moved.technician_id:
+            await record_cancellation(db, moved.technician_id)
     
     await db.commit()
+    wave_scheduler.cancel(request_id)
+    await publish_request_update(request_id, status=RequestStatus.CANCELLED)
     
     return {"message": "Richiesta cancellata", "penalty_applied": False}
 
@@ -288,41 +441,26 @@ async def submit_completion(
     if not current_user.technician_profile:
         raise HTTPException(status_code=403, detail="Solo tecnici possono completare lavori")
     
-    result = await db.execute(
-        select(Request)
-        .where(Request.id == request_id)
-        .options(selectinload(Request.quote))
-    )
-    request = result.scalar_one_or_none()
-    
-    if not request:
-        raise HTTPException(status_code=404, detail="Richiesta non trovata")
-    
-    if request.technician_id != current_user.technician_profile.id:
-        raise HTTPException(status_code=403, detail="Non sei assegnato a questa richiesta")
-    
-    if request.status != RequestStatus.IN_PROGRESS:
-        raise HTTPException(status_code=400, detail="La richiesta non è in corso")
-    
-    # Update completion data
-    request.completion_photos = completion.completion_photos
-    request.status = RequestStatus.COMPLETED
-    request.completed_at = datetime.now(timezone.utc)
-    request.complaint_deadline = datetime.now(timezone.utc) + timedelta(days=7)
-    
-    # Audit log
-    audit = AuditLog(
-        action=AuditAction.REQUEST_COMPLETED,
-        entity_type=EntityType.REQUEST,
-        entity_id=request.id,
-        actor_id=current_user.id,
+    technician_id = current_user.technician_profile.id
+    now = datetime.now(timezone.utc)
+    await transition_or_raise(
+        db,
+        request_id,
+        "complete",
+        technician_id,
+        audit_actor_id=current_user.id,
+        values={
+            "completion_photos": completion.completion_photos,
+            "completed_at": now,
+            "complaint_deadline": now + timedelta(days=7),
+        },
     )
-    db.add(audit)
+    await record_completion(db, technician_id)
     
     await db.commit()
-    await db.refresh(request)
+    await publish_request_update(request_id, status=RequestStatus.COMPLETED, completed_at=now)
     
-    return RequestResponse.model_validate(request)
+    return RequestResponse.model_validate(await load_request(db, request_id))
 
 
 @router.post("/{request_id}/sign", response_model=RequestResponse)
@@ -337,34 +475,23 @@ async def submit_signature(
     
     This triggers payment capture.
     """
-    result = await db.execute(
-        select(Request)
-        .where(Request.id == request_id)
-        .options(
-            selectinload(Request.media),
-            selectinload(Request.quote),
-            selectinload(Request.payment),
-        )
+    # Refused requests store nothing; the transition below still settles races
+    await check_transition(db, request_id, "sign", current_user.id)
+    try:
+        key = await asyncio.to_thread(store_signature, signature.signature_data)
+    except InvalidSignature as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    await transition_or_raise(
+        db,
+        request_id,
+        "sign",
+        current_user.id,
+        values={"client_signature_key": key},
     )
-    request = result.scalar_one_or_none()
-    
-    if not request:
-        raise HTTPException(status_code=404, detail="Richiesta non trovata")
-    
-    if request.client_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Accesso negato")
-    
-    if request.status != RequestStatus.COMPLETED:
-        raise HTTPException(status_code=400, detail="Il lavoro non è ancora completato")
-    
-    # TODO: Upload signature image to S3
-    # For now, store base64 data URL
-    request.client_signature_url = signature.signature_data
-    request.status = RequestStatus.PAID
     
     # TODO: Capture payment and transfer to technician
     
     await db.commit()
-    await db.refresh(request)
+    await publish_request_update(request_id, status=RequestStatus.PAID)
     
-    return RequestResponse.model_validate(request)
+    return RequestResponse.model_validate(await load_request(db, request_id))
@@ -10,16 +10,26 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, update, case, func
 from sqlalchemy.orm import selectinload
 
+from app.config import settings
 from app.database import get_db
 from app.models.user import User
 from app.models.technician import Technician
 from app.models.request import Request, RequestStatus
 from app.models.audit_log import AuditLog, AuditAction, EntityType
+from app.models.dispatch_offer import DispatchOffer, OfferState
+from app.models.dispatch_event import DispatchEventType
 from app.api.v1.auth import get_current_active_user
 from app.schemas.request import RequestResponse
+from app.services.dispatch import sync_technician_index, pending_offers
+from app.services.dispatch_waves import wave_scheduler
+from app.services.dispatch_telemetry import EventRecord, record_dispatch_events
+from app.services.availability import compile_schedule
+from app.services.location_buffer import location_buffer
+from app.services.request_events import publish_request_update
+from app.services.request_transitions import transition_or_raise
 
 
 router = APIRouter()
@@ -142,9 +152,14 @@ async def update_availability(
         technician.is_accepting_jobs = is_accepting_jobs
     
     if availability is not None:
+        try:
+            technician.availability_bitmap = compile_schedule(availability)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         technician.availability = availability
     
     await db.commit()
+    sync_technician_index(technician)
     
     return {
         "is_available_now": technician.is_available_now,
@@ -162,11 +177,19 @@ async def update_location(
     db: AsyncSession = Depends(get_db),
 ):
     """Update technician's current location."""
+    if settings.LOCATION_BUFFER_ENABLED:
+        # Written in bulk by the flush loop; dispatch sees it in the index right away
+        location_buffer.record(technician.id, latitude, longitude, address)
+        sync_technician_index(technician, latitude, longitude)
+        return {"message": "Posizione aggiornata"}
+    
     technician.location = f"POINT({longitude} {latitude})"
+    technician.location_updated_at = datetime.now(timezone.utc)
     if address:
         technician.current_address = address
     
     await db.commit()
+    sync_technician_index(technician, latitude, longitude)
     
     return {"message": "Posizione aggiornata"}
 
@@ -210,20 +233,26 @@ async def get_pending_requests(
     These are requests in DISPATCHING status where this technician
     was notified but hasn't responded yet.
     """
-    # TODO: Implement dispatch tracking table
-    # For now, return dispatching requests in technician's specializations
-    
-    query = select(Request).where(
-        Request.status == RequestStatus.DISPATCHING,
-        Request.technician_id.is_(None),
-        Request.category.in_([s.lower() for s in technician.specializations]),
-    ).options(
-        selectinload(Request.media),
-        selectinload(Request.quote),
-    ).order_by(Request.created_at.desc()).limit(10)
-    
-    result = await db.execute(query)
-    requests = result.scalars().all()
+    rows = await pending_offers(db, technician.id, limit=10)
+    
+    # First listing of an offer counts as "seen"
+    if rows:
+        now = datetime.now(timezone.utc)
+        seen = await db.execute(
+            update(DispatchOffer)
+            .where(
+                DispatchOffer.technician_id == technician.id,
+                DispatchOffer.request_id.in_([r.id for r in rows]),
+                DispatchOffer.seen_at.is_(None),
+            )
+            .values(seen_at=now)
+            .returning(DispatchOffer.request_id, DispatchOffer.offered_at)
+        )
+        await record_dispatch_events(db, [
+            EventRecord(DispatchEventType.SEEN, request_id, technician.id, (now - offered_at).total_seconds())
+            for request_id, offered_at in seen.all()
+        ], at=now)
+        await db.commit()
     
     # Don't show full address until accepted
     return [{
@@ -236,13 +265,14 @@ async def get_pending_requests(
         "ai_confidence": r.ai_confidence,
         "is_urgent": r.is_urgent,
         "quote": {
-            "min_price": r.quote.min_price if r.quote else None,
-            "max_price": r.quote.max_price if r.quote else None,
-        } if r.quote else None,
+            "min_price": r.min_price,
+            "max_price": r.max_price,
+        } if r.min_price is not None else None,
         "created_at": r.created_at,
+        "offer_expires_at": r.expires_at,
         # Partial address for privacy
         "area": r.address.split(",")[-2] if "," in r.address else r.address[:20],
-    } for r in requests]
+    } for r in rows]
 
 
 @router.post("/me/accept/{request_id}", response_model=RequestResponse)
@@ -256,86 +286,151 @@ async def accept_request(
     """
     Accept a pending request.
     
-    This assigns the technician and reveals the full address.
+    This assigns the technician and reveals the full address. Assignment is
+    a single conditional UPDATE, so when several notified technicians accept
+    at once exactly one wins and the others get 409 (one extra query, to
+    tell a missing request, 404, from one already taken).
     """
-    result = await db.execute(
-        select(Request)
-        .where(Request.id == request_id)
-        .options(
-            selectinload(Request.media),
-            selectinload(Request.quote),
-            selectinload(Request.client),
+    now = datetime.now(timezone.utc)
+    claimed = await db.execute(
+        update(Request)
+        .where(
+            Request.id == request_id,
+            Request.status == RequestStatus.DISPATCHING,
+            Request.technician_id.is_(None),
         )
+        .values(
+            technician_id=technician.id,
+            status=RequestStatus.ACCEPTED,
+            accepted_at=now,
+            estimated_arrival=now + timedelta(minutes=eta_minutes),
+        )
+        .returning(Request.id)
+        .execution_options(synchronize_session=False)
     )
-    request = result.scalar_one_or_none()
-    
-    if not request:
-        raise HTTPException(status_code=404, detail="Richiesta non trovata")
-    
-    if request.status != RequestStatus.DISPATCHING:
-        raise HTTPException(status_code=400, detail="Richiesta non più disponibile")
-    
-    if request.technician_id:
-        raise HTTPException(status_code=400, detail="Richiesta già assegnata")
-    
-    # Assign technician
-    request.technician_id = technician.id
-    request.status = RequestStatus.ACCEPTED
-    request.accepted_at = datetime.now(timezone.utc)
-    request.estimated_arrival = datetime.now(timezone.utc) + timedelta(minutes=eta_minutes)
+    if claimed.scalar_one_or_none() is None:
+        exists = await db.execute(select(Request.id).where(Request.id == request_id))
+        if exists.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="Richiesta non trovata")
+        raise HTTPException(status_code=409, detail="Richiesta non più disponibile")
     
     # Audit log
     audit = AuditLog(
         action=AuditAction.TECHNICIAN_ACCEPTED,
         entity_type=EntityType.REQUEST,
-        entity_id=request.id,
+        entity_id=request_id,
         actor_id=current_user.id,
         new_value={"technician_id": str(technician.id), "eta_minutes": eta_minutes},
     )
     db.add(audit)
     
+    # Close this request's open offers
+    closed = await db.execute(
+        update(DispatchOffer)
+        .where(
+            DispatchOffer.request_id == request_id,
+            DispatchOffer.state == OfferState.OFFERED,
+        )
+        .values(
+            state=case(
+                (DispatchOffer.technician_id == technician.id, OfferState.ACCEPTED),
+                else_=OfferState.WITHDRAWN,
+            ),
+            responded_at=now,
+        )
+        .returning(DispatchOffer.technician_id, DispatchOffer.offered_at)
+    )
+    offered_at = next((at for tech_id, at in closed.all() if tech_id == technician.id), None)
+    response_seconds = (now - offered_at).total_seconds() if offered_at else None
+    await record_dispatch_events(db, [
+        EventRecord(DispatchEventType.ACCEPTED, request_id, technician.id, response_seconds),
+    ], at=now)
+    
     await db.commit()
-    await db.refresh(request)
+    wave_scheduler.cancel(request_id)
     
-    # TODO: Notify client with technician info and ETA
+    result = await db.execute(
+        select(Request)
+        .where(Request.id == request_id)
+        .options(
+            selectinload(Request.media),
+            selectinload(Request.quote),
+            selectinload(Request.client),
+        )
+    )
+    request = result.scalar_one()
+    
+    await publish_request_update(
+        request_id,
+        status=RequestStatus.ACCEPTED,
+        estimated_arrival=request.estimated_arrival,
+        technician={"internal_code": technician.internal_code},
+    )
     
     return RequestResponse.model_validate(request)
 
 
-@router.post("/me/start/{request_id}")
-async def start_work(
+@router.post("/me/decline/{request_id}")
+async def decline_request(
     request_id: UUID,
     technician: Technician = Depends(get_current_technician),
-    current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db),
 ):
-    """Mark that work has started on a request."""
+    """Decline a pending offer."""
     result = await db.execute(
-        select(Request).where(Request.id == request_id)
+        update(DispatchOffer)
+        .where(
+            DispatchOffer.request_id == request_id,
+            DispatchOffer.technician_id == technician.id,
+            DispatchOffer.state == OfferState.OFFERED,
+        )
+        .values(state=OfferState.DECLINED, responded_at=func.now())
+        .returning(DispatchOffer.offered_at)
     )
-    request = result.scalar_one_or_none()
+    offered_at = result.scalar_one_or_none()
     
-    if not request:
-        raise HTTPException(status_code=404, detail="Richiesta non trovata")
+    if offered_at is None:
+        raise HTTPException(status_code=404, detail="Offerta non trovata")
     
-    if request.technician_id != technician.id:
-        raise HTTPException(status_code=403, detail="Non sei assegnato a questa richiesta")
+    now = datetime.now(timezone.utc)
+    await record_dispatch_events(db, [
+        EventRecord(DispatchEventType.DECLINED, request_id, technician.id, (now - offered_at).total_seconds()),
+    ], at=now)
     
-    if request.status not in [RequestStatus.ACCEPTED, RequestStatus.EN_ROUTE]:
-        raise HTTPException(status_code=400, detail="Stato non valido per iniziare")
-    
-    request.status = RequestStatus.IN_PROGRESS
+    await db.commit()
     
-    # Audit
-    audit = AuditLog(
-        action=AuditAction.TECHNICIAN_ARRIVED,
-        entity_type=EntityType.REQUEST,
-        entity_id=request.id,
-        actor_id=current_user.id,
+    return {"message": "Offerta rifiutata"}
+
+
+@router.post("/me/start/{request_id}")
+async def start_work(
+    request_id: UUID,
+    technician: Technician = Depends(get_current_technician),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Mark that work has started on a request."""
+    moved = await transition_or_raise(
+        db,
+        request_id,
+        "start",
+        technician.id,
+        audit_actor_id=current_user.id,
+        returning=(Request.accepted_at,),
     )
-    db.add(audit)
+    
+    now = datetime.now(timezone.utc)
+    await record_dispatch_events(db, [
+        EventRecord(
+            DispatchEventType.ARRIVED,
+            request_id,
+            technician.id,
+            (now - moved.accepted_at).total_seconds() if moved.accepted_at else None,
+        ),
+    ], at=now)
     
     await db.commit()
+    await publish_request_update(request_id, status=RequestStatus.IN_PROGRESS)
     
     return {"message": "Lavoro iniziato"}
 
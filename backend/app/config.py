@@ -3,7 +3,7 @@ Pronto Casa - Configuration
 
 Environment-based settings using Pydantic.
 """
-from typing import List
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -52,10 +52,33 @@ class Settings(BaseSettings):
     AWS_SECRET_ACCESS_KEY: str = ""
     AWS_REGION: str = "eu-south-1"
     S3_BUCKET_NAME: str = "prontocasa-media"
+    S3_ENDPOINT_URL: str = ""  # S3-compatible stand-in (e.g. MinIO at http://localhost:9000); empty for AWS
     
     # OpenAI (AI Diagnosis)
     OPENAI_API_KEY: str = ""
     
+    # Diagnosis cache
+    DIAGNOSIS_CACHE_ENABLED: bool = True
+    DIAGNOSIS_CACHE_SIZE: int = 5000  # Diagnoses kept per worker
+    DIAGNOSIS_CACHE_TTL_SECONDS: float = 6 * 3600
+    DIAGNOSIS_CACHE_BACKEND: str = "memory"  # "memory" (per worker) or "redis" (shared)
+    
+    # AI inference batching
+    AI_INFERENCE_BACKEND: str = "rules"  # 'rules' (built-in estimate) or 'http' (batched calls to the model server)
+    AI_INFERENCE_URL: str = ""  # Batch endpoint of the model server
+    AI_INFERENCE_BATCH_WINDOW_MS: float = 25.0  # Wait this long for more requests after the first
+    AI_INFERENCE_BATCH_MAX_SIZE: int = 16
+    AI_INFERENCE_CONCURRENCY: int = 4  # Batches in flight to the model server
+    AI_INFERENCE_DEADLINE_SECONDS: float = 8.0  # Per request; the rule-based estimate is used after this
+    AI_IMAGE_PREPROCESS_ENABLED: bool = True  # Send model-sized copies of photos instead of the originals
+    AI_IMAGE_MAX_SIDE: int = 1024  # Longest side sent to the vision model, pixels
+    AI_IMAGE_FORMAT: str = "webp"  # 'webp' or 'jpeg'
+    AI_IMAGE_QUALITY: int = 80
+    AI_IMAGE_WORKERS: int = 2  # Processes decoding and re-encoding photos
+    AI_IMAGE_TIMEOUT_SECONDS: float = 5.0  # Per photo; the original URL is sent after this
+    AI_IMAGE_CACHE_SIZE: int = 10000  # Prepared images remembered per worker, by source URL
+    AI_IMAGE_CACHE_TTL_SECONDS: int = 6 * 3600
+    
     # Google Maps
     GOOGLE_MAPS_API_KEY: str = ""
     
@@ -75,12 +98,104 @@ class Settings(BaseSettings):
     MEDIA_RETENTION_DAYS: int = 10  # Auto-delete after 10 days
     MAX_PHOTOS_PER_REQUEST: int = 5
     MAX_VIDEO_DURATION_SECONDS: int = 10
+    MEDIA_STORAGE_BACKEND: str = "s3"  # 's3' (presigned PUT to the bucket) or 'filesystem' (local dev and tests)
+    MEDIA_FILESYSTEM_ROOT: str = "./media"
+    MEDIA_PUBLIC_BASE_URL: str = ""  # CDN in front of the objects; empty uses the bucket / local route URL
+    MEDIA_UPLOAD_URL_EXPIRE_SECONDS: int = 900  # Validity of a presigned PUT URL
+    MEDIA_SIGNING_SECRET: str = "media-signing-key-change-in-production"  # HMAC of filesystem-backend PUT URLs
+    MAX_PHOTO_SIZE_MB: int = 15
+    MAX_VIDEO_SIZE_MB: int = 100
+    MEDIA_THUMBNAIL_SIZE: int = 320  # Longest side, pixels
+    MEDIA_VARIANT_MAX_SIDE: int = 1600  # Downscaled EXIF-free copy used by the app and the AI
+    MEDIA_PROCESS_WORKERS: int = 2  # Processes generating thumbnails and variants
+    MEDIA_RETENTION_SWEEP_ENABLED: bool = True  # Delete expired media and their objects
+    MEDIA_RETENTION_SWEEP_SECONDS: int = 300  # Pause between sweeps
+    MEDIA_RETENTION_CHUNK_SIZE: int = 1000  # Rows claimed and expired per chunk
+    MEDIA_RETENTION_CLAIM_SECONDS: int = 900  # Other sweeps skip claimed rows this long; failed ones retry after
+    MEDIA_RETENTION_MAX_CHUNKS: int = 100  # Per sweep; the rest waits for the next one
+    
+    # Client signatures
+    SIGNATURE_MAX_BYTES: int = 2 * 1024 * 1024  # Decoded image; larger payloads are refused while decoding
+    SIGNATURE_MAX_SIDE: int = 1200  # Longest side of the stored PNG, pixels
+    SIGNATURE_COLORS: int = 64  # Palette of the stored PNG (ink, background, antialiasing)
+    SIGNATURE_MIGRATION_ENABLED: bool = True  # Move inline signatures of old rows to the store at startup
+    SIGNATURE_MIGRATION_BATCH_SIZE: int = 100  # Rows locked and moved per transaction
+    SIGNATURE_MIGRATION_PAUSE_SECONDS: float = 1.0  # Between batches, to leave room for live traffic
+    
+    # Reference codes
+    REFERENCE_CODE_WORKER_ID: Optional[int] = None  # 0-1023, unique per process; None leases one at startup
+    
+    # Idempotency keys (POST /requests/, POST /payments/create)
+    IDEMPOTENCY_TTL_HOURS: int = 24  # How long a recorded response is replayed
+    IDEMPOTENCY_LOCK_SECONDS: float = 60.0  # An attempt not heartbeating for this long can be taken over
+    IDEMPOTENCY_WAIT_SECONDS: float = 30.0  # Max wait of a duplicate for the first attempt
+    IDEMPOTENCY_POLL_SECONDS: float = 0.2  # Poll interval while another worker holds the key
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_CACHE_BACKEND: str = "memory"  # 'memory' (per worker) or 'redis' (shared)
+    IDEMPOTENCY_PURGE_ENABLED: bool = True  # Delete expired keys
+    IDEMPOTENCY_PURGE_SECONDS: int = 3600  # Pause between purges
+    IDEMPOTENCY_PURGE_BATCH_SIZE: int = 5000  # Rows deleted per transaction
+    
+    # Request pipeline (analysis, quote and dispatch after creation)
+    REQUEST_PIPELINE_MODE: str = "async"  # 'async' (202, background workers) or 'inline' (before responding)
+    REQUEST_PIPELINE_WORKERS: int = 4
+    REQUEST_PIPELINE_MAX_ATTEMPTS: int = 5
+    REQUEST_PIPELINE_RETRY_SECONDS: float = 1.0  # Doubled after every failed attempt
+    REQUEST_PIPELINE_RECOVER_AFTER_SECONDS: int = 300  # Untouched for this long = abandoned (> a job with its retries)
+    REQUEST_PIPELINE_RECOVER_SECONDS: int = 60  # Pause between scans for abandoned requests
     
     # Dispatch settings
     MAX_TECHNICIANS_TO_NOTIFY: int = 5
+    DISPATCH_SEARCH_RADII_KM: List[float] = [5.0, 10.0, 20.0, 40.0, 80.0]  # Expanding search rings
+    TECHNICIAN_INDEX_ENABLED: bool = True  # In-process first-stage candidate index
+    TECHNICIAN_INDEX_CELL_DEG: float = 0.1  # Grid cell size (~11 km of latitude)
+    TECHNICIAN_INDEX_RESYNC_SECONDS: int = 60  # Periodic full reload from the DB
+    DISPATCH_OFFER_TTL_SECONDS: int = 300  # Offer visible in /me/pending for 5 minutes
+    DISPATCH_WAVES_ENABLED: bool = True
+    DISPATCH_WAVE_TIMEOUT_SECONDS: int = 90  # Escalate if nobody accepts within this time
+    DISPATCH_MAX_WAVES: int = 3
+    DISPATCH_WAVE_RADIUS_FACTOR: float = 2.0  # Search rings grow by this factor each wave
+    DISPATCH_RELAX_SPECIALIZATION_WAVE: int = 3  # From this wave any specialization is accepted
+    DISPATCH_WAVE_TICK_SECONDS: float = 0.5
+    DISPATCH_MODE: str = "greedy"  # 'greedy' (per request) or 'batch' (windowed assignment)
+    DISPATCH_BATCH_WINDOW_MS: int = 300
+    DISPATCH_BATCH_MAX_REQUESTS: int = 200
+    DISPATCH_BATCH_CANDIDATES_PER_REQUEST: int = 20
+    DISPATCH_COST_DISTANCE_WEIGHT: float = 1.0
+    DISPATCH_COST_RATING_WEIGHT: float = 0.3
+    DISPATCH_COST_SPECIALIZATION_PENALTY: float = 2.0
+    DISPATCH_COST_OPEN_OFFER_PENALTY: float = 0.25  # Per offer a technician is already holding
+    AVAILABILITY_TIMEZONE: str = "Europe/Rome"  # Wall-clock zone of technician weekly schedules
+    LOCATION_BUFFER_ENABLED: bool = True  # Coalesce GPS pings in memory, write them in bulk
+    LOCATION_FLUSH_SECONDS: float = 5.0
     QUOTE_REVISION_THRESHOLD_PERCENT: float = 40.0  # Require explanation if > 40%
     CANCELLATION_PENALTY_PERCENT: float = 20.0  # 5% app + 15% technician
     
+    # Live request updates (WebSocket / SSE)
+    REALTIME_BACKEND: str = "memory"  # 'memory' (single worker) or 'redis' (pub/sub across workers)
+    REALTIME_SUBSCRIBER_BUFFER: int = 32  # Deltas kept per slow subscriber before dropping the oldest
+    REALTIME_HEARTBEAT_SECONDS: float = 15.0
+    
+    # Notification settings
+    NOTIFY_CHANNELS: List[str] = ["push", "whatsapp", "sms"]  # Preferred channel order
+    NOTIFY_PUSH_CONCURRENCY: int = 4  # Concurrent multicast calls to FCM
+    NOTIFY_SMS_CONCURRENCY: int = 16
+    NOTIFY_WHATSAPP_CONCURRENCY: int = 16
+    NOTIFY_ATTEMPT_TIMEOUT_SECONDS: float = 5.0
+    NOTIFY_MAX_ATTEMPTS: int = 3
+    NOTIFY_RETRY_BASE_SECONDS: float = 0.2  # Exponential backoff with full jitter
+    NOTIFY_RETRY_MAX_SECONDS: float = 2.0
+    
+    # Technician scoring (weighted ranking of dispatch candidates)
+    SCORE_WEIGHT_RATING: float = 1.0
+    SCORE_WEIGHT_EXPERIENCE: float = 0.3  # log-scaled completed jobs
+    SCORE_WEIGHT_ACCEPTANCE: float = 0.8
+    SCORE_WEIGHT_RESPONSE: float = 0.5  # Faster average response scores higher
+    SCORE_WEIGHT_CANCELLATION: float = 1.0  # Subtracted
+    SCORE_WEIGHT_DISTANCE: float = 1.5  # Subtracted, distance / largest search ring
+    DISPATCH_RANK_POOL_FACTOR: int = 4  # Candidates fetched per offer slot before ranking
+    TELEMETRY_EWMA_ALPHA: float = 0.2  # Weight of the newest sample in response/arrival averages
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
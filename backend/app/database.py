@@ -37,7 +37,7 @@ async def init_db():
     """Initialize database tables."""
     async with engine.begin() as conn:
         # Import all models to register them
-        from app.models import user, technician, request, quote, payment, audit_log  # noqa
+        from app.models import user, technician, request, quote, payment, audit_log, dispatch_offer, technician_stats, dispatch_event, idempotency_key, upload  # noqa
         await conn.run_sync(Base.metadata.create_all)
 
 
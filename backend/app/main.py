@@ -3,20 +3,100 @@ Pronto Casa - Main FastAPI Application
 
 Entry point for the Pronto Casa backend API.
 """
+import asyncio
+import contextlib
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import settings
-from app.database import init_db
-from app.api.v1 import auth, requests, technicians, payments, admin
+from app.database import init_db, async_session
+from app.api.v1 import auth, requests, technicians, payments, admin, media
+from app.services.dispatch import resync_technician_index, recover_dispatch_waves, dispatch_wave
+from app.services.batch_dispatch import batch_dispatcher
+from app.services.dispatch_waves import wave_scheduler
+from app.services.technician_scoring import technician_scores
+from app.services.location_buffer import location_buffer
+from app.services.request_events import request_events
+from app.services.request_pipeline import request_pipeline
+from app.services.reference_codes import reference_codes
+from app.services.idempotency import idempotency_store
+from app.services.diagnosis_cache import diagnosis_cache
+from app.services.inference_batcher import inference_batcher
+from app.services.media_processing import media_processor
+from app.services.media_retention import media_retention
+from app.services.image_preprocessing import image_preprocessor
+from app.services.signatures import signature_migration
+
+
+async def resync_technician_index_periodically():
+    """Reload the technician index and scores so changes made by other workers show up."""
+    while True:
+        await asyncio.sleep(settings.TECHNICIAN_INDEX_RESYNC_SECONDS)
+        try:
+            async with async_session() as db:
+                if settings.TECHNICIAN_INDEX_ENABLED:
+                    await resync_technician_index(db)
+                await technician_scores.resync(db)
+        except Exception as exc:  # keep the loop alive, dispatch falls back to SQL
+            print(f"[DISPATCH] Technician index resync failed: {exc}")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize and cleanup application resources."""
     await init_db()
+    
+    async with async_session() as db:
+        if settings.REFERENCE_CODE_WORKER_ID is None:
+            await reference_codes.lease_worker_id(db)
+        if settings.TECHNICIAN_INDEX_ENABLED:
+            await resync_technician_index(db)
+        await technician_scores.resync(db)
+    background = [asyncio.create_task(resync_technician_index_periodically())]
+    if settings.DISPATCH_MODE == "batch":
+        batch_dispatcher.start()
+    if settings.LOCATION_BUFFER_ENABLED:
+        location_buffer.start()
+    await request_events.start()
+    idempotency_store.start()
+    diagnosis_cache.start()
+    if settings.AI_INFERENCE_BACKEND == "http":
+        inference_batcher.start()
+        if settings.AI_IMAGE_PREPROCESS_ENABLED:
+            image_preprocessor.start()  # The rule engine does not look at the photos
+    media_processor.start()
+    async with async_session() as db:
+        await media_processor.recover(db)
+    if settings.MEDIA_RETENTION_SWEEP_ENABLED:
+        media_retention.start()
+    if settings.SIGNATURE_MIGRATION_ENABLED:
+        signature_migration.start()
+    if settings.DISPATCH_WAVES_ENABLED:
+        async with async_session() as db:
+            await recover_dispatch_waves(db)
+        wave_scheduler.start(dispatch_wave)
+    if settings.REQUEST_PIPELINE_MODE == "async":
+        request_pipeline.start()
+    
     yield
+    
+    await request_pipeline.stop()
+    await inference_batcher.stop()
+    await image_preprocessor.stop()
+    await media_processor.stop()
+    await media_retention.stop()
+    await signature_migration.stop()
+    await wave_scheduler.stop()
+    await batch_dispatcher.stop()
+    await location_buffer.stop()
+    await request_events.stop()
+    await idempotency_store.stop()
+    await diagnosis_cache.stop()
+    for task in background:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
 
 
 app = FastAPI(
@@ -40,6 +120,7 @@ app.include_router(auth.router, prefix="/api/v1/auth", tags=["Autenticazione"])
 app.include_router(requests.router, prefix="/api/v1/requests", tags=["Richieste"])
 app.include_router(technicians.router, prefix="/api/v1/technicians", tags=["Tecnici"])
 app.include_router(payments.router, prefix="/api/v1/payments", tags=["Pagamenti"])
+app.include_router(media.router, prefix="/api/v1/media", tags=["Media"])
 app.include_router(admin.router, prefix="/api/v1/admin", tags=["Admin"])
 
 
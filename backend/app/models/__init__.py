@@ -5,6 +5,11 @@ from app.models.request import Request, Media
 from app.models.quote import Quote
 from app.models.payment import Payment
 from app.models.audit_log import AuditLog
+from app.models.dispatch_offer import DispatchOffer
+from app.models.technician_stats import TechnicianStats
+from app.models.dispatch_event import DispatchEvent
+from app.models.idempotency_key import IdempotencyKey
+from app.models.upload import Upload
 
 __all__ = [
     "User",
@@ -14,4 +19,9 @@ __all__ = [
     "Quote",
     "Payment",
     "AuditLog",
+    "DispatchOffer",
+    "TechnicianStats",
+    "DispatchEvent",
+    "IdempotencyKey",
+    "Upload",
 ]
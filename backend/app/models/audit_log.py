@@ -117,8 +117,8 @@ class AuditLog(Base):
     old_value: Mapped[Optional[dict]] = mapped_column(JSONB, nullable=True)
     new_value: Mapped[Optional[dict]] = mapped_column(JSONB, nullable=True)
     
-    # Additional context
-    metadata: Mapped[dict] = mapped_column(JSONB, default={})
+    # Additional context ("metadata" is reserved by the declarative API)
+    extra_metadata: Mapped[dict] = mapped_column("metadata", JSONB, default={})
     
     # Timestamp (immutable)
     created_at: Mapped[datetime] = mapped_column(
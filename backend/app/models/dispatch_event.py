@@ -0,0 +1,67 @@
+"""
+Dispatch Event Model
+
+Append-only stream of what happened to each offer, for technician telemetry.
+"""
+import uuid
+from datetime import datetime
+from typing import Optional
+from enum import Enum
+from sqlalchemy import DateTime, Float, ForeignKey, Index, func, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class DispatchEventType(str, Enum):
+    """Steps of an offer, from the technician's point of view."""
+    OFFERED = "offered"      # Offer sent
+    SEEN = "seen"            # Offer shown in /me/pending
+    ACCEPTED = "accepted"    # Technician took the job
+    DECLINED = "declined"    # Technician refused
+    ARRIVED = "arrived"      # Technician on site (work started)
+
+
+class DispatchEvent(Base):
+    """One dispatch event. Rows are never updated."""
+    
+    __tablename__ = "dispatch_events"
+    __table_args__ = (
+        Index("ix_dispatch_events_technician_time", "technician_id", "occurred_at"),
+    )
+    
+    # Primary key
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        default=uuid.uuid4,
+    )
+    
+    # Request and technician
+    request_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("requests.id", ondelete="CASCADE"),
+        index=True,
+    )
+    technician_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("technicians.id", ondelete="CASCADE"),
+    )
+    
+    # Event
+    type: Mapped[DispatchEventType] = mapped_column(
+        SQLEnum(DispatchEventType, name="dispatch_event_type"),
+    )
+    latency_seconds: Mapped[Optional[float]] = mapped_column(
+        Float,
+        nullable=True,
+    )  # Offer -> seen/accepted/declined, acceptance -> arrival
+    
+    occurred_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+    )
+    
+    def __repr__(self) -> str:
+        return f"<DispatchEvent {self.type.value} {self.request_id} -> {self.technician_id}>"
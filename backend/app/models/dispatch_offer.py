@@ -0,0 +1,94 @@
+"""
+Dispatch Offer Model
+
+Tracks which technicians were offered a request, in which wave, and how they responded.
+"""
+import uuid
+from datetime import datetime
+from typing import Optional, TYPE_CHECKING
+from enum import Enum
+from sqlalchemy import DateTime, Integer, ForeignKey, Index, UniqueConstraint, func, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.database import Base
+
+if TYPE_CHECKING:
+    from app.models.request import Request
+    from app.models.technician import Technician
+
+
+class OfferState(str, Enum):
+    """Lifecycle of a single offer."""
+    OFFERED = "offered"        # Notified, awaiting response
+    ACCEPTED = "accepted"      # This technician took the job
+    DECLINED = "declined"      # Technician refused
+    EXPIRED = "expired"        # No response before expires_at
+    WITHDRAWN = "withdrawn"    # Another technician accepted / request cancelled
+
+
+class DispatchOffer(Base):
+    """A job offer sent to one technician."""
+    
+    __tablename__ = "dispatch_offers"
+    __table_args__ = (
+        UniqueConstraint("request_id", "technician_id", name="uq_dispatch_offers_request_technician"),
+        # Covering index for the technician's pending feed (index-only scan)
+        Index(
+            "ix_dispatch_offers_pending",
+            "technician_id",
+            "state",
+            "expires_at",
+            postgresql_include=["request_id", "offered_at"],
+        ),
+    )
+    
+    # Primary key
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        default=uuid.uuid4,
+    )
+    
+    # Request and technician
+    request_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("requests.id", ondelete="CASCADE"),
+    )  # Leading column of uq_dispatch_offers_request_technician
+    technician_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("technicians.id", ondelete="CASCADE"),
+    )
+    
+    # Dispatch wave (1 = first batch of candidates)
+    wave: Mapped[int] = mapped_column(Integer, default=1)
+    
+    # State
+    state: Mapped[OfferState] = mapped_column(
+        SQLEnum(OfferState, name="offer_state"),
+        default=OfferState.OFFERED,
+    )
+    
+    # Timestamps
+    offered_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+    )
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+    )
+    seen_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True,
+    )  # First time the offer was listed in /me/pending
+    responded_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True,
+    )
+    
+    # Relationships
+    request: Mapped["Request"] = relationship("Request")
+    technician: Mapped["Technician"] = relationship("Technician")
+    
+    def __repr__(self) -> str:
+        return f"<DispatchOffer {self.request_id} -> {self.technician_id} ({self.state.value})>"
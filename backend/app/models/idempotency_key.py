@@ -0,0 +1,45 @@
+"""
+Idempotency Key Model
+
+First response to a client-supplied Idempotency-Key, replayed to retries.
+"""
+import uuid
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import String, Integer, DateTime, ForeignKey, func
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class IdempotencyKey(Base):
+    """One key of one user on one endpoint. status_code is NULL while in progress."""
+    
+    __tablename__ = "idempotency_keys"
+    
+    # Keys are scoped per user and endpoint
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    endpoint: Mapped[str] = mapped_column(String(50), primary_key=True)  # e.g. "requests.create"
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    
+    # SHA-256 of the request body: the same key with another body is rejected
+    request_hash: Mapped[str] = mapped_column(String(64))
+    
+    # Recorded response
+    status_code: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    response_body: Mapped[Optional[dict]] = mapped_column(JSONB, nullable=True)
+    
+    # Timestamps
+    locked_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+    )  # When the current attempt claimed the key
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+    
+    def __repr__(self) -> str:
+        return f"<IdempotencyKey {self.endpoint} {self.key}>"
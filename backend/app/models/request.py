@@ -7,7 +7,7 @@ import uuid
 from datetime import datetime
 from typing import Optional, List, TYPE_CHECKING
 from enum import Enum
-from sqlalchemy import String, Boolean, DateTime, Text, Integer, ForeignKey, func, Enum as SQLEnum
+from sqlalchemy import String, Boolean, DateTime, Text, Integer, ForeignKey, Index, Sequence, func, text, Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from geoalchemy2 import Geography
@@ -54,10 +54,22 @@ class Category(str, Enum):
     GENERAL = "general"             # Riparazioni generiche
 
 
+# Hands out reference-code worker ids to processes at startup
+REFERENCE_WORKER_SEQUENCE = Sequence("reference_code_worker_seq", metadata=Base.metadata)
+
+
 class Request(Base):
     """Repair request model."""
     
     __tablename__ = "requests"
+    __table_args__ = (
+        # Signature migration: only rows still holding an inline data URL
+        Index(
+            "ix_requests_signature_legacy",
+            "id",
+            postgresql_where=text("client_signature_url IS NOT NULL"),
+        ),
+    )
     
     # Primary key
     id: Mapped[uuid.UUID] = mapped_column(
@@ -71,7 +83,7 @@ class Request(Base):
         String(20),
         unique=True,
         index=True,
-    )  # e.g., "REQ-20260120-ABCD"
+    )  # e.g., "REQ-06JJS6-9NG0M00" (see services/reference_codes.py)
     
     # Client
     client_id: Mapped[uuid.UUID] = mapped_column(
@@ -167,7 +179,14 @@ class Request(Base):
         JSONB,
         default=[],
     )  # Max 5 photos
-    client_signature_url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    client_signature_key: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # Object in the media store
+    # Inline data URLs of rows signed before client_signature_key; emptied by SignatureMigration
+    legacy_signature: Mapped[Optional[str]] = mapped_column(
+        "client_signature_url",
+        String(500),
+        nullable=True,
+        deferred=True,
+    )
     
     # Complaint window (7 days after completion)
     complaint_deadline: Mapped[Optional[datetime]] = mapped_column(
@@ -237,6 +256,14 @@ class Media(Base):
     """Media files attached to requests."""
     
     __tablename__ = "request_media"
+    __table_args__ = (
+        # Retention sweep: only media still to delete, oldest expiry first
+        Index(
+            "ix_request_media_expires_due",
+            "expires_at",
+            postgresql_where=text("NOT is_deleted"),
+        ),
+    )
     
     # Primary key
     id: Mapped[uuid.UUID] = mapped_column(
@@ -256,7 +283,7 @@ class Media(Base):
     type: Mapped[MediaType] = mapped_column(
         SQLEnum(MediaType, name="media_type"),
     )
-    url: Mapped[str] = mapped_column(String(500))
+    url: Mapped[str] = mapped_column(String(500), index=True)  # Matched against uploads.url
     thumbnail_url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
     
     # Metadata
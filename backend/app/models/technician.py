@@ -6,12 +6,13 @@ Extended profile for technician users.
 import uuid
 from datetime import datetime
 from typing import Optional, List, TYPE_CHECKING
-from sqlalchemy import String, Boolean, DateTime, Float, Integer, Text, ForeignKey, func
+from sqlalchemy import String, Boolean, DateTime, Float, Integer, LargeBinary, Text, ForeignKey, Index, func, text, Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import UUID, ARRAY, JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from geoalchemy2 import Geography
 
 from app.database import Base
+from app.models.request import Category
 
 if TYPE_CHECKING:
     from app.models.user import User
@@ -22,6 +23,23 @@ class Technician(Base):
     """Technician profile with specializations and availability."""
     
     __tablename__ = "technicians"
+    __table_args__ = (
+        # KNN / ST_DWithin index used by dispatch, restricted to dispatchable technicians
+        Index(
+            "ix_technicians_location_dispatchable",
+            "location",
+            postgresql_using="gist",
+            postgresql_where=text(
+                "is_active AND is_available_now AND is_accepting_jobs AND is_verified"
+            ),
+        ),
+        # Containment / overlap (@>, &&) filters on specializations
+        Index(
+            "ix_technicians_specializations",
+            "specializations",
+            postgresql_using="gin",
+        ),
+    )
     
     # Primary key
     id: Mapped[uuid.UUID] = mapped_column(
@@ -44,11 +62,11 @@ class Technician(Base):
         index=True,
     )
     
-    # Specializations
-    specializations: Mapped[List[str]] = mapped_column(
-        ARRAY(String),
+    # Specializations (same enum type as Request.category)
+    specializations: Mapped[List[Category]] = mapped_column(
+        ARRAY(SQLEnum(Category, name="request_category")),
         default=[],
-    )  # ['idraulica', 'elettricità', 'serrature', 'caldaie', 'elettrodomestici']
+    )  # [Category.PLUMBING, Category.HVAC, ...]
     
     # Bio and description
     bio: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
@@ -64,10 +82,15 @@ class Technician(Base):
     # Location (PostGIS geography for distance queries)
     # Note: Requires PostGIS extension
     location: Mapped[Optional[str]] = mapped_column(
-        Geography(geometry_type='POINT', srid=4326),
+        Geography(geometry_type='POINT', srid=4326, spatial_index=False),
         nullable=True,
     )
     
+    location_updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True),
+        nullable=True,
+    )  # Time of the GPS ping that produced `location`
+    
     # Last known address (for display)
     current_address: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
     
@@ -76,6 +99,10 @@ class Technician(Base):
         JSONB,
         default={},
     )  # {"mon": ["09:00-18:00"], "tue": ["09:00-18:00"], ...}
+    availability_bitmap: Mapped[Optional[bytes]] = mapped_column(
+        LargeBinary,
+        nullable=True,
+    )  # Compiled schedule, 672 bits (15-minute slots from Monday 00:00); NULL = anytime
     
     is_available_now: Mapped[bool] = mapped_column(Boolean, default=True)
     is_accepting_jobs: Mapped[bool] = mapped_column(Boolean, default=True)
@@ -118,4 +145,4 @@ class Technician(Base):
     )
     
     def __repr__(self) -> str:
-        return f"<Technician {self.internal_code} - {', '.join(self.specializations)}>"
+        return f"<Technician {self.internal_code} - {', '.join(s.value for s in self.specializations)}>"
@@ -0,0 +1,78 @@
+"""
+Technician Stats Model
+
+Per-technician counters behind the dispatch ranking, updated incrementally.
+"""
+import uuid
+from datetime import datetime
+from typing import List, Optional, TYPE_CHECKING
+from sqlalchemy import DateTime, Float, Integer, ForeignKey, func
+from sqlalchemy.dialects.postgresql import UUID, ARRAY
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.database import Base
+
+if TYPE_CHECKING:
+    from app.models.technician import Technician
+
+
+# Upper bounds (seconds) of the response-time histogram buckets; the last one is open
+RESPONSE_BUCKET_BOUNDS = [10, 20, 30, 45, 60, 90, 120, 180, 240, 300, 450, 600, 900, 1800, 3600]
+
+# Days kept in the rolling offer/accept rings
+WINDOW_DAYS = 30
+
+
+def empty_response_histogram() -> List[int]:
+    return [0] * (len(RESPONSE_BUCKET_BOUNDS) + 1)
+
+
+def empty_window() -> List[int]:
+    return [0] * WINDOW_DAYS
+
+
+class TechnicianStats(Base):
+    """Acceptance, response-time and cancellation counters of a technician."""
+    
+    __tablename__ = "technician_stats"
+    
+    # One row per technician
+    technician_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("technicians.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    
+    # Offers
+    offers_received: Mapped[int] = mapped_column(Integer, default=0)
+    offers_accepted: Mapped[int] = mapped_column(Integer, default=0)
+    offers_declined: Mapped[int] = mapped_column(Integer, default=0)
+    
+    # Jobs
+    jobs_completed: Mapped[int] = mapped_column(Integer, default=0)
+    jobs_cancelled: Mapped[int] = mapped_column(Integer, default=0)  # Cancelled after acceptance
+    
+    # Seconds from offer to acceptance, bucketed by RESPONSE_BUCKET_BOUNDS
+    response_histogram: Mapped[List[int]] = mapped_column(
+        ARRAY(Integer),
+        default=empty_response_histogram,
+    )
+    
+    # Rolling aggregates, maintained per dispatch event
+    ewma_response_seconds: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # Offer -> accept
+    ewma_arrival_seconds: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # Accept -> on site
+    window_day: Mapped[int] = mapped_column(Integer, default=0)  # UTC day number of the newest ring slot
+    daily_offers: Mapped[List[int]] = mapped_column(ARRAY(Integer), default=empty_window)  # Slot = day % WINDOW_DAYS
+    daily_accepts: Mapped[List[int]] = mapped_column(ARRAY(Integer), default=empty_window)
+    
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+    
+    # Relationships
+    technician: Mapped["Technician"] = relationship("Technician")
+    
+    def __repr__(self) -> str:
+        return f"<TechnicianStats {self.technician_id} {self.offers_accepted}/{self.offers_received}>"
@@ -0,0 +1,76 @@
+"""
+Upload Model
+
+Photos and videos uploaded by clients straight to the object store, before
+they are attached to a request.
+"""
+import uuid
+from datetime import datetime
+from typing import Optional
+from enum import Enum
+from sqlalchemy import String, Integer, DateTime, ForeignKey, func, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+from app.models.request import MediaType
+
+
+class UploadState(str, Enum):
+    """Upload lifecycle."""
+    PENDING = "pending"        # Presigned URL issued, bytes not confirmed yet
+    CONFIRMED = "confirmed"    # Object checked (size, type), variants being generated
+    PROCESSED = "processed"    # Thumbnail and downscaled variant ready
+    REJECTED = "rejected"      # Failed the checks or could not be decoded; object deleted
+
+
+class Upload(Base):
+    """One object uploaded through a presigned PUT URL."""
+    
+    __tablename__ = "uploads"
+    
+    # Primary key
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        default=uuid.uuid4,
+    )
+    
+    # FK to uploader
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        index=True,
+    )
+    
+    # Object
+    type: Mapped[MediaType] = mapped_column(SQLEnum(MediaType, name="media_type"))
+    content_type: Mapped[str] = mapped_column(String(100))
+    object_key: Mapped[str] = mapped_column(String(500), unique=True)
+    url: Mapped[str] = mapped_column(String(500), unique=True)  # What RequestCreate.media refers to
+    declared_size_bytes: Mapped[int] = mapped_column(Integer)
+    
+    # Filled in by confirmation and processing
+    state: Mapped[UploadState] = mapped_column(
+        SQLEnum(UploadState, name="upload_state"),
+        default=UploadState.PENDING,
+        index=True,
+    )
+    file_size_bytes: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    thumbnail_url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    variant_url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)  # Downscaled, EXIF-free
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)  # SHA-256 of the original
+    error: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    
+    # Timestamps
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+    )
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        index=True,
+    )  # Same retention as request media; swept with its objects
+    
+    def __repr__(self) -> str:
+        return f"<Upload {self.id} - {self.state.value}>"
@@ -20,6 +20,11 @@ from app.schemas.payment import (
     QuoteResponse,
     QuoteRevision,
 )
+from app.schemas.media import (
+    UploadCreate,
+    UploadTicket,
+    UploadResponse,
+)
 
 __all__ = [
     "UserCreate",
@@ -37,4 +42,7 @@ __all__ = [
     "PaymentResponse",
     "QuoteResponse",
     "QuoteRevision",
+    "UploadCreate",
+    "UploadTicket",
+    "UploadResponse",
 ]
@@ -0,0 +1,46 @@
+"""
+Media Schemas
+
+Pydantic models for direct-to-storage uploads.
+"""
+from datetime import datetime
+from typing import Optional, Dict
+from uuid import UUID
+from pydantic import BaseModel, Field
+
+from app.models.request import MediaType
+from app.models.upload import UploadState
+
+
+class UploadCreate(BaseModel):
+    """Schema for requesting an upload URL."""
+    type: MediaType
+    content_type: str = Field(..., max_length=100)
+    size_bytes: int = Field(..., gt=0)
+
+
+class UploadTicket(BaseModel):
+    """Where and how the client uploads the bytes."""
+    id: UUID
+    upload_url: str
+    method: str = "PUT"
+    headers: Dict[str, str] = {}  # Must be sent as-is with the PUT
+    url: str  # Pass this in RequestCreate.media once confirmed
+    expires_at: datetime
+
+
+class UploadResponse(BaseModel):
+    """Upload state schema."""
+    id: UUID
+    type: MediaType
+    content_type: str
+    url: str
+    state: UploadState
+    file_size_bytes: Optional[int] = None
+    thumbnail_url: Optional[str] = None
+    variant_url: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
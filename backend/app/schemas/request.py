@@ -205,7 +205,8 @@ class CompletionSubmit(BaseModel):
 
 class SignatureSubmit(BaseModel):
     """For submitting client signature."""
-    signature_data: str  # Base64 encoded signature image
+    # Base64 data URL of the signature image; the decoded size is capped by SIGNATURE_MAX_BYTES
+    signature_data: str = Field(..., max_length=3_000_000)
 
 
 # Update forward references
@@ -9,6 +9,8 @@ from uuid import UUID
 from pydantic import BaseModel, EmailStr, Field, field_validator
 import re
 
+from app.models.request import Category
+
 
 class UserBase(BaseModel):
     """Base user schema."""
@@ -94,7 +96,7 @@ class TechnicianBrief(BaseModel):
     """Brief technician info for user response."""
     id: UUID
     internal_code: str
-    specializations: list[str]
+    specializations: list[Category]
     rating: float
     completed_jobs: int
     is_active: bool
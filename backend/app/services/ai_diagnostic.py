@@ -3,9 +3,19 @@ AI Diagnostic Service
 
 Analyzes repair requests using AI for diagnosis, severity, and price estimation.
 """
-from typing import List
+import hashlib
+import json
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+
 from app.models.request import Category, Severity
 from app.schemas.request import AIAnalysisResponse, PriceRange
+from app.services.diagnosis_cache import diagnosis_cache, fingerprint
+from app.services.inference_batcher import inference_batcher, DiagnosisInput
+from app.services.image_preprocessing import image_preprocessor
 
 
 # Price ranges by category (min, max in cents)
@@ -44,61 +54,235 @@ SAFETY_INSTRUCTIONS = {
     ],
 }
 
+# Mock probable issue by category
+PROBABLE_ISSUES = {
+    Category.PLUMBING: "Possibile tubo rotto o perdita dal sifone",
+    Category.ELECTRICAL: "Possibile cortocircuito o problema all'impianto",
+    Category.LOCKSMITH: "Serratura bloccata o meccanismo danneggiato",
+    Category.HVAC: "Problema alla caldaia o perdita nel circuito",
+    Category.APPLIANCES: "Guasto all'elettrodomestico",
+    Category.CARPENTRY: "Danneggiamento strutturale",
+    Category.GENERAL: "Riparazione generica necessaria",
+}
+
+
+@dataclass(frozen=True)
+class SeverityRule:
+    """
+    One row of the severity decision table; every condition given must hold.
+    
+    any_of: at least one of these guided answers is set.
+    answer/values: that guided answer, lowercased, is one of values.
+    categories: the request is in one of these categories.
+    """
+    severity: Severity
+    any_of: Tuple[str, ...] = ()
+    answer: Optional[str] = None
+    values: Tuple[str, ...] = ()
+    categories: Tuple[Category, ...] = ()
+    
+    def matches(self, category: Category, guided_answers: dict) -> bool:
+        if self.any_of and not any(guided_answers.get(key) for key in self.any_of):
+            return False
+        if self.answer is not None:
+            value = guided_answers.get(self.answer)
+            if not isinstance(value, str) or value.lower() not in self.values:
+                return False
+        return not self.categories or category in self.categories
+
+
+# Severity decision table: the first matching rule wins
+SEVERITY_RULES = [
+    SeverityRule(Severity.HIGH, any_of=("sparks", "burning_smell")),
+    SeverityRule(Severity.HIGH, any_of=("gas_smell",)),
+    SeverityRule(Severity.HIGH, any_of=("running_water",), categories=(Category.PLUMBING,)),
+    SeverityRule(Severity.MEDIUM, answer="how_long", values=("poco", "oggi", "hours")),
+]
+DEFAULT_SEVERITY = Severity.LOW
+DEFAULT_PRICES = (5000, 20000)  # Categories missing from CATEGORY_PRICES
+
+# Price multipliers (min, max) and estimated duration by severity
+SEVERITY_PRICE_FACTORS = {
+    Severity.HIGH: (1.3, 1.5),
+    Severity.MEDIUM: (1.0, 1.0),
+    Severity.LOW: (1.0, 1.0),
+}
+SEVERITY_DURATION_HOURS = {
+    Severity.HIGH: 2.0,
+    Severity.MEDIUM: 1.5,
+    Severity.LOW: 1.5,
+}
+
+CATEGORIES = list(Category)
+SEVERITIES = list(Severity)
+
+
+def rules_version() -> str:
+    """Short hash of the rule tables above; part of every diagnosis cache key."""
+    tables = [CATEGORY_PRICES, SAFETY_INSTRUCTIONS, PROBABLE_ISSUES, SEVERITY_PRICE_FACTORS, SEVERITY_DURATION_HOURS]
+    material = json.dumps(
+        [[asdict(rule) for rule in SEVERITY_RULES], DEFAULT_SEVERITY.value, DEFAULT_PRICES]
+        + [{k.value: v for k, v in t.items()} for t in tables],
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode()).hexdigest()[:12]
+
+
+def invalidate_diagnoses():
+    """Call after changing the rule tables: cached diagnoses no longer apply."""
+    diagnosis_cache.invalidate(rules_version())
+
 
 async def analyze_request(
-    request_id: str,
+    request_id: UUID,
     category: Category,
     description: str,
     guided_answers: dict,
     media_urls: List[str],
+    media_hashes: Optional[List[str]] = None,
 ) -> AIAnalysisResponse:
     """
-    Analyze a repair request using AI.
+    Analyze a repair request, reusing the diagnosis of an equivalent one.
     
-    In production, this would:
-    1. Send images to OpenAI Vision API
-    2. Analyze description with NLP
-    3. Cross-reference guided answers
-    4. Return diagnosis with confidence
+    Photos are first shrunk to model-sized copies (image_preprocessor).
+    media_hashes default to their content hashes, so identical photos at
+    different URLs share a diagnosis; media passed through unchanged are
+    keyed by URL. When the model does not answer in time the rule-based
+    estimate is returned, and not cached.
     """
-    # Determine severity from guided answers
-    severity = Severity.MEDIUM
-    if guided_answers.get("sparks") or guided_answers.get("burning_smell"):
-        severity = Severity.HIGH
-    elif guided_answers.get("gas_smell"):
-        severity = Severity.HIGH
-    elif guided_answers.get("running_water") and category == Category.PLUMBING:
-        severity = Severity.HIGH
-    elif guided_answers.get("how_long", "").lower() in ["poco", "oggi", "hours"]:
-        severity = Severity.MEDIUM
-    else:
-        severity = Severity.LOW
-    
-    # Get safety instructions
-    safety = SAFETY_INSTRUCTIONS.get(category, ["Attendi il tecnico in sicurezza"])
-    
-    # Calculate price range
-    base_min, base_max = CATEGORY_PRICES.get(category, (5000, 20000))
-    if severity == Severity.HIGH:
-        base_min = int(base_min * 1.3)
-        base_max = int(base_max * 1.5)
+    images = await image_preprocessor.prepare(media_urls)
+    if media_hashes is None:
+        media_hashes = [image.content_hash or image.source_url for image in images]
+    key = fingerprint(category, description, guided_answers, media_hashes)
+    result = await diagnosis_cache.get_or_compute(
+        key,
+        lambda: run_diagnosis(request_id, category, description, guided_answers, [image.url for image in images]),
+    )
+    return result if result is not None else rule_based_diagnosis(category, guided_answers, media_urls)
+
+
+async def run_diagnosis(
+    request_id: UUID,
+    category: Category,
+    description: str,
+    guided_answers: dict,
+    media_urls: List[str],
+) -> Optional[AIAnalysisResponse]:
+    """
+    Analyze a repair request using AI.
     
-    # Mock probable issue based on category
-    issues = {
-        Category.PLUMBING: "Possibile tubo rotto o perdita dal sifone",
-        Category.ELECTRICAL: "Possibile cortocircuito o problema all'impianto",
-        Category.LOCKSMITH: "Serratura bloccata o meccanismo danneggiato",
-        Category.HVAC: "Problema alla caldaia o perdita nel circuito",
-        Category.APPLIANCES: "Guasto all'elettrodomestico",
-        Category.CARPENTRY: "Danneggiamento strutturale",
-        Category.GENERAL: "Riparazione generica necessaria",
-    }
+    With AI_INFERENCE_BACKEND="http" the request joins the next batch sent
+    to the model (images, description and guided answers); None when the
+    model failed or missed AI_INFERENCE_DEADLINE_SECONDS. Otherwise the
+    rule engine is the model.
+    """
+    if not inference_batcher.running:
+        return rule_based_diagnosis(category, guided_answers, media_urls)
+    return await inference_batcher.infer(
+        DiagnosisInput(request_id, category, description, guided_answers, media_urls)
+    )
+
+
+def rule_based_diagnosis(category: Category, guided_answers: dict, media_urls: List[str]) -> AIAnalysisResponse:
+    """Severity, safety instructions and price range from the rule tables."""
+    severity = evaluate_severity(category, guided_answers)
+    min_price, max_price = price_range(category, severity)
     
     return AIAnalysisResponse(
         severity=severity,
         confidence=75 + (10 if media_urls else 0),
-        probable_issue=issues.get(category, "Da valutare"),
-        safety_instructions=safety,
-        estimated_duration_hours=2.0 if severity == Severity.HIGH else 1.5,
-        price_range=PriceRange(min_price=base_min, max_price=base_max),
+        probable_issue=PROBABLE_ISSUES.get(category, "Da valutare"),
+        safety_instructions=SAFETY_INSTRUCTIONS.get(category, ["Attendi il tecnico in sicurezza"]),
+        estimated_duration_hours=SEVERITY_DURATION_HOURS[severity],
+        price_range=PriceRange(min_price=min_price, max_price=max_price),
     )
+
+
+def evaluate_severity(category: Category, guided_answers: dict) -> Severity:
+    """Severity of one request from the decision table."""
+    for rule in SEVERITY_RULES:
+        if rule.matches(category, guided_answers):
+            return rule.severity
+    return DEFAULT_SEVERITY
+
+
+def price_range(category: Category, severity: Severity) -> Tuple[int, int]:
+    """Initial (min, max) estimate in cents."""
+    base_min, base_max = CATEGORY_PRICES.get(category, DEFAULT_PRICES)
+    factor_min, factor_max = SEVERITY_PRICE_FACTORS[severity]
+    return int(base_min * factor_min), int(base_max * factor_max)
+
+
+@dataclass
+class RuleColumns:
+    """
+    Columnar view of many requests, holding only what the decision table reads.
+    
+    category: index into CATEGORIES per request.
+    flags: per answer used in any_of, whether it is set.
+    text: per answer used in answer/values, the lowercased string ("" if not a string).
+    """
+    category: np.ndarray
+    flags: Dict[str, np.ndarray]
+    text: Dict[str, np.ndarray]
+    
+    def __len__(self) -> int:
+        return len(self.category)
+
+
+def _lowered(value) -> str:
+    return value.lower() if isinstance(value, str) else ""
+
+
+def decode_columns(categories: Sequence[Category], guided_answers: Sequence[dict]) -> RuleColumns:
+    """Decode guided_answers dicts into the arrays the decision table needs."""
+    codes = {category: i for i, category in enumerate(CATEGORIES)}
+    flag_keys = {key for rule in SEVERITY_RULES for key in rule.any_of}
+    text_keys = {rule.answer for rule in SEVERITY_RULES if rule.answer is not None}
+    return RuleColumns(
+        category=np.fromiter((codes[c] for c in categories), dtype=np.int8, count=len(categories)),
+        flags={
+            key: np.fromiter((bool(a.get(key)) for a in guided_answers), dtype=bool, count=len(guided_answers))
+            for key in flag_keys
+        },
+        text={
+            key: np.array([_lowered(a.get(key)) for a in guided_answers], dtype=str)
+            for key in text_keys
+        },
+    )
+
+
+def evaluate_batch(columns: RuleColumns) -> Dict[str, np.ndarray]:
+    """
+    Decision table over a whole batch: same results as rule_based_diagnosis.
+    
+    Returns "severity" (index into SEVERITIES), "min_price", "max_price"
+    (cents) and "duration_hours", one entry per request.
+    """
+    n = len(columns)
+    severity = np.full(n, SEVERITIES.index(DEFAULT_SEVERITY), dtype=np.int8)
+    undecided = np.ones(n, dtype=bool)
+    for rule in SEVERITY_RULES:
+        match = undecided.copy()
+        if rule.any_of:
+            match &= np.logical_or.reduce([columns.flags[key] for key in rule.any_of])
+        if rule.answer is not None:
+            match &= np.isin(columns.text[rule.answer], rule.values)
+        if rule.categories:
+            match &= np.isin(columns.category, [CATEGORIES.index(c) for c in rule.categories])
+        severity[match] = SEVERITIES.index(rule.severity)
+        undecided &= ~match
+    
+    base = np.array([CATEGORY_PRICES.get(c, DEFAULT_PRICES) for c in CATEGORIES], dtype=np.float64)
+    factors = np.array([SEVERITY_PRICE_FACTORS[s] for s in SEVERITIES], dtype=np.float64)
+    durations = np.array([SEVERITY_DURATION_HOURS[s] for s in SEVERITIES])
+    return {
+        "severity": severity,
+        "min_price": (base[columns.category, 0] * factors[severity, 0]).astype(np.int64),
+        "max_price": (base[columns.category, 1] * factors[severity, 1]).astype(np.int64),
+        "duration_hours": durations[severity],
+    }
+
+
+# Key the cache by the tables loaded at import
+invalidate_diagnoses()
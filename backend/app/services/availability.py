@@ -0,0 +1,113 @@
+"""
+Availability Service
+
+Compiles the weekly JSON schedule of a technician into a 672-bit bitmap
+(one bit per 15 minutes, Monday 00:00 first, Europe/Rome wall-clock time),
+so "available at time T" is a single bit test in Python or in SQL.
+"""
+import re
+from datetime import datetime, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func, or_
+
+from app.config import settings
+from app.models.technician import Technician
+
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+BITMAP_BYTES = SLOTS_PER_WEEK // 8
+
+FULL_WEEK = b"\xff" * BITMAP_BYTES
+ANYTIME = "anytime"
+
+_RANGE = re.compile(r"^(\d{2}):(\d{2})-(\d{2}):(\d{2})$")
+_ZONE = ZoneInfo(settings.AVAILABILITY_TIMEZONE)
+
+
+def _minutes(hours: str, minutes: str, label: str) -> int:
+    value = int(hours) * 60 + int(minutes)
+    if int(minutes) >= 60 or value > 24 * 60:
+        raise ValueError(f"Orario non valido: {label}")
+    if value % SLOT_MINUTES:
+        raise ValueError(f"Gli orari devono essere multipli di {SLOT_MINUTES} minuti: {label}")
+    return value
+
+
+def compile_schedule(schedule: dict) -> Optional[bytes]:
+    """
+    Validate a weekly schedule and compile it to a bitmap.
+    
+    Keys are "mon".."sun" with lists of "HH:MM-HH:MM" ranges; a range that
+    ends before it starts runs past midnight into the next day. Returns None
+    (available at any time) for an empty schedule, {"anytime": true} or a
+    schedule covering the whole week. Raises ValueError on invalid input.
+    """
+    if not schedule or schedule.get(ANYTIME) is True:
+        return None
+    
+    bits = bytearray(BITMAP_BYTES)
+    for day, ranges in schedule.items():
+        if day not in DAYS:
+            raise ValueError(f"Giorno non valido: {day}")
+        if not isinstance(ranges, list) or not all(isinstance(r, str) for r in ranges):
+            raise ValueError(f"Fasce orarie non valide per {day}")
+        
+        day_start = DAYS.index(day) * SLOTS_PER_DAY
+        for label in ranges:
+            match = _RANGE.match(label.strip())
+            if not match:
+                raise ValueError(f"Fascia oraria non valida: {label}")
+            start = _minutes(match[1], match[2], label) // SLOT_MINUTES
+            end = _minutes(match[3], match[4], label) // SLOT_MINUTES
+            if start == end:
+                raise ValueError(f"Fascia oraria vuota: {label}")
+            if end < start:
+                end += SLOTS_PER_DAY  # Overnight
+            
+            for slot in range(day_start + start, day_start + end):
+                slot %= SLOTS_PER_WEEK  # Sunday night wraps to Monday
+                bits[slot >> 3] |= 1 << (slot & 7)
+    
+    if bits == FULL_WEEK:
+        return None
+    return bytes(bits)
+
+
+def week_slot(when: Optional[datetime] = None) -> int:
+    """
+    Bitmap position of an instant.
+    
+    The instant is converted to local time first, so the same bit means
+    "Tuesday 09:00" in both CET and CEST; naive datetimes are taken as UTC.
+    """
+    when = when or datetime.now(timezone.utc)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    local = when.astimezone(_ZONE)
+    return local.weekday() * SLOTS_PER_DAY + (local.hour * 60 + local.minute) // SLOT_MINUTES
+
+
+def is_available_at(bitmap: Optional[bytes], when: Optional[datetime] = None) -> bool:
+    """Bit lookup; a NULL bitmap means no schedule restriction."""
+    if bitmap is None:
+        return True
+    slot = week_slot(when)
+    return bool(bitmap[slot >> 3] >> (slot & 7) & 1)
+
+
+def available_at_clause(when: Optional[datetime] = None):
+    """
+    SQL filter equivalent to is_available_at.
+    
+    get_bit() numbers bits least-significant first within each byte, the
+    same layout compile_schedule writes.
+    """
+    return or_(
+        Technician.availability_bitmap.is_(None),
+        func.get_bit(Technician.availability_bitmap, week_slot(when)) == 1,
+    )
@@ -0,0 +1,397 @@
+"""
+Batch Dispatch Service
+
+Micro-batched global assignment: requests arriving within a short window are
+matched to technicians together, solving a min-cost assignment instead of
+greedily sending the same top technicians to everyone.
+"""
+import asyncio
+from typing import Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import Integer, select, func, or_, true, values, column
+from sqlalchemy.dialects.postgresql import UUID as PGUUID, array
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.config import settings
+from app.database import async_session
+from app.models.request import Request, RequestStatus, Category, Severity
+from app.models.technician import Technician
+from app.models.dispatch_offer import DispatchOffer, OfferState
+from app.services.availability import BITMAP_BYTES, FULL_WEEK, week_slot
+from app.services.dispatch import (
+    dispatch_and_notify,
+    dispatchable_filters,
+    notify_technician_batches,
+    record_offer_pairs,
+    technician_position,
+)
+from app.services.technician_index import haversine_km, point_coordinates, technician_index
+from app.services.dispatch_waves import wave_scheduler
+
+
+# Cost of a missing pair; anything at or above this is never offered
+INFEASIBLE = 1e9
+
+# Severe requests are weighted up so they win contention for close technicians
+SEVERITY_WEIGHTS = {
+    Severity.HIGH: 2.0,
+    Severity.MEDIUM: 1.3,
+    Severity.LOW: 1.0,
+    None: 1.3,
+}
+
+CATEGORY_INDEX = {category: i for i, category in enumerate(Category)}
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Pairwise great-circle distances (km) between two point sets."""
+    return haversine_km(
+        np.asarray(lat1, dtype=np.float64)[:, None],
+        np.asarray(lon1, dtype=np.float64)[:, None],
+        np.asarray(lat2, dtype=np.float64)[None, :],
+        np.asarray(lon2, dtype=np.float64)[None, :],
+    )
+
+
+def availability_matrix(requests: Sequence[Request], technicians: Sequence[Technician]) -> np.ndarray:
+    """(requests x technicians) weekly-schedule check at each request's preferred time."""
+    slots = np.array([week_slot(r.preferred_time) for r in requests], dtype=np.intp)
+    bitmaps = np.frombuffer(
+        b"".join(t.availability_bitmap or FULL_WEEK for t in technicians), dtype=np.uint8
+    ).reshape(len(technicians), BITMAP_BYTES)
+    return (bitmaps[:, slots >> 3] >> (slots & 7) & 1).T.astype(bool)
+
+
+def build_cost_matrix(
+    req_lat: np.ndarray,
+    req_lon: np.ndarray,
+    req_category: np.ndarray,
+    req_severity_weight: np.ndarray,
+    tech_lat: np.ndarray,
+    tech_lon: np.ndarray,
+    tech_rating: np.ndarray,
+    tech_skills: np.ndarray,
+    tech_open_offers: Optional[np.ndarray] = None,
+    max_radius_km: Optional[float] = None,
+    available: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Cost of offering each request (rows) to each technician (columns).
+    
+    tech_skills is a (technicians x categories) boolean matrix. Distance and
+    rating are normalised to [0, 1]; technicians without the category pay a
+    fixed penalty, technicians already holding open offers pay per offer;
+    pairs beyond max_radius_km, or outside the technician's schedule
+    (`available`, requests x technicians), are infeasible.
+    """
+    max_radius_km = max_radius_km or max(settings.DISPATCH_SEARCH_RADII_KM)
+    distance = haversine_matrix(req_lat, req_lon, tech_lat, tech_lon)
+    rating_gap = (5.0 - np.asarray(tech_rating, dtype=np.float64)) / 4.0
+    
+    cost = (
+        settings.DISPATCH_COST_DISTANCE_WEIGHT * (distance / max_radius_km)
+        + settings.DISPATCH_COST_RATING_WEIGHT * rating_gap[None, :]
+    )
+    if tech_open_offers is not None:
+        busy = settings.DISPATCH_COST_OPEN_OFFER_PENALTY * np.asarray(tech_open_offers, dtype=np.float64)
+        cost += busy[None, :]
+    skilled = tech_skills[:, req_category].T  # (requests x technicians)
+    cost += np.where(skilled, 0.0, settings.DISPATCH_COST_SPECIALIZATION_PENALTY)
+    cost *= np.asarray(req_severity_weight, dtype=np.float64)[:, None]
+    cost[distance > max_radius_km] = INFEASIBLE
+    if available is not None:
+        cost[~available] = INFEASIBLE
+    return cost
+
+
+def linear_sum_assignment(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Min-cost one-to-one assignment (Hungarian / shortest augmenting path).
+    
+    Works on rectangular matrices; returns (row_indices, col_indices) with
+    min(rows, cols) pairs. The inner relaxation step is vectorized.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    if n == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=int)    # p[j] = row (1-based) matched to column j
+    way = np.zeros(m + 1, dtype=int)
+    
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = np.nonzero(~used[1:])[0] + 1
+            reduced = cost[i0 - 1, free - 1] - u[i0] - v[free]
+            better = reduced < minv[free]
+            minv[free[better]] = reduced[better]
+            way[free[better]] = j0
+            j1 = free[np.argmin(minv[free])]
+            delta = minv[j1]
+            matched = np.nonzero(used)[0]
+            u[p[matched]] += delta
+            v[matched] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    
+    cols = np.nonzero(p[1:])[0]
+    rows = p[cols + 1] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def assign_offers(cost: np.ndarray, offers_per_request: int) -> List[List[int]]:
+    """
+    Spread technicians across requests.
+    
+    Runs one assignment round per offer slot; a technician receives at most
+    one offer per batch. Returns, per request, the chosen column indices.
+    """
+    n_requests, n_techs = cost.shape
+    chosen: List[List[int]] = [[] for _ in range(n_requests)]
+    available = np.ones(n_techs, dtype=bool)
+    
+    for _ in range(offers_per_request):
+        columns = np.nonzero(available)[0]
+        if columns.size == 0:
+            break
+        rows, cols = linear_sum_assignment(cost[:, columns])
+        for row, col in zip(rows, cols):
+            if cost[row, columns[col]] >= INFEASIBLE:
+                continue
+            chosen[row].append(int(columns[col]))
+            available[columns[col]] = False
+    return chosen
+
+
+def window_candidates_query(requests: Sequence[Request], k: int):
+    """
+    Technicians near any request of a window, as a single statement.
+    
+    For every (request, category) pair a LATERAL subquery takes the k
+    nearest technicians of that category available at the request's
+    preferred time within the largest ring (KNN on the partial GiST index).
+    """
+    window = values(
+        column("request_id", PGUUID(as_uuid=True)),
+        column("category", Request.category.type),
+        column("slot", Integer),
+        name="batch_window",
+    ).data([
+        (r.id, category, week_slot(r.preferred_time))
+        for r in requests
+        for category in {r.category, Category.GENERAL}
+    ])
+    nearby = (
+        select(Technician.id)
+        .where(
+            *dispatchable_filters(),
+            Technician.location.isnot(None),
+            Technician.specializations.contains(array([window.c.category])),
+            or_(
+                Technician.availability_bitmap.is_(None),
+                func.get_bit(Technician.availability_bitmap, window.c.slot) == 1,
+            ),
+            func.ST_DWithin(Technician.location, Request.location, max(settings.DISPATCH_SEARCH_RADII_KM) * 1000),
+        )
+        .order_by(Technician.location.op("<->")(Request.location))
+        .limit(k)
+        .lateral("nearby")
+    )
+    candidate_ids = (
+        select(nearby.c.id)
+        .select_from(window)
+        .join(Request, Request.id == window.c.request_id)
+        .join(nearby, true())
+    )
+    return select(Technician).where(Technician.id.in_(candidate_ids))
+
+
+async def window_candidates(db: AsyncSession, requests: Sequence[Request], k: int) -> List[Technician]:
+    """
+    Candidate pool of a window: up to k nearby specialists and k generalists per request.
+    
+    Looked up in the in-process index when it is loaded (then loaded by
+    primary key), otherwise with window_candidates_query; either way one
+    query for the whole window.
+    """
+    if technician_index.loaded and settings.TECHNICIAN_INDEX_ENABLED:
+        radius_km = max(settings.DISPATCH_SEARCH_RADII_KM)
+        ids = set()
+        for request in requests:
+            latitude, longitude = point_coordinates(request.location)
+            for category in {request.category, Category.GENERAL}:
+                ids.update(technician_index.query(category, latitude, longitude, radius_km, k).ids)
+        if not ids:
+            return []
+        query = select(Technician).where(Technician.id.in_(ids), *dispatchable_filters())
+    else:
+        query = window_candidates_query(requests, k)
+    result = await db.execute(query.options(selectinload(Technician.user)))
+    return list(result.scalars().all())
+
+
+async def dispatch_batch(db: AsyncSession, request_ids: Sequence[UUID], wave: int = 1) -> Dict[UUID, list]:
+    """
+    Jointly dispatch a window of requests and emit all offers in bulk.
+    
+    Requests accepted or cancelled while waiting in the window are skipped.
+    """
+    result = await db.execute(
+        select(Request).where(
+            Request.id.in_(list(request_ids)),
+            Request.status == RequestStatus.DISPATCHING,
+            Request.technician_id.is_(None),
+        )
+    )
+    requests = list(result.scalars().all())
+    
+    # Without coordinates there is nothing to optimise: dispatch greedily, each in its own commit
+    dispatched = {}
+    for request in [r for r in requests if r.location is None]:
+        dispatched[request.id] = await dispatch_and_notify(db, request.id, wave)
+    requests = [r for r in requests if r.location is not None]
+    if not requests:
+        return dispatched
+    
+    # Candidate pool: nearby specialists and generalists of every request
+    technicians = await window_candidates(db, requests, settings.DISPATCH_BATCH_CANDIDATES_PER_REQUEST)
+    if not technicians:
+        return {**dispatched, **{r.id: [] for r in requests}}
+    
+    tech_points = [technician_position(t) for t in technicians]
+    req_points = [point_coordinates(r.location) for r in requests]
+    
+    # Offers still open from earlier windows, so busy technicians are spread out
+    result = await db.execute(
+        select(DispatchOffer.technician_id, func.count())
+        .where(
+            DispatchOffer.technician_id.in_([t.id for t in technicians]),
+            DispatchOffer.state == OfferState.OFFERED,
+            DispatchOffer.expires_at > func.now(),
+        )
+        .group_by(DispatchOffer.technician_id)
+    )
+    open_offers = dict(result.all())
+    
+    skills = np.zeros((len(technicians), len(CATEGORY_INDEX)), dtype=bool)
+    for i, tech in enumerate(technicians):
+        for category in tech.specializations:
+            skills[i, CATEGORY_INDEX[category]] = True
+    
+    cost = build_cost_matrix(
+        req_lat=np.array([p[0] for p in req_points]),
+        req_lon=np.array([p[1] for p in req_points]),
+        req_category=np.array([CATEGORY_INDEX[r.category] for r in requests]),
+        req_severity_weight=np.array([SEVERITY_WEIGHTS[r.severity] for r in requests]),
+        tech_lat=np.array([p[0] for p in tech_points]),
+        tech_lon=np.array([p[1] for p in tech_points]),
+        tech_rating=np.array([t.rating for t in technicians]),
+        tech_skills=skills,
+        tech_open_offers=np.array([open_offers.get(t.id, 0) for t in technicians]),
+        available=availability_matrix(requests, technicians),
+    )
+    chosen = assign_offers(cost, settings.MAX_TECHNICIANS_TO_NOTIFY)
+    
+    assignments = {
+        request.id: [technicians[c] for c in cols]
+        for request, cols in zip(requests, chosen)
+    }
+    inserted = set(await record_offer_pairs(
+        db,
+        [(request_id, tech) for request_id, techs in assignments.items() for tech in techs],
+        wave,
+    ))
+    await db.commit()
+    
+    # Only technicians not already offered the request (e.g. by another worker) are notified
+    assignments = {
+        request_id: [t for t in techs if (request_id, t.id) in inserted]
+        for request_id, techs in assignments.items()
+    }
+    
+    if settings.DISPATCH_WAVES_ENABLED:
+        for request in requests:
+            wave_scheduler.schedule(request.id, wave + 1)
+    
+    await notify_technician_batches([(r, assignments[r.id]) for r in requests])
+    dispatched.update({
+        request_id: [{"id": t.id, "internal_code": t.internal_code} for t in techs]
+        for request_id, techs in assignments.items()
+    })
+    return dispatched
+
+
+class BatchDispatcher:
+    """Collects request ids for DISPATCH_BATCH_WINDOW_MS and dispatches them together."""
+    
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def submit(self, request_id: UUID):
+        """Queue a request for the next batch window."""
+        if self._queue is None:
+            raise RuntimeError("BatchDispatcher is not running")
+        self._queue.put_nowait(request_id)
+    
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+    
+    async def _collect(self) -> List[UUID]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.DISPATCH_BATCH_WINDOW_MS / 1000
+        while len(batch) < settings.DISPATCH_BATCH_MAX_REQUESTS:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                async with async_session() as db:
+                    await dispatch_batch(db, batch)
+            except Exception as exc:  # keep collecting; requests stay DISPATCHING
+                print(f"[DISPATCH] Batch of {len(batch)} requests failed: {exc!r}")
+
+
+batch_dispatcher = BatchDispatcher()
@@ -0,0 +1,82 @@
+"""
+Cache Service
+
+Small caches in front of slower lookups: a bounded in-process LRU with
+per-entry TTL, and a Redis variant with the same (async) interface so a
+cache can be shared by every worker.
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """LRU of at most `maxsize` entries, each expiring `ttl` seconds after set()."""
+    
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires, value)
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= self.clock():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+    
+    def stats(self) -> dict:
+        return {"backend": "memory", "size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class RedisCache:
+    """JSON values under `prefix` in Redis, with TTL set by Redis itself."""
+    
+    def __init__(self, url: str, prefix: str, ttl: float):
+        import redis.asyncio as redis
+        
+        self._redis = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+    
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._redis.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+    
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        await self._redis.set(self.prefix + key, json.dumps(value), px=int((self.ttl if ttl is None else ttl) * 1000))
+    
+    async def pop(self, key: str):
+        await self._redis.delete(self.prefix + key)
+    
+    async def close(self):
+        await self._redis.aclose()
+    
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,184 @@
+"""
+Diagnosis Cache Service
+
+Memoizes AI diagnoses of near-identical requests. The key is a fingerprint
+of what the model sees (category, diagnostic guided answers, normalized
+description, media content hashes) plus the version of the rule tables.
+Two tiers: an in-process LRU with TTL and, optionally, Redis shared by the
+workers. Concurrent misses on the same key make a single model call.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import time
+import unicodedata
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+from app.config import settings
+from app.models.request import Category
+from app.schemas.request import AIAnalysisResponse
+from app.services.cache import TTLCache, RedisCache
+
+
+# Guided answers that do not change the diagnosis (scheduling only)
+NON_DIAGNOSTIC_ANSWERS = {"availability"}
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_description(text: str) -> str:
+    """Lowercase, no accents, no punctuation, single spaces."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return _SPACES.sub(" ", _PUNCTUATION.sub(" ", text)).strip()
+
+
+def fingerprint(
+    category: Category,
+    description: str,
+    guided_answers: dict,
+    media_hashes: Iterable[str],
+) -> str:
+    """SHA-256 over the normalized inputs of a diagnosis."""
+    answers = {
+        key: value.strip().lower() if isinstance(value, str) else value
+        for key, value in guided_answers.items()
+        if value is not None and key not in NON_DIAGNOSTIC_ANSWERS
+    }
+    material = json.dumps(
+        [category.value, normalize_description(description), answers, sorted(media_hashes)],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class DiagnosisCache:
+    """Two-tier memo of AIAnalysisResponse by fingerprint, with hit/miss metrics."""
+    
+    def __init__(self):
+        self.rules_version = ""
+        self._local = TTLCache(settings.DIAGNOSIS_CACHE_SIZE, settings.DIAGNOSIS_CACHE_TTL_SECONDS)
+        self._shared: Optional[RedisCache] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.model_seconds = 0.0
+    
+    def start(self):
+        if settings.DIAGNOSIS_CACHE_BACKEND == "redis":
+            self._shared = RedisCache(settings.REDIS_URL, "diagnosis:", settings.DIAGNOSIS_CACHE_TTL_SECONDS)
+    
+    async def stop(self):
+        if self._shared is not None:
+            await self._shared.close()
+            self._shared = None
+    
+    def invalidate(self, rules_version: Optional[str] = None):
+        """
+        Drop every cached diagnosis, e.g. after the rule tables changed.
+        
+        Local entries are cleared; shared ones become unreachable because
+        the rules version is part of the key, and expire in Redis by TTL.
+        """
+        if rules_version is not None:
+            self.rules_version = rules_version
+        self._local = TTLCache(settings.DIAGNOSIS_CACHE_SIZE, settings.DIAGNOSIS_CACHE_TTL_SECONDS)
+    
+    async def get_or_compute(
+        self,
+        fingerprint_: str,
+        compute: Callable[[], Awaitable[Optional[AIAnalysisResponse]]],
+    ) -> Optional[AIAnalysisResponse]:
+        """Cached result, or compute() once per key. A None result is not stored."""
+        if not settings.DIAGNOSIS_CACHE_ENABLED:
+            return await compute()
+        key = f"{self.rules_version}:{fingerprint_}"
+        
+        result = self._local.get(key)
+        if result is not None:
+            self.local_hits += 1
+            return result.model_copy(deep=True)
+        
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            try:
+                result = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # First caller went away (client disconnected): start over
+                self.coalesced -= 1
+                return await self.get_or_compute(fingerprint_, compute)
+            return result.model_copy(deep=True) if result is not None else None
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._shared_get(key)
+            if result is not None:
+                self.shared_hits += 1
+            else:
+                self.misses += 1
+                start = time.perf_counter()
+                result = await compute()
+                self.model_seconds += time.perf_counter() - start
+                if result is None:
+                    future.set_result(None)
+                    return None
+                await self._shared_set(key, result)
+            self._local.set(key, result)
+            future.set_result(result)
+            return result.model_copy(deep=True)
+        except BaseException as exc:
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+                future.exception()  # Retrieved: no warning when nobody was waiting
+            raise
+        finally:
+            del self._inflight[key]
+    
+    async def _shared_get(self, key: str) -> Optional[AIAnalysisResponse]:
+        if self._shared is None:
+            return None
+        try:
+            stored = await self._shared.get(key)
+        except Exception as exc:  # Redis down: fall through to the model
+            print(f"[DIAGNOSIS] Redis get failed: {exc!r}")
+            return None
+        return AIAnalysisResponse.model_validate(stored) if stored is not None else None
+    
+    async def _shared_set(self, key: str, result: AIAnalysisResponse):
+        if self._shared is None:
+            return
+        try:
+            await self._shared.set(key, result.model_dump(mode="json"))
+        except Exception as exc:
+            print(f"[DIAGNOSIS] Redis set failed: {exc!r}")
+    
+    def stats(self) -> dict:
+        hits = self.local_hits + self.shared_hits + self.coalesced
+        lookups = hits + self.misses
+        avg_model = self.model_seconds / self.misses if self.misses else 0.0
+        return {
+            "backend": "redis" if self._shared is not None else "memory",
+            "rules_version": self.rules_version,
+            "size": len(self._local),
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "avg_model_seconds": avg_model,
+            "model_seconds_saved": hits * avg_model,  # Estimated
+        }
+
+
+diagnosis_cache = DiagnosisCache()
@@ -3,17 +3,223 @@ Dispatch Service
 
 Intelligent technician dispatch based on specialization, distance, and availability.
 """
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Sequence, Tuple
 from uuid import UUID
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import selectinload
 
 from app.config import settings
+from app.database import async_session
 from app.models.technician import Technician
-from app.models.request import Request
+from app.models.request import Request, RequestStatus, Category
+from app.models.quote import Quote
+from app.models.dispatch_offer import DispatchOffer, OfferState
+from app.services.notifications import notification_fan_out, technician_messages
+from app.services.technician_index import technician_index, point_coordinates, haversine_km
+from app.services.technician_scoring import technician_scores
+from app.services.dispatch_telemetry import record_offers_sent
+from app.services.dispatch_waves import wave_scheduler
+from app.services.availability import available_at_clause
+from app.services.location_buffer import location_buffer
 
 
-async def dispatch_technicians(db: AsyncSession, request_id: UUID) -> list:
+def is_dispatchable(technician: Technician) -> bool:
+    """Whether a technician can currently receive new jobs."""
+    return bool(
+        technician.is_active
+        and technician.is_available_now
+        and technician.is_accepting_jobs
+        and technician.is_verified
+    )
+
+
+def sync_technician_index(
+    technician: Technician,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+):
+    """Reflect a technician's current state in the in-process index."""
+    if not is_dispatchable(technician):
+        technician_index.remove(technician.id)
+        return
+    
+    if latitude is None or longitude is None:
+        coords = technician_index.position(technician.id) or point_coordinates(technician.location)
+        if coords is None:
+            technician_index.remove(technician.id)
+            return
+        latitude, longitude = coords
+    
+    technician_index.upsert(
+        technician.id,
+        technician.specializations,
+        latitude,
+        longitude,
+        technician.rating,
+        technician.completed_jobs,
+    )
+
+
+async def resync_technician_index(db: AsyncSession) -> int:
+    """Rebuild the in-process index from the database."""
+    return await technician_index.resync(db)
+
+
+def dispatchable_filters():
+    """Filters matching the partial GiST index on technicians.location."""
+    return (
+        Technician.is_active == True,
+        Technician.is_available_now == True,
+        Technician.is_accepting_jobs == True,
+        Technician.is_verified == True,
+    )
+
+
+def _use_index(request: Request, category: Optional[Category]) -> bool:
+    return (
+        request.location is not None
+        and category is not None
+        and technician_index.loaded
+        and settings.TECHNICIAN_INDEX_ENABLED
+    )
+
+
+async def find_nearest_technicians(
+    db: AsyncSession,
+    request: Request,
+    category: Optional[Category],
+    limit: int,
+    radii_km: Optional[Sequence[float]] = None,
+    exclude_ids: Sequence[UUID] = (),
+    use_index: bool = True,
+) -> List[Technician]:
+    """
+    Find the closest dispatchable technicians for a category.
+    
+    Searches ring by ring (ST_DWithin on the GiST index) and orders each ring
+    by KNN distance (<->), stopping at the first ring with enough candidates.
+    A category of None matches any specialization. Weekly schedules are
+    checked at the request's preferred time, or now.
+    """
+    available = available_at_clause(request.preferred_time)
+    if use_index and _use_index(request, category):
+        technicians = await _indexed_candidates(db, request, category, limit, radii_km, exclude_ids, available)
+        if len(technicians) >= limit:
+            return technicians
+    
+    base = select(Technician).where(*dispatchable_filters(), available)
+    if category is not None:
+        # specializations @> ARRAY[category], served by the GIN index
+        base = base.where(Technician.specializations.contains([category]))
+    if exclude_ids:
+        base = base.where(Technician.id.notin_(exclude_ids))
+    
+    if request.location is None:
+        # No coordinates: best-rated specialists only
+        query = base.order_by(
+            Technician.rating.desc(),
+            Technician.completed_jobs.desc(),
+        ).limit(limit)
+        result = await db.execute(query.options(selectinload(Technician.user)))
+        return list(result.scalars().all())
+    
+    # Keep the request point server-side (single InitPlan per query)
+    origin = select(Request.location).where(Request.id == request.id).scalar_subquery()
+    
+    technicians: List[Technician] = []
+    for radius_km in radii_km or settings.DISPATCH_SEARCH_RADII_KM:
+        query = base.where(
+            Technician.location.isnot(None),
+            func.ST_DWithin(Technician.location, origin, radius_km * 1000),
+        ).order_by(
+            Technician.location.op("<->")(origin),
+            Technician.rating.desc(),
+        ).limit(limit)
+        
+        result = await db.execute(query.options(selectinload(Technician.user)))
+        technicians = list(result.scalars().all())
+        if len(technicians) >= limit:
+            break
+    
+    return technicians
+
+
+async def _indexed_candidates(
+    db: AsyncSession,
+    request: Request,
+    category: Category,
+    limit: int,
+    radii_km: Optional[Sequence[float]],
+    exclude_ids: Sequence[UUID],
+    available,
+) -> List[Technician]:
+    """
+    First-stage lookup in the in-process index.
+    
+    The index may lag behind other workers, so hits are re-checked
+    against the database by primary key.
+    """
+    latitude, longitude = point_coordinates(request.location)
+    hits = technician_index.nearest(
+        category, latitude, longitude, limit, radii_km, exclude_ids=set(exclude_ids)
+    )
+    if not hits:
+        return []
+    
+    order = {tech_id: i for i, tech_id in enumerate(hits.ids)}
+    result = await db.execute(
+        select(Technician)
+        .where(Technician.id.in_(list(order)), *dispatchable_filters(), available)
+        .options(selectinload(Technician.user))
+    )
+    return sorted(result.scalars().all(), key=lambda t: order[t.id])
+
+
+async def best_technicians(
+    db: AsyncSession,
+    request: Request,
+    category: Optional[Category],
+    count: int,
+    radii_km: Optional[Sequence[float]] = None,
+    exclude_ids: Sequence[UUID] = (),
+) -> List[Technician]:
+    """
+    The `count` best-scored dispatchable technicians near a request.
+    
+    Ranks a pool of count * DISPATCH_RANK_POOL_FACTOR nearest candidates.
+    With the in-process index the pool is ranked on the feature rows and
+    distances the index hands back, and only the winners are loaded (and
+    re-checked) from the database; when the index is unusable, short of
+    candidates or stale for a winner, the pool is loaded and ranked instead.
+    """
+    pool = count * settings.DISPATCH_RANK_POOL_FACTOR
+    if _use_index(request, category):
+        latitude, longitude = point_coordinates(request.location)
+        hits = technician_index.nearest(
+            category, latitude, longitude, pool, radii_km, exclude_ids=set(exclude_ids)
+        )
+        if len(hits) >= pool:
+            winners = [hits.ids[i] for i in technician_scores.rank(hits.score_rows, hits.distance_km, count)]
+            result = await db.execute(
+                select(Technician)
+                .where(Technician.id.in_(winners), *dispatchable_filters(), available_at_clause(request.preferred_time))
+                .options(selectinload(Technician.user))
+            )
+            loaded = {t.id: t for t in result.scalars().all()}
+            if len(loaded) == len(winners):
+                return [loaded[tech_id] for tech_id in winners]
+    
+    candidates = await find_nearest_technicians(
+        db, request, category, pool, radii_km, exclude_ids, use_index=False
+    )
+    return rank_technicians(request, candidates, count)
+
+
+async def dispatch_and_notify(db: AsyncSession, request_id: UUID, wave: int = 1) -> list:
     """
     Find and notify the best technicians for a request.
     
@@ -24,7 +230,12 @@ async def dispatch_technicians(db: AsyncSession, request_id: UUID) -> list:
     4. Rating
     5. Response time history
     
-    Notifies up to MAX_TECHNICIANS_TO_NOTIFY technicians.
+    Notifies up to MAX_TECHNICIANS_TO_NOTIFY technicians. Later waves search
+    wider rings, skip technicians already offered the request and, from
+    DISPATCH_RELAX_SPECIALIZATION_WAVE, accept any specialization.
+    
+    Unit of work: the offers are committed on `db` before anyone is
+    notified, so pass a session without pending changes of the caller.
     """
     # Get the request
     result = await db.execute(
@@ -34,44 +245,276 @@ async def dispatch_technicians(db: AsyncSession, request_id: UUID) -> list:
     if not request:
         return []
     
-    category = request.category.value
+    limit = settings.MAX_TECHNICIANS_TO_NOTIFY
+    radii_km = wave_radii(wave)
+    excluded = await offered_technician_ids(db, request.id) if wave > 1 else []
+    matching = await best_technicians(db, request, request.category, limit, radii_km, excluded)
     
-    # Query technicians
-    # In production, use PostGIS ST_Distance for real distance calculation
-    query = select(Technician).where(
-        Technician.is_active == True,
-        Technician.is_available_now == True,
-        Technician.is_accepting_jobs == True,
-        Technician.is_verified == True,
-    ).order_by(
-        Technician.rating.desc(),
-        Technician.completed_jobs.desc(),
-    ).limit(settings.MAX_TECHNICIANS_TO_NOTIFY)
+    # If not enough specialists, include nearby general technicians
+    fallbacks = [Category.GENERAL] if request.category != Category.GENERAL else []
+    if wave >= settings.DISPATCH_RELAX_SPECIALIZATION_WAVE:
+        fallbacks.append(None)
+    for category in fallbacks:
+        if len(matching) >= limit:
+            break
+        matching.extend(await best_technicians(
+            db,
+            request,
+            category,
+            limit - len(matching),
+            radii_km,
+            exclude_ids=[*excluded, *(t.id for t in matching)],
+        ))
     
-    result = await db.execute(query.options(selectinload(Technician.user)))
-    technicians = result.scalars().all()
+    matching = matching[:limit]
     
-    # Filter by specialization (case insensitive)
-    matching = [t for t in technicians if category.lower() in [s.lower() for s in t.specializations]]
+    # Record offers before notifying so /me/pending is consistent with the push;
+    # technicians another worker already offered this request are not notified again
+    matching = await record_offers(db, request.id, matching, wave)
+    await db.commit()
     
-    # If not enough specialists, include general technicians
-    if len(matching) < settings.MAX_TECHNICIANS_TO_NOTIFY:
-        general = [t for t in technicians if t not in matching]
-        matching.extend(general[:settings.MAX_TECHNICIANS_TO_NOTIFY - len(matching)])
+    # Escalate if nobody accepts within the wave timeout
+    if settings.DISPATCH_WAVES_ENABLED:
+        wave_scheduler.schedule(request.id, wave + 1)
     
-    # Notify technicians (in production: push, SMS, WhatsApp)
-    for tech in matching[:settings.MAX_TECHNICIANS_TO_NOTIFY]:
-        await notify_technician(tech, request)
+    # Notify technicians concurrently (push, SMS, WhatsApp)
+    await notify_technicians(matching, request)
     
     return [{"id": t.id, "internal_code": t.internal_code} for t in matching]
 
 
-async def notify_technician(technician: Technician, request: Request):
-    """Send notification to technician about new job."""
-    # In production, implement:
-    # 1. Push notification via Firebase
-    # 2. SMS via Twilio
-    # 3. WhatsApp via Business API
+def technician_position(technician: Technician) -> Optional[Tuple[float, float]]:
+    """Latest known (latitude, longitude): a buffered ping if newer than the stored one."""
+    buffered = location_buffer.position(technician.id)
+    if buffered is not None:
+        latitude, longitude, at = buffered
+        if technician.location_updated_at is None or at > technician.location_updated_at:
+            return latitude, longitude
+    return point_coordinates(technician.location)
+
+
+def rank_technicians(
+    request: Request,
+    technicians: Sequence[Technician],
+    limit: Optional[int] = None,
+) -> List[Technician]:
+    """
+    Order candidates by weighted score (only the best `limit` when given).
+    
+    Rating and experience come from the loaded rows, acceptance, response
+    time and cancellations from the feature store; distance to the request
+    is subtracted when both points are known.
+    """
+    if len(technicians) < 2:
+        return list(technicians)
+    
+    rows = np.fromiter(
+        (technician_scores.set_profile(t.id, t.rating, t.completed_jobs) for t in technicians),
+        dtype=np.intp,
+        count=len(technicians),
+    )
+    
+    distance_km = None
+    origin = point_coordinates(request.location)
+    if origin is not None:
+        farthest = max(settings.DISPATCH_SEARCH_RADII_KM)
+        distance_km = np.array([
+            haversine_km(*origin, *position) if position else farthest
+            for position in (technician_position(t) for t in technicians)
+        ])
+    
+    return [technicians[i] for i in technician_scores.rank(rows, distance_km, limit)]
+
+
+def wave_radii(wave: int) -> List[float]:
+    """Search rings of a wave: the base rings scaled by DISPATCH_WAVE_RADIUS_FACTOR per wave."""
+    factor = settings.DISPATCH_WAVE_RADIUS_FACTOR ** (wave - 1)
+    return [radius_km * factor for radius_km in settings.DISPATCH_SEARCH_RADII_KM]
+
+
+async def offered_technician_ids(db: AsyncSession, request_id: UUID) -> List[UUID]:
+    """Technicians already offered a request in earlier waves."""
+    result = await db.execute(
+        select(DispatchOffer.technician_id).where(DispatchOffer.request_id == request_id)
+    )
+    return list(result.scalars().all())
+
+
+async def dispatch_wave(request_id: UUID, wave: int):
+    """
+    Timer callback: dispatch the next wave if the request is still open.
+    
+    Runs in its own session. Skips requests that were accepted or cancelled
+    meanwhile, or whose wave was already dispatched by another worker: the
+    request row stays locked until the wave's offers are committed, so
+    workers re-arming the same request after a restart run it one at a time.
+    """
+    async with async_session() as db:
+        result = await db.execute(
+            select(Request.status, Request.technician_id)
+            .where(Request.id == request_id)
+            .with_for_update()
+        )
+        row = result.first()
+        if row is None:
+            return
+        status, technician_id = row
+        if status != RequestStatus.DISPATCHING or technician_id is not None:
+            return
+        result = await db.execute(
+            select(func.max(DispatchOffer.wave)).where(DispatchOffer.request_id == request_id)
+        )
+        last_wave = result.scalar_one()
+        if last_wave is not None and last_wave >= wave:
+            return
+        if wave > settings.DISPATCH_MAX_WAVES:
+            print(f"[DISPATCH] Request {request_id}: no technician accepted after {wave - 1} waves")
+            return
+        
+        await dispatch_and_notify(db, request_id, wave)
+
+
+async def recover_dispatch_waves(db: AsyncSession) -> int:
+    """
+    Re-arm wave timers after a restart.
+    
+    Every open DISPATCHING request gets its next wave scheduled relative to
+    its last offer; requests without offers are dispatched right away.
+    """
+    result = await db.execute(
+        select(
+            Request.id,
+            func.max(DispatchOffer.wave),
+            func.max(DispatchOffer.offered_at),
+        )
+        .select_from(Request)
+        .outerjoin(DispatchOffer, DispatchOffer.request_id == Request.id)
+        .where(
+            Request.status == RequestStatus.DISPATCHING,
+            Request.technician_id.is_(None),
+        )
+        .group_by(Request.id)
+    )
+    now = datetime.now(timezone.utc)
+    rows = result.all()
+    scheduled = 0
+    for request_id, last_wave, last_offered_at in rows:
+        if last_wave is None:
+            wave_scheduler.schedule(request_id, 1, delay=0)
+            scheduled += 1
+            continue
+        if last_wave >= settings.DISPATCH_MAX_WAVES:
+            continue
+        elapsed = (now - last_offered_at).total_seconds()
+        wave_scheduler.schedule(
+            request_id,
+            last_wave + 1,
+            delay=max(0.0, settings.DISPATCH_WAVE_TIMEOUT_SECONDS - elapsed),
+        )
+        scheduled += 1
+    return scheduled
+
+
+async def record_offers(
+    db: AsyncSession,
+    request_id: UUID,
+    technicians: Sequence[Technician],
+    wave: int,
+) -> List[Technician]:
+    """Insert one dispatch offer per technician in a single statement; returns those inserted."""
+    inserted = await record_offer_pairs(db, [(request_id, t) for t in technicians], wave)
+    offered = {technician_id for _, technician_id in inserted}
+    return [t for t in technicians if t.id in offered]
+
+
+async def record_offer_pairs(
+    db: AsyncSession,
+    pairs: Sequence[Tuple[UUID, Technician]],
+    wave: int,
+) -> List[Tuple[UUID, UUID]]:
+    """
+    Insert offers for many (request_id, technician) pairs in a single statement.
+    
+    Returns the (request_id, technician_id) pairs actually inserted: pairs
+    that already had an offer, e.g. from a concurrent worker, are skipped.
+    """
+    if not pairs:
+        return []
     
-    # For now, just log
-    print(f"[DISPATCH] Notifying {technician.internal_code} about request {request.reference_code}")
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(seconds=settings.DISPATCH_OFFER_TTL_SECONDS)
+    result = await db.execute(
+        pg_insert(DispatchOffer)
+        .values([
+            {
+                "request_id": request_id,
+                "technician_id": t.id,
+                "wave": wave,
+                "state": OfferState.OFFERED,
+                "offered_at": now,
+                "expires_at": expires_at,
+            }
+            for request_id, t in pairs
+        ])
+        .on_conflict_do_nothing(constraint="uq_dispatch_offers_request_technician")
+        .returning(DispatchOffer.request_id, DispatchOffer.technician_id)
+    )
+    inserted = [tuple(row) for row in result.all()]
+    await record_offers_sent(db, inserted)
+    return inserted
+
+
+async def pending_offers(db: AsyncSession, technician_id: UUID, limit: int = 10) -> list:
+    """
+    Open offers for a technician, newest first.
+    
+    The offer lookup is served by ix_dispatch_offers_pending; request and
+    quote columns are joined in the same statement, without ORM hydration.
+    """
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        select(
+            Request.id,
+            Request.reference_code,
+            Request.category,
+            Request.title,
+            Request.description,
+            Request.severity,
+            Request.ai_confidence,
+            Request.is_urgent,
+            Request.created_at,
+            Request.address,
+            Quote.min_price,
+            Quote.max_price,
+            DispatchOffer.expires_at,
+        )
+        .select_from(DispatchOffer)
+        .join(Request, Request.id == DispatchOffer.request_id)
+        .outerjoin(Quote, Quote.request_id == Request.id)
+        .where(
+            DispatchOffer.technician_id == technician_id,
+            DispatchOffer.state == OfferState.OFFERED,
+            DispatchOffer.expires_at > now,
+            Request.status == RequestStatus.DISPATCHING,
+            Request.technician_id.is_(None),
+        )
+        .order_by(DispatchOffer.offered_at.desc())
+        .limit(limit)
+    )
+    return result.all()
+
+
+async def notify_technicians(technicians: List[Technician], request: Request):
+    """Send notifications to technicians about a new job."""
+    return await notify_technician_batches([(request, technicians)])
+
+
+async def notify_technician_batches(offers: Sequence[Tuple[Request, List[Technician]]]):
+    """Notify technicians for several requests in one fan-out."""
+    messages = []
+    for request, technicians in offers:
+        messages.extend(technician_messages(technicians, request))
+    result = await notification_fan_out.send(messages)
+    if result.failed:
+        print(f"[DISPATCH] {result.failed} of {len(messages)} notifications failed")
+    return result
@@ -0,0 +1,162 @@
+"""
+Dispatch Telemetry Service
+
+Append-only dispatch events and rolling per-technician aggregates (EWMA
+latencies, daily offer/accept rings behind the 7/30-day acceptance ratios),
+maintained in constant time per event instead of being recomputed with
+GROUP BY.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+from uuid import UUID
+
+from sqlalchemy import select, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.dispatch_event import DispatchEvent, DispatchEventType
+from app.models.technician_stats import (
+    TechnicianStats,
+    WINDOW_DAYS,
+    empty_response_histogram,
+    empty_window,
+)
+from app.services.technician_scoring import technician_scores, response_bucket, window_sums
+
+
+@dataclass
+class EventRecord:
+    """A dispatch event to append."""
+    type: DispatchEventType
+    request_id: UUID
+    technician_id: UUID
+    latency_seconds: Optional[float] = None
+
+
+def day_number(when: datetime) -> int:
+    """UTC day number used to address the rolling rings."""
+    return when.astimezone(timezone.utc).date().toordinal()
+
+
+def ewma(previous: Optional[float], sample: float, alpha: float) -> float:
+    return sample if previous is None else previous + alpha * (sample - previous)
+
+
+def acceptance_ratio(stats: TechnicianStats, days: int, today: int) -> Optional[float]:
+    """Accepted/offered over the last `days` days up to `today` (None without offers)."""
+    offers, accepts = window_sums(stats.daily_offers, stats.daily_accepts, stats.window_day, days, today)
+    return min(1.0, accepts / offers) if offers else None
+
+
+def apply_event(stats: TechnicianStats, event: EventRecord, day: int):
+    """
+    Fold one event into a stats row.
+    
+    Work is bounded by WINDOW_DAYS: moving to a new day clears at most that
+    many ring slots, whatever the gap since the previous event.
+    """
+    offers = list(stats.daily_offers or empty_window())
+    accepts = list(stats.daily_accepts or empty_window())
+    if day > stats.window_day:
+        for skipped in range(max(stats.window_day + 1, day - WINDOW_DAYS + 1), day + 1):
+            offers[skipped % WINDOW_DAYS] = 0
+            accepts[skipped % WINDOW_DAYS] = 0
+        stats.window_day = day
+    in_window = day > stats.window_day - WINDOW_DAYS
+    alpha = settings.TELEMETRY_EWMA_ALPHA
+    latency = event.latency_seconds
+    
+    if event.type == DispatchEventType.OFFERED:
+        stats.offers_received += 1
+        if in_window:
+            offers[day % WINDOW_DAYS] += 1
+    elif event.type == DispatchEventType.ACCEPTED:
+        stats.offers_accepted += 1
+        if in_window:
+            accepts[day % WINDOW_DAYS] += 1
+        if latency is not None:
+            histogram = list(stats.response_histogram or empty_response_histogram())
+            histogram[response_bucket(latency)] += 1
+            stats.response_histogram = histogram
+            stats.ewma_response_seconds = ewma(stats.ewma_response_seconds, latency, alpha)
+    elif event.type == DispatchEventType.DECLINED:
+        stats.offers_declined += 1
+        if latency is not None:
+            stats.ewma_response_seconds = ewma(stats.ewma_response_seconds, latency, alpha)
+    elif event.type == DispatchEventType.ARRIVED:
+        if latency is not None:
+            stats.ewma_arrival_seconds = ewma(stats.ewma_arrival_seconds, latency, alpha)
+    
+    # Reassign so the ORM sees the array changes
+    stats.daily_offers = offers
+    stats.daily_accepts = accepts
+
+
+async def record_dispatch_events(
+    db: AsyncSession,
+    events: Sequence[EventRecord],
+    at: Optional[datetime] = None,
+):
+    """
+    Append events and update the aggregates of the technicians involved.
+    
+    One INSERT for the events, one upsert for missing stats rows and one
+    locking SELECT; the updated rows are flushed with the caller's
+    transaction and mirrored into the in-process score store.
+    """
+    if not events:
+        return
+    
+    now = at or datetime.now(timezone.utc)
+    await db.execute(insert(DispatchEvent), [
+        {
+            "type": event.type,
+            "request_id": event.request_id,
+            "technician_id": event.technician_id,
+            "latency_seconds": event.latency_seconds,
+            "occurred_at": now,
+        }
+        for event in events
+    ])
+    
+    # Lock in a stable order so concurrent dispatches cannot deadlock
+    technician_ids = sorted({event.technician_id for event in events})
+    await db.execute(
+        pg_insert(TechnicianStats)
+        .values([
+            {
+                "technician_id": tech_id,
+                "response_histogram": empty_response_histogram(),
+                "daily_offers": empty_window(),
+                "daily_accepts": empty_window(),
+            }
+            for tech_id in technician_ids
+        ])
+        .on_conflict_do_nothing(index_elements=[TechnicianStats.technician_id])
+    )
+    result = await db.execute(
+        select(TechnicianStats)
+        .where(TechnicianStats.technician_id.in_(technician_ids))
+        .order_by(TechnicianStats.technician_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    stats = {row.technician_id: row for row in result.scalars()}
+    
+    day = day_number(now)
+    for event in events:
+        apply_event(stats[event.technician_id], event, day)
+    await db.flush()
+    
+    for row in stats.values():
+        technician_scores.load_stats(row)
+
+
+async def record_offers_sent(db: AsyncSession, pairs: Sequence[tuple]):
+    """OFFERED events for (request_id, technician_id) pairs."""
+    await record_dispatch_events(db, [
+        EventRecord(DispatchEventType.OFFERED, request_id, technician_id)
+        for request_id, technician_id in pairs
+    ])
@@ -0,0 +1,151 @@
+"""
+Dispatch Wave Scheduler
+
+Timer wheel driving wave-based dispatch: when a wave times out without an
+accepted offer, the next (wider) wave is dispatched from the background
+loop instead of request-handler code.
+"""
+import asyncio
+import math
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from uuid import UUID
+
+from app.config import settings
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel with an injectable clock.
+    
+    Scheduling and cancelling are O(1); advance() only visits the slots of
+    the ticks that elapsed. A timer never fires before its deadline, at most
+    one tick after it.
+    """
+    
+    def __init__(
+        self,
+        tick_seconds: float,
+        slots: int = 512,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.tick_seconds = tick_seconds
+        self.clock = clock
+        self._slots: List[Dict[Hashable, Tuple[int, object]]] = [{} for _ in range(slots)]
+        self._timers: Dict[Hashable, int] = {}  # key -> slot
+        self._tick = self._tick_of(clock())
+    
+    def __len__(self) -> int:
+        return len(self._timers)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+    
+    def _tick_of(self, when: float) -> int:
+        return math.floor(when / self.tick_seconds)
+    
+    def schedule(self, key: Hashable, delay: float, payload: object = None):
+        """(Re)arm the timer for key; replaces any pending timer with the same key."""
+        self.cancel(key)
+        deadline = self.clock() + max(0.0, delay)
+        tick = max(math.ceil(deadline / self.tick_seconds), self._tick + 1)
+        slot = tick % len(self._slots)
+        self._slots[slot][key] = (tick, payload)
+        self._timers[key] = slot
+    
+    def cancel(self, key: Hashable) -> bool:
+        """Disarm a timer; returns False if it was not pending."""
+        slot = self._timers.pop(key, None)
+        if slot is None:
+            return False
+        del self._slots[slot][key]
+        return True
+    
+    def advance(self, now: Optional[float] = None) -> List[Tuple[Hashable, object]]:
+        """Move the wheel to now and return the (key, payload) of expired timers."""
+        target = self._tick_of(self.clock() if now is None else now)
+        if target <= self._tick:
+            return []
+        
+        # After a long pause every slot is visited once
+        steps = min(target - self._tick, len(self._slots))
+        due = []
+        for step in range(1, steps + 1):
+            slot = self._slots[(self._tick + step) % len(self._slots)]
+            for key, (tick, payload) in list(slot.items()):
+                if tick <= target:
+                    del slot[key]
+                    del self._timers[key]
+                    due.append((key, payload))
+        self._tick = target
+        return due
+
+
+WaveHandler = Callable[[UUID, int], Awaitable[None]]
+
+
+class WaveScheduler:
+    """
+    Runs dispatch waves when their timers expire.
+    
+    schedule(request_id, wave, delay) arms a timer; on expiry the handler is
+    called with (request_id, wave). The clock is injectable so waves can be
+    driven in virtual time through run_due().
+    """
+    
+    def __init__(
+        self,
+        handler: Optional[WaveHandler] = None,
+        clock: Callable[[], float] = time.monotonic,
+        tick_seconds: Optional[float] = None,
+    ):
+        self.handler = handler
+        self.clock = clock
+        self.tick_seconds = tick_seconds or settings.DISPATCH_WAVE_TICK_SECONDS
+        self.wheel = TimerWheel(self.tick_seconds, clock=clock)
+        self._task: Optional[asyncio.Task] = None
+    
+    def schedule(self, request_id: UUID, wave: int, delay: Optional[float] = None):
+        """Dispatch `wave` of a request after delay (default: the wave timeout)."""
+        if delay is None:
+            delay = settings.DISPATCH_WAVE_TIMEOUT_SECONDS
+        self.wheel.schedule(request_id, delay, wave)
+    
+    def cancel(self, request_id: UUID) -> bool:
+        """Stop escalating a request (accepted or cancelled)."""
+        return self.wheel.cancel(request_id)
+    
+    async def run_due(self, now: Optional[float] = None) -> int:
+        """Fire every expired timer; returns how many waves were started."""
+        due = self.wheel.advance(now)
+        if due:
+            await asyncio.gather(*(self._fire(request_id, wave) for request_id, wave in due))
+        return len(due)
+    
+    async def _fire(self, request_id: UUID, wave: int):
+        try:
+            await self.handler(request_id, wave)
+        except Exception as exc:  # one failing request must not stop the wheel
+            print(f"[DISPATCH] Wave {wave} for request {request_id} failed: {exc!r}")
+    
+    def start(self, handler: Optional[WaveHandler] = None):
+        if handler is not None:
+            self.handler = handler
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            await self.run_due()
+
+
+wave_scheduler = WaveScheduler()
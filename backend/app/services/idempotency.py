@@ -0,0 +1,324 @@
+"""
+Idempotency Service
+
+Replays the first response to an Idempotency-Key instead of running the
+endpoint again. Duplicates that arrive while the first attempt is still
+running wait for it: on the same worker through a shared future, across
+workers by polling the row that attempt claimed. The attempt refreshes its
+claim while the handler runs, so only a crashed worker's claim goes stale
+and can be taken over. Expired keys are purged periodically.
+"""
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import select, update, delete, and_, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.config import settings
+from app.database import async_session
+from app.models.idempotency_key import IdempotencyKey
+from app.services.cache import TTLCache, RedisCache
+
+
+Replay = Tuple[str, int, Any]  # (request hash, status code, JSON body)
+
+
+def _row(user_id: UUID, endpoint: str, key: str):
+    return and_(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.endpoint == endpoint,
+        IdempotencyKey.key == key,
+    )
+
+
+class IdempotencyStore:
+    """Idempotency keys in the database, fronted by a TTL cache of finished responses."""
+    
+    def __init__(self):
+        self._ttl = settings.IDEMPOTENCY_TTL_HOURS * 3600
+        self._cache = TTLCache(settings.IDEMPOTENCY_CACHE_SIZE, self._ttl)
+        self._redis: Optional[RedisCache] = None
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self._purge_task: Optional[asyncio.Task] = None
+        self.executed = 0
+        self.replayed = 0
+        self.joined = 0
+        self.purged = 0
+    
+    def start(self):
+        if settings.IDEMPOTENCY_CACHE_BACKEND == "redis":
+            self._redis = RedisCache(settings.REDIS_URL, "idempotency:", self._ttl)
+        if settings.IDEMPOTENCY_PURGE_ENABLED:
+            self._purge_task = asyncio.create_task(self._purge_periodically())
+    
+    async def stop(self):
+        if self._purge_task is not None:
+            self._purge_task.cancel()
+            try:
+                await self._purge_task
+            except asyncio.CancelledError:
+                pass
+            self._purge_task = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+    
+    async def run(
+        self,
+        key: Optional[str],
+        endpoint: str,
+        user_id: UUID,
+        payload: BaseModel,
+        response: Response,
+        default_status: int,
+        handler: Callable[[], Awaitable[Any]],
+    ):
+        """
+        Run handler once per (user, endpoint, key).
+        
+        Without a key the handler simply runs. Otherwise the first call runs
+        it and records status and body; later calls get a JSONResponse replay.
+        A failed first attempt records nothing, so the client can retry.
+        """
+        if key is None:
+            return await handler()
+        if not 1 <= len(key) <= 255:
+            raise HTTPException(status_code=400, detail="Idempotency-Key non valida")
+        request_hash = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+        scope = f"{endpoint}:{user_id}:{key}"
+        
+        replay = await self._cached(scope)
+        if replay is not None:
+            return self._replay(replay, request_hash)
+        
+        inflight = self._inflight.get(scope)
+        if inflight is not None:
+            # Same worker: wait for the first attempt instead of running again
+            self.joined += 1
+            if inflight[0] != request_hash:
+                raise HTTPException(status_code=422, detail="Idempotency-Key già usata con dati diversi")
+            future = inflight[1]
+            try:
+                replay = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # First attempt went away (client disconnected): start over
+                return await self.run(key, endpoint, user_id, payload, response, default_status, handler)
+            return self._replay(replay, request_hash)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[scope] = (request_hash, future)
+        try:
+            replay = await self._claim_or_wait(user_id, endpoint, key, request_hash)
+            if replay is not None:
+                future.set_result(replay)
+                await self._remember(scope, replay)
+                return self._replay(replay, request_hash)
+            
+            heartbeat = asyncio.create_task(self._heartbeat(user_id, endpoint, key, request_hash))
+            try:
+                result = await handler()
+            except BaseException:
+                await self._release(user_id, endpoint, key)
+                raise
+            finally:
+                heartbeat.cancel()
+            replay = (request_hash, response.status_code or default_status, jsonable_encoder(result))
+            await self._complete(user_id, endpoint, key, replay)
+            self.executed += 1
+            future.set_result(replay)
+            await self._remember(scope, replay)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            if not future.done():
+                future.set_exception(exc)
+                future.exception()  # Retrieved: no warning when nobody was waiting
+            raise
+        finally:
+            del self._inflight[scope]
+    
+    def _replay(self, replay: Replay, request_hash: str) -> JSONResponse:
+        stored_hash, status_code, body = replay
+        if stored_hash != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key già usata con dati diversi")
+        self.replayed += 1
+        return JSONResponse(body, status_code=status_code, headers={"Idempotent-Replayed": "true"})
+    
+    async def _cached(self, scope: str) -> Optional[Replay]:
+        replay = self._cache.get(scope)
+        if replay is None and self._redis is not None:
+            try:
+                stored = await self._redis.get(scope)
+            except Exception as exc:  # Redis down: the database still has it
+                print(f"[IDEMPOTENCY] Redis get failed: {exc!r}")
+                stored = None
+            if stored is not None:
+                replay = tuple(stored)
+                self._cache.set(scope, replay)
+        return replay
+    
+    async def _remember(self, scope: str, replay: Replay):
+        self._cache.set(scope, replay)
+        if self._redis is not None:
+            try:
+                await self._redis.set(scope, list(replay))
+            except Exception as exc:
+                print(f"[IDEMPOTENCY] Redis set failed: {exc!r}")
+    
+    async def _claim_or_wait(self, user_id: UUID, endpoint: str, key: str, request_hash: str) -> Optional[Replay]:
+        """
+        Claim the key, or wait for whoever holds it.
+        
+        Returns None once claimed (the caller runs the handler) or the
+        recorded response. A claim can be taken over when it expired or
+        its attempt is older than IDEMPOTENCY_LOCK_SECONDS (crashed worker).
+        """
+        deadline = asyncio.get_running_loop().time() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            now = datetime.now(timezone.utc)
+            stmt = pg_insert(IdempotencyKey).values(
+                user_id=user_id,
+                endpoint=endpoint,
+                key=key,
+                request_hash=request_hash,
+                locked_at=now,
+                expires_at=now + timedelta(seconds=self._ttl),
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[IdempotencyKey.user_id, IdempotencyKey.endpoint, IdempotencyKey.key],
+                set_={
+                    "request_hash": stmt.excluded.request_hash,
+                    "status_code": None,
+                    "response_body": None,
+                    "locked_at": stmt.excluded.locked_at,
+                    "expires_at": stmt.excluded.expires_at,
+                },
+                where=or_(
+                    IdempotencyKey.expires_at < now,
+                    and_(
+                        IdempotencyKey.status_code.is_(None),
+                        IdempotencyKey.locked_at < now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+                    ),
+                ),
+            ).returning(IdempotencyKey.key)
+            
+            async with async_session() as db:
+                claimed = (await db.execute(stmt)).scalar_one_or_none()
+                await db.commit()
+                if claimed is not None:
+                    return None
+                row = (await db.execute(
+                    select(IdempotencyKey.request_hash, IdempotencyKey.status_code, IdempotencyKey.response_body)
+                    .where(_row(user_id, endpoint, key))
+                )).one_or_none()
+            
+            if row is not None:
+                if row.request_hash != request_hash:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key già usata con dati diversi")
+                if row.status_code is not None:
+                    return tuple(row)
+            # Still running elsewhere (or just released): wait and look again
+            if asyncio.get_running_loop().time() >= deadline:
+                raise HTTPException(status_code=409, detail="Richiesta già in elaborazione, riprova tra poco")
+            self.joined += 1
+            await asyncio.sleep(settings.IDEMPOTENCY_POLL_SECONDS)
+    
+    async def _heartbeat(self, user_id: UUID, endpoint: str, key: str, request_hash: str):
+        """Keep the claim fresh while the handler runs, however long it takes."""
+        while True:
+            await asyncio.sleep(settings.IDEMPOTENCY_LOCK_SECONDS / 3)
+            try:
+                async with async_session() as db:
+                    await db.execute(
+                        update(IdempotencyKey)
+                        .where(
+                            _row(user_id, endpoint, key),
+                            IdempotencyKey.request_hash == request_hash,
+                            IdempotencyKey.status_code.is_(None),
+                        )
+                        .values(locked_at=datetime.now(timezone.utc))
+                    )
+                    await db.commit()
+            except Exception as exc:  # Tried again on the next beat
+                print(f"[IDEMPOTENCY] Heartbeat of {endpoint}:{key} failed: {exc!r}")
+    
+    async def purge_expired(self, batch_size: Optional[int] = None) -> int:
+        """Delete expired keys, batch_size rows per transaction. Returns the rows deleted."""
+        batch_size = batch_size or settings.IDEMPOTENCY_PURGE_BATCH_SIZE
+        now = datetime.now(timezone.utc)
+        due = (
+            select(IdempotencyKey.user_id, IdempotencyKey.endpoint, IdempotencyKey.key)
+            .where(IdempotencyKey.expires_at < now)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        total = 0
+        while True:
+            async with async_session() as db:
+                result = await db.execute(
+                    delete(IdempotencyKey)
+                    .where(tuple_(IdempotencyKey.user_id, IdempotencyKey.endpoint, IdempotencyKey.key).in_(due))
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+            total += result.rowcount
+            if result.rowcount < batch_size:
+                self.purged += total
+                return total
+    
+    async def _purge_periodically(self):
+        while True:
+            try:
+                purged = await self.purge_expired()
+                if purged:
+                    print(f"[IDEMPOTENCY] Purged {purged} expired keys")
+            except Exception as exc:  # keep the loop alive, expired rows are picked up next time
+                print(f"[IDEMPOTENCY] Purge failed: {exc!r}")
+            await asyncio.sleep(settings.IDEMPOTENCY_PURGE_SECONDS)
+    
+    async def _complete(self, user_id: UUID, endpoint: str, key: str, replay: Replay):
+        _, status_code, body = replay
+        async with async_session() as db:
+            await db.execute(
+                update(IdempotencyKey)
+                .where(_row(user_id, endpoint, key))
+                .values(status_code=status_code, response_body=body)
+            )
+            await db.commit()
+    
+    async def _release(self, user_id: UUID, endpoint: str, key: str):
+        try:
+            async with async_session() as db:
+                await db.execute(
+                    delete(IdempotencyKey).where(
+                        _row(user_id, endpoint, key),
+                        IdempotencyKey.status_code.is_(None),
+                    )
+                )
+                await db.commit()
+        except Exception as exc:  # The claim then expires after IDEMPOTENCY_LOCK_SECONDS
+            print(f"[IDEMPOTENCY] Release of {endpoint}:{key} failed: {exc!r}")
+    
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "joined": self.joined,
+            "purged": self.purged,
+            "cache": (self._redis or self._cache).stats(),
+        }
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,210 @@
+"""
+Image Preprocessing Service
+
+Shrinks request photos before they are sent to the vision model. Phone
+photos arrive at 4-12 MB; the model only needs AI_IMAGE_MAX_SIDE pixels.
+Each photo is read and decoded once in a process pool, turned upright
+(EXIF orientation), downscaled and re-encoded as WebP or JPEG at
+AI_IMAGE_QUALITY. The result is stored under the SHA-256 of the original,
+so the same photo is encoded once for every worker and across restarts;
+the hash also keys the diagnosis cache.
+
+Media outside our store (legacy external URLs) and videos pass through
+unchanged.
+"""
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.config import settings
+from app.models.request import MediaType
+from app.services.cache import TTLCache
+from app.services.media_processing import CONTENT_TYPES, WORKER_SETTINGS, configure_worker, open_oriented
+from app.services.media_storage import get_storage
+
+
+# Encoders: format -> (Pillow format, content type, extension)
+MODEL_FORMATS = {
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+}
+
+PHOTO_EXTENSIONS = set(CONTENT_TYPES[MediaType.PHOTO].values())
+
+
+@dataclass
+class PreparedImage:
+    """What the model gets for one request photo."""
+    source_url: str
+    url: str                             # Model-sized copy, or source_url when passed through
+    content_hash: Optional[str] = None   # SHA-256 of the original; None when passed through
+    original_bytes: int = 0
+    bytes: int = 0
+
+
+def model_key(content_hash: str, max_side: int, fmt: str, quality: int) -> str:
+    """Content-addressed key of a model-sized copy; the encoding settings are part of it."""
+    return f"ai/{max_side}-{fmt}-q{quality}/{content_hash}{MODEL_FORMATS[fmt][2]}"
+
+
+def render_for_model(data: bytes, max_side: int, fmt: str, quality: int) -> bytes:
+    """Upright, downscaled, metadata-free copy of a photo in the model format."""
+    image = open_oriented(data, max_side)
+    out = io.BytesIO()
+    options = {"method": 4} if fmt == "webp" else {"optimize": True}
+    image.save(out, MODEL_FORMATS[fmt][0], quality=quality, **options)
+    return out.getvalue()
+
+
+def prepare_object(object_key: str, max_side: int, fmt: str, quality: int) -> dict:
+    """Worker process: read and hash the original, encode the model copy unless already stored."""
+    start = time.perf_counter()
+    storage = get_storage()
+    data = storage.read(object_key)
+    content_hash = hashlib.sha256(data).hexdigest()
+    key = model_key(content_hash, max_side, fmt, quality)
+    info = storage.head(key)
+    if info is None:
+        encoded = render_for_model(data, max_side, fmt, quality)
+        storage.write(key, encoded, MODEL_FORMATS[fmt][1])
+        size = len(encoded)
+    else:
+        size = info.size
+    return {
+        "url": storage.public_url(key),
+        "content_hash": content_hash,
+        "original_bytes": len(data),
+        "bytes": size,
+        "encoded": info is None,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+class ImagePreprocessor:
+    """
+    Runs prepare_object for request photos in a process pool.
+    
+    Results are also kept per source URL (uploaded objects never change),
+    so analysing the same request again does not read the original; the
+    model copy is checked with a HEAD before reuse, since media retention
+    may have deleted it meanwhile.
+    Anything that fails or exceeds AI_IMAGE_TIMEOUT_SECONDS is passed
+    through: the model can still fetch the original.
+    """
+    
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._by_url = TTLCache(settings.AI_IMAGE_CACHE_SIZE, settings.AI_IMAGE_CACHE_TTL_SECONDS)
+        self.prepared = 0
+        self.encoded = 0
+        self.url_hits = 0
+        self.stale_urls = 0
+        self.passed_through = 0
+        self.failed = 0
+        self.original_bytes = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+    
+    @property
+    def running(self) -> bool:
+        return self._pool is not None
+    
+    def start(self):
+        # spawn: children must not inherit the event loop or pooled DB connections
+        self._pool = ProcessPoolExecutor(
+            settings.AI_IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=configure_worker,
+            initargs=({name: getattr(settings, name) for name in WORKER_SETTINGS},),
+        )
+    
+    async def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+    
+    async def prepare(self, media_urls: List[str]) -> List[PreparedImage]:
+        """Model-ready images for media_urls, in order, processed concurrently."""
+        return list(await asyncio.gather(*(self._prepare(url) for url in media_urls)))
+    
+    async def _prepare(self, url: str) -> PreparedImage:
+        key = get_storage().key_for_url(url) if self.running else None
+        if key is None or os.path.splitext(key)[1].lower() not in PHOTO_EXTENSIONS:
+            self.passed_through += 1
+            return PreparedImage(url, url)
+        
+        cached = self._by_url.get(url)
+        if cached is not None and await self._still_stored(cached):
+            self.url_hits += 1
+            self._count(cached)
+            return cached
+        
+        loop = asyncio.get_running_loop()
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(
+                    self._pool,
+                    prepare_object,
+                    key,
+                    settings.AI_IMAGE_MAX_SIDE,
+                    settings.AI_IMAGE_FORMAT,
+                    settings.AI_IMAGE_QUALITY,
+                ),
+                settings.AI_IMAGE_TIMEOUT_SECONDS,
+            )
+        except Exception as exc:  # Unreadable or slow: the model gets the original
+            self.failed += 1
+            print(f"[AI-IMAGE] Preprocessing of {key} failed: {exc!r}")
+            return PreparedImage(url, url)
+        
+        self.prepared += 1
+        self.encoded += result["encoded"]
+        self.seconds += result["seconds"]
+        self.max_seconds = max(self.max_seconds, result["seconds"])
+        image = PreparedImage(url, result["url"], result["content_hash"], result["original_bytes"], result["bytes"])
+        self._by_url.set(url, image)
+        self._count(image)
+        return image
+    
+    async def _still_stored(self, image: PreparedImage) -> bool:
+        """False (and the entry dropped) when the cached model copy is gone from the store."""
+        storage = get_storage()
+        try:
+            info = await asyncio.to_thread(storage.head, storage.key_for_url(image.url))
+        except Exception:  # Store unreachable: the model's fetch will tell
+            return True
+        if info is None:
+            self.stale_urls += 1
+            self._by_url.pop(image.source_url)
+            return False
+        return True
+    
+    def _count(self, image: PreparedImage):
+        self.original_bytes += image.original_bytes
+        self.bytes += image.bytes
+    
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "prepared": self.prepared,
+            "encoded": self.encoded,  # The rest reused a stored copy of the same content
+            "url_hits": self.url_hits,
+            "stale_urls": self.stale_urls,  # Cached copies deleted meanwhile, prepared again
+            "passed_through": self.passed_through,
+            "failed": self.failed,
+            "original_bytes": self.original_bytes,
+            "bytes": self.bytes,
+            "bytes_saved": self.original_bytes - self.bytes,
+            "avg_ms": self.seconds / self.prepared * 1000 if self.prepared else 0.0,
+            "max_ms": self.max_seconds * 1000,
+        }
+
+
+image_preprocessor = ImagePreprocessor()
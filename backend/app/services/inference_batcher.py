@@ -0,0 +1,275 @@
+"""
+Inference Batcher Service
+
+Groups concurrent AI diagnoses into batched calls to the model provider.
+Requests arriving within AI_INFERENCE_BATCH_WINDOW_MS (or until the batch
+is full) are sent together; every caller has a deadline and gets None when
+the model did not answer in time, so it can fall back to the rule engine.
+"""
+import asyncio
+import random
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from app.config import settings
+from app.models.request import Category
+from app.schemas.request import AIAnalysisResponse
+
+
+@dataclass
+class DiagnosisInput:
+    """What the model sees of one request."""
+    request_id: UUID
+    category: Category
+    description: str
+    guided_answers: dict = field(default_factory=dict)
+    media_urls: List[str] = field(default_factory=list)
+    
+    def to_json(self) -> dict:
+        return {
+            "request_id": str(self.request_id),
+            "category": self.category.value,
+            "description": self.description,
+            "guided_answers": self.guided_answers,
+            "media_urls": self.media_urls,
+        }
+
+
+class InferenceBackend:
+    """
+    Base class for model providers.
+    
+    infer_batch receives up to max_batch_size inputs and returns one result
+    per input, in order; None for an input the model could not diagnose.
+    """
+    max_batch_size: int = 1
+    
+    async def infer_batch(self, items: Sequence[DiagnosisInput]) -> List[Optional[AIAnalysisResponse]]:
+        raise NotImplementedError
+    
+    async def close(self):
+        pass
+
+
+class HTTPInferenceBackend(InferenceBackend):
+    """
+    POSTs {"items": [...]} to AI_INFERENCE_URL, expects {"results": [...]}.
+    
+    Each result is an AIAnalysisResponse object or null.
+    """
+    
+    def __init__(self, url: str, max_batch_size: int, timeout: float):
+        import httpx
+        
+        self.url = url
+        self.max_batch_size = max_batch_size
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            headers={"Authorization": f"Bearer {settings.OPENAI_API_KEY}"} if settings.OPENAI_API_KEY else None,
+        )
+    
+    async def infer_batch(self, items: Sequence[DiagnosisInput]) -> List[Optional[AIAnalysisResponse]]:
+        response = await self._client.post(self.url, json={"items": [item.to_json() for item in items]})
+        response.raise_for_status()
+        results = response.json()["results"]
+        if len(results) != len(items):
+            raise ValueError(f"{len(results)} results for {len(items)} items")
+        return [AIAnalysisResponse.model_validate(r) if r is not None else None for r in results]
+    
+    async def close(self):
+        await self._client.aclose()
+
+
+class FakeInferenceBackend(InferenceBackend):
+    """
+    Local stand-in for a model server, answering with the rule engine.
+    
+    A call costs overhead_ms plus per_item_ms for each input, and at most
+    `capacity` calls run at once (like a GPU), so batching pays off the way
+    it does on a real provider. Used by offline benchmarks and the fake
+    HTTP server of the tests.
+    """
+    
+    def __init__(
+        self,
+        overhead_ms: float = 40.0,
+        per_item_ms: float = 2.0,
+        capacity: int = 2,
+        max_batch_size: int = 64,
+        failure_rate: float = 0.0,
+        hang_rate: float = 0.0,
+    ):
+        self.overhead_ms = overhead_ms
+        self.per_item_ms = per_item_ms
+        self.max_batch_size = max_batch_size
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self._capacity = asyncio.Semaphore(capacity)
+        self.calls = 0
+        self.items = 0
+    
+    async def infer_batch(self, items: Sequence[DiagnosisInput]) -> List[Optional[AIAnalysisResponse]]:
+        from app.services.ai_diagnostic import rule_based_diagnosis
+        
+        async with self._capacity:
+            self.calls += 1
+            self.items += len(items)
+            if random.random() < self.hang_rate:
+                await asyncio.sleep(3600)  # Simulate a stuck model
+            await asyncio.sleep((self.overhead_ms + self.per_item_ms * len(items)) / 1000)
+            if random.random() < self.failure_rate:
+                raise RuntimeError("Fake model failure")
+        return [
+            rule_based_diagnosis(i.category, i.guided_answers, i.media_urls).model_copy(update={"confidence": 90})
+            for i in items
+        ]
+
+
+class InferenceBatcher:
+    """
+    Queue in front of an InferenceBackend.
+    
+    A collector takes the first waiting input, then whatever else arrives
+    within the batch window, up to the batch size, and hands the batch to
+    the backend; at most AI_INFERENCE_CONCURRENCY batches are in flight.
+    Inputs whose caller already gave up are dropped before sending.
+    """
+    
+    def __init__(
+        self,
+        backend: Optional[InferenceBackend] = None,
+        window_ms: Optional[float] = None,
+        max_batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ):
+        self.backend = backend
+        self.window_ms = settings.AI_INFERENCE_BATCH_WINDOW_MS if window_ms is None else window_ms
+        self.max_batch_size = max_batch_size or settings.AI_INFERENCE_BATCH_MAX_SIZE
+        self.concurrency = concurrency or settings.AI_INFERENCE_CONCURRENCY
+        self.deadline = deadline or settings.AI_INFERENCE_DEADLINE_SECONDS
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._limit: Optional[asyncio.Semaphore] = None
+        self._in_flight: set = set()
+        self.batches = 0
+        self.answered = 0
+        self.timed_out = 0
+        self.failed = 0
+        self.dropped = 0
+        self.batch_items = 0
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+    
+    def start(self):
+        if self.backend is None:
+            self.backend = HTTPInferenceBackend(
+                settings.AI_INFERENCE_URL,
+                settings.AI_INFERENCE_BATCH_MAX_SIZE,
+                settings.AI_INFERENCE_DEADLINE_SECONDS,
+            )
+        self._queue = asyncio.Queue()
+        self._limit = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        # Queued callers fall back now instead of waiting for their deadline
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_result(None)
+        self._queue = None
+        for task in list(self._in_flight):
+            task.cancel()
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if self.backend is not None:
+            await self.backend.close()
+    
+    async def infer(self, item: DiagnosisInput, deadline: Optional[float] = None) -> Optional[AIAnalysisResponse]:
+        """Model diagnosis of one input, or None if it failed or missed the deadline."""
+        if self._queue is None:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        try:
+            # On timeout wait_for cancels the future, which drops the item if still queued
+            result = await asyncio.wait_for(future, deadline or self.deadline)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            return None
+        if result is None:
+            self.failed += 1
+        else:
+            self.answered += 1
+        return result
+    
+    async def _collect(self) -> List[Tuple[DiagnosisInput, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        size = min(self.max_batch_size, self.backend.max_batch_size)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window_ms / 1000
+        while len(batch) < size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                # Window over: still take whatever is already waiting
+                if self._queue.empty():
+                    break
+                batch.append(self._queue.get_nowait())
+                continue
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            live = [(item, future) for item, future in batch if not future.done()]
+            self.dropped += len(batch) - len(live)
+            if not live:
+                continue
+            await self._limit.acquire()
+            task = asyncio.create_task(self._send(live))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+    
+    async def _send(self, batch: List[Tuple[DiagnosisInput, asyncio.Future]]):
+        self.batches += 1
+        self.batch_items += len(batch)
+        results = [None] * len(batch)
+        try:
+            results = await self.backend.infer_batch([item for item, _ in batch])
+        except Exception as exc:  # Callers fall back to the rule engine
+            print(f"[AI] Batch of {len(batch)} failed: {exc!r}")
+        finally:
+            self._limit.release()
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+    
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches_in_flight": len(self._in_flight),
+            "batches": self.batches,
+            "avg_batch_size": self.batch_items / self.batches if self.batches else 0.0,
+            "answered": self.answered,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "dropped": self.dropped,
+        }
+
+
+inference_batcher = InferenceBatcher()
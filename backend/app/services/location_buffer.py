@@ -0,0 +1,155 @@
+"""
+Location Buffer Service
+
+Keeps the latest GPS ping of each technician in memory and writes them to
+the database in bulk every LOCATION_FLUSH_SECONDS, so frequent pings cost
+one dict assignment each instead of an UPDATE and a commit.
+"""
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import update, values, column, func, or_, Float, String, DateTime
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import async_session
+from app.models.technician import Technician
+
+
+@dataclass
+class Ping:
+    latitude: float
+    longitude: float
+    address: Optional[str]
+    at: datetime
+
+
+class LocationBuffer:
+    """
+    Latest position per technician, coalesced between flushes.
+    
+    Each worker buffers the pings it receives. Flushes only move a row
+    forward in time (location_updated_at), so workers flushing out of order
+    cannot overwrite a newer position with an older one.
+    """
+    
+    def __init__(self):
+        self._pending: Dict[UUID, Ping] = {}
+        self._latest: Dict[UUID, Ping] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.pings = 0
+        self.rows_written = 0
+        self.flushes = 0
+    
+    def __len__(self) -> int:
+        return len(self._pending)
+    
+    def record(
+        self,
+        tech_id: UUID,
+        latitude: float,
+        longitude: float,
+        address: Optional[str] = None,
+        at: Optional[datetime] = None,
+    ):
+        """Buffer a ping, replacing any earlier one not flushed yet."""
+        previous = self._pending.get(tech_id)
+        if address is None and previous is not None:
+            address = previous.address
+        ping = Ping(latitude, longitude, address, at or datetime.now(timezone.utc))
+        self._pending[tech_id] = ping
+        self._latest[tech_id] = ping
+        self.pings += 1
+    
+    def position(self, tech_id: UUID) -> Optional[Tuple[float, float, datetime]]:
+        """Latest (latitude, longitude, at) seen by this worker, flushed or not."""
+        ping = self._latest.get(tech_id)
+        return (ping.latitude, ping.longitude, ping.at) if ping else None
+    
+    async def flush(self, db: AsyncSession) -> int:
+        """Write the buffered positions with one UPDATE ... FROM (VALUES ...)."""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        
+        rows = values(
+            column("id", PG_UUID(as_uuid=True)),
+            column("lon", Float),
+            column("lat", Float),
+            column("address", String),
+            column("at", DateTime(timezone=True)),
+            name="pings",
+        ).data([
+            (tech_id, p.longitude, p.latitude, p.address, p.at)
+            for tech_id, p in batch.items()
+        ])
+        try:
+            result = await db.execute(
+                update(Technician)
+                .where(
+                    Technician.id == rows.c.id,
+                    or_(
+                        Technician.location_updated_at.is_(None),
+                        Technician.location_updated_at < rows.c.at,
+                    ),
+                )
+                .values(
+                    location=func.ST_SetSRID(func.ST_MakePoint(rows.c.lon, rows.c.lat), 4326),
+                    current_address=func.coalesce(rows.c.address, Technician.current_address),
+                    location_updated_at=rows.c.at,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        except Exception:
+            # Put the batch back unless a newer ping arrived meanwhile
+            for tech_id, ping in batch.items():
+                self._pending.setdefault(tech_id, ping)
+            raise
+        
+        self.flushes += 1
+        self.rows_written += result.rowcount
+        return result.rowcount
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        # Last flush so shutdown does not lose the newest positions
+        if self._pending:
+            try:
+                async with async_session() as db:
+                    await self.flush(db)
+            except Exception as exc:
+                print(f"[LOCATION] Final flush of {len(self)} positions failed: {exc!r}")
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.LOCATION_FLUSH_SECONDS)
+            try:
+                async with async_session() as db:
+                    await self.flush(db)
+            except Exception as exc:  # keep buffering, retried on the next tick
+                print(f"[LOCATION] Flush of {len(self)} positions failed: {exc!r}")
+    
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "pings": self.pings,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+
+location_buffer = LocationBuffer()
@@ -0,0 +1,253 @@
+"""
+Media Processing Service
+
+Checks confirmed uploads and derives what the app shows: a thumbnail and a
+downscaled, EXIF-free variant of every photo. Decoding and resizing are
+CPU-bound, so they run in a process pool; the event loop only awaits the
+result and records it on the upload and on any request media pointing at it.
+"""
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import async_session
+from app.models.request import Media, MediaType
+from app.models.upload import Upload, UploadState
+from app.services.media_storage import get_storage
+
+
+# Accepted content types and the extension of their object keys
+CONTENT_TYPES = {
+    MediaType.PHOTO: {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"},
+    MediaType.VIDEO: {"video/mp4": ".mp4", "video/quicktime": ".mov"},
+}
+
+# Leading bytes each content type must start with (checked on confirmation)
+SIGNATURE_BYTES = 16
+SIGNATURES = {
+    "image/jpeg": lambda head: head.startswith(b"\xff\xd8\xff"),
+    "image/png": lambda head: head.startswith(b"\x89PNG\r\n\x1a\n"),
+    "image/webp": lambda head: head[:4] == b"RIFF" and head[8:12] == b"WEBP",
+    "video/mp4": lambda head: head[4:8] == b"ftyp",
+    "video/quicktime": lambda head: head[4:8] in (b"ftyp", b"moov", b"mdat", b"wide", b"free"),
+}
+
+# Larger photos are rejected rather than decoded (decompression bombs)
+MAX_IMAGE_PIXELS = 60_000_000
+
+# Settings a worker process needs to reach the same storage
+WORKER_SETTINGS = [
+    "MEDIA_STORAGE_BACKEND",
+    "MEDIA_FILESYSTEM_ROOT",
+    "MEDIA_PUBLIC_BASE_URL",
+    "S3_BUCKET_NAME",
+    "S3_ENDPOINT_URL",
+    "AWS_REGION",
+    "AWS_ACCESS_KEY_ID",
+    "AWS_SECRET_ACCESS_KEY",
+]
+
+
+class InvalidMedia(ValueError):
+    """The object is not a decodable photo."""
+
+
+def max_size_bytes(media_type: MediaType) -> int:
+    mb = settings.MAX_PHOTO_SIZE_MB if media_type == MediaType.PHOTO else settings.MAX_VIDEO_SIZE_MB
+    return mb * 1024 * 1024
+
+
+def upload_problem(upload: Upload, size: int, content_type: Optional[str], head: bytes) -> Optional[str]:
+    """Why a stored object cannot be accepted for this upload, or None (messages for the client)."""
+    if size > max_size_bytes(upload.type):
+        return "File troppo grande"
+    if size != upload.declared_size_bytes:
+        return "Dimensione del file diversa da quella dichiarata"
+    if content_type and content_type.split(";")[0].strip().lower() != upload.content_type:
+        return "Tipo di file diverso da quello dichiarato"
+    if not SIGNATURES[upload.content_type](head):
+        return "Il contenuto del file non corrisponde al tipo dichiarato"
+    return None
+
+
+def open_oriented(data: bytes, max_side: int):
+    """
+    Decode a photo upright, in RGB, with its longest side at most max_side.
+    
+    The EXIF orientation is applied to the pixels; callers drop the EXIF
+    block (GPS position, device) by not writing it back. JPEGs are decoded
+    at reduced scale (draft mode) when much larger than needed.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > MAX_IMAGE_PIXELS:
+            raise InvalidMedia(f"Image too large: {image.width}x{image.height}")
+        image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as exc:
+        raise InvalidMedia(str(exc) or exc.__class__.__name__) from exc
+    return image
+
+
+def render_variants(data: bytes, thumbnail_size: int, variant_max_side: int) -> Tuple[bytes, bytes]:
+    """JPEG thumbnail and downscaled variant of a photo, both without metadata."""
+    from PIL import Image
+    
+    image = open_oriented(data, variant_max_side)
+    try:
+        variant = io.BytesIO()
+        image.save(variant, "JPEG", quality=85, optimize=True)
+        image.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS)
+        thumbnail = io.BytesIO()
+        image.save(thumbnail, "JPEG", quality=80, optimize=True)
+    except OSError as exc:
+        raise InvalidMedia(str(exc) or exc.__class__.__name__) from exc
+    return thumbnail.getvalue(), variant.getvalue()
+
+
+def derived_key(object_key: str, suffix: str) -> str:
+    """uploads/u/123.png -> uploads/u/123_thumb.jpg"""
+    return object_key.rsplit(".", 1)[0] + f"_{suffix}.jpg"
+
+
+def process_photo(object_key: str, thumbnail_size: int, variant_max_side: int) -> Dict[str, object]:
+    """Worker process: read the original, store thumbnail and variant, return the column values."""
+    storage = get_storage()
+    data = storage.read(object_key)
+    thumbnail, variant = render_variants(data, thumbnail_size, variant_max_side)
+    thumbnail_key = derived_key(object_key, "thumb")
+    variant_key = derived_key(object_key, "variant")
+    storage.write(thumbnail_key, thumbnail, "image/jpeg")
+    storage.write(variant_key, variant, "image/jpeg")
+    return {
+        "file_size_bytes": len(data),
+        "content_hash": hashlib.sha256(data).hexdigest(),
+        "thumbnail_url": storage.public_url(thumbnail_key),
+        "variant_url": storage.public_url(variant_key),
+    }
+
+
+def configure_worker(values: dict):
+    """Pool initializer: apply the parent's storage settings in a spawned worker."""
+    for name, value in values.items():
+        setattr(settings, name, value)
+
+
+class MediaProcessor:
+    """
+    Runs process_photo for confirmed uploads in a process pool.
+    
+    Uploads stay CONFIRMED until processed, so recover() picks up the ones
+    a previous worker did not finish.
+    """
+    
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or settings.MEDIA_PROCESS_WORKERS
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: set = set()
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.seconds = 0.0
+    
+    def start(self):
+        # spawn: children must not inherit the event loop or pooled DB connections
+        self._pool = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=configure_worker,
+            initargs=({name: getattr(settings, name) for name in WORKER_SETTINGS},),
+        )
+    
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+    
+    def submit(self, upload_id: UUID, object_key: str, media_type: MediaType, url: str):
+        """Process an upload in the background (no-op when the processor is not running)."""
+        if self._pool is None:
+            return
+        task = asyncio.create_task(self._process(upload_id, object_key, media_type, url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def recover(self, db: AsyncSession):
+        """Resubmit uploads confirmed but not processed (e.g. before a restart)."""
+        result = await db.execute(
+            select(Upload.id, Upload.object_key, Upload.type, Upload.url)
+            .where(Upload.state == UploadState.CONFIRMED)
+        )
+        for row in result.all():
+            self.submit(*row)
+    
+    async def _process(self, upload_id: UUID, object_key: str, media_type: MediaType, url: str):
+        if media_type != MediaType.PHOTO:
+            # No frame extraction for videos: nothing to derive
+            await self._finish(upload_id, url, {"state": UploadState.PROCESSED})
+            return
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            values = await loop.run_in_executor(
+                self._pool,
+                process_photo,
+                object_key,
+                settings.MEDIA_THUMBNAIL_SIZE,
+                settings.MEDIA_VARIANT_MAX_SIDE,
+            )
+        except InvalidMedia as exc:
+            self.rejected += 1
+            await asyncio.to_thread(get_storage().delete, object_key)
+            await self._finish(upload_id, url, {"state": UploadState.REJECTED, "error": str(exc)[:255]})
+            return
+        except Exception as exc:  # Storage or pool trouble: stays CONFIRMED for recover()
+            self.failed += 1
+            print(f"[MEDIA] Processing of {object_key} failed: {exc!r}")
+            return
+        self.seconds += time.perf_counter() - start
+        self.processed += 1
+        await self._finish(upload_id, url, {"state": UploadState.PROCESSED, **values})
+    
+    async def _finish(self, upload_id: UUID, url: str, values: dict):
+        """Record the outcome on the upload and on request media already using it."""
+        async with async_session() as db:
+            await db.execute(update(Upload).where(Upload.id == upload_id).values(**values))
+            if values.get("thumbnail_url"):
+                await db.execute(
+                    update(Media)
+                    .where(Media.url == url)
+                    .values(thumbnail_url=values["thumbnail_url"], file_size_bytes=values["file_size_bytes"])
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+    
+    def stats(self) -> dict:
+        return {
+            "running": self._pool is not None,
+            "in_progress": len(self._tasks),
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "avg_seconds": self.seconds / self.processed if self.processed else 0.0,
+        }
+
+
+media_processor = MediaProcessor()
@@ -0,0 +1,327 @@
+"""
+Media Retention Service
+
+Deletes request photos and videos once Media.expires_at has passed
+(MEDIA_RETENTION_DAYS after the request was created). Due rows are read
+through the partial index ix_request_media_expires_due in chunks:
+1. SELECT ... FOR UPDATE SKIP LOCKED, so workers sweeping at the same time
+   take disjoint chunks instead of queueing on the same rows, then claim
+   them by moving expires_at MEDIA_RETENTION_CLAIM_SECONDS ahead, and commit
+2. delete the stored objects (original, thumbnail, variant) with bulk
+   calls of DELETE_BATCH keys, with no transaction open
+3. one UPDATE flipping is_deleted and one INSERT of the audit rows
+Rows whose objects could not be deleted (or whose worker died) become due
+again when the claim runs out; deleting an object twice is harmless.
+The model-sized copy is keyed by content hash and shared by uploads of the
+same bytes: it is deleted once no remaining upload has that hash.
+Uploads never attached to a request are swept the same way once expired.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional, Set, Tuple
+
+from sqlalchemy import select, update, delete, insert, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import async_session
+from app.models.request import Media
+from app.models.upload import Upload
+from app.models.audit_log import AuditLog, AuditAction, EntityType
+from app.services.media_processing import derived_key
+from app.services.image_preprocessing import model_key
+from app.services.media_storage import DELETE_BATCH, MediaStorage, get_storage
+
+
+@dataclass
+class SweptChunk:
+    selected: int = 0   # Due rows claimed by this chunk
+    expired: int = 0    # Rows marked deleted (or removed, for uploads)
+    objects: int = 0    # Objects deleted from the store
+    failed: int = 0     # Objects the store could not delete; their rows are due again after the claim
+
+
+def object_keys(row) -> List[str]:
+    """Objects stored for one upload alone: the original and the derived JPEGs."""
+    if not row.object_key:
+        return []  # Media hosted elsewhere: nothing of ours to delete
+    keys = [row.object_key]
+    if row.thumbnail_url:
+        keys.append(derived_key(row.object_key, "thumb"))
+    if row.variant_url:
+        keys.append(derived_key(row.object_key, "variant"))
+    return keys
+
+
+def claimed_until(now: datetime) -> datetime:
+    """expires_at of claimed rows: other sweeps skip them until then."""
+    return max(now, datetime.now(timezone.utc)) + timedelta(seconds=settings.MEDIA_RETENTION_CLAIM_SECONDS)
+
+
+async def delete_objects(storage: MediaStorage, keys: Set[str]) -> Set[str]:
+    """Bulk-delete keys, DELETE_BATCH per call; returns the keys that failed."""
+    keys = sorted(keys)
+    failed = set()
+    for i in range(0, len(keys), DELETE_BATCH):
+        batch = keys[i:i + DELETE_BATCH]
+        try:
+            failed.update(await asyncio.to_thread(storage.delete_many, batch))
+        except Exception as exc:  # Whole call failed: retried on the next sweep
+            print(f"[RETENTION] Deleting {len(batch)} objects failed: {exc!r}")
+            failed.update(batch)
+    return failed
+
+
+async def delete_model_copies(db: AsyncSession, storage: MediaStorage, hashes: Set[str]) -> Tuple[int, int]:
+    """
+    Delete the model-sized copies no remaining upload shares. Returns (deleted, failed).
+    
+    Runs after the chunk's uploads are gone, so of two chunks removing the
+    last uploads of one hash, the later one sees neither and deletes it.
+    A copy that fails to delete is left behind.
+    """
+    if not hashes:
+        return 0, 0
+    result = await db.execute(select(Upload.content_hash).where(Upload.content_hash.in_(hashes)).distinct())
+    shared = set(result.scalars().all())
+    await db.commit()
+    keys = {
+        model_key(content_hash, settings.AI_IMAGE_MAX_SIDE, settings.AI_IMAGE_FORMAT, settings.AI_IMAGE_QUALITY)
+        for content_hash in hashes - shared
+    }
+    failed = await delete_objects(storage, keys)
+    if failed:
+        print(f"[RETENTION] {len(failed)} model-sized copies could not be deleted")
+    return len(keys) - len(failed), len(failed)
+
+
+def audit_rows(entity_ids: List, new_values: List[dict]) -> List[dict]:
+    return [
+        {
+            "entity_type": EntityType.MEDIA,
+            "entity_id": entity_id,
+            "action": AuditAction.MEDIA_AUTO_EXPIRED,
+            "actor_type": "system",
+            "new_value": new_value,
+        }
+        for entity_id, new_value in zip(entity_ids, new_values)
+    ]
+
+
+async def sweep_media_chunk(
+    db: AsyncSession,
+    storage: MediaStorage,
+    now: datetime,
+    limit: int,
+) -> SweptChunk:
+    """Expire up to `limit` due request media in the caller's session; commits as it goes."""
+    query = (
+        select(
+            Media.id,
+            Media.request_id,
+            Upload.id.label("upload_id"),
+            Upload.object_key,
+            Upload.thumbnail_url,
+            Upload.variant_url,
+            Upload.content_hash,
+        )
+        .outerjoin(Upload, Upload.url == Media.url)
+        .where(~Media.is_deleted, Media.expires_at <= now)  # Matches the partial index predicate
+        .order_by(Media.expires_at)
+        .limit(limit)
+        .with_for_update(of=Media, skip_locked=True)
+    )
+    rows = (await db.execute(query)).all()
+    if rows:
+        await db.execute(
+            update(Media)
+            .where(Media.id.in_([row.id for row in rows]))
+            .values(expires_at=claimed_until(now))
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()  # Locks released before talking to the store
+    
+    keys = {row.id: object_keys(row) for row in rows}
+    all_keys = {key for row_keys in keys.values() for key in row_keys}
+    failed = await delete_objects(storage, all_keys)
+    done = [row for row in rows if not failed.intersection(keys[row.id])]
+    
+    if done:
+        await db.execute(
+            update(Media)
+            .where(Media.id.in_([row.id for row in done]))
+            .values(is_deleted=True, thumbnail_url=None)
+            .execution_options(synchronize_session=False)
+        )
+        upload_ids = {row.upload_id for row in done if row.upload_id}
+        if upload_ids:
+            await db.execute(delete(Upload).where(Upload.id.in_(upload_ids)))
+        await db.execute(
+            insert(AuditLog),
+            audit_rows(
+                [row.id for row in done],
+                [{"request_id": str(row.request_id), "objects": len(keys[row.id])} for row in done],
+            ),
+        )
+        await db.commit()
+    models, models_failed = await delete_model_copies(
+        db, storage, {row.content_hash for row in done if row.upload_id and row.content_hash}
+    )
+    return SweptChunk(
+        selected=len(rows),
+        expired=len(done),
+        objects=len(all_keys) - len(failed) + models,
+        failed=len(failed) + models_failed,
+    )
+
+
+async def sweep_upload_chunk(
+    db: AsyncSession,
+    storage: MediaStorage,
+    now: datetime,
+    limit: int,
+) -> SweptChunk:
+    """Remove up to `limit` expired uploads no live request media refers to; commits as it goes."""
+    attached = exists().where(Media.url == Upload.url, ~Media.is_deleted)
+    query = (
+        select(Upload.id, Upload.object_key, Upload.thumbnail_url, Upload.variant_url, Upload.content_hash)
+        .where(Upload.expires_at <= now, ~attached)
+        .order_by(Upload.expires_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    rows = (await db.execute(query)).all()
+    if rows:
+        await db.execute(
+            update(Upload)
+            .where(Upload.id.in_([row.id for row in rows]))
+            .values(expires_at=claimed_until(now))
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()  # Locks released before talking to the store
+    
+    keys = {row.id: object_keys(row) for row in rows}
+    all_keys = {key for row_keys in keys.values() for key in row_keys}
+    failed = await delete_objects(storage, all_keys)
+    done = [row for row in rows if not failed.intersection(keys[row.id])]
+    
+    if done:
+        await db.execute(delete(Upload).where(Upload.id.in_([row.id for row in done])))
+        await db.execute(
+            insert(AuditLog),
+            audit_rows(
+                [row.id for row in done],
+                [{"upload": True, "objects": len(keys[row.id])} for row in done],
+            ),
+        )
+        await db.commit()
+    models, models_failed = await delete_model_copies(
+        db, storage, {row.content_hash for row in done if row.content_hash}
+    )
+    return SweptChunk(
+        selected=len(rows),
+        expired=len(done),
+        objects=len(all_keys) - len(failed) + models,
+        failed=len(failed) + models_failed,
+    )
+
+
+class MediaRetentionSweeper:
+    """
+    Periodic retention sweep on every worker.
+    
+    SKIP LOCKED and the claim let the workers' sweeps overlap safely: each
+    chunk takes rows no other sweep holds, and rows whose objects could not
+    be deleted are due again once their claim runs out.
+    """
+    
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession] = async_session,
+        storage: Optional[MediaStorage] = None,
+    ):
+        self._session_factory = session_factory
+        self._storage = storage
+        self._task: Optional[asyncio.Task] = None
+        self.sweeps = 0
+        self.chunks = 0
+        self.media_expired = 0
+        self.uploads_expired = 0
+        self.objects_deleted = 0
+        self.objects_failed = 0
+        self.last_sweep_seconds = 0.0
+    
+    async def sweep(
+        self,
+        chunk_size: Optional[int] = None,
+        max_chunks: Optional[int] = None,
+        now: Optional[datetime] = None,
+    ) -> dict:
+        """Expire due media, then orphan uploads, until none are left or max_chunks chunks ran."""
+        chunk_size = chunk_size or settings.MEDIA_RETENTION_CHUNK_SIZE
+        max_chunks = max_chunks or settings.MEDIA_RETENTION_MAX_CHUNKS
+        now = now or datetime.now(timezone.utc)
+        storage = self._storage or get_storage()
+        start = time.perf_counter()
+        totals = {"media": 0, "uploads": 0, "objects": 0, "failed": 0, "chunks": 0}
+        
+        for name, sweep_chunk in (("media", sweep_media_chunk), ("uploads", sweep_upload_chunk)):
+            while totals["chunks"] < max_chunks:
+                async with self._session_factory() as db:
+                    chunk = await sweep_chunk(db, storage, now, chunk_size)
+                totals["chunks"] += 1
+                totals[name] += chunk.expired
+                totals["objects"] += chunk.objects
+                totals["failed"] += chunk.failed
+                # A short chunk means nothing else is due (or left unlocked)
+                if chunk.selected < chunk_size or chunk.expired == 0:
+                    break
+        
+        self.sweeps += 1
+        self.chunks += totals["chunks"]
+        self.media_expired += totals["media"]
+        self.uploads_expired += totals["uploads"]
+        self.objects_deleted += totals["objects"]
+        self.objects_failed += totals["failed"]
+        self.last_sweep_seconds = time.perf_counter() - start
+        return totals
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+    
+    async def _run(self):
+        while True:
+            try:
+                totals = await self.sweep()
+                if totals["media"] or totals["uploads"]:
+                    print(f"[RETENTION] Expired {totals['media']} media and {totals['uploads']} uploads, "
+                          f"{totals['objects']} objects deleted, {totals['failed']} failed")
+            except Exception as exc:  # keep the loop alive, due rows are picked up next time
+                print(f"[RETENTION] Sweep failed: {exc!r}")
+            await asyncio.sleep(settings.MEDIA_RETENTION_SWEEP_SECONDS)
+    
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "sweeps": self.sweeps,
+            "chunks": self.chunks,
+            "media_expired": self.media_expired,
+            "uploads_expired": self.uploads_expired,
+            "objects_deleted": self.objects_deleted,
+            "objects_failed": self.objects_failed,
+            "last_sweep_seconds": self.last_sweep_seconds,
+        }
+
+
+media_retention = MediaRetentionSweeper()
@@ -0,0 +1,222 @@
+"""
+Media Storage Service
+
+Object store behind client uploads. Clients PUT bytes straight to a
+presigned URL, so photo and video bodies never pass through the API
+workers. Two backends with the same interface: S3 (or any S3-compatible
+stand-in, via S3_ENDPOINT_URL) and a local filesystem for development and
+tests, whose "presigned" URLs are HMAC-signed routes of this API.
+
+All methods are blocking; async callers go through asyncio.to_thread.
+"""
+import hashlib
+import hmac
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from app.config import settings
+
+
+LOCAL_ROUTE = "/api/v1/media/local"
+DELETE_BATCH = 1000  # Keys per S3 DeleteObjects call (the API maximum)
+
+
+@dataclass
+class ObjectInfo:
+    """What the store knows about a stored object."""
+    size: int
+    content_type: Optional[str]
+
+
+class MediaStorage:
+    """
+    Base class for object stores.
+    
+    presign_put returns the URL and the headers the client must send with
+    its PUT; public_url is where the stored object can be read afterwards.
+    """
+    
+    def presign_put(self, key: str, content_type: str, expires_in: int) -> Tuple[str, Dict[str, str]]:
+        raise NotImplementedError
+    
+    def head(self, key: str) -> Optional[ObjectInfo]:
+        raise NotImplementedError
+    
+    def read(self, key: str, length: Optional[int] = None) -> bytes:
+        raise NotImplementedError
+    
+    def write(self, key: str, data: bytes, content_type: str):
+        raise NotImplementedError
+    
+    def delete(self, key: str):
+        raise NotImplementedError
+    
+    def delete_many(self, keys: List[str]) -> List[str]:
+        """Delete up to DELETE_BATCH objects; returns the keys that could not be deleted."""
+        raise NotImplementedError
+    
+    def public_url(self, key: str) -> str:
+        raise NotImplementedError
+    
+    def key_for_url(self, url: str) -> Optional[str]:
+        """Key of the object public_url points to, or None for URLs outside this store."""
+        prefix = self.public_url("")
+        return unquote(url[len(prefix):]) if url.startswith(prefix) and len(url) > len(prefix) else None
+
+
+class S3Storage(MediaStorage):
+    """S3 bucket through boto3; S3_ENDPOINT_URL points it at MinIO or another stand-in."""
+    
+    def __init__(self):
+        import boto3
+        
+        self.bucket = settings.S3_BUCKET_NAME
+        self._client = boto3.client(
+            "s3",
+            region_name=settings.AWS_REGION,
+            endpoint_url=settings.S3_ENDPOINT_URL or None,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID or None,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY or None,
+        )
+    
+    def presign_put(self, key: str, content_type: str, expires_in: int) -> Tuple[str, Dict[str, str]]:
+        url = self._client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": self.bucket, "Key": key, "ContentType": content_type},
+            ExpiresIn=expires_in,
+        )
+        return url, {"Content-Type": content_type}
+    
+    def head(self, key: str) -> Optional[ObjectInfo]:
+        from botocore.exceptions import ClientError
+        
+        try:
+            response = self._client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return ObjectInfo(size=response["ContentLength"], content_type=response.get("ContentType"))
+    
+    def read(self, key: str, length: Optional[int] = None) -> bytes:
+        params = {"Bucket": self.bucket, "Key": key}
+        if length is not None:
+            params["Range"] = f"bytes=0-{length - 1}"
+        return self._client.get_object(**params)["Body"].read()
+    
+    def write(self, key: str, data: bytes, content_type: str):
+        self._client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type)
+    
+    def delete(self, key: str):
+        self._client.delete_object(Bucket=self.bucket, Key=key)
+    
+    def delete_many(self, keys: List[str]) -> List[str]:
+        response = self._client.delete_objects(
+            Bucket=self.bucket,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+        # Missing keys count as deleted; only real failures come back
+        return [error["Key"] for error in response.get("Errors", [])]
+    
+    def public_url(self, key: str) -> str:
+        if settings.MEDIA_PUBLIC_BASE_URL:
+            return f"{settings.MEDIA_PUBLIC_BASE_URL.rstrip('/')}/{quote(key)}"
+        if settings.S3_ENDPOINT_URL:
+            return f"{settings.S3_ENDPOINT_URL.rstrip('/')}/{self.bucket}/{quote(key)}"
+        return f"https://{self.bucket}.s3.{settings.AWS_REGION}.amazonaws.com/{quote(key)}"
+
+
+class FilesystemStorage(MediaStorage):
+    """
+    Objects as files under MEDIA_FILESYSTEM_ROOT.
+    
+    Uploads go to PUT {LOCAL_ROUTE}/{key}?expires=...&signature=..., an
+    HMAC of key, content type and expiry, checked by verify_signature.
+    The content type is kept in a sidecar file.
+    """
+    
+    def __init__(self, root: Optional[str] = None):
+        self.root = os.path.abspath(root or settings.MEDIA_FILESYSTEM_ROOT)
+    
+    def path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+    
+    def presign_put(self, key: str, content_type: str, expires_in: int) -> Tuple[str, Dict[str, str]]:
+        expires = int(time.time()) + expires_in
+        signature = sign_upload(key, content_type, expires)
+        return (
+            f"{LOCAL_ROUTE}/{quote(key)}?expires={expires}&signature={signature}",
+            {"Content-Type": content_type},
+        )
+    
+    def head(self, key: str) -> Optional[ObjectInfo]:
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return None
+        content_type = None
+        if os.path.isfile(path + ".type"):
+            with open(path + ".type") as f:
+                content_type = f.read().strip() or None
+        return ObjectInfo(size=os.path.getsize(path), content_type=content_type)
+    
+    def read(self, key: str, length: Optional[int] = None) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read() if length is None else f.read(length)
+    
+    def write(self, key: str, data: bytes, content_type: str):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".part", "wb") as f:
+            f.write(data)
+        os.replace(path + ".part", path)
+        with open(path + ".type", "w") as f:
+            f.write(content_type)
+    
+    def delete(self, key: str):
+        for path in (self.path(key), self.path(key) + ".type"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    
+    def delete_many(self, keys: List[str]) -> List[str]:
+        failed = []
+        for key in keys:
+            try:
+                self.delete(key)
+            except (OSError, ValueError):
+                failed.append(key)
+        return failed
+    
+    def public_url(self, key: str) -> str:
+        base = settings.MEDIA_PUBLIC_BASE_URL or LOCAL_ROUTE
+        return f"{base.rstrip('/')}/{quote(key)}"
+
+
+def sign_upload(key: str, content_type: str, expires: int) -> str:
+    """HMAC authorizing a filesystem-backend PUT."""
+    message = f"{key}\n{content_type}\n{expires}".encode()
+    return hmac.new(settings.MEDIA_SIGNING_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify_signature(key: str, content_type: str, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(sign_upload(key, content_type, expires), signature)
+
+
+_storage: Optional[MediaStorage] = None
+
+
+def get_storage() -> MediaStorage:
+    """Storage configured by MEDIA_STORAGE_BACKEND (one per process)."""
+    global _storage
+    if _storage is None:
+        _storage = FilesystemStorage() if settings.MEDIA_STORAGE_BACKEND == "filesystem" else S3Storage()
+    return _storage
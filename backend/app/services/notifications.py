@@ -0,0 +1,335 @@
+"""
+Notification Service
+
+Concurrent, bounded fan-out of technician notifications over push, SMS and WhatsApp.
+"""
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Dict, List, Optional, Sequence
+
+from app.config import settings
+
+
+class Channel(str, Enum):
+    """Notification channels."""
+    PUSH = "push"            # Firebase Cloud Messaging
+    SMS = "sms"              # Twilio
+    WHATSAPP = "whatsapp"    # WhatsApp Business API
+
+
+@dataclass
+class Message:
+    """A single notification to one recipient."""
+    channel: Channel
+    recipient: str  # FCM token or phone number
+    title: str
+    body: str
+    data: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class FanOutResult:
+    """Outcome of a fan-out run."""
+    sent: int = 0
+    failed: int = 0
+    attempts: int = 0
+    latencies_ms: List[float] = field(default_factory=list)  # Per delivered message
+
+
+class NotificationProvider:
+    """
+    Base class for channel providers.
+    
+    send_batch receives up to max_batch_size messages sharing title/body and
+    returns one success flag per message, in order.
+    """
+    channel: Channel
+    max_batch_size: int = 1
+    
+    async def send_batch(self, messages: Sequence[Message]) -> List[bool]:
+        raise NotImplementedError
+
+
+class LogProvider(NotificationProvider):
+    """Fallback provider that only logs (no credentials configured)."""
+    
+    def __init__(self, channel: Channel):
+        self.channel = channel
+        self.max_batch_size = 500 if channel == Channel.PUSH else 1
+    
+    async def send_batch(self, messages: Sequence[Message]) -> List[bool]:
+        for message in messages:
+            print(f"[NOTIFY:{self.channel.value}] {message.recipient}: {message.body}")
+        return [True] * len(messages)
+
+
+class FakeProvider(NotificationProvider):
+    """
+    Local stand-in with configurable latency and failure rate.
+    
+    Used for offline benchmarks and tests of the fan-out engine.
+    """
+    
+    def __init__(
+        self,
+        channel: Channel,
+        latency_ms: float = 50.0,
+        jitter_ms: float = 20.0,
+        failure_rate: float = 0.0,
+        max_batch_size: int = 1,
+        hang_rate: float = 0.0,
+    ):
+        self.channel = channel
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.max_batch_size = max_batch_size
+        self.hang_rate = hang_rate
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+    
+    async def send_batch(self, messages: Sequence[Message]) -> List[bool]:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if random.random() < self.hang_rate:
+                await asyncio.sleep(3600)  # Simulate a stuck connection
+            delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            await asyncio.sleep(delay)
+            return [random.random() >= self.failure_rate for _ in messages]
+        finally:
+            self.in_flight -= 1
+
+
+class FirebasePushProvider(NotificationProvider):
+    """FCM multicast (up to 500 tokens per call)."""
+    channel = Channel.PUSH
+    max_batch_size = 500
+    
+    def __init__(self):
+        import firebase_admin
+        from firebase_admin import credentials, messaging
+        
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(
+                credentials.Certificate(settings.FIREBASE_CREDENTIALS_PATH),
+                {"projectId": settings.FIREBASE_PROJECT_ID},
+            )
+        self._messaging = messaging
+    
+    async def send_batch(self, messages: Sequence[Message]) -> List[bool]:
+        first = messages[0]
+        multicast = self._messaging.MulticastMessage(
+            tokens=[m.recipient for m in messages],
+            notification=self._messaging.Notification(title=first.title, body=first.body),
+            data=first.data,
+        )
+        # The Admin SDK is blocking
+        response = await asyncio.to_thread(self._messaging.send_each_for_multicast, multicast)
+        return [r.success for r in response.responses]
+
+
+class TwilioSMSProvider(NotificationProvider):
+    """Single-recipient SMS through Twilio."""
+    channel = Channel.SMS
+    max_batch_size = 1
+    
+    def __init__(self):
+        from twilio.rest import Client
+        
+        self._client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+    
+    async def send_batch(self, messages: Sequence[Message]) -> List[bool]:
+        message = messages[0]
+        await asyncio.to_thread(
+            self._client.messages.create,
+            to=message.recipient,
+            from_=settings.TWILIO_PHONE_NUMBER,
+            body=f"{message.title}\n{message.body}",
+        )
+        return [True]
+
+
+class WhatsAppProvider(NotificationProvider):
+    """Single-recipient text message through the WhatsApp Cloud API."""
+    channel = Channel.WHATSAPP
+    max_batch_size = 1
+    
+    def __init__(self):
+        import httpx
+        
+        self._client = httpx.AsyncClient(
+            base_url="https://graph.facebook.com/v18.0",
+            headers={"Authorization": f"Bearer {settings.WHATSAPP_API_TOKEN}"},
+        )
+    
+    async def send_batch(self, messages: Sequence[Message]) -> List[bool]:
+        message = messages[0]
+        response = await self._client.post(
+            f"/{settings.WHATSAPP_PHONE_ID}/messages",
+            json={
+                "messaging_product": "whatsapp",
+                "to": message.recipient,
+                "type": "text",
+                "text": {"body": f"{message.title}\n{message.body}"},
+            },
+        )
+        response.raise_for_status()
+        return [True]
+
+
+def _default_providers() -> Dict[Channel, NotificationProvider]:
+    """Real providers where credentials are configured, log-only otherwise."""
+    providers: Dict[Channel, NotificationProvider] = {}
+    if settings.FIREBASE_CREDENTIALS_PATH:
+        providers[Channel.PUSH] = FirebasePushProvider()
+    if settings.TWILIO_ACCOUNT_SID:
+        providers[Channel.SMS] = TwilioSMSProvider()
+    if settings.WHATSAPP_API_TOKEN:
+        providers[Channel.WHATSAPP] = WhatsAppProvider()
+    for channel in Channel:
+        providers.setdefault(channel, LogProvider(channel))
+    return providers
+
+
+CHANNEL_CONCURRENCY = {
+    Channel.PUSH: lambda: settings.NOTIFY_PUSH_CONCURRENCY,
+    Channel.SMS: lambda: settings.NOTIFY_SMS_CONCURRENCY,
+    Channel.WHATSAPP: lambda: settings.NOTIFY_WHATSAPP_CONCURRENCY,
+}
+
+
+class NotificationFanOut:
+    """
+    Sends many messages concurrently.
+    
+    - Messages are grouped per channel and chunked into multicast batches
+      where the provider supports it.
+    - Each channel has its own concurrency limit.
+    - Every attempt has a timeout; failed recipients are retried with
+      exponential backoff and full jitter.
+    """
+    
+    def __init__(
+        self,
+        providers: Optional[Dict[Channel, NotificationProvider]] = None,
+        concurrency: Optional[Dict[Channel, int]] = None,
+        attempt_timeout: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        retry_base: Optional[float] = None,
+        retry_max: Optional[float] = None,
+    ):
+        self._providers = providers
+        concurrency = concurrency or {}
+        self._limits = {
+            channel: asyncio.Semaphore(concurrency.get(channel) or CHANNEL_CONCURRENCY[channel]())
+            for channel in Channel
+        }
+        self.attempt_timeout = attempt_timeout or settings.NOTIFY_ATTEMPT_TIMEOUT_SECONDS
+        self.max_attempts = max_attempts or settings.NOTIFY_MAX_ATTEMPTS
+        self.retry_base = retry_base or settings.NOTIFY_RETRY_BASE_SECONDS
+        self.retry_max = retry_max or settings.NOTIFY_RETRY_MAX_SECONDS
+    
+    @property
+    def providers(self) -> Dict[Channel, NotificationProvider]:
+        if self._providers is None:
+            self._providers = _default_providers()
+        return self._providers
+    
+    async def send(self, messages: Sequence[Message]) -> FanOutResult:
+        """Deliver all messages; returns aggregate counts and latencies."""
+        result = FanOutResult()
+        started = time.perf_counter()
+        
+        tasks = []
+        for channel in Channel:
+            group = [m for m in messages if m.channel == channel]
+            if not group:
+                continue
+            provider = self.providers[channel]
+            # Multicast only works for messages sharing the same payload
+            by_payload: Dict[tuple, List[Message]] = {}
+            for message in group:
+                key = (message.title, message.body, tuple(sorted(message.data.items())))
+                by_payload.setdefault(key, []).append(message)
+            for same_payload in by_payload.values():
+                size = max(1, provider.max_batch_size)
+                for i in range(0, len(same_payload), size):
+                    tasks.append(self._deliver(provider, same_payload[i:i + size], result, started))
+        
+        if tasks:
+            await asyncio.gather(*tasks)
+        return result
+    
+    async def _deliver(
+        self,
+        provider: NotificationProvider,
+        batch: List[Message],
+        result: FanOutResult,
+        started: float,
+    ):
+        pending = batch
+        for attempt in range(self.max_attempts):
+            if attempt:
+                backoff = min(self.retry_max, self.retry_base * 2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(0, backoff))
+            
+            result.attempts += 1
+            try:
+                async with self._limits[provider.channel]:
+                    outcome = await asyncio.wait_for(
+                        provider.send_batch(pending), timeout=self.attempt_timeout
+                    )
+            except Exception as exc:  # timeout or provider error: retry the whole batch
+                print(f"[NOTIFY:{provider.channel.value}] attempt {attempt + 1} failed: {exc!r}")
+                continue
+            
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            retry = []
+            for message, ok in zip(pending, outcome):
+                if ok:
+                    result.sent += 1
+                    result.latencies_ms.append(elapsed_ms)
+                else:
+                    retry.append(message)
+            pending = retry
+            if not pending:
+                return
+        
+        result.failed += len(pending)
+
+
+def technician_messages(technicians, request) -> List[Message]:
+    """
+    Build one message per technician on its preferred reachable channel.
+    
+    Channels are tried in NOTIFY_CHANNELS order.
+    """
+    title = "Nuova richiesta Pronto Casa"
+    body = f"{request.title} ({request.reference_code})"
+    data = {"request_id": str(request.id), "category": request.category.value}
+    
+    messages = []
+    for technician in technicians:
+        user = technician.user
+        addresses = {
+            Channel.PUSH: user.fcm_token if user else None,
+            Channel.SMS: user.phone if user else None,
+            Channel.WHATSAPP: user.phone if user else None,
+        }
+        for name in settings.NOTIFY_CHANNELS:
+            channel = Channel(name)
+            if addresses[channel]:
+                messages.append(Message(channel, addresses[channel], title, body, data))
+                break
+        else:
+            print(f"[NOTIFY] {technician.internal_code} has no reachable channel")
+    return messages
+
+
+notification_fan_out = NotificationFanOut()
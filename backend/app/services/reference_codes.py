@@ -0,0 +1,126 @@
+"""
+Reference Codes Service
+
+Allocates request reference codes without collisions and without touching
+the database: a Snowflake-style 63-bit id (milliseconds, worker id,
+per-millisecond sequence) encoded in Crockford base32, e.g.
+"REQ-06JJS6-9NG0M00". Codes sort by creation time.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.request import REFERENCE_WORKER_SEQUENCE
+
+
+CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # No I, L, O, U
+_DECODE = {c: i for i, c in enumerate(CROCKFORD)}
+_DECODE.update({"I": 1, "L": 1, "O": 0})  # Read-back aliases
+
+EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+CODE_LENGTH = 13  # 63 bits in 5-bit digits
+PREFIX = "REQ-"
+
+
+def encode(value: int) -> str:
+    """Fixed-width Crockford base32 of a non-negative 63-bit integer."""
+    digits = []
+    for _ in range(CODE_LENGTH):
+        digits.append(CROCKFORD[value & 31])
+        value >>= 5
+    return "".join(reversed(digits))
+
+
+def decode(code: str) -> int:
+    """Inverse of encode(); accepts the prefix, dashes and lowercase."""
+    code = code.upper()
+    if code.startswith(PREFIX):
+        code = code[len(PREFIX):]
+    value = 0
+    for char in code.replace("-", ""):
+        value = (value << 5) | _DECODE[char]
+    return value
+
+
+def format_code(value: int) -> str:
+    digits = encode(value)
+    return f"{PREFIX}{digits[:6]}-{digits[6:]}"
+
+
+def parse_code(code: str) -> Tuple[datetime, int, int]:
+    """(created_at, worker_id, sequence) of a reference code."""
+    value = decode(code)
+    ms = (value >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS
+    worker_id = (value >> SEQUENCE_BITS) & MAX_WORKER_ID
+    return datetime.fromtimestamp(ms / 1000, timezone.utc), worker_id, value & MAX_SEQUENCE
+
+
+class ReferenceCodeGenerator:
+    """
+    Snowflake id generator for one process.
+    
+    Unique as long as no two live processes share a worker id: set
+    REFERENCE_CODE_WORKER_ID per process, or lease one at startup with
+    lease_worker_id(). If the clock steps back, generation waits for it to
+    catch up rather than reuse a timestamp.
+    """
+    
+    def __init__(
+        self,
+        worker_id: Optional[int] = None,
+        clock: Callable[[], int] = time.time_ns,
+    ):
+        self.worker_id = worker_id
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+    
+    def configure(self, worker_id: int):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"Worker id must be between 0 and {MAX_WORKER_ID}")
+        self.worker_id = worker_id
+    
+    async def lease_worker_id(self, db: AsyncSession) -> int:
+        """Take the next worker id from the database sequence (once per process)."""
+        result = await db.execute(select(REFERENCE_WORKER_SEQUENCE.next_value()))
+        self.configure(result.scalar_one() % (MAX_WORKER_ID + 1))
+        return self.worker_id
+    
+    def _now_ms(self) -> int:
+        return self.clock() // 1_000_000 - EPOCH_MS
+    
+    def next_id(self) -> int:
+        if self.worker_id is None:
+            if settings.REFERENCE_CODE_WORKER_ID is None:
+                raise RuntimeError("Reference code worker id not configured")
+            self.configure(settings.REFERENCE_CODE_WORKER_ID)
+        with self._lock:
+            now = self._now_ms()
+            while now < self._last_ms:  # Clock stepped back
+                time.sleep((self._last_ms - now) / 1000)
+                now = self._now_ms()
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:  # 4096 codes this millisecond: wait for the next
+                    while now <= self._last_ms:
+                        now = self._now_ms()
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (now << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+    
+    def generate(self) -> str:
+        return format_code(self.next_id())
+
+
+reference_codes = ReferenceCodeGenerator()
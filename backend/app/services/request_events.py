@@ -0,0 +1,165 @@
+"""
+Request Events Service
+
+Pub/sub of compact request deltas (status, ETA, quote) for the live
+WebSocket/SSE channel. The default in-memory backend fans out within the
+worker; with REALTIME_BACKEND="redis" deltas go through Redis pub/sub so
+every worker sees them.
+"""
+import asyncio
+import json
+from collections import deque
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Optional, Set
+from uuid import UUID
+
+from fastapi.encoders import jsonable_encoder
+
+from app.config import settings
+
+
+CHANNEL_PREFIX = "requests:"
+
+
+class Subscription:
+    """
+    One listener on a request's events.
+    
+    Kept deliberately small (no Queue, no task) since every open socket
+    holds one: a bounded deque of serialized messages and a waiter future.
+    """
+    
+    __slots__ = ("request_id", "_pending", "_waiter", "dropped")
+    
+    def __init__(self, request_id: UUID):
+        self.request_id = request_id
+        self._pending = deque(maxlen=settings.REALTIME_SUBSCRIBER_BUFFER)
+        self._waiter: Optional[asyncio.Future] = None
+        self.dropped = 0
+    
+    def deliver(self, message: str):
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1  # Slow consumer: oldest delta is discarded
+        self._pending.append(message)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+    
+    async def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Next message, or None if nothing arrived within timeout."""
+        if not self._pending:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self._waiter = None
+        return self._pending.popleft()
+
+
+class RequestEventBus:
+    """Subscribers per request id, fed locally or from Redis."""
+    
+    def __init__(self):
+        self._subscribers: Dict[UUID, Set[Subscription]] = {}
+        self._redis = None
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.delivered = 0
+    
+    def __len__(self) -> int:
+        return sum(len(subs) for subs in self._subscribers.values())
+    
+    def subscribe(self, request_id: UUID) -> Subscription:
+        subscription = Subscription(request_id)
+        self._subscribers.setdefault(request_id, set()).add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription: Subscription):
+        subs = self._subscribers.get(subscription.request_id)
+        if subs is not None:
+            subs.discard(subscription)
+            if not subs:
+                del self._subscribers[subscription.request_id]
+    
+    def fan_out(self, request_id: UUID, message: str):
+        """Deliver a serialized message to this worker's subscribers."""
+        for subscription in self._subscribers.get(request_id, ()):
+            subscription.deliver(message)
+            self.delivered += 1
+    
+    async def publish(self, request_id: UUID, delta: dict):
+        """Serialize once and send to every subscriber of the request."""
+        message = json.dumps(jsonable_encoder({
+            "request_id": request_id,
+            "at": datetime.now(timezone.utc),
+            **delta,
+        }))
+        self.published += 1
+        if self._redis is not None:
+            try:
+                await self._redis.publish(f"{CHANNEL_PREFIX}{request_id}", message)
+                return
+            except Exception as exc:  # Redis down: local subscribers still get it
+                print(f"[REALTIME] Redis publish failed: {exc!r}")
+        self.fan_out(request_id, message)
+    
+    async def start(self):
+        if settings.REALTIME_BACKEND != "redis":
+            return
+        import redis.asyncio as redis
+        
+        self._redis = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        pubsub = self._redis.pubsub()
+        await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+        self._task = asyncio.create_task(self._listen(pubsub))
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+    
+    async def _listen(self, pubsub):
+        async for item in pubsub.listen():
+            if item["type"] != "pmessage":
+                continue
+            try:
+                request_id = UUID(item["channel"][len(CHANNEL_PREFIX):])
+            except ValueError:
+                continue
+            self.fan_out(request_id, item["data"])
+    
+    def stats(self) -> dict:
+        return {
+            "backend": "redis" if self._redis is not None else "memory",
+            "requests": len(self._subscribers),
+            "subscribers": len(self),
+            "published": self.published,
+            "delivered": self.delivered,
+        }
+
+
+request_events = RequestEventBus()
+
+
+async def publish_request_update(request_id: UUID, **delta):
+    """Push a delta such as status=..., estimated_arrival=..., quote={...}."""
+    await request_events.publish(request_id, {"type": "request.updated", **delta})
+
+
+async def sse_messages(subscription: Subscription, snapshot: dict) -> AsyncIterator[str]:
+    """Server-sent event frames: the snapshot, then deltas, with heartbeat comments."""
+    try:
+        yield f"event: snapshot\ndata: {json.dumps(jsonable_encoder(snapshot))}\n\n"
+        while True:
+            message = await subscription.get(timeout=settings.REALTIME_HEARTBEAT_SECONDS)
+            yield ": ping\n\n" if message is None else f"data: {message}\n\n"
+    finally:
+        request_events.unsubscribe(subscription)
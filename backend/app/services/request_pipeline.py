@@ -0,0 +1,292 @@
+"""
+Request Pipeline Service
+
+Runs the work that follows request creation (AI analysis and initial quote,
+then dispatch) outside the create handler. Each stage is guarded by the
+request status, so a retried or duplicated job skips the stages that
+already committed.
+"""
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import async_session
+from app.models.request import Request, Media, RequestStatus
+from app.models.quote import Quote
+from app.schemas.request import AIAnalysisResponse
+from app.services.ai_diagnostic import analyze_request
+from app.services.dispatch import dispatch_and_notify
+from app.services.batch_dispatch import batch_dispatcher
+from app.services.dispatch_waves import wave_scheduler
+from app.services.request_events import publish_request_update
+
+
+# A stage returns False when the remaining stages must not run
+Stage = Callable[[AsyncSession, UUID], Awaitable[bool]]
+
+
+def analysis_values(ai_result: AIAnalysisResponse) -> dict:
+    """Request columns filled in by the AI analysis."""
+    return {
+        "severity": ai_result.severity,
+        "ai_confidence": ai_result.confidence,
+        "ai_diagnosis": {
+            "probable_issue": ai_result.probable_issue,
+            "safety_instructions": ai_result.safety_instructions,
+            "estimated_duration_hours": ai_result.estimated_duration_hours,
+        },
+        "safety_instructions_shown": True,
+    }
+
+
+def initial_quote(request_id: UUID, ai_result: AIAnalysisResponse) -> Quote:
+    """Quote priced from the AI estimate."""
+    price = ai_result.price_range
+    return Quote(
+        request_id=request_id,
+        initial_min_price=price.min_price,
+        initial_max_price=price.max_price,
+        min_price=price.min_price,
+        max_price=price.max_price,
+    )
+
+
+async def analyze_stage(db: AsyncSession, request_id: UUID) -> bool:
+    """PENDING -> ANALYZED: AI diagnosis and the initial quote, in one commit."""
+    result = await db.execute(
+        select(Request.status, Request.category, Request.description, Request.guided_answers)
+        .where(Request.id == request_id)
+    )
+    row = result.one_or_none()
+    if row is None:
+        return False
+    if row.status != RequestStatus.PENDING:
+        return row.status == RequestStatus.ANALYZED  # Done by an earlier attempt
+    media = await db.execute(select(Media.url).where(Media.request_id == request_id))
+    media_urls = list(media.scalars().all())
+    await db.commit()  # No connection held during the AI call
+    
+    ai_result = await analyze_request(
+        request_id=request_id,
+        category=row.category,
+        description=row.description,
+        guided_answers=row.guided_answers,
+        media_urls=media_urls,
+    )
+    
+    result = await db.execute(
+        update(Request)
+        .where(Request.id == request_id, Request.status == RequestStatus.PENDING)
+        .values(status=RequestStatus.ANALYZED, **analysis_values(ai_result))
+        .returning(Request.id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.scalar_one_or_none() is None:
+        await db.rollback()
+        return False  # Cancelled, or analyzed by a concurrent job
+    
+    # The quote is priced from the analysis, so it commits with it
+    db.add(initial_quote(request_id, ai_result))
+    await db.commit()
+    
+    price = ai_result.price_range
+    await publish_request_update(
+        request_id,
+        status=RequestStatus.ANALYZED,
+        severity=ai_result.severity,
+        quote={"min_price": price.min_price, "max_price": price.max_price},
+    )
+    return True
+
+
+async def dispatching_stage(db: AsyncSession, request_id: UUID) -> bool:
+    """ANALYZED -> DISPATCHING; only the job that moves it starts dispatch."""
+    result = await db.execute(
+        update(Request)
+        .where(Request.id == request_id, Request.status == RequestStatus.ANALYZED)
+        .values(status=RequestStatus.DISPATCHING)
+        .returning(Request.id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.scalar_one_or_none() is None:
+        await db.rollback()
+        return False
+    await db.commit()
+    await publish_request_update(request_id, status=RequestStatus.DISPATCHING)
+    return True
+
+
+async def dispatch_stage(db: AsyncSession, request_id: UUID) -> bool:
+    """Hand the request to the configured dispatcher."""
+    # Batch mode joins the next assignment window, with waves enabled the
+    # first wave runs on the scheduler's next tick
+    if settings.DISPATCH_MODE == "batch":
+        batch_dispatcher.submit(request_id)
+    elif settings.DISPATCH_WAVES_ENABLED:
+        wave_scheduler.schedule(request_id, 1, delay=0)
+    else:
+        await dispatch_and_notify(db, request_id)
+    return True
+
+
+STAGES: List[Tuple[str, Stage]] = [
+    ("analyze", analyze_stage),
+    ("dispatching", dispatching_stage),
+    ("dispatch", dispatch_stage),
+]
+
+
+@dataclass
+class Job:
+    request_id: UUID
+    stage: int = 0  # Index in STAGES to resume from
+    attempt: int = 1
+
+
+class RequestPipeline:
+    """
+    In-process workers running STAGES for newly created requests.
+    
+    A failed stage is retried with exponential backoff from that stage on,
+    up to REQUEST_PIPELINE_MAX_ATTEMPTS. Requests left behind by a restart
+    are picked up again by recover(), run at start and every
+    REQUEST_PIPELINE_RECOVER_SECONDS.
+    """
+    
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._retries: set = set()
+        self._recovery: Optional[asyncio.Task] = None
+        self.recovered = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+    
+    def submit(self, request_id: UUID):
+        """Queue a newly created request."""
+        if self._queue is None:
+            raise RuntimeError("RequestPipeline is not running")
+        self._queue.put_nowait(Job(request_id))
+    
+    async def recover(self, db: AsyncSession) -> int:
+        """
+        Re-queue requests whose pipeline did not finish before a restart.
+        
+        Only requests untouched for REQUEST_PIPELINE_RECOVER_AFTER_SECONDS
+        are taken, so jobs still running in live workers are left alone.
+        Taking one bumps its updated_at in the same statement (SKIP LOCKED),
+        so workers starting together do not queue the same request twice.
+        """
+        now = datetime.now(timezone.utc)
+        abandoned = (
+            select(Request.id)
+            .where(
+                Request.status.in_([RequestStatus.PENDING, RequestStatus.ANALYZED]),
+                Request.updated_at < now - timedelta(seconds=settings.REQUEST_PIPELINE_RECOVER_AFTER_SECONDS),
+            )
+            .with_for_update(skip_locked=True)
+        )
+        result = await db.execute(
+            update(Request)
+            .where(Request.id.in_(abandoned))
+            .values(updated_at=now)
+            .returning(Request.id, Request.status)
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+        await db.commit()
+        for request_id, status in rows:
+            self._queue.put_nowait(Job(request_id, stage=0 if status == RequestStatus.PENDING else 1))
+        return len(rows)
+    
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._run())
+            for _ in range(settings.REQUEST_PIPELINE_WORKERS)
+        ]
+        self._recovery = asyncio.create_task(self._recover_periodically())
+    
+    async def stop(self):
+        if self._recovery is not None:
+            self._recovery.cancel()
+            try:
+                await self._recovery
+            except asyncio.CancelledError:
+                pass
+            self._recovery = None
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        for task in self._workers:
+            task.cancel()
+        for task in self._workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+    
+    async def _recover_periodically(self):
+        while True:
+            try:
+                async with async_session() as db:
+                    recovered = await self.recover(db)
+                if recovered:
+                    self.recovered += recovered
+                    print(f"[PIPELINE] Recovered {recovered} abandoned requests")
+            except Exception as exc:  # keep the loop alive, abandoned rows are picked up next time
+                print(f"[PIPELINE] Recovery failed: {exc!r}")
+            await asyncio.sleep(settings.REQUEST_PIPELINE_RECOVER_SECONDS)
+    
+    def _retry(self, job: Job):
+        delay = settings.REQUEST_PIPELINE_RETRY_SECONDS * 2 ** (job.attempt - 1)
+        job.attempt += 1
+        self.retried += 1
+        
+        def requeue():
+            self._retries.discard(handle)
+            self._queue.put_nowait(job)
+        
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries.add(handle)
+    
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                async with async_session() as db:
+                    for index in range(job.stage, len(STAGES)):
+                        job.stage = index
+                        if not await STAGES[index][1](db, job.request_id):
+                            break
+                self.completed += 1
+            except Exception as exc:
+                name = STAGES[job.stage][0]
+                if job.attempt < settings.REQUEST_PIPELINE_MAX_ATTEMPTS:
+                    print(f"[PIPELINE] Stage {name} for request {job.request_id} failed "
+                          f"(attempt {job.attempt}): {exc!r}")
+                    self._retry(job)
+                else:
+                    self.failed += 1
+                    print(f"[PIPELINE] Giving up on request {job.request_id} at stage {name}: {exc!r}")
+    
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "retrying": len(self._retries),
+            "recovered": self.recovered,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+request_pipeline = RequestPipeline()
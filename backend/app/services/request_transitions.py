@@ -0,0 +1,212 @@
+"""
+Request Transitions Service
+
+Declares the allowed RequestStatus transitions and who may trigger each,
+and applies them as one guarded UPDATE that also writes the audit row.
+"""
+import uuid
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, FrozenSet, Optional, Sequence
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import select, insert, update, literal, cast, func, String
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.request import Request, RequestStatus
+from app.models.audit_log import AuditLog, AuditAction, EntityType
+
+
+class Actor(str, Enum):
+    """Who may trigger a transition."""
+    CLIENT = "client"            # Request.client_id
+    TECHNICIAN = "technician"    # Request.technician_id
+
+
+@dataclass(frozen=True)
+class Transition:
+    sources: FrozenSet[RequestStatus]
+    target: RequestStatus
+    actor: Actor
+    audit_action: AuditAction
+    error: str  # Shown when the request is in none of the source states
+
+
+# Work not finished yet: the client can still cancel
+_OPEN = frozenset({
+    RequestStatus.PENDING,
+    RequestStatus.ANALYZED,
+    RequestStatus.DISPATCHING,
+    RequestStatus.ACCEPTED,
+    RequestStatus.EN_ROUTE,
+    RequestStatus.IN_PROGRESS,
+    RequestStatus.QUOTE_REVISION,
+})
+
+TRANSITIONS: Dict[str, Transition] = {
+    "start": Transition(
+        frozenset({RequestStatus.ACCEPTED, RequestStatus.EN_ROUTE}),
+        RequestStatus.IN_PROGRESS,
+        Actor.TECHNICIAN,
+        AuditAction.TECHNICIAN_ARRIVED,
+        "Stato non valido per iniziare",
+    ),
+    "complete": Transition(
+        frozenset({RequestStatus.IN_PROGRESS}),
+        RequestStatus.COMPLETED,
+        Actor.TECHNICIAN,
+        AuditAction.REQUEST_COMPLETED,
+        "La richiesta non è in corso",
+    ),
+    "sign": Transition(
+        frozenset({RequestStatus.COMPLETED}),
+        RequestStatus.PAID,
+        Actor.CLIENT,
+        AuditAction.REQUEST_UPDATED,
+        "Il lavoro non è ancora completato",
+    ),
+    "cancel": Transition(
+        _OPEN,
+        RequestStatus.CANCELLED,
+        Actor.CLIENT,
+        AuditAction.REQUEST_CANCELLED,
+        "Non puoi cancellare una richiesta completata",
+    ),
+    "approve_quote": Transition(
+        frozenset({RequestStatus.QUOTE_REVISION}),
+        RequestStatus.IN_PROGRESS,
+        Actor.CLIENT,
+        AuditAction.QUOTE_APPROVED,
+        "Nessuna revisione del preventivo in attesa",
+    ),
+    "reject_quote": Transition(
+        _OPEN - {RequestStatus.IN_PROGRESS},
+        RequestStatus.CANCELLED,
+        Actor.CLIENT,
+        AuditAction.QUOTE_REJECTED,
+        "Il preventivo non può più essere rifiutato",
+    ),
+}
+
+_OWNER = {
+    Actor.CLIENT: (Request.client_id, "Accesso negato"),
+    Actor.TECHNICIAN: (Request.technician_id, "Non sei assegnato a questa richiesta"),
+}
+
+
+def transition_statement(
+    request_id: UUID,
+    name: str,
+    actor_id: UUID,
+    audit_actor_id: Optional[UUID] = None,
+    values: Optional[dict] = None,
+    returning: Sequence = (),
+):
+    """
+    Single statement applying a transition:
+        
+        WITH prev AS (SELECT ... FOR UPDATE),
+             moved AS (UPDATE requests ... FROM prev WHERE <guards> RETURNING ...),
+             audit AS (INSERT INTO audit_logs SELECT ... FROM moved)
+        SELECT * FROM moved
+    
+    Locking prev first makes the guards see the latest committed status, so
+    of two concurrent transitions from the same state only one matches.
+    """
+    transition = TRANSITIONS[name]
+    owner, _ = _OWNER[transition.actor]
+    
+    prev = (
+        select(Request.id, Request.status)
+        .where(Request.id == request_id)
+        .with_for_update()
+        .cte("prev")
+    )
+    moved = (
+        update(Request)
+        .where(
+            Request.id == prev.c.id,
+            prev.c.status.in_(transition.sources),
+            owner == actor_id,
+        )
+        .values(status=transition.target, **(values or {}))
+        .returning(Request.id, prev.c.status.label("previous_status"), *returning)
+        .cte("moved")
+    )
+    audit = insert(AuditLog).from_select(
+        ["id", "entity_type", "entity_id", "action", "actor_id", "actor_type", "old_value", "new_value", "metadata"],
+        select(
+            literal(uuid.uuid4(), AuditLog.id.type),
+            cast(literal(EntityType.REQUEST, AuditLog.entity_type.type), AuditLog.entity_type.type),
+            moved.c.id,
+            cast(literal(transition.audit_action, AuditLog.action.type), AuditLog.action.type),
+            literal(audit_actor_id or actor_id, AuditLog.actor_id.type),
+            literal("user", String),
+            func.jsonb_build_object("status", func.lower(cast(moved.c.previous_status, String))),
+            cast(literal({"status": transition.target.value}, JSONB), JSONB),
+            cast(literal({}, JSONB), JSONB),
+        ),
+    ).cte("audit")
+    
+    return select(moved).add_cte(audit)
+
+
+async def apply_transition(
+    db: AsyncSession,
+    request_id: UUID,
+    name: str,
+    actor_id: UUID,
+    audit_actor_id: Optional[UUID] = None,
+    values: Optional[dict] = None,
+    returning: Sequence = (),
+) -> Optional[Row]:
+    """
+    Apply a transition in the caller's transaction.
+    
+    Returns the moved row (id, previous_status, *returning), or None when the
+    request is missing, owned by someone else or in a non-source state.
+    """
+    result = await db.execute(
+        transition_statement(request_id, name, actor_id, audit_actor_id, values, returning)
+    )
+    return result.one_or_none()
+
+
+async def transition_or_raise(
+    db: AsyncSession,
+    request_id: UUID,
+    name: str,
+    actor_id: UUID,
+    audit_actor_id: Optional[UUID] = None,
+    values: Optional[dict] = None,
+    returning: Sequence = (),
+) -> Row:
+    """apply_transition, with 404/403/400 on failure (one extra query, failures only)."""
+    row = await apply_transition(db, request_id, name, actor_id, audit_actor_id, values, returning)
+    if row is not None:
+        return row
+    
+    await check_transition(db, request_id, name, actor_id)
+    raise HTTPException(status_code=400, detail=TRANSITIONS[name].error)
+
+
+async def check_transition(db: AsyncSession, request_id: UUID, name: str, actor_id: UUID):
+    """
+    Raise the 404/403/400 of transition_or_raise if the transition cannot apply now.
+    
+    One unlocked SELECT, for work that must not start on a refused request
+    (e.g. storing an upload); the transition itself still decides.
+    """
+    transition = TRANSITIONS[name]
+    owner, denied = _OWNER[transition.actor]
+    result = await db.execute(select(owner, Request.status).where(Request.id == request_id))
+    current = result.one_or_none()
+    if current is None:
+        raise HTTPException(status_code=404, detail="Richiesta non trovata")
+    if current[0] != actor_id:
+        raise HTTPException(status_code=403, detail=denied)
+    if current[1] not in transition.sources:
+        raise HTTPException(status_code=400, detail=transition.error)
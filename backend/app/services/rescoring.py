@@ -0,0 +1,177 @@
+"""
+Rescoring Service
+
+Re-runs the diagnostic decision table over already analyzed requests to
+measure the impact of a change to the rule tables: which severities and
+initial price estimates would now come out differently.
+"""
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.request import Request
+from app.models.quote import Quote
+from app.services.ai_diagnostic import (
+    CATEGORIES,
+    SEVERITIES,
+    decode_columns,
+    evaluate_batch,
+    rules_version,
+)
+
+
+@dataclass
+class RescoredChunk:
+    """Stored and recomputed values of one chunk, as parallel arrays."""
+    reference_codes: List[str]
+    category: np.ndarray
+    old_severity: np.ndarray  # Index into SEVERITIES
+    new_severity: np.ndarray
+    has_quote: np.ndarray
+    old_min_price: np.ndarray  # 0 where there is no quote
+    old_max_price: np.ndarray
+    new_min_price: np.ndarray
+    new_max_price: np.ndarray
+    
+    @property
+    def changed(self) -> np.ndarray:
+        """Rows whose severity or (quoted) price estimate would change."""
+        return (self.old_severity != self.new_severity) | (
+            self.has_quote
+            & ((self.old_min_price != self.new_min_price) | (self.old_max_price != self.new_max_price))
+        )
+
+
+async def rescore_chunks(
+    db: AsyncSession,
+    chunk_size: int = 5000,
+    limit: Optional[int] = None,
+) -> AsyncIterator[RescoredChunk]:
+    """
+    Stream analyzed requests by id (keyset pagination) and rescore each chunk.
+    
+    Only the columns the decision table reads are loaded; every chunk is
+    decoded into arrays and evaluated in one pass.
+    """
+    severity_codes = {severity: i for i, severity in enumerate(SEVERITIES)}
+    last_id: Optional[UUID] = None
+    seen = 0
+    while limit is None or seen < limit:
+        query = (
+            select(
+                Request.id,
+                Request.reference_code,
+                Request.category,
+                Request.guided_answers,
+                Request.severity,
+                Quote.initial_min_price,
+                Quote.initial_max_price,
+            )
+            .outerjoin(Quote, Quote.request_id == Request.id)
+            .where(Request.severity.is_not(None))
+            .order_by(Request.id)
+            .limit(chunk_size if limit is None else min(chunk_size, limit - seen))
+        )
+        if last_id is not None:
+            query = query.where(Request.id > last_id)
+        rows = (await db.execute(query)).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        seen += len(rows)
+        
+        columns = decode_columns([r.category for r in rows], [r.guided_answers or {} for r in rows])
+        result = evaluate_batch(columns)
+        yield RescoredChunk(
+            reference_codes=[r.reference_code for r in rows],
+            category=columns.category,
+            old_severity=np.fromiter((severity_codes[r.severity] for r in rows), dtype=np.int8, count=len(rows)),
+            new_severity=result["severity"],
+            has_quote=np.fromiter((r.initial_min_price is not None for r in rows), dtype=bool, count=len(rows)),
+            old_min_price=np.fromiter((r.initial_min_price or 0 for r in rows), dtype=np.int64, count=len(rows)),
+            old_max_price=np.fromiter((r.initial_max_price or 0 for r in rows), dtype=np.int64, count=len(rows)),
+            new_min_price=result["min_price"],
+            new_max_price=result["max_price"],
+        )
+
+
+@dataclass
+class RescoreReport:
+    """Aggregate comparison of stored vs recomputed diagnoses."""
+    rows: int = 0
+    changed: int = 0
+    quoted: int = 0
+    # severity_matrix[old, new] counts, indices into SEVERITIES
+    severity_matrix: np.ndarray = field(default_factory=lambda: np.zeros((len(SEVERITIES),) * 2, dtype=np.int64))
+    by_category: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    min_price_delta: int = 0  # Sum over quoted rows, cents
+    max_price_delta: int = 0
+    seconds: float = 0.0
+    
+    def add(self, chunk: RescoredChunk):
+        self.rows += len(chunk.category)
+        self.changed += int(chunk.changed.sum())
+        self.quoted += int(chunk.has_quote.sum())
+        np.add.at(self.severity_matrix, (chunk.old_severity, chunk.new_severity), 1)
+        min_delta = np.where(chunk.has_quote, chunk.new_min_price - chunk.old_min_price, 0)
+        max_delta = np.where(chunk.has_quote, chunk.new_max_price - chunk.old_max_price, 0)
+        self.min_price_delta += int(min_delta.sum())
+        self.max_price_delta += int(max_delta.sum())
+        
+        counts = np.bincount(chunk.category, minlength=len(CATEGORIES))
+        severity_changed = np.bincount(
+            chunk.category, weights=chunk.old_severity != chunk.new_severity, minlength=len(CATEGORIES),
+        )
+        quoted = np.bincount(chunk.category, weights=chunk.has_quote, minlength=len(CATEGORIES))
+        min_sum = np.bincount(chunk.category, weights=min_delta, minlength=len(CATEGORIES))
+        max_sum = np.bincount(chunk.category, weights=max_delta, minlength=len(CATEGORIES))
+        for i in np.nonzero(counts)[0]:
+            entry = self.by_category.setdefault(CATEGORIES[i].value, {
+                "rows": 0, "severity_changed": 0, "quoted": 0, "min_price_delta": 0, "max_price_delta": 0,
+            })
+            entry["rows"] += int(counts[i])
+            entry["severity_changed"] += int(severity_changed[i])
+            entry["quoted"] += int(quoted[i])
+            entry["min_price_delta"] += int(min_sum[i])
+            entry["max_price_delta"] += int(max_sum[i])
+    
+    def to_dict(self) -> dict:
+        return {
+            "rules_version": rules_version(),
+            "rows": self.rows,
+            "changed": self.changed,
+            "severity_transitions": {
+                f"{old.value}->{new.value}": int(self.severity_matrix[i, j])
+                for i, old in enumerate(SEVERITIES)
+                for j, new in enumerate(SEVERITIES)
+                if self.severity_matrix[i, j]
+            },
+            "avg_min_price_delta": self.min_price_delta / self.quoted if self.quoted else 0.0,
+            "avg_max_price_delta": self.max_price_delta / self.quoted if self.quoted else 0.0,
+            "by_category": {
+                category: {
+                    "rows": entry["rows"],
+                    "severity_changed": entry["severity_changed"],
+                    "avg_min_price_delta": entry["min_price_delta"] / entry["quoted"] if entry["quoted"] else 0.0,
+                    "avg_max_price_delta": entry["max_price_delta"] / entry["quoted"] if entry["quoted"] else 0.0,
+                }
+                for category, entry in sorted(self.by_category.items())
+            },
+            "seconds": self.seconds,
+            "rows_per_second": self.rows / self.seconds if self.seconds else 0.0,
+        }
+
+
+async def rescore_requests(db: AsyncSession, chunk_size: int = 5000, limit: Optional[int] = None) -> RescoreReport:
+    """Rescore every analyzed request (or the first `limit`) and aggregate the differences."""
+    report = RescoreReport()
+    start = time.perf_counter()
+    async for chunk in rescore_chunks(db, chunk_size, limit):
+        report.add(chunk)
+    report.seconds = time.perf_counter() - start
+    return report
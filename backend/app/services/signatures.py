@@ -0,0 +1,259 @@
+"""
+Signature Storage Service
+
+Client signatures arrive from the signing pad as base64 data URLs. The
+payload is decoded in chunks, so an oversized or non-image body is refused
+after its first bytes instead of after a full copy, then checked and
+re-encoded by Pillow as a small palette PNG (line art needs few colors)
+and written to the media store under the SHA-256 of that PNG. The requests
+row keeps only the object key.
+
+Rows signed before this kept the data URL inline in
+requests.client_signature_url; SignatureMigration moves them to the store
+in small batches.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Collection, List, Optional, Set
+from uuid import UUID
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import async_session
+from app.models.request import Request
+from app.services.media_processing import MAX_IMAGE_PIXELS, SIGNATURE_BYTES, SIGNATURES
+from app.services.media_storage import MediaStorage, get_storage
+
+
+SIGNATURE_CONTENT_TYPES = ("image/png", "image/jpeg", "image/webp")
+DECODE_CHUNK = 64 * 1024  # Base64 characters per step (a multiple of 4)
+
+
+class InvalidSignature(ValueError):
+    """The payload is not an acceptable signature image (message for the client)."""
+
+
+def decode_data_url(data: str, max_bytes: int) -> bytes:
+    """
+    Bytes of a base64 data URL ("data:image/png;base64,...") or of bare base64.
+    
+    Decoded DECODE_CHUNK characters at a time: the image type is checked on
+    the first chunk and the size on every one. Whitespace (line-wrapped
+    base64) is ignored.
+    """
+    start = 0
+    if data.startswith("data:"):
+        comma = data.find(",", 0, 100)
+        if comma < 0 or not data[5:comma].endswith(";base64"):
+            raise InvalidSignature("Formato della firma non valido")
+        start = comma + 1
+    
+    decoded = bytearray()
+    carry = ""
+    checked = False
+    for offset in range(start, len(data), DECODE_CHUNK):
+        chunk = carry + "".join(data[offset:offset + DECODE_CHUNK].split())
+        usable = len(chunk) - len(chunk) % 4
+        carry = chunk[usable:]
+        try:
+            decoded += base64.b64decode(chunk[:usable], validate=True)
+        except binascii.Error:
+            raise InvalidSignature("Firma non codificata correttamente in base64")
+        if len(decoded) > max_bytes:
+            raise InvalidSignature("Firma troppo grande")
+        if not checked and len(decoded) >= SIGNATURE_BYTES:
+            check_image_type(bytes(decoded[:SIGNATURE_BYTES]))
+            checked = True
+    if carry:
+        raise InvalidSignature("Firma non codificata correttamente in base64")
+    if not checked:
+        check_image_type(bytes(decoded))
+    return bytes(decoded)
+
+
+def check_image_type(head: bytes):
+    if not any(SIGNATURES[content_type](head) for content_type in SIGNATURE_CONTENT_TYPES):
+        raise InvalidSignature("La firma deve essere un'immagine PNG, JPEG o WebP")
+
+
+def render_signature(data: bytes, max_side: int, colors: int) -> bytes:
+    """Decode and check a signature image; palette PNG, transparency kept, no metadata."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > MAX_IMAGE_PIXELS:
+            raise InvalidSignature("Immagine della firma troppo grande")
+        image = ImageOps.exif_transpose(image)
+        transparent = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if transparent else "RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if transparent and image.getextrema()[3][1] == 0:
+            raise InvalidSignature("La firma è vuota")
+        image = image.quantize(colors, method=Image.Quantize.FASTOCTREE)
+        out = io.BytesIO()
+        image.save(out, "PNG", optimize=True)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise InvalidSignature("Immagine della firma non leggibile")
+    return out.getvalue()
+
+
+def signature_key(png: bytes) -> str:
+    """Content-addressed key: the same signature is stored once."""
+    return f"signatures/{hashlib.sha256(png).hexdigest()}.png"
+
+
+def store_signature(data: str, storage: Optional[MediaStorage] = None) -> str:
+    """Blocking: decode, check and store a signature data URL; returns the object key."""
+    storage = storage or get_storage()
+    png = render_signature(
+        decode_data_url(data, settings.SIGNATURE_MAX_BYTES),
+        settings.SIGNATURE_MAX_SIDE,
+        settings.SIGNATURE_COLORS,
+    )
+    key = signature_key(png)
+    if storage.head(key) is None:
+        storage.write(key, png, "image/png")
+    return key
+
+
+@dataclass
+class MigratedChunk:
+    selected: int = 0   # Rows with an inline signature locked by this chunk
+    migrated: int = 0   # Rows now pointing at a stored object
+    retry: List[UUID] = field(default_factory=list)  # Rows whose value could not be moved
+
+
+def legacy_key(value: str, storage: MediaStorage) -> str:
+    """Blocking: object key for a legacy client_signature_url value."""
+    key = storage.key_for_url(value)
+    if key is not None:
+        return key  # Already a URL of our store
+    return store_signature(value, storage)
+
+
+async def migrate_signature_chunk(
+    db: AsyncSession,
+    storage: MediaStorage,
+    limit: int,
+    skip: Collection[UUID] = (),
+) -> MigratedChunk:
+    """Move up to `limit` inline signatures (except `skip`) to the store in the caller's session, and commit."""
+    query = (
+        select(Request.id, Request.legacy_signature)
+        .where(Request.legacy_signature.isnot(None))  # Matches the partial index predicate
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    if skip:
+        query = query.where(Request.id.notin_(skip))
+    rows = (await db.execute(query)).all()
+    
+    moved, retry = [], []
+    for row in rows:
+        try:
+            key = await asyncio.to_thread(legacy_key, row.legacy_signature, storage)
+        except Exception as exc:  # Invalid payload or store down: the inline value stays
+            print(f"[SIGNATURES] Request {row.id} not migrated: {exc!r}")
+            retry.append(row.id)
+            continue
+        moved.append({"id": row.id, "client_signature_key": key, "legacy_signature": None})
+    if moved:
+        await db.execute(update(Request), moved)  # Bulk UPDATE by primary key
+    await db.commit()
+    return MigratedChunk(selected=len(rows), migrated=len(moved), retry=retry)
+
+
+class SignatureMigration:
+    """
+    Background move of inline signatures to the store, on every worker.
+    
+    Each batch is one transaction over rows locked with SKIP LOCKED, so
+    workers migrating at the same time take disjoint rows. The task ends
+    when no inline signature is left; rows that cannot be moved keep their
+    value and are reported.
+    """
+    
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession] = async_session,
+        storage: Optional[MediaStorage] = None,
+    ):
+        self._session_factory = session_factory
+        self._storage = storage
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.migrated = 0
+        self.failed = 0
+        self.seconds = 0.0
+    
+    async def migrate(
+        self,
+        batch_size: Optional[int] = None,
+        max_batches: Optional[int] = None,
+        pause: float = 0.0,
+    ) -> dict:
+        """Migrate batches until none is left or max_batches ran, sleeping `pause` seconds between them."""
+        batch_size = batch_size or settings.SIGNATURE_MIGRATION_BATCH_SIZE
+        storage = self._storage or get_storage()
+        start = time.perf_counter()
+        totals = {"migrated": 0, "failed": 0, "batches": 0}
+        skip: Set[UUID] = set()
+        try:
+            while max_batches is None or totals["batches"] < max_batches:
+                async with self._session_factory() as db:
+                    chunk = await migrate_signature_chunk(db, storage, batch_size, skip)
+                skip.update(chunk.retry)
+                totals["batches"] += 1
+                totals["migrated"] += chunk.migrated
+                totals["failed"] += len(chunk.retry)
+                if chunk.selected < batch_size:
+                    break
+                await asyncio.sleep(pause)
+        finally:
+            self.batches += totals["batches"]
+            self.migrated += totals["migrated"]
+            self.failed += totals["failed"]
+            self.seconds += time.perf_counter() - start
+        return totals
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+    
+    async def _run(self):
+        try:
+            totals = await self.migrate(pause=settings.SIGNATURE_MIGRATION_PAUSE_SECONDS)
+        except Exception as exc:  # Left for the next start
+            print(f"[SIGNATURES] Migration failed: {exc!r}")
+            return
+        if totals["migrated"] or totals["failed"]:
+            print(f"[SIGNATURES] Moved {totals['migrated']} inline signatures to the store, "
+                  f"{totals['failed']} could not be moved")
+    
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "batches": self.batches,
+            "migrated": self.migrated,
+            "failed": self.failed,
+            "seconds": self.seconds,
+        }
+
+
+signature_migration = SignatureMigration()
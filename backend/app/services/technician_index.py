@@ -0,0 +1,309 @@
+"""
+Technician Index Service
+
+In-process spatial index of dispatchable technicians, used by dispatch as a
+first-stage candidate filter before touching the database. Each entry also
+holds the technician's row in the scoring feature store, so hits can be
+ranked as arrays before any technician is loaded.
+"""
+import math
+import struct
+import time
+from array import array
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+
+import numpy as np
+from geoalchemy2 import Geometry
+from sqlalchemy import select, cast, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.request import Category
+from app.models.technician import Technician
+from app.services.technician_scoring import TechnicianScores, technician_scores
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+CellKey = Tuple[Category, int, int]
+
+
+def point_coordinates(location) -> Optional[Tuple[float, float]]:
+    """
+    Extract (latitude, longitude) from a location column value.
+    
+    Accepts the WKT strings written by the API ("POINT(lon lat)") and the
+    EWKB elements returned by geoalchemy2 when loading from the database.
+    """
+    if location is None:
+        return None
+    if isinstance(location, str):
+        wkt = location.split(";")[-1].strip()
+        if not wkt.upper().startswith("POINT"):
+            return None
+        lon, lat = wkt[wkt.index("(") + 1:wkt.rindex(")")].split()
+        return float(lat), float(lon)
+    
+    data = getattr(location, "data", location)
+    if isinstance(data, str):
+        data = bytes.fromhex(data)
+    data = bytes(data)
+    endian = "<" if data[0] == 1 else ">"
+    geom_type = struct.unpack(endian + "I", data[1:5])[0]
+    offset = 9 if geom_type & 0x20000000 else 5  # Skip SRID if present
+    lon, lat = struct.unpack(endian + "dd", data[offset:offset + 16])
+    return lat, lon
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres; any argument may be a NumPy array."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+@dataclass
+class IndexHits:
+    """Technicians found by a query, nearest first, as parallel columns."""
+    ids: List[UUID] = field(default_factory=list)
+    distance_km: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    score_rows: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.intp))  # In TechnicianScores
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class _Bucket:
+    """Compact column storage for the technicians of one grid cell."""
+    
+    __slots__ = ("ids", "lat", "lon", "rating", "completed_jobs", "score_row")
+    
+    def __init__(self):
+        self.ids: List[UUID] = []
+        self.lat = array("d")
+        self.lon = array("d")
+        self.rating = array("d")
+        self.completed_jobs = array("l")
+        self.score_row = array("q")
+    
+    def append(self, tech_id: UUID, lat: float, lon: float, rating: float, completed_jobs: int, score_row: int):
+        self.ids.append(tech_id)
+        self.lat.append(lat)
+        self.lon.append(lon)
+        self.rating.append(rating)
+        self.completed_jobs.append(completed_jobs)
+        self.score_row.append(score_row)
+    
+    def remove(self, tech_id: UUID) -> bool:
+        """Swap-remove a technician, keeping the arrays dense."""
+        try:
+            pos = self.ids.index(tech_id)
+        except ValueError:
+            return False
+        last = len(self.ids) - 1
+        for column in (self.ids, self.lat, self.lon, self.rating, self.completed_jobs, self.score_row):
+            column[pos] = column[last]
+            column.pop()
+        return True
+
+
+class TechnicianIndex:
+    """
+    Grid-bucket index of dispatchable technicians keyed by category.
+    
+    Each technician is stored once per category it serves, in the cell
+    containing its position. Queries scan only the cells overlapping the
+    search radius, on the bucket columns as arrays.
+    """
+    
+    def __init__(self, cell_deg: Optional[float] = None, scores: Optional[TechnicianScores] = None):
+        self.cell_deg = cell_deg or settings.TECHNICIAN_INDEX_CELL_DEG
+        self.scores = scores if scores is not None else technician_scores
+        self._buckets: Dict[CellKey, _Bucket] = {}
+        self._entries: Dict[UUID, List[CellKey]] = {}
+        self.loaded = False
+        self.last_resync_at: Optional[float] = None
+        self.last_update_at: Optional[float] = None
+        self.updates_since_resync = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def __contains__(self, tech_id: UUID) -> bool:
+        return tech_id in self._entries
+    
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+    
+    def clear(self):
+        self._buckets.clear()
+        self._entries.clear()
+    
+    def upsert(
+        self,
+        tech_id: UUID,
+        categories: Iterable[Category],
+        lat: float,
+        lon: float,
+        rating: float,
+        completed_jobs: int,
+    ):
+        """Insert or move a technician."""
+        self._discard(tech_id)
+        row, col = self._cell(lat, lon)
+        score_row = self.scores.set_profile(tech_id, rating, completed_jobs)  # Stable for the process
+        keys = []
+        for category in set(categories):
+            key = (category, row, col)
+            self._buckets.setdefault(key, _Bucket()).append(
+                tech_id, lat, lon, rating, completed_jobs, score_row
+            )
+            keys.append(key)
+        if keys:
+            self._entries[tech_id] = keys
+        self._touch()
+    
+    def remove(self, tech_id: UUID):
+        """Drop a technician (no longer dispatchable)."""
+        if self._discard(tech_id):
+            self._touch()
+    
+    def _discard(self, tech_id: UUID) -> bool:
+        keys = self._entries.pop(tech_id, None)
+        if not keys:
+            return False
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if bucket and bucket.remove(tech_id) and not bucket.ids:
+                del self._buckets[key]
+        return True
+    
+    def _touch(self):
+        self.last_update_at = time.time()
+        self.updates_since_resync += 1
+    
+    def position(self, tech_id: UUID) -> Optional[Tuple[float, float]]:
+        """Current indexed (lat, lon) of a technician."""
+        keys = self._entries.get(tech_id)
+        if not keys:
+            return None
+        bucket = self._buckets[keys[0]]
+        pos = bucket.ids.index(tech_id)
+        return bucket.lat[pos], bucket.lon[pos]
+    
+    def query(
+        self,
+        category: Category,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        limit: int,
+        exclude_ids: Set[UUID] = frozenset(),
+    ) -> IndexHits:
+        """
+        Nearest technicians for a category within radius_km.
+        
+        Sorted by distance, then rating, then completed jobs.
+        """
+        lat_span = radius_km / KM_PER_DEGREE
+        lon_span = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        row_min, col_min = self._cell(lat - lat_span, lon - lon_span)
+        row_max, col_max = self._cell(lat + lat_span, lon + lon_span)
+        
+        buckets = [
+            bucket
+            for row in range(row_min, row_max + 1)
+            for col in range(col_min, col_max + 1)
+            if (bucket := self._buckets.get((category, row, col))) is not None
+        ]
+        if not buckets:
+            return IndexHits()
+        
+        # Copies of the columns: the arrays must stay resizable
+        lats = np.concatenate([np.array(b.lat) for b in buckets])
+        lons = np.concatenate([np.array(b.lon) for b in buckets])
+        distance = haversine_km(lat, lon, lats, lons)
+        inside = distance <= radius_km
+        score_rows = np.concatenate([np.array(b.score_row, dtype=np.intp) for b in buckets])
+        if exclude_ids:
+            inside &= ~np.isin(score_rows, self.scores.rows_for(list(exclude_ids)))
+        found = np.flatnonzero(inside)
+        if not len(found):
+            return IndexHits()
+        
+        rating = np.concatenate([np.array(b.rating) for b in buckets])[found]
+        completed = np.concatenate([np.array(b.completed_jobs) for b in buckets])[found]
+        found = found[np.lexsort((-completed, -rating, distance[found]))[:limit]]
+        ids = list(chain.from_iterable(b.ids for b in buckets))
+        return IndexHits([ids[i] for i in found], distance[found], score_rows[found])
+    
+    def nearest(
+        self,
+        category: Category,
+        lat: float,
+        lon: float,
+        limit: int,
+        radii_km: Optional[Iterable[float]] = None,
+        exclude_ids: Set[UUID] = frozenset(),
+    ) -> IndexHits:
+        """Ring-by-ring search, stopping at the first ring with enough hits."""
+        hits = IndexHits()
+        for radius_km in radii_km or settings.DISPATCH_SEARCH_RADII_KM:
+            hits = self.query(category, lat, lon, radius_km, limit, exclude_ids)
+            if len(hits) >= limit:
+                break
+        return hits
+    
+    def stats(self) -> dict:
+        """Size and staleness metrics."""
+        now = time.time()
+        return {
+            "loaded": self.loaded,
+            "technicians": len(self._entries),
+            "buckets": len(self._buckets),
+            "seconds_since_resync": round(now - self.last_resync_at, 3) if self.last_resync_at else None,
+            "seconds_since_update": round(now - self.last_update_at, 3) if self.last_update_at else None,
+            "updates_since_resync": self.updates_since_resync,
+        }
+    
+    async def resync(self, db: AsyncSession) -> int:
+        """
+        Rebuild the index from the database.
+        
+        Returns the number of indexed technicians.
+        """
+        point = cast(Technician.location, Geometry)
+        result = await db.execute(
+            select(
+                Technician.id,
+                Technician.specializations,
+                Technician.rating,
+                Technician.completed_jobs,
+                func.ST_Y(point),
+                func.ST_X(point),
+            ).where(
+                Technician.is_active == True,
+                Technician.is_available_now == True,
+                Technician.is_accepting_jobs == True,
+                Technician.is_verified == True,
+                Technician.location.isnot(None),
+            )
+        )
+        
+        self.clear()
+        for tech_id, specializations, rating, completed_jobs, lat, lon in result.all():
+            self.upsert(tech_id, specializations or [], lat, lon, rating, completed_jobs)
+        
+        self.loaded = True
+        self.last_resync_at = time.time()
+        self.updates_since_resync = 0
+        return len(self._entries)
+
+
+technician_index = TechnicianIndex()
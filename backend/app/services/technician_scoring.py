@@ -0,0 +1,309 @@
+"""
+Technician Scoring Service
+
+Compact per-technician feature rows, updated incrementally from dispatch
+telemetry and job outcomes, and ranked with a single NumPy weighted pass.
+"""
+import bisect
+import math
+from datetime import datetime, timezone
+from typing import Dict, Optional, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.technician import Technician
+from app.models.technician_stats import (
+    TechnicianStats,
+    RESPONSE_BUCKET_BOUNDS,
+    WINDOW_DAYS,
+    empty_response_histogram,
+)
+
+
+# Feature columns, normalised to [0, 1]
+RATING, EXPERIENCE, ACCEPTANCE, RESPONSE, CANCELLATION = range(5)
+N_FEATURES = 5
+
+# Raw counter columns (offers/accepts over the last WINDOW_DAYS, response = histogram median or NaN)
+C_RATING, C_COMPLETED, C_OFFERS, C_ACCEPTED, C_ACCEPTED_TOTAL, C_CANCELLED, C_RESPONSE = range(7)
+N_COUNTERS = 7
+
+EXPERIENCE_CAP_JOBS = 500
+RESPONSE_CAP_SECONDS = 600.0
+DEFAULT_RESPONSE_SECONDS = 120.0  # Until a technician has responded to something
+PRIOR_OFFERS = 4  # Pseudo-offers (half accepted) so new technicians start at 50%
+
+
+def response_bucket(seconds: float) -> int:
+    """Histogram bucket of a response time."""
+    return bisect.bisect_left(RESPONSE_BUCKET_BOUNDS, seconds)
+
+
+def histogram_median(histogram: Sequence[int]) -> Optional[float]:
+    """Median response time, interpolated inside its bucket."""
+    total = sum(histogram)
+    if not total:
+        return None
+    half = total / 2
+    seen = 0
+    for i, count in enumerate(histogram):
+        if count and seen + count >= half:
+            if i == len(RESPONSE_BUCKET_BOUNDS):
+                return float(RESPONSE_BUCKET_BOUNDS[-1])
+            low = RESPONSE_BUCKET_BOUNDS[i - 1] if i else 0
+            return low + (RESPONSE_BUCKET_BOUNDS[i] - low) * (half - seen) / count
+        seen += count
+    return None
+
+
+def window_sums(
+    daily_offers: Sequence[int],
+    daily_accepts: Sequence[int],
+    window_day: int,
+    days: int,
+    today: Optional[int] = None,
+) -> Tuple[int, int]:
+    """
+    (offers, accepts) over the last `days` days of the rolling rings.
+    
+    today defaults to window_day; days after window_day have no events yet.
+    """
+    today = window_day if today is None else today
+    offers = accepts = 0
+    for day in range(max(today - days + 1, window_day - WINDOW_DAYS + 1), min(today, window_day) + 1):
+        offers += daily_offers[day % WINDOW_DAYS]
+        accepts += daily_accepts[day % WINDOW_DAYS]
+    return offers, accepts
+
+
+def score_weights() -> np.ndarray:
+    """Weight vector matching the feature columns (cancellation counts against)."""
+    weights = np.zeros(N_FEATURES)
+    weights[RATING] = settings.SCORE_WEIGHT_RATING
+    weights[EXPERIENCE] = settings.SCORE_WEIGHT_EXPERIENCE
+    weights[ACCEPTANCE] = settings.SCORE_WEIGHT_ACCEPTANCE
+    weights[RESPONSE] = settings.SCORE_WEIGHT_RESPONSE
+    weights[CANCELLATION] = -settings.SCORE_WEIGHT_CANCELLATION
+    return weights
+
+
+class TechnicianScores:
+    """
+    In-process feature store.
+    
+    Row 0 holds the prior used for technicians not loaded yet; every other
+    technician owns one row of raw counters and one normalised feature row,
+    so ranking is a gather of the weighted score column (the dot product of
+    each feature row with the current weights, kept in step with the row)
+    plus the distance term. A technician keeps the same
+    row for the life of the process, so callers (the technician index) can
+    hold on to it.
+    """
+    
+    def __init__(self, capacity: int = 1024):
+        self._row: Dict[UUID, int] = {}
+        self._size = 1
+        self.counters = np.zeros((capacity, N_COUNTERS))
+        self.features = np.zeros((capacity, N_FEATURES))
+        self.weighted = np.zeros(capacity)
+        self._weights = score_weights()
+        self.loaded = False
+        self.counters[0, C_RATING] = 5.0
+        self.counters[0, C_RESPONSE] = np.nan
+        self._refresh(0)
+    
+    def __len__(self) -> int:
+        return self._size - 1
+    
+    def __contains__(self, tech_id: UUID) -> bool:
+        return tech_id in self._row
+    
+    def _grow(self):
+        capacity = self.features.shape[0] * 2
+        for name in ("counters", "features", "weighted"):
+            old = getattr(self, name)
+            new = np.zeros((capacity, *old.shape[1:]), dtype=old.dtype)
+            new[:old.shape[0]] = old
+            setattr(self, name, new)
+    
+    def _ensure(self, tech_id: UUID) -> int:
+        row = self._row.get(tech_id)
+        if row is None:
+            if self._size == self.features.shape[0]:
+                self._grow()
+            row = self._size
+            self._size += 1
+            self._row[tech_id] = row
+            self.counters[row] = self.counters[0]
+            self._refresh(row)
+        return row
+    
+    def _refresh(self, row: int):
+        """Recompute the normalised features of one row from its counters."""
+        rating, completed, offers, accepted, accepted_total, cancelled, response = self.counters[row]
+        if np.isnan(response):
+            response = DEFAULT_RESPONSE_SECONDS
+        
+        features = self.features[row]
+        features[RATING] = rating / 5.0
+        features[EXPERIENCE] = math.log1p(min(completed, EXPERIENCE_CAP_JOBS)) / math.log1p(EXPERIENCE_CAP_JOBS)
+        features[ACCEPTANCE] = min(1.0, (accepted + PRIOR_OFFERS / 2) / (offers + PRIOR_OFFERS))
+        features[RESPONSE] = 1.0 - min(response, RESPONSE_CAP_SECONDS) / RESPONSE_CAP_SECONDS
+        features[CANCELLATION] = min(1.0, cancelled / (accepted_total + PRIOR_OFFERS))
+        self.weighted[row] = features @ self._weights
+    
+    def load(
+        self,
+        tech_id: UUID,
+        rating: float,
+        completed_jobs: int,
+        offers_30d: int = 0,
+        accepts_30d: int = 0,
+        accepted_total: int = 0,
+        jobs_cancelled: int = 0,
+        response_seconds: Optional[float] = None,
+    ):
+        """Set the full feature row of a technician."""
+        row = self._ensure(tech_id)
+        self.counters[row] = (
+            rating,
+            completed_jobs,
+            offers_30d,
+            accepts_30d,
+            accepted_total,
+            jobs_cancelled,
+            np.nan if response_seconds is None else response_seconds,
+        )
+        self._refresh(row)
+    
+    def load_stats(self, stats: TechnicianStats, today: Optional[int] = None):
+        """Copy the aggregates of a technician_stats row, keeping the profile columns."""
+        row = self._ensure(stats.technician_id)
+        offers, accepts = window_sums(
+            stats.daily_offers, stats.daily_accepts, stats.window_day, WINDOW_DAYS, today
+        )
+        counters = self.counters[row]
+        counters[C_OFFERS] = offers
+        counters[C_ACCEPTED] = accepts
+        counters[C_ACCEPTED_TOTAL] = stats.offers_accepted
+        counters[C_CANCELLED] = stats.jobs_cancelled
+        median = histogram_median(stats.response_histogram or ())
+        counters[C_RESPONSE] = np.nan if median is None else median
+        self._refresh(row)
+    
+    def set_profile(self, tech_id: UUID, rating: float, completed_jobs: int) -> int:
+        """Refresh the profile columns (rating, completed jobs) if they changed; returns the row."""
+        row = self._ensure(tech_id)
+        if self.counters[row, C_RATING] != rating or self.counters[row, C_COMPLETED] != completed_jobs:
+            self.counters[row, C_RATING] = rating
+            self.counters[row, C_COMPLETED] = completed_jobs
+            self._refresh(row)
+        return row
+    
+    def add_completion(self, tech_id: UUID):
+        row = self._ensure(tech_id)
+        self.counters[row, C_COMPLETED] += 1
+        self._refresh(row)
+    
+    def add_cancellation(self, tech_id: UUID):
+        row = self._ensure(tech_id)
+        self.counters[row, C_CANCELLED] += 1
+        self._refresh(row)
+    
+    def rows_for(self, tech_ids: Sequence[UUID]) -> np.ndarray:
+        """Feature rows of technicians (0, the prior, for unknown ones)."""
+        get = self._row.get
+        return np.fromiter((get(tech_id, 0) for tech_id in tech_ids), dtype=np.intp, count=len(tech_ids))
+    
+    def scores(
+        self,
+        rows: np.ndarray,
+        distance_km: Optional[np.ndarray] = None,
+        weights: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Weighted score of each row; distance is normalised by the largest search ring."""
+        if weights is None:
+            weights = score_weights()
+            if not np.array_equal(weights, self._weights):  # Settings changed: rebuild the column
+                self._weights = weights
+                self.weighted[:self._size] = self.features[:self._size] @ weights
+            scores = self.weighted[rows]
+        else:
+            scores = self.features[rows] @ weights
+        if distance_km is not None:
+            scores -= settings.SCORE_WEIGHT_DISTANCE / max(settings.DISPATCH_SEARCH_RADII_KM) * distance_km
+        return scores
+    
+    def rank(
+        self,
+        rows: np.ndarray,
+        distance_km: Optional[np.ndarray] = None,
+        limit: Optional[int] = None,
+        weights: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Positions into rows, best first (only the top `limit` when given)."""
+        scores = self.scores(rows, distance_km, weights)
+        if limit is not None and limit < len(scores):
+            top = np.argpartition(-scores, limit)[:limit]
+            return top[np.argsort(-scores[top], kind="stable")]
+        return np.argsort(-scores, kind="stable")
+    
+    async def resync(self, db: AsyncSession) -> int:
+        """Reload every row from technicians and technician_stats, keeping row numbers."""
+        result = await db.execute(
+            select(Technician.id, Technician.rating, Technician.completed_jobs, TechnicianStats)
+            .outerjoin(TechnicianStats, TechnicianStats.technician_id == Technician.id)
+            .where(Technician.is_active == True)
+        )
+        rows = result.all()
+        today = datetime.now(timezone.utc).date().toordinal()
+        
+        for tech_id, rating, completed, stats in rows:
+            self.load(tech_id, rating, completed)
+            if stats is not None:
+                self.load_stats(stats, today)
+        self.loaded = True
+        return len(rows)
+
+
+technician_scores = TechnicianScores()
+
+
+async def _ensure_stats_row(db: AsyncSession, technician_id: UUID):
+    await db.execute(
+        pg_insert(TechnicianStats)
+        .values(technician_id=technician_id, response_histogram=empty_response_histogram())
+        .on_conflict_do_nothing(index_elements=[TechnicianStats.technician_id])
+    )
+
+
+async def record_completion(db: AsyncSession, technician_id: UUID):
+    """Count a completed job (also on the public completed_jobs counter)."""
+    await _ensure_stats_row(db, technician_id)
+    await db.execute(
+        update(TechnicianStats)
+        .where(TechnicianStats.technician_id == technician_id)
+        .values(jobs_completed=TechnicianStats.jobs_completed + 1)
+    )
+    await db.execute(
+        update(Technician)
+        .where(Technician.id == technician_id)
+        .values(completed_jobs=Technician.completed_jobs + 1)
+    )
+    technician_scores.add_completion(technician_id)
+
+
+async def record_cancellation(db: AsyncSession, technician_id: UUID):
+    """Count a job cancelled after the technician accepted it."""
+    await _ensure_stats_row(db, technician_id)
+    await db.execute(
+        update(TechnicianStats)
+        .where(TechnicianStats.technician_id == technician_id)
+        .values(jobs_cancelled=TechnicianStats.jobs_cancelled + 1)
+    )
+    technician_scores.add_cancellation(technician_id)
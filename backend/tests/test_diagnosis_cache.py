@@ -0,0 +1,47 @@
+"""Coalescing of concurrent diagnosis cache misses."""
+import asyncio
+
+from app.models.request import Severity
+from app.schemas.request import AIAnalysisResponse, PriceRange
+from app.services.diagnosis_cache import DiagnosisCache
+
+
+def _diagnosis() -> AIAnalysisResponse:
+    return AIAnalysisResponse(
+        severity=Severity.MEDIUM,
+        confidence=80,
+        probable_issue="Guarnizione del sifone usurata",
+        safety_instructions=["Chiudere la valvola sotto il lavandino"],
+        estimated_duration_hours=1.0,
+        price_range=PriceRange(min_price=8000, max_price=15000),
+    )
+
+
+def test_waiter_computes_again_when_first_caller_is_cancelled():
+    async def scenario():
+        cache = DiagnosisCache()
+        started = asyncio.Event()
+        calls = 0
+        
+        async def hung():
+            started.set()
+            await asyncio.sleep(3600)
+        
+        async def compute():
+            nonlocal calls
+            calls += 1
+            return _diagnosis()
+        
+        first = asyncio.create_task(cache.get_or_compute("abc", hung))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_compute("abc", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        
+        result = await waiter
+        assert first.cancelled()
+        assert result == _diagnosis()
+        assert calls == 1
+        assert cache.misses == 2 and cache.coalesced == 0
+    
+    asyncio.run(scenario())
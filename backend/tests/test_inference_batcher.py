@@ -0,0 +1,22 @@
+"""Payload sent to the model server by HTTPInferenceBackend."""
+import json
+import uuid
+
+from app.models.request import Category
+from app.services.inference_batcher import DiagnosisInput
+
+
+def test_diagnosis_input_to_json_serializes_uuid_request_id():
+    request_id = uuid.uuid4()
+    item = DiagnosisInput(
+        request_id,
+        Category.PLUMBING,
+        "Perdita sotto il lavandino",
+        {"how_long": "oggi", "running_water": True},
+        ["https://media.example.com/uploads/1.jpg"],
+    )
+    
+    payload = json.loads(json.dumps({"items": [item.to_json()]}))
+    
+    assert payload["items"][0]["request_id"] == str(request_id)
+    assert payload["items"][0]["category"] == Category.PLUMBING.value
@@ -0,0 +1,24 @@
+"""GET /media/local/{key}: the development stand-in for public bucket URLs."""
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.services import media_storage
+
+
+def test_local_objects_are_served_in_debug_only_and_never_signatures(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "MEDIA_STORAGE_BACKEND", "filesystem")
+    monkeypatch.setattr(settings, "MEDIA_FILESYSTEM_ROOT", str(tmp_path))
+    monkeypatch.setattr(settings, "DEBUG", True)
+    monkeypatch.setattr(media_storage, "_storage", None)
+    storage = media_storage.get_storage()
+    storage.write("uploads/u1/photo.jpg", b"jpeg", "image/jpeg")
+    storage.write("signatures/ab.png", b"png", "image/png")
+    client = TestClient(app)  # No lifespan: this route needs no database
+    
+    assert client.get("/api/v1/media/local/uploads/u1/photo.jpg").content == b"jpeg"
+    assert client.get("/api/v1/media/local/signatures/ab.png").status_code == 404
+    assert client.get("/api/v1/media/local/uploads/..%2Fsignatures/ab.png").status_code == 404
+    
+    monkeypatch.setattr(settings, "DEBUG", False)
+    assert client.get("/api/v1/media/local/uploads/u1/photo.jpg").status_code == 404
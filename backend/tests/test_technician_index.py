@@ -0,0 +1,56 @@
+"""In-process technician index: hits carry distances and feature-store rows."""
+import asyncio
+import uuid
+
+import numpy as np
+
+from app.models.request import Category
+from app.services.technician_index import TechnicianIndex, haversine_km
+from app.services.technician_scoring import C_RATING, TechnicianScores, score_weights
+
+MILANO = (45.4642, 9.1900)
+
+
+def test_query_returns_nearest_hits_with_score_rows():
+    scores = TechnicianScores()
+    index = TechnicianIndex(cell_deg=0.05, scores=scores)
+    ids = [uuid.uuid4() for _ in range(4)]
+    positions = [(45.47, 9.19), (45.50, 9.25), (45.4642, 9.1901), (46.50, 9.19)]
+    for tech_id, (lat, lon) in zip(ids, positions):
+        index.upsert(tech_id, [Category.PLUMBING], lat, lon, rating=4.5, completed_jobs=10)
+    
+    hits = index.query(Category.PLUMBING, *MILANO, radius_km=20, limit=10, exclude_ids={ids[1]})
+    
+    assert hits.ids == [ids[2], ids[0]]
+    assert np.allclose(hits.distance_km, [haversine_km(*MILANO, *positions[i]) for i in (2, 0)])
+    assert list(hits.score_rows) == list(scores.rows_for(hits.ids))
+
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+    
+    def all(self):
+        return self._rows
+
+
+class _Session:
+    def __init__(self, rows):
+        self._rows = rows
+    
+    async def execute(self, query):
+        return _Result(self._rows)
+
+
+def test_score_rows_survive_resync_of_the_feature_store():
+    scores = TechnicianScores()
+    index = TechnicianIndex(cell_deg=0.05, scores=scores)
+    tech_id = uuid.uuid4()
+    index.upsert(tech_id, [Category.PLUMBING], *MILANO, rating=4.0, completed_jobs=3)
+    row = index.query(Category.PLUMBING, *MILANO, radius_km=5, limit=1).score_rows[0]
+    
+    asyncio.run(scores.resync(_Session([(uuid.uuid4(), 5.0, 1, None), (tech_id, 3.0, 50, None)])))
+    
+    assert scores.rows_for([tech_id])[0] == row
+    assert scores.counters[row, C_RATING] == 3.0
+    assert np.isclose(scores.scores(np.array([row]))[0], scores.features[row] @ score_weights())
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Benchmark della preparazione delle foto per il modello di visione.
+
+Crea foto "da smartphone" (4032x3024, JPEG 4-12 MB, orientamento EXIF vario,
+GPS) nello store su filesystem (cartella temporanea) e le passa a
+`ImagePreprocessor` come farebbe `analyze_request`, a gruppi di 5 per
+richiesta. Misura byte risparmiati e tempo per immagine, poi verifica:
+  - copie con lato lungo AI_IMAGE_MAX_SIDE, dritte, senza EXIF, nel formato scelto
+  - secondo passaggio sugli stessi URL: nessuna lettura (cache per URL)
+  - copia eliminata dalla pulizia dei media: la cache per URL non la
+    riusa, la foto viene preparata di nuovo
+  - nuovo worker (o riavvio): nessuna ricodifica (copie indirizzate per hash)
+  - stessa foto caricata due volte: una sola codifica, stessa diagnosi in cache
+  - URL esterni e video passano invariati
+Stampa infine dimensione e tempo di codifica per WebP e JPEG a varie qualità.
+
+Usage:
+    python execution/bench_ai_image_preprocessing.py [--photos 30] [--workers 2] \
+        [--max-side 1024] [--format webp] [--quality 80]
+"""
+
+import argparse
+import asyncio
+import io
+import random
+import tempfile
+import time
+
+import bench_common  # noqa: F401  (configura sys.path)
+from bench_common import print_summary, timed
+
+import numpy as np
+from PIL import Image
+
+from app.config import settings
+from app.models.request import Category
+from app.services import media_storage
+from app.services.ai_diagnostic import analyze_request
+from app.services.diagnosis_cache import diagnosis_cache
+from app.services.image_preprocessing import ImagePreprocessor, image_preprocessor, render_for_model
+from app.services.media_storage import get_storage
+
+ORIENTATIONS = [1, 3, 6, 8]  # 6 e 8: foto scattate in verticale
+
+
+def phone_photo(seed: int, orientation: int) -> bytes:
+    """JPEG 4032x3024 con rumore (come un sensore reale), EXIF e GPS."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:3024, 0:4032]
+    base = np.stack([(x * 255 // 4032), (y * 255 // 3024), np.full_like(x, 128)], axis=-1)
+    noise = rng.integers(-40, 40, size=base.shape)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    image = Image.fromarray(pixels, "RGB")
+    exif = image.getexif()
+    exif[0x0112] = orientation
+    exif[0x010F] = "TestPhone"
+    exif.get_ifd(0x8825).update({1: "N", 2: (45.0, 27.0, 50.0), 3: "E", 4: (9.0, 11.0, 22.0)})
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=random.choice([85, 90, 95]), exif=exif)
+    return out.getvalue()
+
+
+async def prepare_requests(preprocessor: ImagePreprocessor, urls: list, latencies: list) -> list:
+    """Prepara gli URL a gruppi di 5 (una richiesta), tutte le richieste insieme."""
+    async def one_request(group):
+        with timed(latencies):
+            return await preprocessor.prepare(group)
+    groups = [urls[i:i + 5] for i in range(0, len(urls), 5)]
+    results = await asyncio.gather(*(one_request(g) for g in groups))
+    return [image for group in results for image in group]
+
+
+def check_copy(image, orientation: int, fmt: str) -> bool:
+    """Lato lungo, orientamento, formato e assenza di EXIF della copia per il modello."""
+    copy = Image.open(io.BytesIO(get_storage().read(get_storage().key_for_url(image.url))))
+    portrait = orientation in (6, 8)
+    upright = (copy.height > copy.width) == portrait
+    return (
+        max(copy.size) == settings.AI_IMAGE_MAX_SIDE
+        and upright
+        and copy.format == {"webp": "WEBP", "jpeg": "JPEG"}[fmt]
+        and len(copy.getexif()) == 0
+    )
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    storage = get_storage()
+    errors = 0
+    print(f"Creazione di {args.photos} foto di prova...")
+    photos = []
+    for i in range(args.photos):
+        orientation = ORIENTATIONS[i % len(ORIENTATIONS)]
+        data = phone_photo(i, orientation)
+        key = f"uploads/bench/{i}.jpg"
+        storage.write(key, data, "image/jpeg")
+        photos.append((storage.public_url(key), orientation, data))
+    sizes = [len(p[2]) / 2**20 for p in photos]
+    print(f"Originali: {min(sizes):.1f}-{max(sizes):.1f} MB, totale {sum(sizes):.0f} MB")
+    urls = [p[0] for p in photos]
+    
+    preprocessor = ImagePreprocessor()
+    preprocessor.start()
+    try:
+        latencies = []
+        start = time.perf_counter()
+        images = await prepare_requests(preprocessor, urls, latencies)
+        seconds = time.perf_counter() - start
+        stats = preprocessor.stats()
+        print(f"\nPrimo passaggio ({args.workers} processi): {len(images)} foto in {seconds:.2f}s")
+        print(f"  per immagine nel worker: media {stats['avg_ms']:.0f}ms, max {stats['max_ms']:.0f}ms")
+        print_summary("  richiesta da 5 foto", latencies)
+        saved = stats["bytes_saved"]
+        print(f"  byte: {stats['original_bytes'] / 2**20:.1f} MB -> {stats['bytes'] / 2**20:.2f} MB, "
+              f"risparmiati {saved / 2**20:.1f} MB ({saved / stats['original_bytes']:.1%}), "
+              f"{stats['bytes'] / len(images) / 1024:.0f} KB per foto")
+        bad = sum(not check_copy(image, p[1], args.format) for image, p in zip(images, photos))
+        print(f"  copie non conformi (lato, orientamento, formato, EXIF): {bad}")
+        errors += bad != 0 or stats["encoded"] != args.photos
+        
+        before = preprocessor.stats()
+        start = time.perf_counter()
+        await prepare_requests(preprocessor, urls, [])
+        after = preprocessor.stats()
+        print(f"\nSecondo passaggio: {time.perf_counter() - start:.3f}s, "
+              f"{after['url_hits'] - before['url_hits']} dalla cache per URL")
+        errors += after["url_hits"] - before["url_hits"] != args.photos
+        
+        # La pulizia dei media elimina la copia: l'URL in cache non va più riusato
+        storage.delete(storage.key_for_url(images[0].url))
+        again = (await preprocessor.prepare([urls[0]]))[0]
+        stale = preprocessor.stats()
+        print(f"Copia eliminata: {stale['stale_urls']} URL scartati dalla cache, "
+              f"ricodificate {stale['encoded'] - after['encoded']}, copia di nuovo nello store "
+              f"{storage.head(storage.key_for_url(again.url)) is not None}")
+        errors += stale["stale_urls"] != 1 or stale["encoded"] - after["encoded"] != 1
+    finally:
+        await preprocessor.stop()
+    
+    # Altro worker o riavvio: cache per URL vuota, copie già nello store
+    other = image_preprocessor  # Quello usato da analyze_request
+    other.start()
+    try:
+        await prepare_requests(other, urls, [])
+        print(f"Nuovo worker: {other.stats()['prepared']} foto preparate, {other.stats()['encoded']} ricodificate")
+        errors += other.stats()["encoded"] != 0
+        
+        # Stessa foto caricata di nuovo (altro URL) + URL esterno + video
+        storage.write("uploads/bench/again.jpg", photos[0][2], "image/jpeg")
+        storage.write("uploads/bench/clip.mp4", b"\x00\x00\x00\x18ftypmp42", "video/mp4")
+        again = storage.public_url("uploads/bench/again.jpg")
+        mixed = [again, "https://cdn.example.com/foto.jpg", storage.public_url("uploads/bench/clip.mp4")]
+        prepared = await other.prepare(mixed)
+        same_hash = prepared[0].content_hash == images[0].content_hash
+        passed = [p.url == p.source_url and p.content_hash is None for p in prepared[1:]]
+        print(f"Foto ricaricata: stesso hash {same_hash}, ricodificate {other.stats()['encoded']}; "
+              f"esterno/video invariati: {passed}")
+        errors += not same_hash or other.stats()["encoded"] != 0 or not all(passed)
+        
+        # Diagnosi: la foto ricaricata ha lo stesso hash, quindi la diagnosi è in cache
+        settings.DIAGNOSIS_CACHE_BACKEND = "memory"
+        diagnosis_cache.start()
+        answers = {"how_long": "oggi"}
+        await analyze_request("r1", Category.PLUMBING, "Perdita sotto il lavandino", answers, [urls[0]])
+        await analyze_request("r2", Category.PLUMBING, "Perdita sotto il lavandino", answers, [again])
+        cache = diagnosis_cache.stats()
+        print(f"Diagnosi: {cache['local_hits']} hit, {cache['misses']} miss (stessa foto, URL diversi)")
+        errors += cache["local_hits"] != 1
+        await diagnosis_cache.stop()
+    finally:
+        await other.stop()
+    
+    print("\nFormato e qualità (foto 0, nel processo principale):")
+    for fmt in ("webp", "jpeg"):
+        for quality in (70, 80, 90):
+            start = time.perf_counter()
+            encoded = render_for_model(photos[0][2], settings.AI_IMAGE_MAX_SIDE, fmt, quality)
+            print(f"  {fmt:<5} q{quality}: {len(encoded) / 1024:6.0f} KB in {(time.perf_counter() - start) * 1000:.0f}ms")
+    print("OK" if errors == 0 else "ERRORE")
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--photos", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-side", type=int, default=1024)
+    parser.add_argument("--format", choices=["webp", "jpeg"], default="webp")
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as root:
+        settings.MEDIA_STORAGE_BACKEND = "filesystem"
+        settings.MEDIA_FILESYSTEM_ROOT = root
+        settings.AI_IMAGE_WORKERS = args.workers
+        settings.AI_IMAGE_MAX_SIDE = args.max_side
+        settings.AI_IMAGE_FORMAT = args.format
+        settings.AI_IMAGE_QUALITY = args.quality
+        settings.AI_IMAGE_TIMEOUT_SECONDS = 120.0  # Qui interessa il tempo, non il fallback
+        media_storage._storage = None
+        asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark delle disponibilità settimanali compilate in bitmap.
+
+Genera N calendari casuali nel formato di `Technician.availability`, li
+compila con `compile_schedule` e misura: compilazione, lookup singolo
+(`is_available_at`) e filtro vettoriale NumPy su tutti i tecnici per lo
+stesso istante. Verifica anche la coerenza col calendario JSON attorno ai
+cambi d'ora (Europe/Rome). Nessun database richiesto.
+
+Usage:
+    python execution/bench_availability.py [--schedules 50000] [--lookups 200000]
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import bench_common  # noqa: F401  (configura sys.path)
+from bench_common import print_summary
+
+import numpy as np
+
+from app.services.availability import (
+    DAYS,
+    SLOTS_PER_WEEK,
+    compile_schedule,
+    is_available_at,
+    week_slot,
+)
+
+ROME = ZoneInfo("Europe/Rome")
+
+
+def random_schedule() -> dict:
+    """Calendario verosimile: 20% sempre disponibili, gli altri a turni."""
+    if random.random() < 0.2:
+        return {}
+    schedule = {}
+    for day in DAYS:
+        if random.random() < 0.25:
+            continue
+        start = random.randint(6 * 4, 11 * 4)
+        end = min(start + random.randint(4 * 4, 10 * 4), 24 * 4)
+        ranges = [f"{start // 4:02d}:{start % 4 * 15:02d}-{end // 4:02d}:{end % 4 * 15:02d}"]
+        if random.random() < 0.1:
+            ranges.append("22:00-02:00")  # Reperibilità notturna
+        schedule[day] = ranges
+    return schedule
+
+
+def reference_available(schedule: dict, when: datetime) -> bool:
+    """Valutazione diretta del JSON, per confronto."""
+    if not schedule:
+        return True
+    local = when.astimezone(ROME)
+    minute = local.hour * 60 + local.minute
+    for offset, day_index in ((0, local.weekday()), (24 * 60, (local.weekday() - 1) % 7)):
+        for label in schedule.get(DAYS[day_index], []):
+            start, end = label.split("-")
+            start = int(start[:2]) * 60 + int(start[3:])
+            end = int(end[:2]) * 60 + int(end[3:])
+            if end < start:
+                end += 24 * 60
+            elif offset:
+                continue
+            if start <= minute + offset < end:
+                return True
+    return False
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--schedules", type=int, default=50000)
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    
+    schedules = [random_schedule() for _ in range(args.schedules)]
+    
+    started = time.perf_counter()
+    bitmaps = [compile_schedule(s) for s in schedules]
+    elapsed = time.perf_counter() - started
+    print(f"compilazione: {args.schedules} calendari in {elapsed * 1000:.1f} ms "
+          f"({elapsed / args.schedules * 1e6:.1f} µs/calendario)")
+    anytime = sum(b is None for b in bitmaps)
+    print(f"fast path 'anytime': {anytime} calendari senza bitmap")
+    
+    # Coerenza, anche a cavallo dei cambi d'ora 2026 (29/03 e 25/10)
+    instants = [
+        datetime(2026, 3, 28, 23, 0, tzinfo=timezone.utc) + timedelta(minutes=7 * i) for i in range(600)
+    ] + [
+        datetime(2026, 10, 24, 23, 0, tzinfo=timezone.utc) + timedelta(minutes=7 * i) for i in range(600)
+    ]
+    mismatches = 0
+    for schedule, bitmap in zip(schedules[:500], bitmaps[:500]):
+        for when in instants:
+            mismatches += is_available_at(bitmap, when) != reference_available(schedule, when)
+    print(f"coerenza con il JSON: {mismatches} differenze su {500 * len(instants)} verifiche")
+    
+    # Lookup singolo
+    now = datetime.now(timezone.utc)
+    probes = [random.choice(bitmaps) for _ in range(args.lookups)]
+    samples = []
+    for chunk in range(0, args.lookups, 1000):
+        t0 = time.perf_counter()
+        for bitmap in probes[chunk:chunk + 1000]:
+            is_available_at(bitmap, now)
+        samples.append((time.perf_counter() - t0) * 1000)
+    print_summary("1000 lookup (is_available_at)", samples)
+    
+    # Filtro vettoriale: una colonna di bit per tutti i tecnici
+    matrix = np.unpackbits(
+        np.frombuffer(b"".join(b or b"\xff" * (SLOTS_PER_WEEK // 8) for b in bitmaps), dtype=np.uint8)
+        .reshape(len(bitmaps), -1),
+        axis=1,
+        bitorder="little",
+    )
+    samples = []
+    for _ in range(200):
+        slot = week_slot(now + timedelta(minutes=random.randint(0, 7 * 24 * 60)))
+        t0 = time.perf_counter()
+        available = np.flatnonzero(matrix[:, slot])
+        samples.append((time.perf_counter() - t0) * 1000)
+    print_summary(f"filtro NumPy su {len(bitmaps)}", samples)
+    print(f"disponibili ora: {len(available)}")
+    
+    print("OK" if mismatches == 0 else "ERRORE: bitmap e JSON non coincidono")
+
+
+if __name__ == "__main__":
+    main()
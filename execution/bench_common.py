@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Utility condivise dagli script di benchmark del backend.
+
+Non è uno script eseguibile: viene importato dagli altri `bench_*.py`.
+"""
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence
+
+# Rende importabile il package `app` del backend
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """Percentile con nearest-rank su una lista di campioni."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    """Riassume una serie di latenze in millisecondi."""
+    return {
+        "n": len(samples_ms),
+        "mean_ms": sum(samples_ms) / len(samples_ms) if samples_ms else 0.0,
+        "p50_ms": percentile(samples_ms, 50),
+        "p95_ms": percentile(samples_ms, 95),
+        "p99_ms": percentile(samples_ms, 99),
+        "max_ms": max(samples_ms) if samples_ms else 0.0,
+    }
+
+
+def print_summary(label: str, samples_ms: List[float]) -> None:
+    """Stampa una riga di riepilogo leggibile."""
+    s = summarize(samples_ms)
+    print(
+        f"{label:<32} n={s['n']:<7} mean={s['mean_ms']:.3f}ms "
+        f"p50={s['p50_ms']:.3f}ms p95={s['p95_ms']:.3f}ms "
+        f"p99={s['p99_ms']:.3f}ms max={s['max_ms']:.3f}ms"
+    )
+
+
+@contextmanager
+def timed(samples_ms: List[float]):
+    """Aggiunge la durata del blocco (ms) a `samples_ms`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples_ms.append((time.perf_counter() - start) * 1000)
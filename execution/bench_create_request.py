@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark della latenza di `POST /requests/` sotto carico: pipeline inline vs asincrona.
+
+Lancia N creazioni di richiesta con C client concorrenti chiamando
+direttamente l'endpoint `submit_request`, una volta per modalità:
+  - inline: analisi AI, preventivo e dispatch prima di rispondere (201)
+  - async:  la richiesta viene salvata in PENDING e si risponde subito (202),
+            la pipeline in background fa analisi -> preventivo -> dispatch
+L'analisi AI viene rallentata di --ai-latency-ms per simulare la chiamata
+reale a OpenAI. Stampa p50/p95/p99 della risposta e, per la modalità
+asincrona, il tempo fino a DISPATCHING di tutte le richieste.
+
+ATTENZIONE: crea e svuota tabelle nel database indicato. Usare un DB usa-e-getta.
+
+Usage:
+    python execution/bench_create_request.py --database-url postgresql+asyncpg://... \
+        [--requests 2000] [--concurrency 50] [--ai-latency-ms 800] [--workers 16]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+import bench_common  # noqa: F401  (configura sys.path)
+from bench_common import print_summary, timed
+
+from fastapi import Response
+from sqlalchemy import insert, select, func, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.config import settings
+from app.database import Base
+from app.models import User, Request
+from app.models.request import Category, RequestStatus
+from app.schemas.request import RequestCreate
+from app.services import request_pipeline as pipeline_module
+from app.services.request_pipeline import request_pipeline
+from app.services.reference_codes import reference_codes
+from app.api.v1 import requests as requests_module
+from app.api.v1.requests import submit_request
+
+MILANO = (45.4642, 9.1900)
+
+
+def payload(i: int) -> RequestCreate:
+    return RequestCreate(
+        category=random.choice(list(Category)),
+        title=f"Guasto numero {i}",
+        description="Perdita d'acqua sotto il lavandino della cucina",
+        latitude=MILANO[0] + random.uniform(-0.2, 0.2),
+        longitude=MILANO[1] + random.uniform(-0.2, 0.2),
+        address="Via di prova 1, Milano, Italia",
+        media=[{"type": "photo", "url": f"https://cdn.example.com/{i}-{k}.jpg"} for k in range(3)],
+        guided_answers={"how_long": "oggi", "running_water": True},
+    )
+
+
+async def run_mode(session_factory, client: User, args) -> list:
+    """N creazioni con C client concorrenti. Ritorna le latenze (ms)."""
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    
+    async def one(i: int):
+        async with semaphore:
+            async with session_factory() as session:
+                with timed(latencies):
+                    await submit_request(payload(i), Response(), client, session)
+    
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    return latencies
+
+
+async def wait_dispatching(session_factory, total: int) -> float:
+    """Attende che tutte le richieste siano in DISPATCHING. Ritorna i secondi."""
+    start = time.perf_counter()
+    while True:
+        async with session_factory() as session:
+            done = (await session.execute(
+                select(func.count()).where(Request.status == RequestStatus.DISPATCHING)
+            )).scalar()
+        if done >= total:
+            return time.perf_counter() - start
+        await asyncio.sleep(0.1)
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    engine = create_async_engine(args.database_url, pool_size=args.concurrency + args.workers, max_overflow=0)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    
+    client = User(id=uuid.uuid4(), name="Cliente bench")
+    async with session_factory() as session:
+        await session.execute(insert(User), [{"id": client.id, "name": client.name}])
+        await session.commit()
+    
+    # Chiamata AI simulata con latenza fissa
+    analyze = pipeline_module.analyze_request
+    
+    async def slow_analyze(**kwargs):
+        await asyncio.sleep(args.ai_latency_ms / 1000)
+        return await analyze(**kwargs)
+    
+    pipeline_module.analyze_request = requests_module.analyze_request = slow_analyze
+    pipeline_module.async_session = session_factory
+    reference_codes.configure(0)
+    settings.DISPATCH_MODE = "greedy"
+    settings.DISPATCH_WAVES_ENABLED = True  # Il primo wave viene solo schedulato
+    settings.REQUEST_PIPELINE_WORKERS = args.workers
+    
+    settings.REQUEST_PIPELINE_MODE = "inline"
+    start = time.perf_counter()
+    inline = await run_mode(session_factory, client, args)
+    inline_elapsed = time.perf_counter() - start
+    
+    settings.REQUEST_PIPELINE_MODE = "async"
+    request_pipeline.start()
+    start = time.perf_counter()
+    queued = await run_mode(session_factory, client, args)
+    async_elapsed = time.perf_counter() - start
+    drain = await wait_dispatching(session_factory, 2 * args.requests)
+    await request_pipeline.stop()
+    
+    print_summary("inline (201)", inline)
+    print_summary("async (202)", queued)
+    print(f"inline: {args.requests / inline_elapsed:.0f} richieste/s")
+    print(f"async:  {args.requests / async_elapsed:.0f} richieste/s, tutte in DISPATCHING "
+          f"{drain:.2f}s dopo l'ultima risposta ({args.workers} worker)")
+    print(f"pipeline: {request_pipeline.stats()}")
+    await engine.dispose()
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--ai-latency-ms", type=float, default=800.0)
+    parser.add_argument("--workers", type=int, default=16, help="Worker della pipeline")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Benchmark della cache delle diagnosi AI con un modello finto e lento.
+
+Sostituisce `run_diagnosis` con una versione che dorme --model-ms e genera
+N richieste da un insieme di scenari con distribuzione di Zipf: la stessa
+descrizione arriva con maiuscole, accenti, punteggiatura e spazi diversi e
+con la disponibilità (non diagnostica) variabile, come farebbero clienti
+diversi con lo stesso guasto. Confronta latenza e chiamate al modello con
+cache disattivata e attiva, poi verifica che l'invalidazione delle tabelle
+delle regole forzi di nuovo il modello.
+
+Non serve un database.
+
+Usage:
+    python execution/bench_diagnosis_cache.py [--requests 5000] [--scenarios 300] \
+        [--concurrency 50] [--model-ms 40] [--zipf 1.1]
+"""
+
+import argparse
+import asyncio
+import random
+
+import bench_common  # noqa: F401  (configura sys.path)
+from bench_common import print_summary, timed
+
+from app.config import settings
+from app.models.request import Category
+from app.services import ai_diagnostic
+from app.services.diagnosis_cache import DiagnosisCache
+from app.services import diagnosis_cache as cache_module
+
+DESCRIPTIONS = [
+    "Perdita d'acqua sotto il lavandino della cucina",
+    "La caldaia non si accende e fa un rumore strano",
+    "Salta la corrente quando accendo il forno",
+    "Porta blindata bloccata, la chiave non gira",
+    "La lavatrice non scarica l'acqua",
+    "Anta dell'armadio staccata dai cardini",
+]
+VARIANTS = [
+    lambda s: s,
+    lambda s: s.upper(),
+    lambda s: s.lower() + "!!",
+    lambda s: "  " + s.replace(" ", "   ") + ".",
+    lambda s: s.replace("a", "à", 1),
+]
+CATEGORIES = list(Category)
+AVAILABILITY = ["mattina", "pomeriggio", "sera", "subito"]
+
+
+def scenario(i: int) -> dict:
+    """Un guasto tipico: categoria, descrizione, risposte guidate, foto."""
+    rng = random.Random(i)
+    return {
+        "category": CATEGORIES[i % len(CATEGORIES)],
+        "description": f"{DESCRIPTIONS[i % len(DESCRIPTIONS)]} (caso {i})",
+        "guided_answers": {"how_long": rng.choice(["oggi", "giorni"]), "running_water": rng.random() < 0.3},
+        "media_hashes": [f"{i:064x}"] if rng.random() < 0.5 else [],
+    }
+
+
+def workload(args) -> list:
+    """N richieste con scenari estratti secondo Zipf e varianti di scrittura."""
+    weights = [1 / (rank + 1) ** args.zipf for rank in range(args.scenarios)]
+    picks = random.choices(range(args.scenarios), weights=weights, k=args.requests)
+    requests = []
+    for i in picks:
+        req = dict(scenario(i), scenario=i)
+        req["description"] = random.choice(VARIANTS)(req["description"])
+        req["guided_answers"] = dict(req["guided_answers"], availability=random.choice(AVAILABILITY))
+        requests.append(req)
+    return requests
+
+
+def media_urls(req: dict) -> list:
+    """URL delle foto della richiesta (uno per hash)."""
+    return [f"https://cdn.example.com/{h[-8:]}.jpg" for h in req["media_hashes"]]
+
+
+async def run(requests: list, args) -> list:
+    """Analizza le richieste con al più --concurrency in parallelo. Ritorna le latenze (ms)."""
+    samples = []
+    gate = asyncio.Semaphore(args.concurrency)
+    
+    async def one(n: int, req: dict):
+        async with gate:
+            with timed(samples):
+                await ai_diagnostic.analyze_request(
+                    f"bench-{n}", req["category"], req["description"], req["guided_answers"],
+                    media_urls(req), req["media_hashes"],
+                )
+    
+    await asyncio.gather(*(one(n, req) for n, req in enumerate(requests)))
+    return samples
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    model_calls = 0
+    real_model = ai_diagnostic.run_diagnosis
+    
+    async def slow_model(*a, **kw):
+        nonlocal model_calls
+        model_calls += 1
+        await asyncio.sleep(args.model_ms / 1000)
+        return await real_model(*a, **kw)
+    
+    ai_diagnostic.run_diagnosis = slow_model
+    requests = workload(args)
+    errors = 0
+    
+    settings.DIAGNOSIS_CACHE_ENABLED = False
+    samples = await run(requests, args)
+    print_summary("senza cache", samples)
+    print(f"  chiamate al modello: {model_calls}")
+    uncached_calls = model_calls
+    
+    settings.DIAGNOSIS_CACHE_ENABLED = True
+    cache_module.diagnosis_cache = ai_diagnostic.diagnosis_cache = DiagnosisCache()
+    ai_diagnostic.invalidate_diagnoses()
+    model_calls = 0
+    samples = await run(requests, args)
+    print_summary("con cache", samples)
+    stats = ai_diagnostic.diagnosis_cache.stats()
+    distinct = len({r["scenario"] for r in requests})
+    print(f"  chiamate al modello: {model_calls} ({model_calls / uncached_calls:.1%}), scenari distinti: {distinct}")
+    print(f"  {stats}")
+    # Ogni scenario distinto deve arrivare al modello una sola volta
+    if model_calls != distinct:
+        errors += 1
+        print(f"ERRORE: {model_calls} chiamate al modello per {distinct} scenari")
+    
+    # Il risultato in cache deve essere uguale a quello calcolato
+    req = requests[0]
+    cached = await ai_diagnostic.analyze_request("check", req["category"], req["description"],
+                                                 req["guided_answers"], media_urls(req), req["media_hashes"])
+    fresh = await real_model("check", req["category"], req["description"], req["guided_answers"], media_urls(req))
+    if cached != fresh:
+        errors += 1
+        print("ERRORE: diagnosi in cache diversa da quella del modello")
+    
+    # Cambio delle tabelle delle regole: la cache non deve più rispondere
+    before = model_calls
+    old_prices = ai_diagnostic.CATEGORY_PRICES[req["category"]]
+    ai_diagnostic.CATEGORY_PRICES[req["category"]] = (old_prices[0] + 100, old_prices[1] + 100)
+    ai_diagnostic.invalidate_diagnoses()
+    result = await ai_diagnostic.analyze_request("check", req["category"], req["description"],
+                                                 req["guided_answers"], media_urls(req), req["media_hashes"])
+    ai_diagnostic.CATEGORY_PRICES[req["category"]] = old_prices
+    stale = model_calls == before or result.price_range.min_price == fresh.price_range.min_price
+    print(f"dopo invalidazione: {'modello richiamato' if not stale else 'risposta vecchia dalla cache'}")
+    errors += stale
+    
+    ai_diagnostic.run_diagnosis = real_model
+    print("OK" if errors == 0 else "ERRORE")
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--scenarios", type=int, default=300, help="Guasti distinti")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--model-ms", type=float, default=40, help="Latenza del modello finto")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Esponente della distribuzione degli scenari")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark della selezione candidati geospaziale di `dispatch`.
+
+Popola un database PostGIS di prova con N tecnici distribuiti attorno alle
+principali città italiane, poi misura la latenza di
+`find_nearest_technicians` (ST_DWithin + KNN con espansione ad anelli).
+
+ATTENZIONE: crea e svuota tabelle nel database indicato. Usare un DB usa-e-getta.
+
+Usage:
+    python execution/bench_dispatch_geo.py --database-url postgresql+asyncpg://... \
+        [--technicians 50000] [--queries 1000]
+"""
+
+import argparse
+import asyncio
+import random
+import uuid
+
+import bench_common  # noqa: F401  (configura sys.path)
+from bench_common import print_summary, timed
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.config import settings
+from app.database import Base
+from app.models import User, Technician, Request
+from app.models.request import Category, RequestStatus
+from app.services.dispatch import find_nearest_technicians
+
+# (lat, lon) dei principali centri: i tecnici sono concentrati attorno alle città
+CITIES = [
+    (45.4642, 9.1900),   # Milano
+    (41.9028, 12.4964),  # Roma
+    (40.8518, 14.2681),  # Napoli
+    (45.0703, 7.6869),   # Torino
+    (38.1157, 13.3615),  # Palermo
+    (44.4949, 11.3426),  # Bologna
+    (43.7696, 11.2558),  # Firenze
+    (41.1171, 16.8719),  # Bari
+    (45.4408, 12.3155),  # Venezia
+    (39.2238, 9.1217),   # Cagliari
+]
+
+CHUNK = 5000
+
+
+def random_point(spread_deg: float = 0.4):
+    """Punto casuale attorno a una città (lat, lon)."""
+    lat, lon = random.choice(CITIES)
+    return lat + random.gauss(0, spread_deg), lon + random.gauss(0, spread_deg)
+
+
+async def seed(session: AsyncSession, n_technicians: int, n_requests: int) -> list:
+    """Crea utenti, tecnici e richieste di prova. Ritorna le richieste."""
+    for start in range(0, n_technicians, CHUNK):
+        size = min(CHUNK, n_technicians - start)
+        user_rows = [
+            {"id": uuid.uuid4(), "name": f"Tecnico {start + i}", "role": "technician"}
+            for i in range(size)
+        ]
+        await session.execute(insert(User), user_rows)
+        
+        tech_rows = []
+        for i, user in enumerate(user_rows):
+            lat, lon = random_point()
+            tech_rows.append({
+                "user_id": user["id"],
+                "internal_code": f"TECH-{start + i:07d}",
+                "specializations": random.sample(list(Category), k=random.randint(1, 3)),
+                "rating": round(random.uniform(3.0, 5.0), 2),
+                "completed_jobs": random.randint(0, 500),
+                "location": f"POINT({lon} {lat})",
+                "is_verified": random.random() < 0.8,
+                "is_available_now": random.random() < 0.6,
+            })
+        await session.execute(insert(Technician), tech_rows)
+        await session.commit()
+    
+    client_id = uuid.uuid4()
+    await session.execute(insert(User), [{"id": client_id, "name": "Cliente bench"}])
+    
+    requests = []
+    for i in range(n_requests):
+        lat, lon = random_point(spread_deg=0.6)
+        requests.append(Request(
+            reference_code=f"BENCH-{i:07d}",
+            client_id=client_id,
+            category=random.choice(list(Category)),
+            title="Richiesta di benchmark",
+            description="Richiesta generata per il benchmark di dispatch",
+            address="Via di prova 1, Città",
+            location=f"POINT({lon} {lat})",
+            status=RequestStatus.DISPATCHING,
+        ))
+    session.add_all(requests)
+    await session.commit()
+    await session.execute(text("ANALYZE technicians"))
+    return requests
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    engine = create_async_engine(args.database_url)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as session:
+        print(f"Seeding {args.technicians} tecnici...")
+        requests = await seed(session, args.technicians, min(args.queries, 500))
+    
+    samples = []
+    limit = settings.MAX_TECHNICIANS_TO_NOTIFY
+    async with session_factory() as session:
+        for i in range(args.queries):
+            request = requests[i % len(requests)]
+            with timed(samples):
+                await find_nearest_technicians(session, request, request.category, limit)
+            session.expunge_all()
+    
+    print_summary(f"candidate selection ({args.technicians} tech)", samples)
+    await engine.dispose()
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--technicians", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
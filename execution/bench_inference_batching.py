@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Benchmark della coda di inferenza a batch per la diagnosi AI.
+
+Avvia un finto server del modello in locale (HTTP, su un thread separato)
+che risponde a `POST /v1/diagnose/batch` con `FakeInferenceBackend`: ogni
+chiamata costa un overhead fisso più un costo per elemento e il server
+esegue al più --capacity chiamate alla volta, come una GPU. Invia poi
+--requests diagnosi con arrivi di Poisson a --rate richieste/s, passando da
+`analyze_request` (cache disattivata), per ogni finestra di batch indicata
+e senza batching (batch da 1). Per ogni configurazione stampa throughput,
+latenze, dimensione media dei batch e quante richieste sono ricadute sulla
+stima a regole per scadenza del deadline.
+
+Infine spegne il server e verifica che con il modello irraggiungibile o
+bloccato ogni richiesta riceva comunque una diagnosi entro il deadline.
+
+Non serve un database.
+
+Usage:
+    python execution/bench_inference_batching.py [--requests 1000] [--rate 200] \
+        [--windows 0,5,10,25,50] [--max-batch 16] [--deadline 2.0]
+"""
+
+import argparse
+import asyncio
+import random
+import socket
+import threading
+import time
+import uuid
+
+import bench_common  # noqa: F401  (configura sys.path)
+from bench_common import print_summary, summarize, timed
+
+import uvicorn
+from fastapi import FastAPI
+
+from app.config import settings
+from app.models.request import Category
+from app.services import ai_diagnostic
+from app.services.inference_batcher import (
+    DiagnosisInput,
+    FakeInferenceBackend,
+    HTTPInferenceBackend,
+    InferenceBatcher,
+)
+
+
+def fake_model_app(backend: FakeInferenceBackend) -> FastAPI:
+    """Finto server del modello con il protocollo di HTTPInferenceBackend."""
+    app = FastAPI()
+    
+    @app.post("/v1/diagnose/batch")
+    async def diagnose_batch(body: dict):
+        items = [
+            DiagnosisInput(uuid.UUID(i["request_id"]), Category(i["category"]), i["description"],
+                           i["guided_answers"], i["media_urls"])
+            for i in body["items"]
+        ]
+        results = await backend.infer_batch(items)
+        return {"results": [r.model_dump(mode="json") if r is not None else None for r in results]}
+    
+    return app
+
+
+class FakeModelServer:
+    """Server uvicorn su un thread con il proprio event loop."""
+    
+    def __init__(self, backend: FakeInferenceBackend):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}/v1/diagnose/batch"
+        self._server = uvicorn.Server(uvicorn.Config(
+            fake_model_app(backend), host="127.0.0.1", port=self.port, log_level="critical",
+            timeout_graceful_shutdown=1,  # Il modello bloccato non risponde mai
+        ))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+    
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+    
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+async def run_load(batcher: InferenceBatcher, args) -> dict:
+    """Diagnosi con arrivi di Poisson; ritorna latenze, throughput e ricadute."""
+    ai_diagnostic.inference_batcher = batcher
+    batcher.start()
+    samples = []
+    fallbacks = 0
+    
+    async def one(n: int):
+        nonlocal fallbacks
+        answers = {"how_long": random.choice(["oggi", "giorni"]), "running_water": random.random() < 0.3}
+        with timed(samples):
+            result = await ai_diagnostic.analyze_request(
+                uuid.uuid4(), random.choice(list(Category)), f"Guasto numero {n}", answers, [],
+            )
+        fallbacks += result.confidence != 90  # Il finto modello risponde con confidenza 90
+    
+    started = time.perf_counter()
+    tasks = []
+    for n in range(args.requests):
+        tasks.append(asyncio.create_task(one(n)))
+        await asyncio.sleep(random.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    stats = batcher.stats()
+    await batcher.stop()
+    return {"samples": samples, "throughput": len(samples) / elapsed, "fallbacks": fallbacks, "stats": stats}
+
+
+def make_batcher(url: str, window_ms: float, max_batch: int, args) -> InferenceBatcher:
+    """Coda con backend HTTP verso il finto server."""
+    return InferenceBatcher(
+        backend=HTTPInferenceBackend(url, max_batch, args.deadline),
+        window_ms=window_ms,
+        max_batch_size=max_batch,
+        concurrency=args.concurrency,
+        deadline=args.deadline,
+    )
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    settings.DIAGNOSIS_CACHE_ENABLED = False
+    errors = 0
+    backend = FakeInferenceBackend(overhead_ms=args.overhead_ms, per_item_ms=args.per_item_ms,
+                                   capacity=args.capacity)
+    configs = [("senza batching", 0.0, 1)] + [
+        (f"finestra {w:g} ms", w, args.max_batch) for w in args.windows
+    ]
+    print(f"{args.requests} richieste a {args.rate:g}/s, modello {args.overhead_ms:g} ms + "
+          f"{args.per_item_ms:g} ms/elemento, capacità {args.capacity}, deadline {args.deadline:g} s")
+    
+    with FakeModelServer(backend) as server:
+        for label, window, size in configs:
+            result = await run_load(make_batcher(server.url, window, size, args), args)
+            print_summary(label, result["samples"])
+            print(f"  throughput={result['throughput']:.1f} req/s "
+                  f"batch medio={result['stats']['avg_batch_size']:.1f} "
+                  f"ricadute su regole={result['fallbacks']} (scadute {result['stats']['timed_out']})")
+    
+    # Modello irraggiungibile: server spento
+    args.requests = min(args.requests, 200)
+    result = await run_load(make_batcher(server.url, 10.0, args.max_batch, args), args)
+    worst = summarize(result["samples"])["max_ms"]
+    print_summary("modello spento", result["samples"])
+    print(f"  ricadute su regole={result['fallbacks']} / {len(result['samples'])}")
+    errors += result["fallbacks"] != len(result["samples"]) or worst > args.deadline * 1000 + 250
+    
+    # Modello bloccato: ogni chiamata resta appesa, conta solo il deadline
+    backend = FakeInferenceBackend(hang_rate=1.0, capacity=args.capacity)
+    with FakeModelServer(backend) as server:
+        result = await run_load(make_batcher(server.url, 10.0, args.max_batch, args), args)
+    worst = summarize(result["samples"])["max_ms"]
+    print_summary("modello bloccato", result["samples"])
+    print(f"  ricadute su regole={result['fallbacks']} / {len(result['samples'])}, "
+          f"peggiore {worst:.0f} ms con deadline {args.deadline * 1000:.0f} ms")
+    errors += result["fallbacks"] != len(result["samples"]) or worst > args.deadline * 1000 + 250
+    
+    print("OK" if errors == 0 else "ERRORE: ricaduta sulle regole oltre il deadline")
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=200, help="Richieste al secondo")
+    parser.add_argument("--windows", type=lambda s: [float(w) for w in s.split(",")], default=[0, 5, 10, 25, 50],
+                        help="Finestre di batch da confrontare (ms)")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=4, help="Batch in volo verso il modello")
+    parser.add_argument("--deadline", type=float, default=2.0, help="Deadline per richiesta (s)")
+    parser.add_argument("--overhead-ms", type=float, default=40.0, help="Costo fisso di una chiamata al modello")
+    parser.add_argument("--per-item-ms", type=float, default=2.0, help="Costo per elemento del batch")
+    parser.add_argument("--capacity", type=int, default=2, help="Chiamate eseguite insieme dal modello")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
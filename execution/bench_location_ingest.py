@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Load test dell'ingestione posizioni GPS dei tecnici: scrittura diretta vs buffer.
+
+Simula N tecnici che inviano ping in continuazione per D secondi, con C
+client concorrenti, in due modalità:
+  - diretta: UPDATE + COMMIT per ogni ping (il vecchio PATCH /me/location)
+  - buffer:  `LocationBuffer.record` per ogni ping e flush in blocco ogni
+             --flush-seconds (UPDATE ... FROM (VALUES ...))
+Conta le istruzioni SQL e i commit effettivamente inviati al database e
+stampa ping/s, scritture/s e righe aggiornate/s di ciascuna modalità.
+
+ATTENZIONE: crea e svuota tabelle nel database indicato. Usare un DB usa-e-getta.
+
+Usage:
+    python execution/bench_location_ingest.py --database-url postgresql+asyncpg://... \
+        [--technicians 5000] [--duration 20] [--concurrency 50] [--flush-seconds 5]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+from sqlalchemy import event, insert, update, func, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.database import Base
+from app.models import User, Technician
+from app.models.request import Category
+from app.services.location_buffer import LocationBuffer
+
+MILANO = (45.4642, 9.1900)
+
+
+class Counter:
+    """Istruzioni e commit inviati dal motore."""
+    
+    def __init__(self, engine):
+        self.statements = 0
+        self.commits = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._statement)
+        event.listen(engine.sync_engine, "commit", self._commit)
+    
+    def _statement(self, *args):
+        self.statements += 1
+    
+    def _commit(self, *args):
+        self.commits += 1
+    
+    def reset(self):
+        self.statements = self.commits = 0
+
+
+def random_ping() -> tuple:
+    return MILANO[0] + random.uniform(-0.3, 0.3), MILANO[1] + random.uniform(-0.3, 0.3)
+
+
+async def seed(session_factory, n: int) -> list:
+    """Crea N tecnici. Ritorna gli id."""
+    users = [{"id": uuid.uuid4(), "name": f"Tecnico {i}", "role": "technician"} for i in range(n)]
+    techs = [
+        {"id": uuid.uuid4(), "user_id": u["id"], "internal_code": f"TECH-{i:07d}", "specializations": [Category.PLUMBING]}
+        for i, u in enumerate(users)
+    ]
+    async with session_factory() as session:
+        for start in range(0, n, 5000):
+            await session.execute(insert(User), users[start:start + 5000])
+            await session.execute(insert(Technician), techs[start:start + 5000])
+        await session.commit()
+    return [t["id"] for t in techs]
+
+
+async def run_direct(session_factory, tech_ids, duration: float, concurrency: int) -> int:
+    """Un UPDATE con commit per ping."""
+    deadline = time.perf_counter() + duration
+    pings = 0
+    
+    async def client():
+        nonlocal pings
+        async with session_factory() as session:
+            while time.perf_counter() < deadline:
+                lat, lon = random_ping()
+                await session.execute(
+                    update(Technician)
+                    .where(Technician.id == random.choice(tech_ids))
+                    .values(
+                        location=func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326),
+                        location_updated_at=datetime.now(timezone.utc),
+                    )
+                )
+                await session.commit()
+                pings += 1
+    
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return pings
+
+
+async def run_buffered(session_factory, tech_ids, duration: float, concurrency: int, flush_seconds: float):
+    """Ping nel buffer, flush periodico in blocco."""
+    buffer = LocationBuffer()
+    deadline = time.perf_counter() + duration
+    
+    async def client():
+        while time.perf_counter() < deadline:
+            for _ in range(100):
+                lat, lon = random_ping()
+                buffer.record(random.choice(tech_ids), lat, lon)
+            await asyncio.sleep(0)  # Come tra una richiesta HTTP e l'altra
+    
+    async def flusher():
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(min(flush_seconds, max(0.0, deadline - time.perf_counter())))
+            async with session_factory() as session:
+                await buffer.flush(session)
+    
+    await asyncio.gather(flusher(), *(client() for _ in range(concurrency)))
+    async with session_factory() as session:
+        await buffer.flush(session)
+    return buffer
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    engine = create_async_engine(args.database_url, pool_size=args.concurrency, max_overflow=0)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    tech_ids = await seed(session_factory, args.technicians)
+    counter = Counter(engine)
+    
+    counter.reset()
+    start = time.perf_counter()
+    pings = await run_direct(session_factory, tech_ids, args.duration, args.concurrency)
+    elapsed = time.perf_counter() - start
+    print(f"diretta: {pings / elapsed:,.0f} ping/s, {counter.statements / elapsed:,.0f} istruzioni/s, "
+          f"{counter.commits / elapsed:,.0f} commit/s, {pings / elapsed:,.0f} righe/s")
+    direct_commits = counter.commits / elapsed
+    
+    counter.reset()
+    start = time.perf_counter()
+    buffer = await run_buffered(session_factory, tech_ids, args.duration, args.concurrency, args.flush_seconds)
+    elapsed = time.perf_counter() - start
+    print(f"buffer:  {buffer.pings / elapsed:,.0f} ping/s, {counter.statements / elapsed:,.1f} istruzioni/s, "
+          f"{counter.commits / elapsed:,.1f} commit/s, {buffer.rows_written / elapsed:,.0f} righe/s "
+          f"({buffer.flushes} flush, {buffer.pings / max(1, buffer.rows_written):.1f} ping per riga)")
+    print(f"commit/s ridotti di {direct_commits / max(counter.commits / elapsed, 1e-9):,.0f}x")
+    await engine.dispose()
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--technicians", type=int, default=5000)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--flush-seconds", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
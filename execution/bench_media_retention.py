@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Benchmark della pulizia dei media scaduti con più worker in parallelo.
+
+Crea N media già scaduti (default 1M) distribuiti su poche richieste,
+parte dei quali con il caricamento corrispondente (originale, miniatura e
+variante nello store, più la copia per il modello `ai/`, condivisa dai
+caricamenti con lo stesso hash del contenuto), più media ancora validi,
+media già eliminati e caricamenti orfani scaduti. Poi lancia W
+`MediaRetentionSweeper` in parallelo, ognuno con la propria sessione,
+contro uno store finto che conta le chiamate di eliminazione e simula la
+latenza di DeleteObjects.
+
+Verifica che:
+  - il piano della SELECT usi l'indice parziale `ix_request_media_expires_due`
+  - non resti nessun media scaduto (salvo quelli con oggetti non eliminabili)
+  - i media validi non vengano toccati
+  - ogni media scaduto abbia una sola riga di audit (SKIP LOCKED: nessun
+    blocco elaborato da due worker)
+  - le chiamate allo store siano da DELETE_BATCH chiavi (tranne le code)
+  - una copia `ai/` venga eliminata solo quando nessun caricamento rimasto
+    ha il suo hash, e lo sia sempre in quel caso
+
+ATTENZIONE: crea e svuota tabelle nel database indicato. Usare un DB usa-e-getta.
+
+Usage:
+    python execution/bench_media_retention.py --database-url postgresql+asyncpg://... \
+        [--rows 1000000] [--live 100000] [--workers 4] [--chunk-size 1000] \
+        [--delete-latency-ms 40] [--fail-every 0] [--distinct-images 200000]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+from sqlalchemy import insert, select, func, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.config import settings
+from app.database import Base
+from app.models import User, Request
+from app.models.request import Media, Category, RequestStatus
+from app.models.upload import Upload
+from app.models.audit_log import AuditLog, AuditAction
+from app.services.image_preprocessing import model_key
+from app.services.media_retention import MediaRetentionSweeper
+from app.services.media_storage import DELETE_BATCH, MediaStorage
+
+BASE_URL = "https://media.bench/"
+
+
+class CountingStorage(MediaStorage):
+    """Store finto: conta le chiamate e simula latenza ed errori per chiave."""
+    
+    def __init__(self, latency_ms: float, fail_every: int):
+        self.latency = latency_ms / 1000
+        self.fail_every = fail_every
+        self.calls: List[int] = []
+        self.deleted = 0
+        self.model_copies = set()  # Chiavi ai/ eliminate
+        self._lock = threading.Lock()
+    
+    def delete_many(self, keys: List[str]) -> List[str]:
+        time.sleep(self.latency)
+        failed = [k for k in keys if self.fail_every and zlib.crc32(k.encode()) % self.fail_every == 0]
+        with self._lock:
+            self.calls.append(len(keys))
+            self.deleted += len(keys) - len(failed)
+            self.model_copies.update(k for k in keys if k.startswith("ai/") and k not in failed)
+        return failed
+    
+    def public_url(self, key: str) -> str:
+        return BASE_URL + key
+
+
+def model_copy(content_hash: str) -> str:
+    return model_key(content_hash, settings.AI_IMAGE_MAX_SIDE, settings.AI_IMAGE_FORMAT, settings.AI_IMAGE_QUALITY)
+
+
+async def seed(engine, session_factory, args):
+    """Schema pulito e dati di prova (INSERT ... SELECT generate_series)."""
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    
+    client_id = uuid.uuid4()
+    async with session_factory() as session:
+        await session.execute(insert(User), [{"id": client_id, "name": "Cliente benchmark"}])
+        await session.execute(insert(Request), [
+            {
+                "id": uuid.uuid4(),
+                "reference_code": f"RET-{i:06d}",
+                "client_id": client_id,
+                "category": Category.PLUMBING,
+                "title": "Richiesta con foto",
+                "description": "Perdita sotto il lavandino",
+                "address": "Via di prova 1, Milano, Italia",
+                "status": RequestStatus.COMPLETED,
+            }
+            for i in range(args.requests)
+        ])
+        await session.commit()
+    
+    total = args.rows + args.live + args.already_deleted
+    start = time.perf_counter()
+    async with engine.begin() as conn:
+        # g <= rows: scaduti; poi validi; poi già eliminati
+        await conn.execute(text(f"""
+            WITH r AS (SELECT array_agg(id) AS ids FROM requests)
+            INSERT INTO request_media (id, request_id, type, url, thumbnail_url, expires_at, is_deleted)
+            SELECT gen_random_uuid(), r.ids[1 + g % array_length(r.ids, 1)], 'PHOTO',
+                   '{BASE_URL}bench/m' || g || '.jpg',
+                   '{BASE_URL}bench/m' || g || '_thumb.jpg',
+                   CASE WHEN g <= {args.rows} OR g > {args.rows + args.live}
+                        THEN now() - interval '1 day' - g * interval '1 second'
+                        ELSE now() + interval '1 day' END,
+                   g > {args.rows + args.live}
+            FROM r, generate_series(1, {total}) AS g
+        """))
+        # Caricamenti per una parte dei media (gli altri sono URL esterni)
+        await conn.execute(text(f"""
+            INSERT INTO uploads (id, user_id, type, content_type, object_key, url, declared_size_bytes,
+                                 state, file_size_bytes, thumbnail_url, variant_url, content_hash, expires_at)
+            SELECT gen_random_uuid(), '{client_id}', 'PHOTO', 'image/jpeg',
+                   'bench/m' || g || '.jpg', '{BASE_URL}bench/m' || g || '.jpg', 500000,
+                   'PROCESSED', 500000,
+                   '{BASE_URL}bench/m' || g || '_thumb.jpg', '{BASE_URL}bench/m' || g || '_variant.jpg',
+                   md5((g % {args.distinct_images})::text), now() - interval '2 days'
+            FROM generate_series(1, {args.rows + args.live}) AS g
+            WHERE g % 100 < {args.upload_percent}
+        """))
+        # Caricamenti mai allegati a una richiesta
+        await conn.execute(text(f"""
+            INSERT INTO uploads (id, user_id, type, content_type, object_key, url, declared_size_bytes,
+                                 state, expires_at)
+            SELECT gen_random_uuid(), '{client_id}', 'PHOTO', 'image/jpeg',
+                   'bench/o' || g || '.jpg', '{BASE_URL}bench/o' || g || '.jpg', 500000,
+                   'PENDING', now() - interval '1 day'
+            FROM generate_series(1, {args.orphans}) AS g
+        """))
+        await conn.execute(text("ANALYZE request_media"))
+        await conn.execute(text("ANALYZE uploads"))
+    print(f"Dati creati in {time.perf_counter() - start:.1f}s: {args.rows} media scaduti, {args.live} validi, "
+          f"{args.already_deleted} già eliminati, {args.orphans} caricamenti orfani")
+
+
+async def explain_due_select(engine, now: datetime, chunk_size: int) -> bool:
+    """Stampa il piano della SELECT dei media scaduti. Ritorna True se usa l'indice parziale."""
+    query = (
+        select(Media.id)
+        .where(~Media.is_deleted, Media.expires_at <= now)
+        .order_by(Media.expires_at)
+        .limit(chunk_size)
+        .with_for_update(of=Media, skip_locked=True)
+    )
+    sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    async with engine.connect() as conn:
+        plan = [row[0] for row in await conn.execute(text("EXPLAIN " + sql))]
+    print("Piano della SELECT dei media scaduti:")
+    for line in plan:
+        print("   ", line)
+    return any("ix_request_media_expires_due" in line for line in plan)
+
+
+async def count(session_factory, query) -> int:
+    async with session_factory() as session:
+        return (await session.execute(query)).scalar_one()
+
+
+async def main_async(args) -> bool:
+    """Funzione principale asincrona. Ritorna True se tutte le verifiche passano."""
+    engine = create_async_engine(args.database_url, pool_size=args.workers + 2)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    ok = True
+    try:
+        await seed(engine, session_factory, args)
+        now = datetime.now(timezone.utc)
+        if not await explain_due_select(engine, now, args.chunk_size):
+            print("ERRORE: la SELECT non usa ix_request_media_expires_due")
+            ok = False
+        
+        storage = CountingStorage(args.delete_latency_ms, args.fail_every)
+        sweepers = [MediaRetentionSweeper(session_factory, storage) for _ in range(args.workers)]
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            sweeper.sweep(chunk_size=args.chunk_size, max_chunks=10**9, now=now) for sweeper in sweepers
+        ))
+        seconds = time.perf_counter() - start
+        
+        media_expired = sum(r["media"] for r in results)
+        uploads_expired = sum(r["uploads"] for r in results)
+        chunks = sum(r["chunks"] for r in results)
+        print(f"{args.workers} worker: {media_expired} media e {uploads_expired} caricamenti scaduti "
+              f"in {seconds:.1f}s ({media_expired / seconds:,.0f} media/s), {chunks} blocchi")
+        for i, r in enumerate(results):
+            print(f"  worker {i}: {r['media']} media, {r['uploads']} caricamenti, {r['chunks']} blocchi")
+        full = sum(1 for n in storage.calls if n == DELETE_BATCH)
+        print(f"Store: {len(storage.calls)} chiamate DeleteObjects ({full} da {DELETE_BATCH} chiavi, "
+              f"media {sum(storage.calls) / max(1, len(storage.calls)):.0f}), {storage.deleted} oggetti eliminati")
+        
+        # I media con oggetti non eliminati restano rivendicati fino a claimed_until
+        claimed = now + timedelta(seconds=settings.MEDIA_RETENTION_CLAIM_SECONDS + seconds + 60)
+        due = await count(session_factory, select(func.count()).select_from(Media).where(
+            ~Media.is_deleted, Media.expires_at <= claimed))
+        live_touched = await count(session_factory, select(func.count()).select_from(Media).where(
+            Media.expires_at > claimed, Media.is_deleted))
+        audits = await count(session_factory, select(func.count()).select_from(AuditLog).where(
+            AuditLog.action == AuditAction.MEDIA_AUTO_EXPIRED))
+        distinct_audits = await count(session_factory, select(func.count(func.distinct(AuditLog.entity_id))).where(
+            AuditLog.action == AuditAction.MEDIA_AUTO_EXPIRED))
+        uploads_left = await count(session_factory, select(func.count()).select_from(Upload))
+        print(f"Media ancora scaduti: {due}; media validi toccati: {live_touched}; "
+              f"righe di audit: {audits} ({distinct_audits} distinte); caricamenti rimasti: {uploads_left}")
+        
+        if args.fail_every == 0 and due != 0:
+            print("ERRORE: restano media scaduti")
+            ok = False
+        if args.fail_every and due == 0:
+            print("ERRORE: i media con oggetti non eliminati dovevano restare in attesa")
+            ok = False
+        if live_touched or audits != distinct_audits or audits != media_expired + uploads_expired:
+            print("ERRORE: media validi toccati o audit duplicati")
+            ok = False
+        async with session_factory() as session:
+            remaining = set((await session.execute(
+                select(Upload.content_hash).where(Upload.content_hash.isnot(None)).distinct()
+            )).scalars().all())
+        seeded = {
+            hashlib.md5(str(g % args.distinct_images).encode()).hexdigest()
+            for g in range(1, args.rows + args.live + 1)
+            if g % 100 < args.upload_percent
+        }  # Come md5((g % distinct_images)::text) in seed()
+        shared_deleted = {model_copy(h) for h in remaining} & storage.model_copies
+        print(f"Copie ai/: {len(storage.model_copies)} eliminate, {len(remaining)} ancora condivise; "
+              f"eliminate ma ancora in uso: {len(shared_deleted)}")
+        if shared_deleted:
+            print("ERRORE: eliminate copie ai/ ancora usate da altri caricamenti")
+            ok = False
+        if args.fail_every == 0 and storage.model_copies != {model_copy(h) for h in seeded - remaining}:
+            print("ERRORE: copie ai/ non più usate rimaste nello store")
+            ok = False
+        if args.fail_every == 0 and media_expired != args.rows:
+            print(f"ERRORE: attesi {args.rows} media scaduti")
+            ok = False
+    finally:
+        await engine.dispose()
+    return ok
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Media già scaduti")
+    parser.add_argument("--live", type=int, default=100_000, help="Media ancora validi")
+    parser.add_argument("--already-deleted", type=int, default=50_000)
+    parser.add_argument("--orphans", type=int, default=10_000, help="Caricamenti scaduti mai allegati")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--upload-percent", type=int, default=80, help="Media con caricamento nello store")
+    parser.add_argument("--distinct-images", type=int, default=200_000, help="Hash diversi tra i caricamenti")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--delete-latency-ms", type=float, default=40.0, help="Latenza di una DeleteObjects")
+    parser.add_argument("--fail-every", type=int, default=0, help="Una chiave ogni N non si elimina (0 = mai)")
+    args = parser.parse_args()
+    ok = asyncio.run(main_async(args))
+    print("OK" if ok else "ERRORE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Verifica e benchmark del caricamento diretto dei media e della generazione delle miniature.
+
+Usa il backend su filesystem (in una cartella temporanea) e percorre il
+flusso reale, senza database:
+  - URL prefirmato e PUT sulla route `/api/v1/media/local/...` (firma
+    valida, firma alterata, Content-Type diverso da quello firmato)
+  - controlli di conferma (`upload_problem`: dimensione, tipo, magic bytes)
+  - elaborazione nel pool di processi di `MediaProcessor`: miniatura e
+    variante ridotta, orientamento EXIF applicato, EXIF (GPS) rimosso,
+    JPEG corrotto -> REJECTED e oggetto eliminato
+Misura poi il ritardo massimo dell'event loop mentre si elaborano N foto
+nel pool e, per confronto, direttamente nel loop.
+
+Usage:
+    python execution/bench_media_uploads.py [--photos 24] [--workers 2] [--size 4000x3000]
+"""
+
+import argparse
+import asyncio
+import io
+import tempfile
+import time
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+import httpx
+from fastapi import FastAPI
+from PIL import Image
+
+from app.config import settings
+from app.api.v1 import media
+from app.models.request import MediaType
+from app.models.upload import Upload, UploadState
+from app.services import media_storage
+from app.services.media_processing import (
+    SIGNATURE_BYTES,
+    MediaProcessor,
+    derived_key,
+    process_photo,
+    upload_problem,
+)
+from app.services.media_storage import get_storage
+
+
+def photo_bytes(width: int, height: int, orientation: int = 6) -> bytes:
+    """JPEG con orientamento EXIF e posizione GPS, come da uno smartphone."""
+    image = Image.new("RGB", (width, height))
+    pixels = image.load()
+    for x in range(0, width, 8):
+        for y in range(0, height, 8):
+            pixels[x, y] = (x % 256, y % 256, 128)
+    exif = image.getexif()
+    exif[0x0112] = orientation
+    exif[0x010F] = "TestPhone"
+    exif.get_ifd(0x8825).update({1: "N", 2: (45.0, 27.0, 50.0), 3: "E", 4: (9.0, 11.0, 22.0)})
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90, exif=exif)
+    return out.getvalue()
+
+
+class MemoryProcessor(MediaProcessor):
+    """MediaProcessor che registra gli esiti in memoria invece che nel database."""
+    
+    def __init__(self, workers: int):
+        super().__init__(workers)
+        self.results = {}
+        self.done = asyncio.Event()
+        self.expected = 0
+    
+    async def _finish(self, upload_id, url, values):
+        self.results[upload_id] = values
+        if len(self.results) >= self.expected:
+            self.done.set()
+
+
+async def loop_lag(stop: asyncio.Event, samples: list, interval: float = 0.005):
+    """Registra di quanto ogni sleep(interval) si risveglia in ritardo (ms)."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def check_upload_flow(client: httpx.AsyncClient, data: bytes) -> int:
+    """PUT prefirmato e controlli di conferma. Ritorna il numero di errori."""
+    errors = 0
+    storage = get_storage()
+    key = "uploads/bench/flow.jpg"
+    url, headers = storage.presign_put(key, "image/jpeg", 60)
+    
+    tampered = url.replace("signature=", "signature=0")
+    response = await client.put(tampered, content=data, headers=headers)
+    print(f"PUT con firma alterata:        {response.status_code} (atteso 403)")
+    errors += response.status_code != 403
+    response = await client.put(url, content=data, headers={"Content-Type": "image/png"})
+    print(f"PUT con Content-Type diverso:  {response.status_code} (atteso 403)")
+    errors += response.status_code != 403
+    response = await client.put(url, content=data, headers=headers)
+    print(f"PUT prefirmato:                {response.status_code} (atteso 200)")
+    errors += response.status_code != 200
+    
+    info = storage.head(key)
+    head = storage.read(key, SIGNATURE_BYTES)
+    cases = [
+        ("dichiarato correttamente", Upload(type=MediaType.PHOTO, content_type="image/jpeg", declared_size_bytes=len(data)), False),
+        ("dimensione diversa", Upload(type=MediaType.PHOTO, content_type="image/jpeg", declared_size_bytes=len(data) + 1), True),
+        ("dichiarato PNG", Upload(type=MediaType.PHOTO, content_type="image/png", declared_size_bytes=len(data)), True),
+    ]
+    for label, upload, rejected in cases:
+        problem = upload_problem(upload, info.size, info.content_type, head)
+        print(f"conferma, {label:<25} -> {problem or 'accettato'}")
+        errors += bool(problem) != rejected
+    fake = b"<html>non sono una foto</html>"
+    storage.write("uploads/bench/fake.png", fake, "image/png")
+    fake_upload = Upload(type=MediaType.PHOTO, content_type="image/png", declared_size_bytes=len(fake))
+    problem = upload_problem(fake_upload, len(fake), "image/png", fake[:SIGNATURE_BYTES])
+    print(f"conferma, {'HTML dichiarato PNG':<25} -> {problem or 'accettato'}")
+    errors += problem is None
+    return errors
+
+
+async def check_processing(processor: MemoryProcessor, data: bytes, width: int, height: int) -> int:
+    """Varianti nel pool: orientamento, dimensioni, EXIF, JPEG corrotto. Ritorna gli errori."""
+    errors = 0
+    storage = get_storage()
+    storage.write("uploads/bench/ok.jpg", data, "image/jpeg")
+    storage.write("uploads/bench/broken.jpg", data[:2000], "image/jpeg")
+    processor.expected = 2
+    processor.submit("ok", "uploads/bench/ok.jpg", MediaType.PHOTO, "ok")
+    processor.submit("broken", "uploads/bench/broken.jpg", MediaType.PHOTO, "broken")
+    await asyncio.wait_for(processor.done.wait(), 60)
+    
+    ok = processor.results["ok"]
+    variant = Image.open(io.BytesIO(storage.read(derived_key("uploads/bench/ok.jpg", "variant"))))
+    thumbnail = Image.open(io.BytesIO(storage.read(derived_key("uploads/bench/ok.jpg", "thumb"))))
+    side = settings.MEDIA_VARIANT_MAX_SIDE
+    expected = (round(height * side / width), side) if width >= height else (side, round(width * side / height))
+    print(f"esito foto valida:   {ok['state'].value}, {ok['file_size_bytes']} byte, "
+          f"variante {variant.size} (attesa {expected}, ruotata), miniatura {thumbnail.size}")
+    errors += ok["state"] != UploadState.PROCESSED or abs(variant.size[0] - expected[0]) > 1
+    errors += max(thumbnail.size) != settings.MEDIA_THUMBNAIL_SIZE
+    leftover = len(variant.getexif()) + len(thumbnail.getexif())
+    print(f"tag EXIF rimasti nelle varianti: {leftover}")
+    errors += leftover != 0
+    
+    broken = processor.results["broken"]
+    removed = storage.head("uploads/bench/broken.jpg") is None
+    print(f"esito JPEG corrotto: {broken['state'].value} ({broken['error']}), oggetto eliminato: {removed}")
+    errors += broken["state"] != UploadState.REJECTED or not removed
+    return errors
+
+
+async def measure(processor: MemoryProcessor, data: bytes, photos: int, inline: bool) -> list:
+    """Ritardi dell'event loop mentre si elaborano `photos` foto."""
+    storage = get_storage()
+    keys = [f"uploads/bench/load_{i}.jpg" for i in range(photos)]
+    for key in keys:
+        storage.write(key, data, "image/jpeg")
+    samples = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(loop_lag(stop, samples))
+    start = time.perf_counter()
+    if inline:
+        for key in keys:
+            process_photo(key, settings.MEDIA_THUMBNAIL_SIZE, settings.MEDIA_VARIANT_MAX_SIDE)
+            await asyncio.sleep(0)
+    else:
+        processor.results.clear()
+        processor.done.clear()
+        processor.expected = photos
+        for key in keys:
+            processor.submit(key, key, MediaType.PHOTO, key)
+        await processor.done.wait()
+    seconds = time.perf_counter() - start
+    stop.set()
+    await ticker
+    label = "nel loop" if inline else f"pool ({processor.workers} processi)"
+    bench_common.print_summary(f"lag loop, {label}", samples)
+    print(f"{'':<32} {photos} foto in {seconds:.2f}s ({photos / seconds:.1f} foto/s)")
+    return samples
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    data = photo_bytes(width, height)
+    print(f"foto di prova: {width}x{height}, {len(data) / 1024:.0f} KB, orientamento EXIF 6, GPS")
+    
+    app = FastAPI()
+    app.include_router(media.router, prefix="/api/v1/media")
+    processor = MemoryProcessor(args.workers)
+    processor.start()
+    errors = 0
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            errors += await check_upload_flow(client, data)
+        errors += await check_processing(processor, data, width, height)
+        # Primo giro per avviare i processi del pool, poi le misure
+        await measure(processor, data, args.workers, inline=False)
+        pooled = await measure(processor, data, args.photos, inline=False)
+        inline = await measure(processor, data, args.photos, inline=True)
+    finally:
+        await processor.stop()
+    if max(pooled) > max(inline):
+        errors += 1
+        print("ERRORE: il pool non riduce il ritardo dell'event loop")
+    print("OK" if errors == 0 else "ERRORE")
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--photos", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--size", default="4000x3000", help="Dimensioni delle foto di prova (LxA)")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as root:
+        settings.MEDIA_STORAGE_BACKEND = "filesystem"
+        settings.MEDIA_FILESYSTEM_ROOT = root
+        media_storage._storage = None
+        asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark del fan-out delle notifiche ai tecnici con provider finti.
+
+Confronta l'invio seriale (un await per tecnico, come il vecchio dispatch)
+con `NotificationFanOut` (concorrenza limitata per canale, multicast push,
+timeout per tentativo e retry con jitter). Non richiede rete né credenziali.
+
+Usage:
+    python execution/bench_notifications.py [--messages 2000] [--latency-ms 80]
+        [--failure-rate 0.05] [--hang-rate 0.01]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import bench_common  # noqa: F401  (configura sys.path)
+from bench_common import print_summary
+
+from app.services.notifications import Channel, FakeProvider, Message, NotificationFanOut
+
+
+def build_messages(n: int) -> list:
+    """60% push, 25% WhatsApp, 15% SMS: stesso payload per il multicast."""
+    messages = []
+    for i in range(n):
+        roll = random.random()
+        channel = Channel.PUSH if roll < 0.6 else Channel.WHATSAPP if roll < 0.85 else Channel.SMS
+        messages.append(Message(channel, f"recipient-{i}", "Nuova richiesta", "Perdita in cucina"))
+    return messages
+
+
+def build_providers(args) -> dict:
+    """Provider finti con latenza, errori e connessioni bloccate."""
+    return {
+        Channel.PUSH: FakeProvider(
+            Channel.PUSH, args.latency_ms, args.latency_ms / 4,
+            args.failure_rate, max_batch_size=500, hang_rate=args.hang_rate,
+        ),
+        Channel.SMS: FakeProvider(
+            Channel.SMS, args.latency_ms * 2, args.latency_ms / 2,
+            args.failure_rate, hang_rate=args.hang_rate,
+        ),
+        Channel.WHATSAPP: FakeProvider(
+            Channel.WHATSAPP, args.latency_ms * 1.5, args.latency_ms / 3,
+            args.failure_rate, hang_rate=args.hang_rate,
+        ),
+    }
+
+
+async def run_serial(messages, providers, timeout: float) -> list:
+    """Un invio per volta, senza retry (comportamento precedente)."""
+    latencies = []
+    started = time.perf_counter()
+    for message in messages:
+        try:
+            await asyncio.wait_for(providers[message.channel].send_batch([message]), timeout)
+        except asyncio.TimeoutError:
+            pass
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    messages = build_messages(args.messages)
+    
+    if args.messages <= 500:
+        providers = build_providers(args)
+        started = time.perf_counter()
+        serial = await run_serial(messages, providers, args.timeout)
+        elapsed = time.perf_counter() - started
+        print_summary("serial", serial)
+        print(f"{'':<32} throughput={len(messages) / elapsed:.1f} msg/s")
+    else:
+        print("serial: saltato (troppo lento oltre 500 messaggi)")
+    
+    providers = build_providers(args)
+    fan_out = NotificationFanOut(
+        providers=providers,
+        attempt_timeout=args.timeout,
+        max_attempts=3,
+        retry_base=0.05,
+        retry_max=0.5,
+    )
+    started = time.perf_counter()
+    result = await fan_out.send(messages)
+    elapsed = time.perf_counter() - started
+    print_summary("fan-out", result.latencies_ms)
+    print(
+        f"{'':<32} throughput={result.sent / elapsed:.1f} msg/s sent={result.sent} "
+        f"failed={result.failed} attempts={result.attempts}"
+    )
+    for channel, provider in providers.items():
+        print(f"{'':<32} {channel.value}: calls={provider.calls} max_in_flight={provider.max_in_flight}")
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--hang-rate", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark del feed `/technicians/me/pending` basato su `dispatch_offers`.
+
+Popola un database di prova con tecnici, richieste in DISPATCHING e N offerte
+aperte, poi misura la latenza di `pending_offers` per tecnici casuali e stampa
+il piano di esecuzione (atteso: Index Only Scan su ix_dispatch_offers_pending).
+
+ATTENZIONE: crea e svuota tabelle nel database indicato. Usare un DB usa-e-getta.
+
+Usage:
+    python execution/bench_pending_offers.py --database-url postgresql+asyncpg://... \
+        [--offers 100000] [--technicians 5000] [--queries 2000]
+"""
+
+import argparse
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import bench_common  # noqa: F401  (configura sys.path)
+from bench_common import print_summary, timed
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.database import Base
+from app.models import User, Technician, Request, Quote, DispatchOffer
+from app.models.request import Category, RequestStatus
+from app.models.dispatch_offer import OfferState
+from app.services.dispatch import pending_offers
+
+CHUNK = 5000
+OFFERS_PER_REQUEST = 5
+
+
+async def seed(session, n_technicians: int, n_offers: int) -> list:
+    """Crea tecnici, richieste, preventivi e offerte. Ritorna gli id dei tecnici."""
+    user_rows = [{"id": uuid.uuid4(), "name": f"Tecnico {i}", "role": "technician"} for i in range(n_technicians)]
+    tech_rows = [
+        {"id": uuid.uuid4(), "user_id": u["id"], "internal_code": f"TECH-{i:07d}", "specializations": [Category.PLUMBING]}
+        for i, u in enumerate(user_rows)
+    ]
+    for start in range(0, n_technicians, CHUNK):
+        await session.execute(insert(User), user_rows[start:start + CHUNK])
+        await session.execute(insert(Technician), tech_rows[start:start + CHUNK])
+    
+    client_id = uuid.uuid4()
+    await session.execute(insert(User), [{"id": client_id, "name": "Cliente bench"}])
+    
+    tech_ids = [t["id"] for t in tech_rows]
+    now = datetime.now(timezone.utc)
+    n_requests = n_offers // OFFERS_PER_REQUEST
+    for start in range(0, n_requests, CHUNK):
+        size = min(CHUNK, n_requests - start)
+        request_rows = [
+            {
+                "id": uuid.uuid4(),
+                "reference_code": f"BENCH-{start + i:08d}",
+                "client_id": client_id,
+                "category": Category.PLUMBING,
+                "title": "Richiesta di benchmark",
+                "description": "Perdita sotto il lavandino",
+                "address": "Via di prova 1, Milano, Italia",
+                "status": RequestStatus.DISPATCHING,
+            }
+            for i in range(size)
+        ]
+        await session.execute(insert(Request), request_rows)
+        await session.execute(insert(Quote), [
+            {
+                "request_id": r["id"],
+                "initial_min_price": 8000,
+                "initial_max_price": 25000,
+                "min_price": 8000,
+                "max_price": 25000,
+            }
+            for r in request_rows
+        ])
+        offer_rows = []
+        for r in request_rows:
+            offered_at = now - timedelta(seconds=random.randint(0, 240))
+            for tech_id in random.sample(tech_ids, OFFERS_PER_REQUEST):
+                offer_rows.append({
+                    "request_id": r["id"],
+                    "technician_id": tech_id,
+                    "wave": 1,
+                    "state": OfferState.OFFERED,
+                    "offered_at": offered_at,
+                    "expires_at": offered_at + timedelta(minutes=30),
+                })
+        await session.execute(insert(DispatchOffer), offer_rows)
+        await session.commit()
+    
+    await session.execute(text("ANALYZE"))
+    return tech_ids
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    engine = create_async_engine(args.database_url)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as session:
+        print(f"Seeding {args.offers} offerte aperte su {args.technicians} tecnici...")
+        tech_ids = await seed(session, args.technicians, args.offers)
+    
+    # VACUUM aggiorna la visibility map: necessario per l'index-only scan
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE dispatch_offers"))
+    
+    samples = []
+    async with session_factory() as session:
+        for _ in range(args.queries):
+            with timed(samples):
+                await pending_offers(session, random.choice(tech_ids))
+        
+        plan = await session.execute(
+            text(
+                "EXPLAIN (ANALYZE, BUFFERS) SELECT request_id FROM dispatch_offers "
+                "WHERE technician_id = :tid AND state = 'OFFERED' AND expires_at > now()"
+            ),
+            {"tid": random.choice(tech_ids)},
+        )
+        print("\n".join(row[0] for row in plan))
+    
+    print_summary(f"pending feed ({args.offers} offers)", samples)
+    await engine.dispose()
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--offers", type=int, default=100000)
+    parser.add_argument("--technicians", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
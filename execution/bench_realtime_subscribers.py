@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark del canale live delle richieste: sottoscrittori inattivi per worker.
+
+Apre N sottoscrizioni SSE inattive (una task ciascuna che consuma
+`sse_messages`, come fa lo StreamingResponse di `GET /requests/{id}/events`)
+distribuite su R richieste, e misura:
+  - memoria per sottoscrittore (tracemalloc) e RSS del processo
+  - costo del ciclo di heartbeat con tutti i sottoscrittori inattivi
+  - latenza pubblicazione -> consegna per un delta su ogni richiesta
+    e per una richiesta "calda" seguita da tutti i sottoscrittori
+Usa il backend in memoria (REALTIME_BACKEND="memory"), senza database.
+
+Usage:
+    python execution/bench_realtime_subscribers.py [--subscribers 10000] [--requests 2500] \
+        [--heartbeat 2] [--idle 5]
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import time
+import tracemalloc
+import uuid
+
+import bench_common  # noqa: F401  (configura sys.path)
+from bench_common import print_summary
+
+from app.config import settings
+from app.services.request_events import request_events, publish_request_update, sse_messages
+
+
+class Consumer:
+    """Un client SSE: legge i frame e registra la latenza dei delta."""
+    
+    def __init__(self):
+        self.frames = 0
+        self.pings = 0
+        self.latencies_ms = []
+        self.expected = 0
+        self.done = asyncio.Event()
+    
+    async def run(self, request_id):
+        subscription = request_events.subscribe(request_id)
+        async for frame in sse_messages(subscription, {"type": "request.snapshot", "request_id": request_id}):
+            self.frames += 1
+            if frame.startswith(":"):
+                self.pings += 1
+            elif frame.startswith("data: "):
+                sent = json.loads(frame[6:])["sent"]
+                self.latencies_ms.append((time.perf_counter() - sent) * 1000)
+                if len(self.latencies_ms) >= self.expected:
+                    self.done.set()
+
+
+async def wait_delivered(consumers, expected: int):
+    for consumer in consumers:
+        consumer.expected = expected
+    await asyncio.gather(*(c.done.wait() for c in consumers if len(c.latencies_ms) < expected))
+    for consumer in consumers:
+        consumer.done.clear()
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    settings.REALTIME_HEARTBEAT_SECONDS = args.heartbeat
+    request_ids = [uuid.uuid4() for _ in range(args.requests)]
+    
+    tracemalloc.start()
+    base_mem, _ = tracemalloc.get_traced_memory()
+    consumers = [Consumer() for _ in range(args.subscribers)]
+    tasks = [
+        asyncio.create_task(c.run(request_ids[i % args.requests]))
+        for i, c in enumerate(consumers)
+    ]
+    while len(request_events) < args.subscribers or any(c.frames == 0 for c in consumers):
+        await asyncio.sleep(0.05)
+    mem, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{args.subscribers} sottoscrittori su {args.requests} richieste: "
+          f"{(mem - base_mem) / args.subscribers / 1024:.2f} KiB/sottoscrittore "
+          f"(tracemalloc), RSS max {rss_mb:.0f} MiB")
+    
+    # Fase inattiva: solo heartbeat
+    cpu_start = time.process_time()
+    await asyncio.sleep(args.idle)
+    cpu = time.process_time() - cpu_start
+    pings = sum(c.pings for c in consumers)
+    print(f"inattivi per {args.idle:.0f}s: {pings} heartbeat, CPU {cpu * 1000:.0f}ms "
+          f"({cpu / args.idle * 100:.1f}% di un core)")
+    
+    # Un delta per ogni richiesta
+    start = time.perf_counter()
+    for request_id in request_ids:
+        await publish_request_update(request_id, status="accepted", sent=time.perf_counter())
+    publish_ms = (time.perf_counter() - start) * 1000
+    await wait_delivered(consumers, 1)
+    print(f"pubblicazione di {args.requests} delta: {publish_ms / args.requests * 1000:.1f} µs/delta")
+    print_summary("consegna (un delta/richiesta)", [c.latencies_ms[0] for c in consumers])
+    
+    # Richiesta calda: tutti seguono la stessa
+    hot = uuid.uuid4()
+    hot_consumers = [Consumer() for _ in range(args.subscribers)]
+    hot_tasks = [asyncio.create_task(c.run(hot)) for c in hot_consumers]
+    while any(c.frames == 0 for c in hot_consumers):
+        await asyncio.sleep(0.05)
+    await publish_request_update(hot, status="in_progress", sent=time.perf_counter())
+    await wait_delivered(hot_consumers, 1)
+    print_summary(f"consegna (richiesta calda x{args.subscribers})", [c.latencies_ms[0] for c in hot_consumers])
+    
+    for task in tasks + hot_tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, *hot_tasks, return_exceptions=True)
+    print(f"sottoscrittori rimasti dopo la chiusura: {len(request_events)}")
+    print(request_events.stats())
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--subscribers", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=2500)
+    parser.add_argument("--heartbeat", type=float, default=2.0, help="Secondi tra gli heartbeat")
+    parser.add_argument("--idle", type=float, default=5.0, help="Durata della fase inattiva (s)")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
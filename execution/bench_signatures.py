@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Benchmark dell'acquisizione delle firme dei clienti.
+
+Crea firme come le esporta un pad di firma (PNG trasparente, tratto blu
+antialiasato, a varie densità di pixel), più una foto JPEG di una firma su
+carta, e le passa a `store_signature` come data URL base64, come fa
+POST /requests/{id}/sign. Lo store è su filesystem (cartella temporanea).
+Misura il tempo per firma e i byte: data URL ricevuto, PNG salvato, chiave
+rimasta nella riga di `requests`. Poi verifica che:
+  - il PNG salvato si apra, sia a palette, conservi la trasparenza e non
+    superi SIGNATURE_MAX_SIDE
+  - la stessa firma due volte dia la stessa chiave e un solo oggetto
+  - base64 a capo, base64 senza intestazione "data:" vengano accettati
+  - payload non validi (testo, SVG, base64 errato, PNG troncato, firma
+    vuota, troppo grande) vengano rifiutati con InvalidSignature, e quelli
+    troppo grandi o non immagine già durante la decodifica, senza decodificare
+    tutto
+  - un valore già nello store (URL) venga migrato alla sua chiave senza copie
+
+Usage:
+    python execution/bench_signatures.py [--signatures 50] [--seed 42]
+"""
+
+import argparse
+import base64
+import io
+import os
+import random
+import tempfile
+import time
+
+import bench_common  # noqa: F401  (configura sys.path)
+from bench_common import print_summary, timed
+
+from PIL import Image, ImageDraw
+
+from app.config import settings
+from app.services import media_storage
+from app.services.media_storage import get_storage
+from app.services.signatures import InvalidSignature, decode_data_url, legacy_key, store_signature
+
+PAD_SIZES = [(600, 200), (1200, 400), (1800, 600)]  # Pad da 600x200 CSS a 1x, 2x, 3x
+
+
+def pad_signature(width: int, height: int, color=(20, 40, 160, 255)) -> bytes:
+    """PNG trasparente con un tratto antialiasato, come canvas.toDataURL()."""
+    image = Image.new("RGBA", (width * 2, height * 2), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for _ in range(random.randint(1, 3)):  # Nome, cognome, svolazzo
+        x, y = random.uniform(0.05, 0.3) * width * 2, height
+        points = []
+        for _ in range(random.randint(150, 400)):
+            x += random.uniform(1, 6) * width / 600
+            y = min(max(y + random.uniform(-14, 14) * height / 200, 0.1 * height), 1.9 * height)
+            points.append((x, y))
+        draw.line(points, fill=color, width=max(3, width // 150), joint="curve")
+    image = image.resize((width, height), Image.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, "PNG")
+    return out.getvalue()
+
+
+def paper_signature() -> bytes:
+    """Foto JPEG di una firma su carta (sfondo bianco con rumore)."""
+    image = Image.open(io.BytesIO(pad_signature(1600, 600, (30, 30, 30, 255))))
+    paper = Image.effect_noise((1600, 600), 12).convert("RGB").point(lambda v: 200 + v // 5)
+    paper.paste(image, (0, 0), image)
+    out = io.BytesIO()
+    paper.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def data_url(data: bytes, content_type: str = "image/png") -> str:
+    return f"data:{content_type};base64," + base64.b64encode(data).decode()
+
+
+def rejected(payload: str) -> bool:
+    try:
+        store_signature(payload)
+    except InvalidSignature:
+        return True
+    return False
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--signatures", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    errors = 0
+    
+    with tempfile.TemporaryDirectory() as root:
+        settings.MEDIA_STORAGE_BACKEND = "filesystem"
+        settings.MEDIA_FILESYSTEM_ROOT = root
+        media_storage._storage = None
+        storage = get_storage()
+        
+        payloads = [data_url(pad_signature(*PAD_SIZES[i % len(PAD_SIZES)])) for i in range(args.signatures)]
+        payloads.append(data_url(paper_signature(), "image/jpeg"))
+        latencies = []
+        keys = []
+        for payload in payloads:
+            with timed(latencies):
+                keys.append(store_signature(payload))
+        print_summary(f"{len(payloads)} firme (decodifica, verifica, PNG, scrittura)", latencies)
+        received = sum(len(p) for p in payloads)
+        stored = sum(storage.head(key).size for key in keys)
+        print(f"Byte: data URL {received / len(payloads) / 1024:.0f} KB -> PNG {stored / len(keys) / 1024:.1f} KB "
+              f"per firma ({stored / received:.1%}); nella riga: {max(len(k) for k in keys)} caratteri "
+              f"invece di {max(len(p) for p in payloads):,}")
+        
+        bad = 0
+        for key, payload in zip(keys, payloads):
+            image = Image.open(io.BytesIO(storage.read(key)))
+            transparent = payload.startswith("data:image/png") and image.convert("RGBA").getpixel((0, 0))[3] == 0
+            if image.format != "PNG" or image.mode != "P" or max(image.size) > settings.SIGNATURE_MAX_SIDE:
+                bad += 1
+            elif payload.startswith("data:image/png") and not transparent:
+                bad += 1
+        print(f"PNG non conformi (formato, palette, trasparenza, lato): {bad}")
+        errors += bad != 0
+        
+        objects = len([f for f in os.listdir(os.path.join(root, "signatures")) if f.endswith(".png")])
+        again = store_signature(payloads[0])
+        after = len([f for f in os.listdir(os.path.join(root, "signatures")) if f.endswith(".png")])
+        print(f"Stessa firma di nuovo: stessa chiave {again == keys[0]}, oggetti {objects} -> {after}")
+        errors += again != keys[0] or after != objects
+        
+        encoded = payloads[0].split(",", 1)[1]
+        wrapped = "data:image/png;base64," + "\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+        variants = [store_signature(wrapped), store_signature(encoded)]
+        print(f"Base64 a capo / senza intestazione: stessa chiave {[k == keys[0] for k in variants]}")
+        errors += any(k != keys[0] for k in variants)
+        
+        empty = io.BytesIO()
+        Image.new("RGBA", (600, 200), (0, 0, 0, 0)).save(empty, "PNG")
+        png = base64.b64decode(encoded)
+        invalid = {
+            "testo": data_url(b"non sono una firma, solo testo" * 10, "text/plain"),
+            "svg": data_url(b'<svg xmlns="http://www.w3.org/2000/svg"><path d="M0 0L10 10"/></svg>', "image/svg+xml"),
+            "base64 errato": "data:image/png;base64,iVBORw0KGgo$$$$AAAA",
+            "base64 troncato": payloads[0][:-3],
+            "png troncato": data_url(png[:len(png) // 2]),
+            "firma vuota": data_url(empty.getvalue()),
+            "senza base64": "data:image/png,iVBORw0KGgo",
+        }
+        accepted = [name for name, payload in invalid.items() if not rejected(payload)]
+        print(f"Payload non validi rifiutati: {len(invalid) - len(accepted)}/{len(invalid)} {accepted or ''}")
+        errors += bool(accepted)
+        
+        # Rifiuto durante la decodifica: tempo contro la decodifica completa
+        big = data_url(png[:16] + os.urandom(settings.SIGNATURE_MAX_BYTES * 2))  # Intestazione PNG valida
+        not_image = data_url(b"\x00" * settings.SIGNATURE_MAX_BYTES)
+        for name, payload in (("troppo grande", big), ("non immagine", not_image)):
+            start = time.perf_counter()
+            refused = rejected(payload)
+            early = time.perf_counter() - start
+            start = time.perf_counter()
+            base64.b64decode(payload.split(",", 1)[1])
+            full = time.perf_counter() - start
+            print(f"Payload {name} ({len(payload) / 2**20:.1f} MB): rifiutato {refused} in {early * 1000:.1f}ms "
+                  f"(decodifica completa {full * 1000:.1f}ms)")
+            errors += not refused
+        try:
+            decode_data_url(big, settings.SIGNATURE_MAX_BYTES)
+            errors += 1
+        except InvalidSignature:
+            pass
+        
+        # Migrazione: URL già nello store -> chiave, nessuna copia
+        url = storage.public_url(keys[1])
+        migrated = legacy_key(url, storage)
+        copied = legacy_key(payloads[1], storage)
+        print(f"Migrazione: URL dello store -> {migrated == keys[1]}, data URL -> {copied == keys[1]}")
+        errors += migrated != keys[1] or copied != keys[1]
+    
+    print("OK" if errors == 0 else "ERRORE")
+
+
+if __name__ == "__main__":
+    main()
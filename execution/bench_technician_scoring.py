@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark del ranking vettoriale dei tecnici (`TechnicianScores.rank`).
+
+Popola il feature store in memoria con N tecnici e contatori casuali e
+l'indice spaziale (`TechnicianIndex`) con i candidati intorno a un punto,
+poi misura il ranking pesato top-k di un insieme di candidati, righe
+comprese:
+  - percorso dell'indice (quello del dispatch): le righe del feature store
+    arrivano con i risultati della query, il rank lavora sugli array
+  - percorso SQL (fallback): righe cercate per id (`rows_for`) + rank
+  - la query dell'indice stessa, a parte
+L'obiettivo è restare sotto 1 ms per 10.000 candidati sul percorso
+dell'indice. Il fallback SQL in produzione ordina un pool di
+MAX_TECHNICIANS_TO_NOTIFY * DISPATCH_RANK_POOL_FACTOR candidati, misurato
+anche con quella dimensione. Nessun database richiesto.
+
+Usage:
+    python execution/bench_technician_scoring.py [--technicians 50000] [--candidates 10000]
+        [--iterations 2000] [--top 5]
+"""
+
+import argparse
+import random
+import time
+import uuid
+
+import bench_common  # noqa: F401  (configura sys.path)
+from bench_common import percentile, print_summary
+
+import numpy as np
+
+from app.config import settings
+from app.models.request import Category
+from app.services.technician_index import KM_PER_DEGREE, TechnicianIndex
+from app.services.technician_scoring import TechnicianScores
+
+CENTER = (45.4642, 9.1900)  # Milano
+RADIUS_KM = 30.0
+
+
+def populate(n: int) -> tuple:
+    """Feature store con contatori verosimili. Ritorna store e id."""
+    scores = TechnicianScores()
+    ids = [uuid.uuid4() for _ in range(n)]
+    for tech_id in ids:
+        offers = random.randint(0, 400)
+        accepted = random.randint(0, offers)
+        scores.load(
+            tech_id,
+            rating=round(random.uniform(3.0, 5.0), 2),
+            completed_jobs=random.randint(0, 800),
+            offers_30d=offers,
+            accepts_30d=accepted,
+            accepted_total=accepted,
+            jobs_cancelled=random.randint(0, max(1, accepted // 10)),
+            response_seconds=random.uniform(5, 900) if accepted else None,
+        )
+    return scores, ids
+
+
+def populate_index(scores: TechnicianScores, ids: list) -> TechnicianIndex:
+    """Indice con i tecnici `ids` sparsi entro RADIUS_KM dal centro."""
+    index = TechnicianIndex(scores=scores)
+    span = RADIUS_KM / KM_PER_DEGREE / 1.5  # Dentro il raggio anche in diagonale
+    for tech_id in ids:
+        row = scores.rows_for([tech_id])[0]
+        index.upsert(
+            tech_id,
+            [Category.PLUMBING],
+            CENTER[0] + random.uniform(-span, span),
+            CENTER[1] + random.uniform(-span, span),
+            scores.counters[row, 0],
+            int(scores.counters[row, 1]),
+        )
+    index.loaded = True
+    return index
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--technicians", type=int, default=50000)
+    parser.add_argument("--candidates", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    
+    started = time.perf_counter()
+    scores, ids = populate(args.technicians)
+    print(f"popolamento: {args.technicians} tecnici in {time.perf_counter() - started:.2f}s")
+    
+    candidate_ids = random.sample(ids, args.candidates)
+    index = populate_index(scores, candidate_ids)
+    pool = settings.MAX_TECHNICIANS_TO_NOTIFY * settings.DISPATCH_RANK_POOL_FACTOR
+    
+    query, indexed, by_id, by_id_pool = [], [], [], []
+    for _ in range(args.iterations):
+        t0 = time.perf_counter()
+        hits = index.query(Category.PLUMBING, *CENTER, RADIUS_KM, args.candidates)
+        t1 = time.perf_counter()
+        scores.rank(hits.score_rows, hits.distance_km, limit=args.top)
+        t2 = time.perf_counter()
+        rows = scores.rows_for(hits.ids)
+        scores.rank(rows, hits.distance_km, limit=args.top)
+        t3 = time.perf_counter()
+        rows = scores.rows_for(hits.ids[:pool])
+        scores.rank(rows, hits.distance_km[:pool], limit=args.top)
+        t4 = time.perf_counter()
+        query.append((t1 - t0) * 1000)
+        indexed.append((t2 - t1) * 1000)
+        by_id.append((t3 - t2) * 1000)
+        by_id_pool.append((t4 - t3) * 1000)
+    
+    print(f"candidati trovati dall'indice: {len(hits)}")
+    print_summary(f"query indice ({args.candidates} candidati)", query)
+    print_summary(f"indice: righe + rank top-{args.top}", indexed)
+    print_summary(f"SQL: rows_for + rank top-{args.top}", by_id)
+    print_summary(f"SQL: rows_for + rank top-{args.top} (pool {pool})", by_id_pool)
+    
+    p99 = percentile(indexed, 99)
+    ok = p99 < 1.0 and len(hits) == args.candidates
+    print(f"righe + top-{args.top} su {args.candidates} candidati (indice): p99={p99:.3f} ms")
+    print("OK" if ok else "ERRORE")
+
+
+if __name__ == "__main__":
+    main()
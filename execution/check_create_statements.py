@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Verifica il numero di istruzioni SQL e di commit di una creazione richiesta.
+
+Chiama `submit_request` con foto allegate in entrambe le modalità della
+pipeline, contando le istruzioni inviate al database (evento
+`before_cursor_execute`) e i commit. Fallisce (exit 1) se una creazione
+supera i limiti attesi:
+  - async:  INSERT richiesta, INSERT audit, INSERT multi-riga media -> 3
+  - inline: come sopra + INSERT preventivo                            -> 4
+sempre con un solo commit, indipendentemente dal numero di foto. Il dispatch
+viene solo schedulato (wave), quindi non conta.
+
+ATTENZIONE: crea e svuota tabelle nel database indicato. Usare un DB usa-e-getta.
+
+Usage:
+    python execution/check_create_statements.py --database-url postgresql+asyncpg://... \
+        [--photos 5] [--repeat 20] [--verbose]
+"""
+
+import argparse
+import asyncio
+import sys
+import uuid
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+from fastapi import Response
+from sqlalchemy import event, insert, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.config import settings
+from app.database import Base
+from app.models import User
+from app.models.request import Category, RequestStatus
+from app.schemas.request import RequestCreate
+from app.services.request_pipeline import request_pipeline
+from app.services.reference_codes import reference_codes
+from app.api.v1.requests import submit_request
+
+MAX_STATEMENTS = {"async": 3, "inline": 4}
+MAX_COMMITS = 1
+
+
+class Counter:
+    """Istruzioni e commit inviati dal motore."""
+    
+    def __init__(self, engine, verbose: bool):
+        self.statements = []
+        self.commits = 0
+        self.verbose = verbose
+        event.listen(engine.sync_engine, "before_cursor_execute", self._statement)
+        event.listen(engine.sync_engine, "commit", self._commit)
+    
+    def _statement(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+        if self.verbose:
+            print("   ", " ".join(statement.split())[:120])
+    
+    def _commit(self, *args):
+        self.commits += 1
+    
+    def reset(self):
+        self.statements = []
+        self.commits = 0
+
+
+def payload(photos: int) -> RequestCreate:
+    return RequestCreate(
+        category=Category.PLUMBING,
+        title="Perdita in cucina",
+        description="Perdita d'acqua sotto il lavandino della cucina",
+        latitude=45.4642,
+        longitude=9.1900,
+        address="Via di prova 1, Milano, Italia",
+        media=[{"type": "photo", "url": f"https://cdn.example.com/{k}.jpg"} for k in range(photos)],
+        guided_answers={"how_long": "oggi"},
+    )
+
+
+async def main_async(args) -> bool:
+    """Funzione principale asincrona. Ritorna True se i limiti sono rispettati."""
+    engine = create_async_engine(args.database_url)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    
+    client = User(id=uuid.uuid4(), name="Cliente verifica")
+    async with session_factory() as session:
+        await session.execute(insert(User), [{"id": client.id, "name": client.name}])
+        await session.commit()
+    
+    reference_codes.configure(0)
+    settings.DISPATCH_MODE = "greedy"
+    settings.DISPATCH_WAVES_ENABLED = True  # Il primo wave viene solo schedulato
+    settings.REQUEST_PIPELINE_WORKERS = 0  # I job vengono solo accodati
+    request_pipeline.start()
+    
+    counter = Counter(engine, args.verbose)
+    ok = True
+    for mode, expected_status in (("async", RequestStatus.PENDING), ("inline", RequestStatus.DISPATCHING)):
+        settings.REQUEST_PIPELINE_MODE = mode
+        worst_statements = worst_commits = 0
+        for _ in range(args.repeat):
+            counter.reset()
+            response = Response()
+            async with session_factory() as session:
+                created = await submit_request(payload(args.photos), response, client, session)
+            worst_statements = max(worst_statements, len(counter.statements))
+            worst_commits = max(worst_commits, counter.commits)
+            if created.status != expected_status or len(created.media) != args.photos:
+                print(f"{mode}: risposta inattesa (stato {created.status.value}, {len(created.media)} media)")
+                ok = False
+        
+        within = worst_statements <= MAX_STATEMENTS[mode] and worst_commits <= MAX_COMMITS
+        ok = ok and within
+        print(f"{mode:<7} {args.photos} foto: max {worst_statements} istruzioni "
+              f"(limite {MAX_STATEMENTS[mode]}), max {worst_commits} commit (limite {MAX_COMMITS}) "
+              f"{'OK' if within else 'ERRORE'}")
+    
+    await request_pipeline.stop()
+    await engine.dispose()
+    return ok
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--photos", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--verbose", action="store_true", help="Stampa le istruzioni SQL")
+    args = parser.parse_args()
+    ok = asyncio.run(main_async(args))
+    print("OK" if ok else "ERRORE: troppe istruzioni per creazione")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
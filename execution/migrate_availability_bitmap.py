@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Aggiunge e popola `technicians.availability_bitmap` su un database esistente.
+
+`init_db` crea le colonne solo insieme alle tabelle nuove; senza questa
+colonna ogni ricerca dei tecnici vicini (`available_at_clause`) fallisce.
+Lo script:
+  - esegue ALTER TABLE ... ADD COLUMN IF NOT EXISTS availability_bitmap bytea
+  - compila con `compile_schedule` gli orari (`availability`) dei tecnici
+    che non hanno ancora la bitmap, a blocchi di --batch-size righe, una
+    transazione per blocco
+Gli orari non validi vengono riportati e lasciati senza bitmap (NULL =
+disponibile sempre, come prima della migrazione). Rieseguirlo è innocuo.
+
+Con --dry-run compila e riporta senza scrivere.
+
+Usage:
+    python execution/migrate_availability_bitmap.py [--database-url postgresql+asyncpg://...] \
+        [--batch-size 1000] [--dry-run]
+"""
+
+import argparse
+import asyncio
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+from app.services.availability import compile_schedule
+
+
+async def has_bitmap_column(conn) -> bool:
+    result = await conn.execute(text(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_name = 'technicians' AND column_name = 'availability_bitmap'"
+    ))
+    return result.first() is not None
+
+
+async def backfill(engine, batch_size: int, dry_run: bool) -> dict:
+    """Compila gli orari a blocchi (paginazione per id). Ritorna i conteggi."""
+    async with engine.connect() as conn:
+        pending = "availability_bitmap IS NULL AND " if await has_bitmap_column(conn) else ""  # Dry run
+    totals = {"compiled": 0, "anytime": 0, "invalid": 0}
+    last_id = None
+    while True:
+        params = {"limit": batch_size}
+        if last_id is not None:
+            params["last_id"] = last_id
+        async with engine.begin() as conn:
+            result = await conn.execute(text(
+                f"SELECT id, availability FROM technicians "
+                f"WHERE {pending}availability IS NOT NULL AND availability <> '{{}}'::jsonb "
+                + ("AND id > :last_id " if last_id is not None else "")
+                + "ORDER BY id LIMIT :limit"
+            ), params)
+            rows = result.all()
+            updates = []
+            for technician_id, availability in rows:
+                try:
+                    bitmap = compile_schedule(availability)
+                except ValueError as exc:
+                    print(f"  tecnico {technician_id}: orario non valido ({exc}), resta senza bitmap")
+                    totals["invalid"] += 1
+                    continue
+                if bitmap is None:
+                    totals["anytime"] += 1  # Sempre disponibile: NULL è già corretto
+                    continue
+                updates.append({"id": technician_id, "bitmap": bitmap})
+            if updates and not dry_run:
+                await conn.execute(
+                    text("UPDATE technicians SET availability_bitmap = :bitmap WHERE id = :id"),
+                    updates,
+                )
+            totals["compiled"] += len(updates)
+        if len(rows) < batch_size:
+            return totals
+        last_id = rows[-1][0]
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    engine = create_async_engine(args.database_url)
+    try:
+        async with engine.begin() as conn:
+            statement = "ALTER TABLE technicians ADD COLUMN IF NOT EXISTS availability_bitmap bytea"
+            print(statement)
+            if not args.dry_run:
+                await conn.execute(text(statement))
+        totals = await backfill(engine, args.batch_size, args.dry_run)
+    finally:
+        await engine.dispose()
+    print(f"Orari compilati: {totals['compiled']}, sempre disponibili: {totals['anytime']}, "
+          f"non validi: {totals['invalid']}")
+    print("Dry run: nessuna modifica." if args.dry_run else "Migrazione completata.")
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
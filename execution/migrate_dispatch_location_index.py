@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Sostituisce l'indice GiST su `technicians.location` con quello parziale.
+
+`init_db` crea gli indici solo insieme alle tabelle nuove: un database già
+in uso ha ancora `idx_technicians_location` (creato da GeoAlchemy su tutte
+le righe) e non `ix_technicians_location_dispatchable`, che indicizza solo
+i tecnici a cui si può inviare una richiesta e serve le query KNN (`<->`)
+e `ST_DWithin` del dispatch. Lo script:
+  - crea `ix_technicians_location_dispatchable` con CREATE INDEX CONCURRENTLY
+    (senza bloccare le scritture); se una creazione precedente era stata
+    interrotta, l'indice rimasto non valido viene eliminato e ricreato
+  - elimina `idx_technicians_location` con DROP INDEX CONCURRENTLY, solo
+    dopo che il nuovo indice è valido
+Rieseguirlo è innocuo.
+
+Usage:
+    python execution/migrate_dispatch_location_index.py [--database-url postgresql+asyncpg://...] \
+        [--keep-old-index]
+"""
+
+import argparse
+import asyncio
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+
+NEW_INDEX = "ix_technicians_location_dispatchable"
+OLD_INDEX = "idx_technicians_location"
+CREATE = (
+    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {NEW_INDEX} ON technicians USING gist (location) "
+    "WHERE is_active AND is_available_now AND is_accepting_jobs AND is_verified"
+)  # Stesso predicato di Technician.__table_args__
+
+
+async def index_valid(conn, name: str):
+    """True/False se l'indice esiste (valido o no), None se non esiste."""
+    result = await conn.execute(text(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+    ), {"name": name})
+    return result.scalar_one_or_none()
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    # CONCURRENTLY non può girare dentro una transazione
+    engine = create_async_engine(args.database_url, isolation_level="AUTOCOMMIT")
+    try:
+        async with engine.connect() as conn:
+            if await index_valid(conn, NEW_INDEX) is False:
+                print(f"{NEW_INDEX} non valido (creazione interrotta): lo ricreo")
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {NEW_INDEX}"))
+            print(CREATE)
+            await conn.execute(text(CREATE))
+            if not await index_valid(conn, NEW_INDEX):
+                print(f"ERRORE: {NEW_INDEX} non valido, {OLD_INDEX} non eliminato")
+                return
+            if not args.keep_old_index:
+                statement = f"DROP INDEX CONCURRENTLY IF EXISTS {OLD_INDEX}"
+                print(statement)
+                await conn.execute(text(statement))
+            await conn.execute(text("ANALYZE technicians"))
+    finally:
+        await engine.dispose()
+    print("Migrazione completata.")
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--keep-old-index", action="store_true", help="Non eliminare idx_technicians_location")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Aggiunge `technicians.location_updated_at` su un database esistente.
+
+`init_db` crea le colonne solo insieme alle tabelle nuove; senza questa
+colonna falliscono sia lo scarico del buffer delle posizioni
+(`location_buffer`, UPDATE ... FROM (VALUES) con la condizione sull'ora del
+ping) sia `update_location`. Le righe esistenti restano a NULL: il primo
+ping di ogni tecnico le aggiorna comunque. Rieseguirlo è innocuo.
+
+Usage:
+    python execution/migrate_location_updated_at.py [--database-url postgresql+asyncpg://...]
+"""
+
+import argparse
+import asyncio
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+
+STATEMENTS = [
+    "ALTER TABLE technicians ADD COLUMN IF NOT EXISTS location_updated_at TIMESTAMP WITH TIME ZONE",
+]
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    engine = create_async_engine(args.database_url)
+    try:
+        async with engine.begin() as conn:
+            for statement in STATEMENTS:
+                print(statement)
+                await conn.execute(text(statement))
+    finally:
+        await engine.dispose()
+    print("Migrazione completata.")
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
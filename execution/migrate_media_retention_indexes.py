@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Crea gli indici usati dalla pulizia dei media scaduti su un database esistente.
+
+`init_db` crea gli indici solo insieme alle tabelle nuove; su un database
+già in uso questo script aggiunge:
+  - `ix_request_media_expires_due`: parziale su `expires_at` WHERE NOT is_deleted
+  - `ix_request_media_url`: media -> caricamento (join della pulizia)
+  - `ix_uploads_expires_at`: caricamenti mai allegati a una richiesta
+  - `ix_uploads_content_hash`: caricamenti che condividono la copia per il
+    modello (`ai/`), eliminata solo quando non ne resta nessuno
+Gli indici vengono creati con CREATE INDEX CONCURRENTLY (senza bloccare le
+scritture); quelli già presenti vengono saltati.
+
+Usage:
+    python execution/migrate_media_retention_indexes.py [--database-url postgresql+asyncpg://...]
+"""
+
+import argparse
+import asyncio
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+
+INDEXES = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_request_media_expires_due "
+    "ON request_media (expires_at) WHERE NOT is_deleted",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_request_media_url ON request_media (url)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_uploads_expires_at ON uploads (expires_at)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_uploads_content_hash ON uploads (content_hash)",
+]
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    # CONCURRENTLY non può girare dentro una transazione
+    engine = create_async_engine(args.database_url, isolation_level="AUTOCOMMIT")
+    try:
+        async with engine.connect() as conn:
+            for statement in INDEXES:
+                print(statement)
+                await conn.execute(text(statement))
+            await conn.execute(text("ANALYZE request_media"))
+            await conn.execute(text("ANALYZE uploads"))
+    finally:
+        await engine.dispose()
+    print("Migrazione completata.")
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
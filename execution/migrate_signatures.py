@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Prepara un database esistente allo spostamento delle firme nello store.
+
+`init_db` crea colonne e indici solo insieme alle tabelle nuove; su un
+database già in uso questo script aggiunge:
+  - `requests.client_signature_key`: chiave del PNG della firma nello store
+  - `ix_requests_signature_legacy`: parziale su `id` WHERE client_signature_url
+    IS NOT NULL, le righe che hanno ancora la firma come data URL
+L'indice viene creato con CREATE INDEX CONCURRENTLY (senza bloccare le
+scritture); colonna e indice già presenti vengono saltati.
+
+Le firme vengono poi spostate da `SignatureMigration` all'avvio di ogni
+worker (SIGNATURE_MIGRATION_ENABLED). Con --run lo spostamento avviene qui,
+a blocchi, senza pause.
+
+Usage:
+    python execution/migrate_signatures.py [--database-url postgresql+asyncpg://...] \
+        [--run] [--batch-size 100]
+"""
+
+import argparse
+import asyncio
+import time
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.config import settings
+from app.services.signatures import SignatureMigration
+
+STATEMENTS = [
+    "ALTER TABLE requests ADD COLUMN IF NOT EXISTS client_signature_key VARCHAR(100)",
+    # CONCURRENTLY non può girare dentro una transazione
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_requests_signature_legacy "
+    "ON requests (id) WHERE client_signature_url IS NOT NULL",
+]
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    engine = create_async_engine(args.database_url, isolation_level="AUTOCOMMIT")
+    try:
+        async with engine.connect() as conn:
+            for statement in STATEMENTS:
+                print(statement)
+                await conn.execute(text(statement))
+            pending = (await conn.execute(text(
+                "SELECT count(*) FROM requests WHERE client_signature_url IS NOT NULL"
+            ))).scalar_one()
+        print(f"Firme ancora nella riga: {pending}")
+        
+        if args.run and pending:
+            migration_engine = create_async_engine(args.database_url)
+            migration = SignatureMigration(async_sessionmaker(migration_engine, expire_on_commit=False))
+            start = time.perf_counter()
+            try:
+                totals = await migration.migrate(batch_size=args.batch_size)
+            finally:
+                await migration_engine.dispose()
+            seconds = time.perf_counter() - start
+            print(f"Spostate {totals['migrated']} firme in {seconds:.1f}s ({totals['batches']} blocchi), "
+                  f"non spostabili {totals['failed']}")
+            if totals["failed"]:
+                print("Le firme non spostabili restano nella riga (vedi i messaggi [SIGNATURES]).")
+    finally:
+        await engine.dispose()
+    print("Migrazione completata.")
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--run", action="store_true", help="Sposta subito le firme, senza attendere i worker")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
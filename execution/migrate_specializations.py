@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Migrazione di `technicians.specializations` da testo libero a enum.
+
+Converte la colonna da `varchar[]` (etichette libere, per lo più in italiano)
+a `request_category[]` (lo stesso enum di `requests.category`) e crea
+l'indice GIN `ix_technicians_specializations` usato dai filtri `@>` / `&&`.
+La conversione avviene in SQL, in un'unica transazione; le etichette non
+riconosciute vengono scartate e riportate.
+
+Con --dry-run mostra solo il riepilogo delle etichette.
+Se la colonna è già migrata non fa nulla.
+
+Usage:
+    python execution/migrate_specializations.py [--database-url postgresql+asyncpg://...] [--dry-run]
+"""
+
+import argparse
+import asyncio
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+from app.models.request import Category
+
+# Etichette storiche (minuscole) -> categoria
+LEGACY_LABELS = {
+    Category.PLUMBING: ["plumbing", "idraulica", "idraulico", "idraulici"],
+    Category.ELECTRICAL: ["electrical", "elettricità", "elettricita", "elettricista", "impianti elettrici"],
+    Category.LOCKSMITH: ["locksmith", "serrature", "serratura", "fabbro"],
+    Category.HVAC: ["hvac", "caldaie", "caldaia", "climatizzazione", "condizionatori", "riscaldamento"],
+    Category.APPLIANCES: ["appliances", "elettrodomestici", "elettrodomestico"],
+    Category.CARPENTRY: ["carpentry", "falegnameria", "falegname"],
+    Category.GENERAL: ["general", "riparazioni generiche", "tuttofare", "manutenzione"],
+}
+
+
+def mapping_values() -> tuple:
+    """Clausola VALUES (label, category) e relativi parametri."""
+    rows, params = [], {}
+    for category, labels in LEGACY_LABELS.items():
+        for label in labels:
+            i = len(rows)
+            rows.append(f"(:label_{i}, :category_{i})")
+            params[f"label_{i}"] = label
+            params[f"category_{i}"] = category.name  # SQLEnum salva il nome
+    return ", ".join(rows), params
+
+
+async def column_type(conn) -> str:
+    """Tipo attuale degli elementi della colonna (es. '_varchar' o '_request_category')."""
+    result = await conn.execute(text(
+        "SELECT udt_name FROM information_schema.columns "
+        "WHERE table_name = 'technicians' AND column_name = 'specializations'"
+    ))
+    return result.scalar_one()
+
+
+async def report(conn, values: str, params: dict):
+    """Conteggio delle etichette presenti, riconosciute e non."""
+    result = await conn.execute(text(f"""
+        SELECT lower(btrim(s.label)) AS label, m.category, count(*) AS technicians
+        FROM technicians t
+        CROSS JOIN LATERAL unnest(t.specializations) AS s(label)
+        LEFT JOIN (VALUES {values}) AS m(label, category) ON m.label = lower(btrim(s.label))
+        GROUP BY 1, 2
+        ORDER BY 3 DESC
+    """), params)
+    for label, category, count in result.all():
+        print(f"  {label:<28} -> {category or 'NON RICONOSCIUTA':<16} {count:>8}")
+    
+    result = await conn.execute(text(f"""
+        SELECT count(*) FROM technicians t
+        WHERE cardinality(t.specializations) > 0 AND NOT EXISTS (
+            SELECT 1 FROM unnest(t.specializations) AS s(label)
+            JOIN (VALUES {values}) AS m(label, category) ON m.label = lower(btrim(s.label))
+        )
+    """), params)
+    print(f"Tecnici che resteranno senza specializzazioni: {result.scalar_one()}")
+
+
+async def migrate(conn, values: str, params: dict):
+    """Nuova colonna enum, conversione in blocco, swap e indice GIN."""
+    await conn.execute(text(
+        "ALTER TABLE technicians ADD COLUMN specializations_new request_category[] NOT NULL DEFAULT '{}'"
+    ))
+    result = await conn.execute(text(f"""
+        UPDATE technicians t SET specializations_new = ARRAY(
+            SELECT DISTINCT m.category::request_category
+            FROM unnest(t.specializations) AS s(label)
+            JOIN (VALUES {values}) AS m(label, category) ON m.label = lower(btrim(s.label))
+            ORDER BY 1
+        )
+    """), params)
+    print(f"Tecnici convertiti: {result.rowcount}")
+    
+    await conn.execute(text("ALTER TABLE technicians DROP COLUMN specializations"))
+    await conn.execute(text("ALTER TABLE technicians RENAME COLUMN specializations_new TO specializations"))
+    await conn.execute(text("ALTER TABLE technicians ALTER COLUMN specializations DROP DEFAULT"))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_technicians_specializations "
+        "ON technicians USING gin (specializations)"
+    ))
+    await conn.execute(text("ANALYZE technicians"))
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    engine = create_async_engine(args.database_url)
+    values, params = mapping_values()
+    
+    try:
+        async with engine.begin() as conn:
+            current = await column_type(conn)
+            if current == "_request_category":
+                print("Colonna già migrata, niente da fare.")
+                return
+            
+            print(f"Tipo attuale: {current}")
+            await report(conn, values, params)
+            if args.dry_run:
+                print("Dry run: nessuna modifica.")
+                return
+            await migrate(conn, values, params)
+    finally:
+        await engine.dispose()
+    print("Migrazione completata.")
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Ricalcola severità e stima iniziale delle richieste già analizzate con le regole attuali.
+
+Da lanciare dopo aver modificato `CATEGORY_PRICES`, `SEVERITY_RULES` o le
+altre tabelle di `app/services/ai_diagnostic.py`, per vedere l'impatto sullo
+storico. Legge le richieste a blocchi (paginazione per id, solo lettura),
+valuta ogni blocco con la tabella decisionale vettorializzata e scrive:
+  - un report JSON aggregato (transizioni di severità, variazione media dei
+    prezzi, dettaglio per categoria)
+  - opzionalmente un CSV con le sole richieste che cambierebbero
+
+Usage:
+    python execution/rescore_requests.py [--database-url postgresql+asyncpg://...] \
+        [--chunk-size 5000] [--limit N] [--output rescore.json] [--changes rescore_changes.csv]
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import time
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+import numpy as np
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.config import settings
+from app.services.ai_diagnostic import CATEGORIES, SEVERITIES
+from app.services.rescoring import RescoreReport, rescore_chunks
+
+
+def write_changes(writer, chunk) -> int:
+    """Righe CSV delle richieste che cambierebbero. Ritorna quante."""
+    changed = np.nonzero(chunk.changed)[0]
+    for i in changed:
+        writer.writerow([
+            chunk.reference_codes[i],
+            CATEGORIES[chunk.category[i]].value,
+            SEVERITIES[chunk.old_severity[i]].value,
+            SEVERITIES[chunk.new_severity[i]].value,
+            chunk.old_min_price[i] if chunk.has_quote[i] else "",
+            chunk.new_min_price[i],
+            chunk.old_max_price[i] if chunk.has_quote[i] else "",
+            chunk.new_max_price[i],
+        ])
+    return len(changed)
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    engine = create_async_engine(args.database_url)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    report = RescoreReport()
+    changes_file = open(args.changes, "w", newline="") if args.changes else None
+    writer = csv.writer(changes_file) if changes_file else None
+    if writer:
+        writer.writerow([
+            "reference_code", "category", "old_severity", "new_severity",
+            "old_min_price", "new_min_price", "old_max_price", "new_max_price",
+        ])
+    
+    start = time.perf_counter()
+    try:
+        async with session_factory() as session:
+            async for chunk in rescore_chunks(session, args.chunk_size, args.limit):
+                report.add(chunk)
+                if writer:
+                    write_changes(writer, chunk)
+                print(f"  {report.rows} richieste, {report.changed} cambierebbero "
+                      f"({report.rows / (time.perf_counter() - start):.0f} righe/s)")
+    finally:
+        if changes_file:
+            changes_file.close()
+        await engine.dispose()
+    report.seconds = time.perf_counter() - start
+    
+    result = report.to_dict()
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(json.dumps({k: result[k] for k in ("rules_version", "rows", "changed", "severity_transitions")}, indent=2))
+    print(f"Report scritto in {args.output}" + (f", modifiche in {args.changes}" if args.changes else ""))
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=None, help="Solo le prime N richieste")
+    parser.add_argument("--output", default="rescore.json", help="Report JSON aggregato")
+    parser.add_argument("--changes", default=None, help="CSV delle richieste che cambierebbero")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
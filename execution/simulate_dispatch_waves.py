@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Verifica in tempo virtuale del dispatch a ondate (WaveScheduler + TimerWheel).
+
+Usa lo scheduler di produzione con un orologio finto e un handler in memoria
+che replica `dispatch_wave`: nessun database e nessuna attesa reale.
+Controlla che:
+- nessuna ondata parta prima del timeout e al più un tick dopo;
+- l'accettazione (cancel) fermi l'escalation;
+- non si superi DISPATCH_MAX_WAVES;
+poi confronta il tasso di copertura con una sola ondata e con le ondate.
+
+Usage:
+    python execution/simulate_dispatch_waves.py [--requests 2000] [--accept-prob 0.08]
+"""
+
+import argparse
+import asyncio
+import heapq
+import random
+import sys
+import uuid
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+from app.config import settings
+from app.services.dispatch_waves import TimerWheel, WaveScheduler
+
+
+class VirtualClock:
+    """Orologio manuale per lo scheduler."""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+def check_wheel(errors: list):
+    """Proprietà di base della ruota: mai in anticipo, al più un tick in ritardo."""
+    clock = VirtualClock()
+    wheel = TimerWheel(0.5, slots=16, clock=clock)
+    deadlines = {}
+    for i in range(2000):
+        clock.now = random.uniform(0, 100)
+        wheel.advance()
+        delay = random.choice([0, 0.1, 0.5, 3, 7.9, 12, 40])  # anche oltre un giro di ruota
+        deadlines[i] = clock.now + delay
+        wheel.schedule(i, delay)
+    cancelled = set(random.sample(sorted(deadlines), 200))
+    for key in cancelled:
+        wheel.cancel(key)
+    
+    while len(wheel):
+        clock.now += random.uniform(0.01, 3)
+        for key, _ in wheel.advance():
+            if key in cancelled:
+                errors.append(f"timer {key} cancellato ma scattato")
+            elif clock.now < deadlines[key]:
+                errors.append(f"timer {key} in anticipo ({clock.now:.2f} < {deadlines[key]:.2f})")
+
+
+async def simulate(n_requests: int, accept_prob: float, max_waves: int, seed: int, errors: list) -> dict:
+    """Richieste con ondate guidate dal tempo virtuale."""
+    rng = random.Random(seed)
+    clock = VirtualClock()
+    timeout = settings.DISPATCH_WAVE_TIMEOUT_SECONDS
+    per_wave = settings.MAX_TECHNICIANS_TO_NOTIFY
+    
+    state = {}      # request_id -> {"wave", "accepted_at", "created_at", "wave_at"}
+    responses = []  # heap (time, request_id, wave)
+    
+    async def handler(request_id, wave):
+        request = state[request_id]
+        if request["accepted_at"] is not None:
+            errors.append(f"ondata {wave} partita dopo l'accettazione")
+            return
+        if wave > max_waves:
+            return
+        expected = request["wave_at"] + (timeout if wave > 1 else 0)
+        if not expected <= clock.now <= expected + scheduler.tick_seconds:
+            errors.append(f"ondata {wave} a {clock.now:.2f}s, attesa {expected:.2f}s")
+        request["wave"] = wave
+        request["wave_at"] = clock.now
+        # Ondate successive: raggio più ampio, tecnici più lontani e meno propensi
+        prob = accept_prob / (1 + 0.3 * (wave - 1))
+        for _ in range(per_wave):
+            if rng.random() < prob:
+                delay = rng.lognormvariate(3.5, 0.6)
+                if delay < settings.DISPATCH_OFFER_TTL_SECONDS:
+                    heapq.heappush(responses, (clock.now + delay, request_id, wave))
+        scheduler.schedule(request_id, wave + 1)
+    
+    scheduler = WaveScheduler(handler, clock=clock)
+    arrivals = []
+    t = 0.0
+    for _ in range(n_requests):
+        t += rng.expovariate(2.0)
+        arrivals.append(t)
+    arrivals.reverse()
+    
+    # Avanza a passi di un tick, come il loop di produzione
+    horizon = t + timeout * (max_waves + 1) + settings.DISPATCH_OFFER_TTL_SECONDS
+    while clock.now < horizon:
+        clock.now += scheduler.tick_seconds
+        while arrivals and arrivals[-1] <= clock.now:
+            request_id = uuid.uuid4()
+            state[request_id] = {"wave": 0, "accepted_at": None, "created_at": arrivals.pop(), "wave_at": clock.now}
+            scheduler.schedule(request_id, 1, delay=0)  # come create_request
+        while responses and responses[0][0] <= clock.now:
+            _, request_id, _ = heapq.heappop(responses)
+            request = state[request_id]
+            if request["accepted_at"] is None:
+                request["accepted_at"] = clock.now
+                scheduler.cancel(request_id)  # come accept_request
+        await scheduler.run_due()
+    
+    for request in state.values():
+        if request["wave"] > max_waves:
+            errors.append(f"superato il limite di {max_waves} ondate")
+    accepted = [r for r in state.values() if r["accepted_at"] is not None]
+    return {
+        "fill_rate": len(accepted) / n_requests,
+        "mean_tta": sum(r["accepted_at"] - r["created_at"] for r in accepted) / max(1, len(accepted)),
+        "mean_waves": sum(r["wave"] for r in state.values()) / n_requests,
+    }
+
+
+async def main_async(args) -> int:
+    """Funzione principale asincrona."""
+    errors = []
+    random.seed(args.seed)
+    check_wheel(errors)
+    
+    for max_waves in (1, settings.DISPATCH_MAX_WAVES):
+        result = await simulate(args.requests, args.accept_prob, max_waves, args.seed, errors)
+        print(
+            f"max_waves={max_waves} fill_rate={result['fill_rate']:.1%} "
+            f"mean_time_to_accept={result['mean_tta']:.1f}s mean_waves={result['mean_waves']:.2f}"
+        )
+    
+    for error in errors[:20]:
+        print(f"ERRORE: {error}")
+    print("OK" if not errors else f"{len(errors)} errori")
+    return 1 if errors else 0
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--accept-prob", type=float, default=0.08, help="probabilità di accettazione per offerta")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Stress test dell'accettazione concorrente (`/technicians/me/accept`).
+
+Per ogni round crea una richiesta in DISPATCHING con un'offerta aperta per
+ciascuno degli N tecnici, poi lancia N accettazioni simultanee chiamando
+direttamente l'endpoint `accept_request`, ognuna con la propria sessione.
+Verifica che ci sia esattamente un vincitore (gli altri ricevono 409), che
+la richiesta sia assegnata a lui e che le offerte siano chiuse di conseguenza.
+Stampa throughput e latenze di vincitori e perdenti.
+
+Con `--naive` esegue invece la vecchia sequenza leggi-controlla-scrivi, per
+mostrare le doppie assegnazioni che il compare-and-set evita.
+
+ATTENZIONE: crea e svuota tabelle nel database indicato. Usare un DB usa-e-getta.
+
+Usage:
+    python execution/stress_accept_race.py --database-url postgresql+asyncpg://... \
+        [--technicians 300] [--rounds 20] [--connections 80] [--naive]
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import bench_common  # noqa: F401  (configura sys.path)
+from bench_common import print_summary
+
+from fastapi import HTTPException
+from sqlalchemy import insert, select, func, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.database import Base
+from app.models import User, Technician, Request, Quote, DispatchOffer
+from app.models.request import Category, RequestStatus
+from app.models.dispatch_offer import OfferState
+from app.api.v1.technicians import accept_request
+
+
+async def seed_technicians(session, n: int) -> list:
+    """Crea N tecnici. Ritorna coppie (user_id, technician_id)."""
+    users = [{"id": uuid.uuid4(), "name": f"Tecnico {i}", "role": "technician"} for i in range(n)]
+    techs = [
+        {"id": uuid.uuid4(), "user_id": u["id"], "internal_code": f"TECH-{i:07d}", "specializations": [Category.PLUMBING]}
+        for i, u in enumerate(users)
+    ]
+    await session.execute(insert(User), users)
+    await session.execute(insert(Technician), techs)
+    await session.commit()
+    return [(u["id"], t["id"]) for u, t in zip(users, techs)]
+
+
+async def seed_request(session, client_id, tech_ids, round_no: int):
+    """Una richiesta in DISPATCHING con un'offerta aperta per ogni tecnico."""
+    request_id = uuid.uuid4()
+    now = datetime.now(timezone.utc)
+    await session.execute(insert(Request), [{
+        "id": request_id,
+        "reference_code": f"RACE-{round_no:06d}",
+        "client_id": client_id,
+        "category": Category.PLUMBING,
+        "title": "Richiesta contesa",
+        "description": "Perdita sotto il lavandino",
+        "address": "Via di prova 1, Milano, Italia",
+        "status": RequestStatus.DISPATCHING,
+    }])
+    await session.execute(insert(Quote), [{
+        "request_id": request_id,
+        "initial_min_price": 8000,
+        "initial_max_price": 25000,
+        "min_price": 8000,
+        "max_price": 25000,
+    }])
+    await session.execute(insert(DispatchOffer), [
+        {
+            "request_id": request_id,
+            "technician_id": tech_id,
+            "wave": 1,
+            "state": OfferState.OFFERED,
+            "offered_at": now,
+            "expires_at": now + timedelta(minutes=5),
+        }
+        for tech_id in tech_ids
+    ])
+    await session.commit()
+    return request_id
+
+
+async def naive_accept(session, request_id, technician_id):
+    """La vecchia sequenza: SELECT, controllo in Python, scrittura."""
+    request = (await session.execute(select(Request).where(Request.id == request_id))).scalar_one()
+    if request.status != RequestStatus.DISPATCHING or request.technician_id:
+        raise HTTPException(status_code=400, detail="Richiesta non più disponibile")
+    await asyncio.sleep(0)  # Cede il controllo come farebbe qualunque altra query
+    request.technician_id = technician_id
+    request.status = RequestStatus.ACCEPTED
+    await session.commit()
+
+
+async def attempt(session_factory, request_id, user_id, tech_id, naive: bool) -> tuple:
+    """Una accettazione. Ritorna (esito, latenza ms)."""
+    start = time.perf_counter()
+    async with session_factory() as session:
+        try:
+            if naive:
+                await naive_accept(session, request_id, tech_id)
+            else:
+                await accept_request(
+                    request_id,
+                    eta_minutes=30,
+                    technician=Technician(id=tech_id),
+                    current_user=User(id=user_id),
+                    db=session,
+                )
+            outcome = "win"
+        except HTTPException as e:
+            await session.rollback()
+            outcome = str(e.status_code)
+    return outcome, (time.perf_counter() - start) * 1000
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    engine = create_async_engine(args.database_url, pool_size=args.connections, max_overflow=0)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as session:
+        technicians = await seed_technicians(session, args.technicians)
+        client_id = uuid.uuid4()
+        await session.execute(insert(User), [{"id": client_id, "name": "Cliente stress"}])
+        await session.commit()
+    tech_ids = [tech_id for _, tech_id in technicians]
+    
+    win_ms, lose_ms, failures = [], [], 0
+    attempts, elapsed = 0, 0.0
+    for round_no in range(args.rounds):
+        async with session_factory() as session:
+            request_id = await seed_request(session, client_id, tech_ids, round_no)
+        
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            attempt(session_factory, request_id, user_id, tech_id, args.naive)
+            for user_id, tech_id in technicians
+        ))
+        elapsed += time.perf_counter() - start
+        attempts += len(results)
+        
+        winners = [i for i, (outcome, _) in enumerate(results) if outcome == "win"]
+        win_ms += [ms for outcome, ms in results if outcome == "win"]
+        lose_ms += [ms for outcome, ms in results if outcome != "win"]
+        unexpected = {outcome for outcome, _ in results} - {"win", "409", "400"}
+        
+        async with session_factory() as session:
+            assigned = (await session.execute(
+                select(Request.technician_id).where(Request.id == request_id)
+            )).scalar_one()
+            offers = dict((await session.execute(
+                select(DispatchOffer.state, func.count())
+                .where(DispatchOffer.request_id == request_id)
+                .group_by(DispatchOffer.state)
+            )).all())
+        
+        ok = len(winners) == 1 and not unexpected and assigned == tech_ids[winners[0]]
+        if not args.naive:
+            ok = ok and offers.get(OfferState.ACCEPTED) == 1 \
+                and offers.get(OfferState.WITHDRAWN) == len(tech_ids) - 1
+        if not ok:
+            failures += 1
+            print(f"round {round_no}: {len(winners)} vincitori, esiti inattesi {unexpected or '-'}, "
+                  f"offerte {{{', '.join(f'{s.value}: {c}' for s, c in offers.items())}}}")
+    
+    print_summary("vincitore", win_ms)
+    print_summary("perdente (409)", lose_ms)
+    print(f"{attempts} accettazioni in {elapsed:.2f}s: {attempts / elapsed:.0f}/s "
+          f"({args.technicians} concorrenti, {args.connections} connessioni)")
+    print(f"round con esito errato: {failures}/{args.rounds}")
+    print("OK" if failures == 0 else "ERRORE: assegnazioni non univoche")
+    await engine.dispose()
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--technicians", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--connections", type=int, default=80)
+    parser.add_argument("--naive", action="store_true", help="Vecchio leggi-controlla-scrivi")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Stress test dell'header Idempotency-Key su creazione richieste e pagamenti.
+
+Per K chiavi invia D duplicati simultanei di `POST /requests/` e di
+`POST /payments/create`, distribuiti su W worker simulati (ognuno con il
+proprio `IdempotencyStore`, quindi con cache e attese in-process separate,
+ma lo stesso database). Verifica che:
+  - per ogni chiave esista una sola richiesta / un solo pagamento
+  - tutte le risposte di una chiave siano identiche (prima esecuzione e repliche)
+  - la stessa chiave con un corpo diverso venga rifiutata (422)
+Stampa quante esecuzioni, repliche e attese ci sono state.
+
+ATTENZIONE: crea e svuota tabelle nel database indicato. Usare un DB usa-e-getta.
+
+Usage:
+    python execution/stress_idempotency.py --database-url postgresql+asyncpg://... \
+        [--keys 200] [--duplicates 8] [--workers 4]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import uuid
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import insert, select, func, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.config import settings
+from app.database import Base
+from app.models import User, Request, Quote, Payment
+from app.models.request import Category, RequestStatus
+from app.models.payment import PaymentMethod
+from app.schemas.request import RequestCreate
+from app.schemas.payment import PaymentCreate
+from app.services import idempotency as idempotency_module
+from app.services.idempotency import IdempotencyStore
+from app.services.reference_codes import reference_codes
+from app.services.request_pipeline import request_pipeline
+from app.api.v1.requests import submit_request
+from app.api.v1.payments import start_payment
+
+
+def request_payload(i: int) -> RequestCreate:
+    return RequestCreate(
+        category=Category.PLUMBING,
+        title=f"Perdita numero {i}",
+        description="Perdita d'acqua sotto il lavandino della cucina",
+        latitude=45.4642,
+        longitude=9.1900,
+        address="Via di prova 1, Milano, Italia",
+        media=[{"type": "photo", "url": f"https://cdn.example.com/{i}.jpg"}],
+        guided_answers={"how_long": "oggi"},
+    )
+
+
+def endpoint_response() -> Response:
+    """Come la Response iniettata da FastAPI: status_code assente finché non impostato."""
+    response = Response()
+    response.status_code = None
+    return response
+
+
+def body_of(result) -> str:
+    """Corpo JSON della risposta, sia prima esecuzione (modello) sia replica."""
+    if hasattr(result, "body"):
+        return json.dumps(json.loads(result.body), sort_keys=True)
+    return json.dumps(jsonable_encoder(result), sort_keys=True)
+
+
+async def submit(store, session_factory, endpoint, key, user, payload, default_status, handler):
+    """Una chiamata dell'endpoint, come fa il router con idempotency_store."""
+    await asyncio.sleep(random.uniform(0, 0.005))  # Arrivi leggermente sfalsati
+    async with session_factory() as session:
+        response = endpoint_response()
+        result = await store.run(
+            key, endpoint, user.id, payload, response, default_status,
+            lambda: handler(payload, response, user, session),
+        )
+        await session.commit()
+    return body_of(result)
+
+
+async def seed_payable(session_factory, client, n: int) -> list:
+    """N richieste completate con preventivo approvato. Ritorna gli id."""
+    ids = [uuid.uuid4() for _ in range(n)]
+    async with session_factory() as session:
+        await session.execute(insert(Request), [
+            {
+                "id": request_id,
+                "reference_code": f"PAY-{i:06d}",
+                "client_id": client.id,
+                "category": Category.PLUMBING,
+                "title": "Da pagare",
+                "description": "Lavoro completato",
+                "address": "Via di prova 1, Milano, Italia",
+                "status": RequestStatus.COMPLETED,
+            }
+            for i, request_id in enumerate(ids)
+        ])
+        await session.execute(insert(Quote), [
+            {
+                "request_id": request_id,
+                "initial_min_price": 8000,
+                "initial_max_price": 25000,
+                "min_price": 8000,
+                "max_price": 25000,
+                "client_approved": True,
+            }
+            for request_id in ids
+        ])
+        await session.commit()
+    return ids
+
+
+async def main_async(args):
+    """Funzione principale asincrona."""
+    engine = create_async_engine(args.database_url, pool_size=60, max_overflow=0)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    idempotency_module.async_session = session_factory
+    
+    client = User(id=uuid.uuid4(), name="Cliente stress")
+    async with session_factory() as session:
+        await session.execute(insert(User), [{"id": client.id, "name": client.name}])
+        await session.commit()
+    
+    reference_codes.configure(0)
+    settings.DISPATCH_WAVES_ENABLED = True
+    settings.REQUEST_PIPELINE_MODE = "async"
+    settings.REQUEST_PIPELINE_WORKERS = 0  # I job vengono solo accodati
+    request_pipeline.start()
+    stores = [IdempotencyStore() for _ in range(args.workers)]
+    errors = 0
+    
+    # Creazione richieste
+    keys = [f"req-{uuid.uuid4()}" for _ in range(args.keys)]
+    bodies = await asyncio.gather(*(
+        submit(stores[d % args.workers], session_factory, "requests.create", key, client,
+               request_payload(i), 202, submit_request)
+        for i, key in enumerate(keys)
+        for d in range(args.duplicates)
+    ))
+    async with session_factory() as session:
+        created = (await session.execute(select(func.count()).select_from(Request))).scalar()
+    distinct = {bodies[i * args.duplicates:(i + 1) * args.duplicates].count(bodies[i * args.duplicates]) for i in range(args.keys)}
+    if created != args.keys or distinct != {args.duplicates}:
+        errors += 1
+    print(f"richieste: {args.keys} chiavi x {args.duplicates} duplicati -> {created} create, "
+          f"risposte identiche per chiave: {'sì' if distinct == {args.duplicates} else 'no'}")
+    
+    # Pagamenti
+    payable = await seed_payable(session_factory, client, args.keys)
+    
+    async def pay(payload, response, user, session):
+        return await start_payment(payload, user, session)
+    
+    keys = [f"pay-{uuid.uuid4()}" for _ in range(args.keys)]
+    bodies = await asyncio.gather(*(
+        submit(stores[d % args.workers], session_factory, "payments.create", key, client,
+               PaymentCreate(request_id=request_id, payment_method=PaymentMethod.CARD), 200, pay)
+        for key, request_id in zip(keys, payable)
+        for d in range(args.duplicates)
+    ))
+    async with session_factory() as session:
+        payments = (await session.execute(select(func.count()).select_from(Payment))).scalar()
+    distinct = {bodies[i * args.duplicates:(i + 1) * args.duplicates].count(bodies[i * args.duplicates]) for i in range(args.keys)}
+    if payments != args.keys or distinct != {args.duplicates}:
+        errors += 1
+    print(f"pagamenti: {args.keys} chiavi x {args.duplicates} duplicati -> {payments} creati, "
+          f"risposte identiche per chiave: {'sì' if distinct == {args.duplicates} else 'no'}")
+    
+    # Stessa chiave, corpo diverso
+    try:
+        await submit(stores[0], session_factory, "payments.create", keys[0], client,
+                     PaymentCreate(request_id=payable[1], payment_method=PaymentMethod.CARD), 200, pay)
+        errors += 1
+        print("ERRORE: chiave riusata con un altro corpo accettata")
+    except HTTPException as e:
+        print(f"chiave riusata con un altro corpo: {e.status_code}")
+        errors += e.status_code != 422
+    
+    for i, store in enumerate(stores):
+        print(f"worker {i}: {store.stats()}")
+    await request_pipeline.stop()
+    await engine.dispose()
+    print("OK" if errors == 0 else "ERRORE: esecuzioni duplicate")
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--duplicates", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4, help="Worker simulati")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Stress test dei codici di riferimento delle richieste (Snowflake + Crockford base32).
+
+Avvia P processi, ognuno con il proprio worker id e T thread che generano
+codici in parallelo con `ReferenceCodeGenerator`, per un totale di N codici.
+Verifica nel processo principale che:
+  - non ci siano duplicati tra tutti i processi
+  - ogni codice stia nella colonna `reference_code` (String(20)) e si
+    decodifichi nel worker id giusto
+  - i codici generati da ciascun thread siano strettamente crescenti
+Per confronto stima le collisioni del vecchio schema REQ-YYYYMMDD-XXXX con
+lo stesso numero di codici in un giorno.
+
+Usage:
+    python execution/stress_reference_codes.py [--codes 4000000] [--processes 8] [--threads 4]
+"""
+
+import argparse
+import multiprocessing
+import random
+import string
+import threading
+import time
+
+import numpy as np
+
+import bench_common  # noqa: F401  (configura sys.path)
+
+from app.services.reference_codes import ReferenceCodeGenerator, decode, parse_code
+
+COLUMN_LENGTH = 20
+
+
+def worker(args) -> tuple:
+    """Genera `count` codici con `threads` thread. Ritorna id, valori, secondi e controlli."""
+    worker_id, count, threads = args
+    generator = ReferenceCodeGenerator(worker_id)
+    chunks = [[] for _ in range(threads)]
+    
+    def produce(out: list, n: int):
+        for _ in range(n):
+            out.append(generator.generate())
+    
+    per_thread = count // threads
+    start = time.perf_counter()
+    pool = [
+        threading.Thread(target=produce, args=(chunks[i], per_thread + (1 if i < count % threads else 0)))
+        for i in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    
+    # Stessa larghezza: l'ordine delle stringhe è quello degli id
+    increasing = all(all(a < b for a, b in zip(chunk, chunk[1:])) for chunk in chunks)
+    codes = [code for chunk in chunks for code in chunk]
+    longest = max(len(code) for code in codes)
+    values = np.fromiter((decode(code) for code in codes), dtype=np.int64, count=len(codes))
+    return worker_id, values, elapsed, longest, parse_code(codes[-1])[1], increasing
+
+
+def old_scheme_collisions(n: int) -> int:
+    """Duplicati tra n codici REQ-YYYYMMDD-XXXX generati nello stesso giorno."""
+    seen = set()
+    duplicates = 0
+    for _ in range(n):
+        code = "".join(random.choice(string.ascii_uppercase) for _ in range(4))
+        if code in seen:
+            duplicates += 1
+        seen.add(code)
+    return duplicates
+
+
+def main():
+    """Funzione principale."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--codes", type=int, default=4_000_000)
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=4, help="Thread per processo")
+    parser.add_argument("--old-scheme", type=int, default=100_000, help="Codici per il confronto col vecchio schema")
+    args = parser.parse_args()
+    
+    per_process = args.codes // args.processes
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        results = pool.map(worker, [(i, per_process, args.threads) for i in range(args.processes)])
+    wall = time.perf_counter() - start
+    
+    errors = 0
+    all_values = np.concatenate([result[1] for result in results])
+    unique = np.unique(all_values).size
+    if unique != all_values.size:
+        errors += 1
+        print(f"ERRORE: {all_values.size - unique} duplicati")
+    for worker_id, values, elapsed, longest, decoded_worker, increasing in results:
+        if longest > COLUMN_LENGTH or decoded_worker != worker_id or not increasing:
+            errors += 1
+            print(f"ERRORE worker {worker_id}: lunghezza {longest}, worker decodificato {decoded_worker}, "
+                  f"crescenti {increasing}")
+        print(f"worker {worker_id:>3}: {values.size:,} codici in {elapsed:.2f}s ({values.size / elapsed:,.0f}/s)")
+    
+    print(f"{all_values.size:,} codici da {args.processes} processi x {args.threads} thread "
+          f"in {wall:.2f}s: {unique:,} distinti")
+    duplicates = old_scheme_collisions(args.old_scheme)
+    print(f"vecchio schema: {duplicates:,} collisioni su {args.old_scheme:,} codici nello stesso giorno")
+    print("OK" if errors == 0 else "ERRORE")
+
+
+if __name__ == "__main__":
+    main()